@@ -23,6 +23,7 @@ class EmpresaContratanteAdmin(admin.ModelAdmin):
         'usuarios_ativos',
         'num_usuarios',
         'num_empresas',
+        'envios_simultaneos_nfse',
         'vencimento',
     )
     list_filter = ('status', 'plano')
@@ -0,0 +1,65 @@
+"""
+Contexto da contratante do usuário logado, resolvido uma vez por requisição
+O perfil (com a empresa contratante) e as empresas emissoras ativas ficam em
+cache por usuário; os sinais de UserProfile, EmpresaContratante e Empresa
+descartam as entradas afetadas (accounts.models)
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from core.models import Empresa
+from .models import UserProfile, chave_contexto
+
+
+def carregar_contexto(user):
+    """
+    Perfil e empresas emissoras ativas do usuário (do cache ou do banco)
+
+    Args:
+        user: Usuário autenticado
+
+    Returns:
+        tuple: (UserProfile com empresa carregada ou None, lista de Empresa ativas)
+    """
+    chave = chave_contexto(user.pk)
+    contexto = cache.get(chave)
+    if contexto is None:
+        profile = UserProfile.objects.select_related('empresa').filter(user=user).first()
+        empresas = []
+        if profile and profile.empresa:
+            empresas = list(Empresa.objects.filter(
+                empresa_contratante=profile.empresa,
+                ativo=True
+            ).select_related('empresa_contratante'))
+        contexto = (profile, empresas)
+        cache.set(chave, contexto, getattr(settings, 'CONTEXTO_USUARIO_CACHE', 300))
+    return contexto
+
+
+class ContextoContratanteMiddleware:
+    """
+    Disponibiliza em request.empresa_contratante e request.empresas_ativas a
+    contratante e as empresas emissoras ativas do usuário, e deixa
+    request.user.profile já carregado (sem consulta nas views)
+
+    Deve vir depois de AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.empresa_contratante = None
+        request.empresas_ativas = []
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            profile, empresas = carregar_contexto(user)
+            if profile is not None:
+                # Preenche os caches das relações user <-> profile
+                UserProfile.user.field.set_cached_value(profile, user)
+                UserProfile.user.field.remote_field.set_cached_value(user, profile)
+                request.empresa_contratante = profile.empresa
+                request.empresas_ativas = empresas
+
+        return self.get_response(request)
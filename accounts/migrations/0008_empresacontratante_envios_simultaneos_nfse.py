@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_alter_userprofile_empresa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresacontratante',
+            name='envios_simultaneos_nfse',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Requisições simultâneas à Sefin Nacional por certificado (vazio: padrão do sistema)', null=True, verbose_name='Envios Simultâneos NFS-e Nacional'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:45
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_empresacontratante_envios_simultaneos_nfse'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='empresacontratante',
+            name='envios_simultaneos_nfse',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Requisições simultâneas à Sefin Nacional por certificado (vazio: padrão do sistema)', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(50)], verbose_name='Envios Simultâneos NFS-e Nacional'),
+        ),
+    ]
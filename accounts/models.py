@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 import datetime
@@ -11,6 +14,12 @@ PLANOS_CHOICES = (
     ('pro', 'Pro'),
 )
 
+# Limite do campo EmpresaContratante.envios_simultaneos_nfse (threads e conexões por certificado)
+ENVIOS_SIMULTANEOS_NFSE_MAXIMO = 50
+
+# Cache dos totais por status do console administrativo (views_admin.estatisticas_contratantes)
+CHAVE_CACHE_ESTATISTICAS = 'admin_empresas:estatisticas'
+
 STATUS_CHOICES = (
     ('teste', 'Em Teste'),
     ('ativo', 'Ativo'),
@@ -57,6 +66,11 @@ class EmpresaContratante(models.Model):
     usuarios_cadastrados = models.PositiveIntegerField('Usuários Cadastrados', default=1)
     num_usuarios = models.PositiveIntegerField('Limite de Usuários', default=1)
     num_empresas = models.PositiveIntegerField('Limite de Empresas', default=1)  # número máximo de CNPJs/filiais permitidos
+    envios_simultaneos_nfse = models.PositiveSmallIntegerField(
+        'Envios Simultâneos NFS-e Nacional', null=True, blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(ENVIOS_SIMULTANEOS_NFSE_MAXIMO)],
+        help_text='Requisições simultâneas à Sefin Nacional por certificado (vazio: padrão do sistema)'
+    )
     status = models.CharField('Status', max_length=10, choices=STATUS_CHOICES, default='teste')
     plano = models.CharField('Plano', max_length=20, choices=PLANOS_CHOICES, default='padrao')
     vencimento = models.DateField('Vencimento', null=True, blank=True)
@@ -76,6 +90,11 @@ class EmpresaContratante(models.Model):
     def pode_adicionar_usuario(self):
         return self.usuarios_ativos < self.num_usuarios
 
+    @property
+    def limite_envios_nfse(self):
+        """Envios simultâneos à Sefin Nacional (campo da contratante ou settings.NFSE_NACIONAL_ENVIOS_SIMULTANEOS)"""
+        return self.envios_simultaneos_nfse or getattr(settings, 'NFSE_NACIONAL_ENVIOS_SIMULTANEOS', 8)
+
     def save(self, *args, **kwargs):
         if not self.vencimento:
             self.vencimento = timezone.now().date() + datetime.timedelta(days=7)
@@ -139,3 +158,38 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
     except UserProfile.DoesNotExist:
         UserProfile.objects.create(user=instance)
+
+@receiver(post_save, sender=EmpresaContratante)
+@receiver(post_delete, sender=EmpresaContratante)
+def descartar_estatisticas(sender, **kwargs):
+    """Descarta os totais por status em cache quando uma contratante muda"""
+    cache.delete(CHAVE_CACHE_ESTATISTICAS)
+
+def chave_contexto(user_id):
+    """Chave de cache do perfil e das empresas ativas do usuário (accounts.middleware)"""
+    return f'contexto_contratante:{user_id}'
+
+def descartar_contexto(user_ids):
+    """Descarta o contexto em cache dos usuários informados"""
+    cache.delete_many([chave_contexto(user_id) for user_id in user_ids])
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def descartar_contexto_perfil(sender, instance, **kwargs):
+    """Descarta o contexto em cache do usuário do perfil alterado"""
+    descartar_contexto([instance.user_id])
+
+@receiver(post_save, sender=EmpresaContratante)
+@receiver(pre_delete, sender=EmpresaContratante)
+def descartar_contexto_contratante(sender, instance, **kwargs):
+    """Descarta o contexto em cache dos usuários da contratante alterada"""
+    descartar_contexto(instance.usuarios.values_list('user_id', flat=True))
+
+@receiver(post_save, sender='core.Empresa')
+@receiver(post_delete, sender='core.Empresa')
+def descartar_contexto_empresa(sender, instance, **kwargs):
+    """Descarta o contexto em cache dos usuários da contratante da empresa emissora alterada"""
+    if instance.empresa_contratante_id:
+        descartar_contexto(UserProfile.objects.filter(
+            empresa_id=instance.empresa_contratante_id
+        ).values_list('user_id', flat=True))
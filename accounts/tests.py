@@ -1,3 +1,42 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from core.models import Empresa
+from nfse_nacional.services.cliente_sefin import envios_simultaneos
+from .models import ENVIOS_SIMULTANEOS_NFSE_MAXIMO, EmpresaContratante
+
+
+class EnviosSimultaneosNFSeTest(TestCase):
+    """Limite de envios simultâneos à Sefin Nacional por contratante"""
+
+    def setUp(self):
+        self.contratante = EmpresaContratante.objects.create(cnpj_cpf='11222333000181', nome_razao='Contratante')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@exemplo.com', 'senha'))
+
+    def editar(self, envios):
+        return self.client.post(reverse('accounts:admin_empresa_editar', args=[self.contratante.id]), {
+            'nome_razao': 'Contratante', 'cnpj_cpf': '11222333000181',
+            'num_usuarios': '1', 'num_empresas': '1', 'status': 'ativo', 'plano': 'padrao',
+            'envios_simultaneos_nfse': envios,
+        }, follow=True)
+
+    def test_valor_fora_da_faixa_e_rejeitado(self):
+        for envios in ('0', '51', 'abc', '-3'):
+            resposta = self.editar(envios)
+            self.assertIn('entre 1 e', str(list(resposta.context['messages'])[0]))
+            self.contratante.refresh_from_db()
+            self.assertIsNone(self.contratante.envios_simultaneos_nfse)
+
+    def test_valor_valido_e_gravado(self):
+        self.editar('12')
+        self.contratante.refresh_from_db()
+        self.assertEqual(self.contratante.envios_simultaneos_nfse, 12)
+
+    def test_limite_gravado_fora_da_faixa_e_limitado(self):
+        EmpresaContratante.objects.filter(pk=self.contratante.pk).update(envios_simultaneos_nfse=500)
+        self.contratante.refresh_from_db()
+        empresa = Empresa.objects.create(
+            cnpj='11.222.333/0001-81', razao_social='Prestadora', empresa_contratante=self.contratante
+        )
+        self.assertEqual(envios_simultaneos(empresa), ENVIOS_SIMULTANEOS_NFSE_MAXIMO)
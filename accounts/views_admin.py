@@ -3,8 +3,12 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db.models import Q, Count
-from .models import EmpresaContratante, UserProfile
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, DurationField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import CHAVE_CACHE_ESTATISTICAS, ENVIOS_SIMULTANEOS_NFSE_MAXIMO, EmpresaContratante, UserProfile
 from core.models import Empresa
 from datetime import date, timedelta
 
@@ -14,6 +18,28 @@ def is_superuser(user):
     return user.is_superuser
 
 
+def estatisticas_contratantes():
+    """
+    Totais de contratantes por status, em uma única consulta (guardados em cache
+    por settings.ADMIN_ESTATISTICAS_CACHE; o cache é descartado quando uma
+    contratante é salva ou excluída)
+    
+    Returns:
+        dict: total, ativas, teste, bloqueadas e vencidas
+    """
+    stats = cache.get(CHAVE_CACHE_ESTATISTICAS)
+    if stats is None:
+        stats = EmpresaContratante.objects.aggregate(
+            total=Count('id'),
+            ativas=Count('id', filter=Q(status='ativo')),
+            teste=Count('id', filter=Q(status='teste')),
+            bloqueadas=Count('id', filter=Q(status='bloqueado')),
+            vencidas=Count('id', filter=Q(status='vencido')),
+        )
+        cache.set(CHAVE_CACHE_ESTATISTICAS, stats, getattr(settings, 'ADMIN_ESTATISTICAS_CACHE', 300))
+    return stats
+
+
 @user_passes_test(is_superuser)
 def admin_empresas(request):
     """Tela administrativa para gerenciar empresas contratantes"""
@@ -22,11 +48,22 @@ def admin_empresas(request):
     search = request.GET.get('search', '')
     status_filter = request.GET.get('status', '')
     plano_filter = request.GET.get('plano', '')
+    hoje = date.today()
     
-    # Query base
-    empresas = EmpresaContratante.objects.all().annotate(
-        total_usuarios=Count('usuarios'),
-        total_empresas_emissoras=Count('empresas_emissoras')
+    # Contagens por subquery: dois Count() com JOIN em usuarios e
+    # empresas_emissoras multiplicariam as linhas um do outro
+    empresas = EmpresaContratante.objects.annotate(
+        total_usuarios=Coalesce(Subquery(
+            UserProfile.objects.filter(empresa=OuterRef('pk')).order_by().values('empresa')
+            .annotate(total=Count('id')).values('total')
+        ), 0),
+        total_empresas_emissoras=Coalesce(Subquery(
+            Empresa.objects.filter(empresa_contratante=OuterRef('pk')).order_by().values('empresa_contratante')
+            .annotate(total=Count('id')).values('total')
+        ), 0),
+        # Dias até o vencimento (negativo se vencido), calculados pelo banco
+        prazo_vencimento=ExpressionWrapper(F('vencimento') - Value(hoje), output_field=DurationField()),
+        atraso_vencimento=ExpressionWrapper(Value(hoje) - F('vencimento'), output_field=DurationField()),
     )
     
     # Aplicar filtros
@@ -42,34 +79,18 @@ def admin_empresas(request):
     if plano_filter:
         empresas = empresas.filter(plano=plano_filter)
     
-    # Ordenar
-    empresas = empresas.order_by('-id')
+    # Ordenar e paginar
+    paginator = Paginator(empresas.order_by('-id'), getattr(settings, 'ADMIN_EMPRESAS_POR_PAGINA', 25))
+    pagina = paginator.get_page(request.GET.get('page'))
     
-    # Calcular dias de vencimento para cada empresa
-    hoje = date.today()
-    empresas_com_dias = []
-    for empresa in empresas:
-        if empresa.vencimento:
-            delta = (empresa.vencimento - hoje).days
-            empresa.dias_vencimento = delta
-            empresa.dias_vencimento_abs = abs(delta)  # Valor absoluto para exibição
-        else:
-            empresa.dias_vencimento = None
-            empresa.dias_vencimento_abs = None
-        empresas_com_dias.append(empresa)
-    
-    # Estatísticas
-    stats = {
-        'total': EmpresaContratante.objects.count(),
-        'ativas': EmpresaContratante.objects.filter(status='ativo').count(),
-        'teste': EmpresaContratante.objects.filter(status='teste').count(),
-        'bloqueadas': EmpresaContratante.objects.filter(status='bloqueado').count(),
-        'vencidas': EmpresaContratante.objects.filter(status='vencido').count(),
-    }
+    filtros = request.GET.copy()
+    filtros.pop('page', None)
     
     context = {
-        'empresas': empresas_com_dias,
-        'stats': stats,
+        'empresas': pagina,
+        'pagina': pagina,
+        'filtros_query': filtros.urlencode(),
+        'stats': estatisticas_contratantes(),
         'search': search,
         'status_filter': status_filter,
         'plano_filter': plano_filter,
@@ -124,6 +145,7 @@ def admin_empresa_detalhes(request, empresa_id):
         'empresas_emissoras': empresas_emissoras,
         'dias_vencimento': dias_vencimento,
         'dias_vencimento_abs': dias_vencimento_abs,
+        'envios_maximo': ENVIOS_SIMULTANEOS_NFSE_MAXIMO,
     }
     
     return render(request, 'accounts/admin_empresa_detalhes.html', context)
@@ -135,10 +157,19 @@ def admin_empresa_editar(request, empresa_id):
     empresa = get_object_or_404(EmpresaContratante, id=empresa_id)
     
     if request.method == 'POST':
+        envios = (request.POST.get('envios_simultaneos_nfse') or '').strip()
+        if envios and not (envios.isdigit() and 1 <= int(envios) <= ENVIOS_SIMULTANEOS_NFSE_MAXIMO):
+            messages.error(
+                request,
+                f'Envios simultâneos NFS-e Nacional deve ser um número entre 1 e {ENVIOS_SIMULTANEOS_NFSE_MAXIMO}.'
+            )
+            return redirect('accounts:admin_empresa_detalhes', empresa_id=empresa.id)
+        
         empresa.nome_razao = request.POST.get('nome_razao')
         empresa.cnpj_cpf = request.POST.get('cnpj_cpf')
         empresa.num_usuarios = int(request.POST.get('num_usuarios', 1))
         empresa.num_empresas = int(request.POST.get('num_empresas', 1))
+        empresa.envios_simultaneos_nfse = int(envios) if envios else None
         empresa.status = request.POST.get('status')
         empresa.plano = request.POST.get('plano')
         
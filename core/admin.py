@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Empresa, NotaFiscalSP, NotaFiscalTomadorSP
+from .models import (
+    AgregadoDiarioNotas, Empresa, ExecucaoSincronizacaoNotas, MarcoSincronizacaoNotas, NotaFiscalSP, NotaFiscalTomadorSP,
+    NotaPrefeituraSP, RegistroEnvioRPS, SequenciaRPS, TarefaEmissao
+)
 
 
 @admin.register(Empresa)
@@ -15,10 +18,10 @@ class EmpresaAdmin(admin.ModelAdmin):
             'fields': ('empresa_contratante', 'cnpj', 'razao_social', 'nome_fantasia')
         }),
         ('Inscrições', {
-            'fields': ('inscricao_municipal', 'inscricao_estadual')
+            'fields': ('inscricao_municipal', 'inscricao_estadual', 'opcao_simples_nacional')
         }),
         ('Endereço', {
-            'fields': ('logradouro', 'numero', 'complemento', 'bairro', 'cidade', 'uf', 'cep'),
+            'fields': ('logradouro', 'numero', 'complemento', 'bairro', 'cidade', 'uf', 'cep', 'codigo_municipio'),
             'classes': ('collapse',)
         }),
         ('Contato', {
@@ -116,3 +119,66 @@ class NotaFiscalTomadorSPAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(SequenciaRPS)
+class SequenciaRPSAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'serie', 'ultimo_numero', 'data_atualizacao']
+    list_filter = ['serie']
+    search_fields = ['empresa__cnpj', 'empresa__razao_social']
+    readonly_fields = ['data_atualizacao']
+
+
+@admin.register(RegistroEnvioRPS)
+class RegistroEnvioRPSAdmin(admin.ModelAdmin):
+    list_display = ['cnpj', 'serie', 'numero', 'status', 'data_envio', 'data_atualizacao']
+    list_filter = ['status']
+    search_fields = ['cnpj', 'numero']
+    raw_id_fields = ['nota']
+    readonly_fields = ['impressao_digital', 'data_envio', 'data_atualizacao']
+
+
+@admin.register(NotaPrefeituraSP)
+class NotaPrefeituraSPAdmin(admin.ModelAdmin):
+    list_display = ['numero_nfe', 'tipo', 'empresa', 'data_emissao', 'cpf_cnpj_prestador',
+                    'cpf_cnpj_tomador', 'valor_servicos', 'status_nfe']
+    list_filter = ['tipo', 'status_nfe']
+    search_fields = ['numero_nfe', 'cpf_cnpj_prestador', 'cpf_cnpj_tomador', 'razao_social_tomador']
+    raw_id_fields = ['empresa']
+    readonly_fields = ['data_sincronizacao']
+
+
+@admin.register(MarcoSincronizacaoNotas)
+class MarcoSincronizacaoNotasAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'tipo', 'data_ate', 'data_atualizacao']
+    list_filter = ['tipo']
+    raw_id_fields = ['empresa']
+
+
+@admin.register(ExecucaoSincronizacaoNotas)
+class ExecucaoSincronizacaoNotasAdmin(admin.ModelAdmin):
+    list_display = ['execucao', 'empresa', 'tipo', 'periodo_inicio', 'periodo_fim',
+                    'status', 'notas', 'duracao', 'data_execucao']
+    list_filter = ['tipo', 'status']
+    search_fields = ['execucao', 'empresa__cnpj', 'empresa__razao_social']
+    raw_id_fields = ['empresa']
+    readonly_fields = ['data_execucao']
+
+
+@admin.register(AgregadoDiarioNotas)
+class AgregadoDiarioNotasAdmin(admin.ModelAdmin):
+    list_display = ['empresa', 'tipo', 'status', 'dia', 'quantidade', 'valor_total', 'valor_iss', 'data_atualizacao']
+    list_filter = ['tipo', 'status']
+    search_fields = ['empresa__cnpj', 'empresa__razao_social']
+    raw_id_fields = ['empresa']
+    date_hierarchy = 'dia'
+    readonly_fields = ['data_atualizacao']
+
+
+@admin.register(TarefaEmissao)
+class TarefaEmissaoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'status', 'usuario', 'total', 'processadas',
+                    'emitidas', 'erros', 'data_criacao', 'data_conclusao']
+    list_filter = ['tipo', 'status']
+    search_fields = ['usuario__username', 'worker']
+    readonly_fields = ['data_criacao', 'data_inicio', 'data_sinal', 'data_conclusao', 'worker']
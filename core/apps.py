@@ -5,3 +5,7 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Core'
+    
+    def ready(self):
+        from .services.agregados_notas import conectar_sinais
+        conectar_sinais()
@@ -19,7 +19,8 @@ class EmpresaCadastroForm(forms.ModelForm):
     class Meta:
         model = Empresa
         fields = ['cnpj', 'razao_social', 'nome_fantasia', 'inscricao_municipal', 
-                  'inscricao_estadual', 'senha_certificado', 'tem_procurador', 'cpf_cnpj_procurador']
+                  'inscricao_estadual', 'codigo_municipio', 'opcao_simples_nacional',
+                  'senha_certificado', 'tem_procurador', 'cpf_cnpj_procurador']
         widgets = {
             'cnpj': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -42,6 +43,14 @@ class EmpresaCadastroForm(forms.ModelForm):
                 'class': 'form-control',
                 'placeholder': 'Inscrição Estadual (opcional)'
             }),
+            'codigo_municipio': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'Ex.: 3550308',
+                'maxlength': '7'
+            }),
+            'opcao_simples_nacional': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'senha_certificado': forms.PasswordInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Senha do Certificado Digital'
@@ -63,6 +72,8 @@ class EmpresaCadastroForm(forms.ModelForm):
             'nome_fantasia': 'Nome Fantasia',
             'inscricao_municipal': 'Inscrição Municipal',
             'inscricao_estadual': 'Inscrição Estadual',
+            'codigo_municipio': 'Código do Município (IBGE)',
+            'opcao_simples_nacional': 'Simples Nacional',
             'senha_certificado': 'Senha do Certificado',
             'tem_procurador': 'Possui Procurador',
             'cpf_cnpj_procurador': 'CPF/CNPJ do Procurador',
@@ -76,6 +87,15 @@ class EmpresaCadastroForm(forms.ModelForm):
             cnpj = re.sub(r'\D', '', cnpj)
         return cnpj
     
+    def clean_codigo_municipio(self):
+        """Valida o código IBGE do município (7 dígitos)"""
+        codigo = self.cleaned_data.get('codigo_municipio')
+        if codigo:
+            codigo = re.sub(r'\D', '', codigo)
+            if len(codigo) != 7:
+                raise forms.ValidationError('O código IBGE do município deve ter 7 dígitos.')
+        return codigo
+    
     def clean_cpf_cnpj_procurador(self):
         """Remove formatação do CPF/CNPJ do procurador"""
         cpf_cnpj = self.cleaned_data.get('cpf_cnpj_procurador')
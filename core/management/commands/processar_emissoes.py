@@ -0,0 +1,65 @@
+"""
+Worker da fila de emissão
+
+Uso:
+    python manage.py processar_emissoes              # executa continuamente
+    python manage.py processar_emissoes --uma-vez    # processa as pendentes e encerra
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.services.fila_emissao import (
+    identificacao_worker, processar_tarefa, recuperar_tarefas_interrompidas, reservar_tarefa
+)
+
+
+class Command(BaseCommand):
+    help = 'Processa as tarefas de emissão (NFS-e SP, NFTS e NFS-e Nacional) enfileiradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=2.0,
+            help='Intervalo (segundos) entre consultas à fila quando não há tarefas'
+        )
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help='Processa as tarefas pendentes e encerra'
+        )
+        parser.add_argument(
+            '--timeout-tarefa', type=int, default=120,
+            help='Minutos sem progresso gravado após os quais uma tarefa em processamento é considerada interrompida'
+        )
+
+    def handle(self, *args, **options):
+        worker = identificacao_worker()
+        self.stdout.write(f'Worker {worker} iniciado')
+
+        try:
+            while True:
+                close_old_connections()
+
+                interrompidas = recuperar_tarefas_interrompidas(options['timeout_tarefa'])
+                if interrompidas:
+                    self.stdout.write(self.style.WARNING(
+                        f'{interrompidas} tarefa(s) interrompida(s) encerrada(s)'
+                    ))
+
+                tarefa = reservar_tarefa(worker)
+                if tarefa is None:
+                    if options['uma_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f'Processando {tarefa} ({tarefa.total} nota(s))')
+                inicio = time.monotonic()
+                processar_tarefa(tarefa)
+                tarefa.refresh_from_db()
+                self.stdout.write(
+                    f'{tarefa} finalizada em {time.monotonic() - inicio:.1f}s: '
+                    f'{tarefa.emitidas} emitida(s), {tarefa.erros} erro(s)'
+                )
+        except KeyboardInterrupt:
+            self.stdout.write('Worker finalizado')
@@ -0,0 +1,62 @@
+"""
+Reconstrói os agregados diários das notas a partir das notas (execução noturna)
+
+Uso:
+    python manage.py reconstruir_agregados                      # todo o histórico
+    python manage.py reconstruir_agregados --dias 45            # apenas os últimos 45 dias
+    python manage.py reconstruir_agregados --contratante 3 --tipo nfse_sp
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import Empresa
+from core.services.agregados_notas import TIPOS, reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os agregados diários das notas (painel da tela inicial)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tipo', choices=sorted(TIPOS), action='append',
+            help='Tipo de nota a reconstruir (padrão: todos)'
+        )
+        parser.add_argument(
+            '--empresa', type=int, action='append',
+            help='ID da empresa (padrão: todas)'
+        )
+        parser.add_argument(
+            '--contratante', type=int,
+            help='Reconstrói apenas as empresas da contratante informada'
+        )
+        parser.add_argument(
+            '--dias', type=int,
+            help='Reconstrói apenas os últimos N dias (padrão: todo o histórico)'
+        )
+
+    def handle(self, *args, **options):
+        empresas = None
+        if options['empresa'] or options['contratante']:
+            filtro = Empresa.objects.all()
+            if options['empresa']:
+                filtro = filtro.filter(id__in=options['empresa'])
+            if options['contratante']:
+                filtro = filtro.filter(empresa_contratante_id=options['contratante'])
+            empresas = list(filtro.values_list('id', flat=True))
+            if not empresas:
+                raise CommandError('Nenhuma empresa encontrada')
+
+        desde = None
+        if options['dias']:
+            desde = timezone.localdate() - timedelta(days=options['dias'] - 1)
+
+        inicio = time.monotonic()
+        gravados = reconstruir(tipos=options['tipo'], empresas=empresas, desde=desde)
+        for tipo, quantidade in gravados.items():
+            self.stdout.write(f'{tipo}: {quantidade} agregado(s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Agregados reconstruídos em {time.monotonic() - inicio:.1f}s'
+        ))
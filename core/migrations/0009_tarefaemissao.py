@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_alter_notafiscalsp_cnpj_cpf_tomador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaEmissao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('nfse_sp', 'NFS-e São Paulo'), ('nfts_sp', 'NFTS São Paulo'), ('nfse_nacional', 'NFS-e Nacional')], max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20, verbose_name='Status')),
+                ('notas_ids', models.JSONField(default=list, verbose_name='IDs das Notas')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parâmetros')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('processadas', models.PositiveIntegerField(default=0, verbose_name='Processadas')),
+                ('emitidas', models.PositiveIntegerField(default=0, verbose_name='Emitidas')),
+                ('erros', models.PositiveIntegerField(default=0, verbose_name='Erros')),
+                ('resultados', models.JSONField(blank=True, default=list, verbose_name='Resultados')),
+                ('mensagem', models.TextField(blank=True, null=True, verbose_name='Mensagem')),
+                ('worker', models.CharField(blank=True, max_length=100, null=True, verbose_name='Worker')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('data_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Início do Processamento')),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True, verbose_name='Conclusão')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tarefas_emissao', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Emissão',
+                'verbose_name_plural': 'Tarefas de Emissão',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['status', 'data_criacao'], name='core_tarefa_status_8047d1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_tarefaemissao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaRPS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serie', models.CharField(default='RPS', max_length=5, verbose_name='Série')),
+                ('ultimo_numero', models.PositiveBigIntegerField(default=0, verbose_name='Último Número Reservado')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, verbose_name='Última Atualização')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sequencias_rps', to='core.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Sequência de RPS',
+                'verbose_name_plural': 'Sequências de RPS',
+                'unique_together': {('empresa', 'serie')},
+            },
+        ),
+    ]
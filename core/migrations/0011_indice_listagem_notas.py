@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_sequenciarps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notafiscalsp',
+            index=models.Index(fields=['-data_importacao', '-id'], name='core_notafi_data_im_d7c522_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscaltomadorsp',
+            index=models.Index(fields=['-data_importacao', '-id'], name='core_notafi_data_im_da8e4c_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def preencher_campos(apps, schema_editor):
+    """Preenche data_referencia e cnpj_contribuinte das notas existentes"""
+    Empresa = apps.get_model('core', 'Empresa')
+    cnpj_empresa = Subquery(Empresa.objects.filter(pk=OuterRef('empresa_id')).values('cnpj')[:1])
+    sem_cnpj = Q(cnpj_contribuinte__isnull=True) | Q(cnpj_contribuinte='')
+
+    for nome_modelo in ('NotaFiscalSP', 'NotaFiscalTomadorSP'):
+        modelo = apps.get_model('core', nome_modelo)
+        modelo.objects.filter(sem_cnpj, empresa__isnull=False).update(cnpj_contribuinte=cnpj_empresa)
+
+    NotaFiscalSP = apps.get_model('core', 'NotaFiscalSP')
+    NotaFiscalSP.objects.update(
+        data_referencia=Coalesce('data_emissao', TruncDate('data_importacao'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_indice_listagem_notas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notafiscalsp',
+            name='core_notafi_empresa_79a0ce_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='notafiscaltomadorsp',
+            name='core_notafi_empresa_6cc47f_idx',
+        ),
+        migrations.AddField(
+            model_name='notafiscalsp',
+            name='data_referencia',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Data de Referência'),
+        ),
+        migrations.RunPython(preencher_campos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notafiscalsp',
+            index=models.Index(fields=['empresa', 'status_rps', 'data_referencia'], name='core_notafi_empresa_57c536_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscalsp',
+            index=models.Index(fields=['cnpj_contribuinte', 'status_rps', 'data_referencia'], name='core_notafi_cnpj_co_c10636_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscaltomadorsp',
+            index=models.Index(fields=['empresa', 'status_nfts', 'data_prestacao_servico'], name='core_notafi_empresa_3ef812_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscaltomadorsp',
+            index=models.Index(fields=['cnpj_contribuinte', 'status_nfts', 'data_prestacao_servico'], name='core_notafi_cnpj_co_57e17b_idx'),
+        ),
+    ]
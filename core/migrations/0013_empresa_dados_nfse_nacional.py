@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_nota_data_referencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='codigo_municipio',
+            field=models.CharField(blank=True, help_text='Código IBGE do município do prestador (NFS-e Nacional)', max_length=7, null=True, verbose_name='Código do Município (IBGE)'),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='opcao_simples_nacional',
+            field=models.CharField(choices=[('1', 'Não Optante'), ('2', 'Optante - MEI'), ('3', 'Optante - ME/EPP')], default='1', help_text='Situação perante o Simples Nacional (NFS-e Nacional)', max_length=1, verbose_name='Simples Nacional'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_empresa_dados_nfse_nacional'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroEnvioRPS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cnpj', models.CharField(max_length=14, verbose_name='CNPJ Prestador')),
+                ('serie', models.CharField(max_length=5, verbose_name='Série')),
+                ('numero', models.CharField(max_length=15, verbose_name='Número RPS')),
+                ('impressao_digital', models.CharField(max_length=64, verbose_name='Impressão Digital')),
+                ('status', models.CharField(choices=[('enviando', 'Enviando'), ('confirmado', 'Confirmado'), ('rejeitado', 'Rejeitado')], default='enviando', max_length=20, verbose_name='Status')),
+                ('data_envio', models.DateTimeField(verbose_name='Último Envio')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, verbose_name='Última Atualização')),
+                ('nota', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='registro_envio', to='core.notafiscalsp', verbose_name='Nota Fiscal')),
+            ],
+            options={
+                'verbose_name': 'Registro de Envio de RPS',
+                'verbose_name_plural': 'Registros de Envio de RPS',
+                'indexes': [models.Index(fields=['cnpj', 'serie', 'numero'], name='registro_envio_chave_rps')],
+            },
+        ),
+    ]
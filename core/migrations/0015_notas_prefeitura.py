@@ -0,0 +1,79 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_registroenviorps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcoSincronizacaoNotas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('E', 'Emitida'), ('R', 'Recebida')], max_length=1, verbose_name='Tipo')),
+                ('data_ate', models.DateField(verbose_name='Sincronizado Até')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, verbose_name='Última Atualização')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marcos_sincronizacao', to='core.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Marco de Sincronização de Notas',
+                'verbose_name_plural': 'Marcos de Sincronização de Notas',
+            },
+        ),
+        migrations.CreateModel(
+            name='NotaPrefeituraSP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('E', 'Emitida'), ('R', 'Recebida')], max_length=1, verbose_name='Tipo')),
+                ('inscricao_prestador', models.CharField(max_length=12, verbose_name='Inscrição Municipal Prestador')),
+                ('numero_nfe', models.CharField(max_length=15, verbose_name='Número NFS-e')),
+                ('codigo_verificacao', models.CharField(blank=True, max_length=8, null=True, verbose_name='Código de Verificação')),
+                ('data_emissao', models.DateTimeField(blank=True, null=True, verbose_name='Data/Hora Emissão')),
+                ('data_fato_gerador', models.DateTimeField(blank=True, null=True, verbose_name='Data do Fato Gerador')),
+                ('serie_rps', models.CharField(blank=True, max_length=5, null=True, verbose_name='Série RPS')),
+                ('numero_rps', models.CharField(blank=True, max_length=15, null=True, verbose_name='Número RPS')),
+                ('cpf_cnpj_prestador', models.CharField(blank=True, max_length=14, null=True, verbose_name='CPF/CNPJ Prestador')),
+                ('razao_social_prestador', models.CharField(blank=True, max_length=120, null=True, verbose_name='Razão Social Prestador')),
+                ('logradouro', models.CharField(blank=True, max_length=50, null=True, verbose_name='Logradouro')),
+                ('numero_endereco', models.CharField(blank=True, max_length=10, null=True, verbose_name='Número')),
+                ('bairro', models.CharField(blank=True, max_length=30, null=True, verbose_name='Bairro')),
+                ('cidade', models.CharField(blank=True, max_length=7, null=True, verbose_name='Cidade')),
+                ('uf', models.CharField(blank=True, max_length=2, null=True, verbose_name='UF')),
+                ('cep', models.CharField(blank=True, max_length=8, null=True, verbose_name='CEP')),
+                ('status_nfe', models.CharField(blank=True, max_length=1, null=True, verbose_name='Status')),
+                ('data_cancelamento', models.DateTimeField(blank=True, null=True, verbose_name='Data de Cancelamento')),
+                ('tributacao_nfe', models.CharField(blank=True, max_length=1, null=True, verbose_name='Tributação')),
+                ('codigo_servico', models.CharField(blank=True, max_length=5, null=True, verbose_name='Código do Serviço')),
+                ('aliquota_servicos', models.DecimalField(blank=True, decimal_places=4, max_digits=5, null=True, verbose_name='Alíquota')),
+                ('valor_servicos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor dos Serviços')),
+                ('valor_deducoes', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor das Deduções')),
+                ('valor_iss', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor do ISS')),
+                ('valor_credito', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor do Crédito')),
+                ('iss_retido', models.BooleanField(default=False, verbose_name='ISS Retido')),
+                ('cpf_cnpj_tomador', models.CharField(blank=True, max_length=14, null=True, verbose_name='CPF/CNPJ Tomador')),
+                ('razao_social_tomador', models.CharField(blank=True, max_length=120, null=True, verbose_name='Razão Social Tomador')),
+                ('discriminacao', models.TextField(blank=True, null=True, verbose_name='Discriminação')),
+                ('data_sincronizacao', models.DateTimeField(auto_now=True, verbose_name='Última Sincronização')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notas_prefeitura', to='core.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Nota da Prefeitura SP',
+                'verbose_name_plural': 'Notas da Prefeitura SP',
+                'ordering': ['-data_emissao'],
+                'indexes': [models.Index(fields=['empresa', 'tipo', 'data_emissao'], name='core_notapr_empresa_6730df_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notaprefeiturasp',
+            constraint=models.UniqueConstraint(fields=('empresa', 'tipo', 'inscricao_prestador', 'numero_nfe'), name='nota_prefeitura_chave_nfe'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='marcosincronizacaonotas',
+            unique_together={('empresa', 'tipo')},
+        ),
+    ]
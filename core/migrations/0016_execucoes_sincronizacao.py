@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_notas_prefeitura'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoSincronizacaoNotas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('execucao', models.CharField(db_index=True, max_length=32, verbose_name='Execução')),
+                ('tipo', models.CharField(choices=[('E', 'Emitida'), ('R', 'Recebida')], max_length=1, verbose_name='Tipo')),
+                ('periodo_inicio', models.DateField(verbose_name='Início do Período')),
+                ('periodo_fim', models.DateField(verbose_name='Fim do Período')),
+                ('status', models.CharField(choices=[('sucesso', 'Sucesso'), ('erro', 'Erro'), ('nao_executada', 'Não Executada')], max_length=20, verbose_name='Status')),
+                ('notas', models.PositiveIntegerField(default=0, verbose_name='Notas')),
+                ('duracao', models.FloatField(default=0, verbose_name='Duração (s)')),
+                ('mensagem', models.TextField(blank=True, null=True, verbose_name='Mensagem')),
+                ('data_execucao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Execução')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='execucoes_sincronizacao', to='core.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Execução de Sincronização de Notas',
+                'verbose_name_plural': 'Execuções de Sincronização de Notas',
+                'ordering': ['-data_execucao'],
+                'indexes': [models.Index(fields=['empresa', 'tipo', 'data_execucao'], name='core_execuc_empresa_b01143_idx')],
+            },
+        ),
+    ]
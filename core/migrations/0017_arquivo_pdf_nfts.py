@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_execucoes_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notafiscaltomadorsp',
+            name='arquivo_pdf',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Arquivo PDF'),
+        ),
+    ]
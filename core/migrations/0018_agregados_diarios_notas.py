@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_arquivo_pdf_nfts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgregadoDiarioNotas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('nfse_sp', 'NFS-e SP'), ('nfts_sp', 'NFTS SP'), ('nfse_nacional', 'NFS-e Nacional')], max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(max_length=20, verbose_name='Status')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Quantidade')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor Total')),
+                ('valor_iss', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor ISS')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, verbose_name='Última Atualização')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agregados_diarios', to='core.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Agregado Diário de Notas',
+                'verbose_name_plural': 'Agregados Diários de Notas',
+                'indexes': [models.Index(fields=['empresa', 'dia'], name='core_agrega_empresa_69df3b_idx')],
+                'unique_together': {('empresa', 'tipo', 'status', 'dia')},
+            },
+        ),
+    ]
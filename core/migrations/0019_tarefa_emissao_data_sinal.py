@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_agregados_diarios_notas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarefaemissao',
+            name='data_sinal',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Último Sinal do Worker'),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models import Case, Count, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import Round, TruncMonth
 from accounts.models import EmpresaContratante
 from django.utils import timezone
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
 import re
 
 
@@ -28,6 +32,13 @@ def validate_cnpj(value: str):
         raise models.ValidationError("CNPJ inválido.")
 
 
+OPCAO_SIMPLES_NACIONAL_CHOICES = (
+    ('1', 'Não Optante'),
+    ('2', 'Optante - MEI'),
+    ('3', 'Optante - ME/EPP'),
+)
+
+
 class Empresa(models.Model):
     """Empresa emissora de notas fiscais"""
     
@@ -75,6 +86,14 @@ class Empresa(models.Model):
         null=True
     )
     
+    opcao_simples_nacional = models.CharField(
+        'Simples Nacional',
+        max_length=1,
+        choices=OPCAO_SIMPLES_NACIONAL_CHOICES,
+        default='1',
+        help_text='Situação perante o Simples Nacional (NFS-e Nacional)'
+    )
+    
     # Endereço
     logradouro = models.CharField('Logradouro', max_length=255, blank=True, null=True)
     numero = models.CharField('Número', max_length=20, blank=True, null=True)
@@ -83,6 +102,13 @@ class Empresa(models.Model):
     cidade = models.CharField('Cidade', max_length=100, blank=True, null=True)
     uf = models.CharField('UF', max_length=2, blank=True, null=True)
     cep = models.CharField('CEP', max_length=10, blank=True, null=True)
+    codigo_municipio = models.CharField(
+        'Código do Município (IBGE)',
+        max_length=7,
+        blank=True,
+        null=True,
+        help_text='Código IBGE do município do prestador (NFS-e Nacional)'
+    )
     
     # Contato
     telefone = models.CharField('Telefone', max_length=20, blank=True, null=True)
@@ -178,6 +204,145 @@ TIPO_TRIBUTACAO_CHOICES = (
 )
 
 
+CENTAVO = Decimal('0.01')
+
+
+def arredondar_centavos(valor):
+    """
+    Arredonda em centavos como o ROUND do banco (metade para longe do zero),
+    para que as propriedades e as anotações de com_impostos() coincidam
+    """
+    return Decimal(valor).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def soma_em_centavos(valor):
+    """
+    Converte uma soma vinda do banco em Decimal com centavos (None vira zero);
+    as somas do SQLite chegam com resíduo de ponto flutuante
+    """
+    return Decimal(str(valor or 0)).quantize(CENTAVO)
+
+_DECIMAL = models.DecimalField(max_digits=15, decimal_places=2)
+
+
+def expressoes_impostos(campo_aliquota='aliquota', retencoes=True, deducoes=('deducoes',), retidos_se=None):
+    """
+    Expressões SQL dos valores calculados da nota (as mesmas fórmulas das
+    propriedades valor_iss e valor_liquido); o ISS é arredondado em centavos
+    
+    Args:
+        campo_aliquota: Campo da alíquota do ISS (%)
+        retencoes: Se False, o modelo não tem PIS/COFINS/IRRF/CSLL/INSS retidos
+        deducoes: Campos subtraídos do valor total na base de cálculo
+        retidos_se: Valores retidos condicionalmente, {campo booleano: campo do valor}
+                    (ex.: {'ibs_retido': 'valor_ibs'})
+    
+    Returns:
+        dict: base_calculo, valor_iss, total_retencoes e valor_liquido
+    """
+    base = F('valor_total')
+    for campo in deducoes:
+        base = base - F(campo)
+    base = ExpressionWrapper(base, output_field=_DECIMAL)
+    # Multiplicar por 0,01 (e não dividir por 100): no SQLite, valores inteiros
+    # são guardados como INTEGER e a divisão seria inteira
+    iss = Round(ExpressionWrapper(base * F(campo_aliquota) * Value(Decimal('0.01')), output_field=_DECIMAL), 2)
+    
+    def se_retido(flag, valor):
+        return Case(When(**{flag: True}, then=valor), default=Value(Decimal('0')), output_field=_DECIMAL)
+    
+    retido = se_retido('iss_retido', iss)
+    for flag, campo in (retidos_se or {}).items():
+        retido = retido + se_retido(flag, F(campo))
+    if retencoes:
+        retido = F('pis_retido') + F('cofins_retido') + F('irrf_retido') + F('csll_retido') + F('inss_retido') + retido
+    retido = ExpressionWrapper(retido, output_field=_DECIMAL)
+    return {
+        'base_calculo': base,
+        'valor_iss': iss,
+        'total_retencoes': retido,
+        'valor_liquido': ExpressionWrapper(F('valor_total') - retido, output_field=_DECIMAL),
+    }
+
+
+class ValorCalculado:
+    """
+    Valor calculado da nota, usado no lugar de @property
+    
+    Nas notas lidas com com_impostos() o valor anotado pelo banco fica no
+    __dict__ da instância e tem precedência; nas demais é calculado em Python.
+    """
+    
+    def __init__(self, calcular):
+        self.calcular = calcular
+        self.__doc__ = calcular.__doc__
+    
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return self.calcular(instance)
+
+
+class NotasQuerySet(models.QuerySet):
+    """QuerySet das notas com os impostos calculados pelo banco"""
+    
+    # Parâmetros de expressoes_impostos para o modelo
+    parametros_impostos = {}
+    # Campo de data usado nos filtros por período
+    campo_data = 'data_referencia'
+    # Valores somados por totais() e totais_por_mes()
+    CAMPOS_TOTAIS = ('valor_total', 'deducoes', 'base_calculo', 'valor_iss', 'total_retencoes', 'valor_liquido')
+    
+    def com_impostos(self):
+        """Anota base_calculo, valor_iss, total_retencoes e valor_liquido"""
+        if 'valor_iss' in self.query.annotations:
+            return self
+        return self.annotate(**expressoes_impostos(**self.parametros_impostos))
+    
+    def no_periodo(self, inicio, fim):
+        """Notas com a data (campo_data) entre inicio e fim, inclusive"""
+        return self.filter(**{f'{self.campo_data}__range': (inicio, fim)})
+    
+    def _somas(self):
+        somas = {'quantidade': Count('id')}
+        somas.update({f'soma_{campo}': Sum(campo) for campo in self.CAMPOS_TOTAIS})
+        return somas
+    
+    def totais(self):
+        """
+        Totais das notas, em uma única consulta
+        
+        Returns:
+            dict: quantidade e somas de valor_total, deducoes, base_calculo,
+                  valor_iss, total_retencoes e valor_liquido
+        """
+        resultado = self.com_impostos().order_by().aggregate(**self._somas())
+        totais = {'quantidade': resultado['quantidade']}
+        for campo in self.CAMPOS_TOTAIS:
+            totais[campo] = soma_em_centavos(resultado[f'soma_{campo}'])
+        return totais
+    
+    def totais_por_mes(self, *agrupar):
+        """
+        Totais por mês (e pelos campos informados), agrupados pelo banco
+        
+        Args:
+            *agrupar: Campos adicionais do agrupamento (ex.: 'cnpj_contribuinte')
+        
+        Returns:
+            QuerySet: Dicionários com os campos de agrupamento, mes, quantidade e
+                      soma_<campo> de cada valor de totais()
+        """
+        return self.com_impostos().values(*agrupar, mes=TruncMonth(self.campo_data)).annotate(
+            **self._somas()
+        ).order_by(*agrupar, 'mes')
+
+
+class NotaFiscalTomadorSPQuerySet(NotasQuerySet):
+    parametros_impostos = {'retencoes': False}
+    campo_data = 'data_prestacao_servico'
+
+
 class NotaFiscalSP(models.Model):
     """Nota Fiscal de Serviço - São Paulo"""
     
@@ -230,6 +395,8 @@ class NotaFiscalSP(models.Model):
     data_emissao = models.DateField('Data de Emissão', null=True, blank=True)
     data_importacao = models.DateTimeField('Data de Importação', auto_now_add=True)
     data_atualizacao = models.DateTimeField('Última Atualização', auto_now=True)
+    # Data de emissão ou, na falta dela, dia da importação (mantida em save/preencher_campos_calculados)
+    data_referencia = models.DateField('Data de Referência', null=True, blank=True, editable=False)
     
     # Dados da NFS-e (após emissão)
     numero_nfse = models.CharField('Número NFS-e', max_length=50, blank=True, null=True)
@@ -242,14 +409,18 @@ class NotaFiscalSP(models.Model):
     observacoes = models.TextField('Observações', blank=True, null=True)
     mensagem_erro = models.TextField('Mensagem de Erro', blank=True, null=True)
     
+    objects = NotasQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Nota Fiscal SP'
         verbose_name_plural = 'Notas Fiscais SP'
         ordering = ['-data_importacao']
         indexes = [
-            models.Index(fields=['empresa', 'status_rps']),
+            models.Index(fields=['empresa', 'status_rps', 'data_referencia']),
+            models.Index(fields=['cnpj_contribuinte', 'status_rps', 'data_referencia']),
             models.Index(fields=['data_emissao']),
             models.Index(fields=['numero_nfse']),
+            models.Index(fields=['-data_importacao', '-id']),
         ]
     
     def __str__(self):
@@ -257,13 +428,36 @@ class NotaFiscalSP(models.Model):
             return f"NFS-e {self.numero_nfse} - {self.nome_tomador}"
         return f"RPS {self.id} - {self.nome_tomador}"
     
-    @property
+    def save(self, *args, **kwargs):
+        self.preencher_campos_calculados()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'data_emissao' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'data_referencia'}
+        super().save(*args, **kwargs)
+    
+    def preencher_campos_calculados(self):
+        """
+        Preenche os campos usados nos filtros da listagem (cnpj_contribuinte e
+        data_referencia); chamado no save() e antes de bulk_create/bulk_update
+        """
+        if not self.cnpj_contribuinte and self.empresa_id:
+            self.cnpj_contribuinte = self.empresa.cnpj
+        
+        if self.data_emissao:
+            data = self.data_emissao
+            self.data_referencia = data.date() if isinstance(data, datetime) else data
+        elif self.data_importacao:
+            self.data_referencia = timezone.localdate(self.data_importacao)
+        else:
+            self.data_referencia = timezone.localdate()
+    
+    @ValorCalculado
     def valor_iss(self):
         """Calcula o valor do ISS"""
         base_calculo = self.valor_total - self.deducoes
-        return (base_calculo * self.aliquota) / 100
+        return arredondar_centavos((base_calculo * self.aliquota) / 100)
     
-    @property
+    @ValorCalculado
     def valor_liquido(self):
         """Calcula o valor líquido"""
         total_retencoes = (
@@ -349,19 +543,24 @@ class NotaFiscalTomadorSP(models.Model):
     # Dados da NFTS (após emissão)
     protocolo = models.CharField('Protocolo', max_length=100, blank=True, null=True)
     data_emissao_nfts = models.DateTimeField('Data/Hora Emissão NFTS', null=True, blank=True)
+    arquivo_pdf = models.CharField('Arquivo PDF', max_length=255, blank=True, null=True)
     
     # Observações e Erros
     observacoes = models.TextField('Observações', blank=True, null=True)
     mensagem_erro = models.TextField('Mensagem de Erro', blank=True, null=True)
     
+    objects = NotaFiscalTomadorSPQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Nota Fiscal Tomador SP'
         verbose_name_plural = 'Notas Fiscais Tomador SP'
         ordering = ['-data_importacao']
         indexes = [
-            models.Index(fields=['empresa', 'status_nfts']),
+            models.Index(fields=['empresa', 'status_nfts', 'data_prestacao_servico']),
+            models.Index(fields=['cnpj_contribuinte', 'status_nfts', 'data_prestacao_servico']),
             models.Index(fields=['data_prestacao_servico']),
             models.Index(fields=['nfts']),
+            models.Index(fields=['-data_importacao', '-id']),
         ]
     
     def __str__(self):
@@ -369,8 +568,339 @@ class NotaFiscalTomadorSP(models.Model):
             return f"NFTS {self.nfts} - {self.cnpj_cpf_prestador}"
         return f"NFTS {self.id} - {self.cnpj_cpf_prestador}"
     
-    @property
+    def save(self, *args, **kwargs):
+        self.preencher_campos_calculados()
+        super().save(*args, **kwargs)
+    
+    def preencher_campos_calculados(self):
+        """
+        Preenche o cnpj_contribuinte usado no filtro da listagem; chamado no
+        save() e antes de bulk_create
+        """
+        if not self.cnpj_contribuinte and self.empresa_id:
+            self.cnpj_contribuinte = self.empresa.cnpj
+    
+    @ValorCalculado
     def valor_iss(self):
         """Calcula o valor do ISS"""
         base_calculo = self.valor_total - self.deducoes
-        return (base_calculo * self.aliquota) / 100
+        return arredondar_centavos((base_calculo * self.aliquota) / 100)
+    
+    @ValorCalculado
+    def valor_liquido(self):
+        """Calcula o valor líquido (desconta o ISS retido pelo tomador)"""
+        if self.iss_retido:
+            return self.valor_total - self.valor_iss
+        return self.valor_total
+
+
+class SequenciaRPS(models.Model):
+    """Controle da numeração de RPS por empresa e série"""
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='sequencias_rps',
+        verbose_name='Empresa'
+    )
+    serie = models.CharField('Série', max_length=5, default='RPS')
+    ultimo_numero = models.PositiveBigIntegerField('Último Número Reservado', default=0)
+    data_atualizacao = models.DateTimeField('Última Atualização', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Sequência de RPS'
+        verbose_name_plural = 'Sequências de RPS'
+        unique_together = [('empresa', 'serie')]
+    
+    def __str__(self):
+        return f"{self.empresa} - Série {self.serie}: {self.ultimo_numero}"
+
+
+STATUS_REGISTRO_ENVIO_CHOICES = (
+    ('enviando', 'Enviando'),
+    ('confirmado', 'Confirmado'),
+    ('rejeitado', 'Rejeitado'),
+)
+
+
+class RegistroEnvioRPS(models.Model):
+    """
+    Registro do envio de um RPS à prefeitura, gravado antes da chamada SOAP
+    
+    Um registro que continua 'enviando' indica que o resultado do envio não
+    chegou a ser gravado na nota (timeout, queda do processo); na nova tentativa
+    o RPS é consultado (ConsultaNFe por ChaveRPS) em vez de reenviado.
+    """
+    
+    nota = models.OneToOneField(
+        NotaFiscalSP,
+        on_delete=models.CASCADE,
+        related_name='registro_envio',
+        verbose_name='Nota Fiscal'
+    )
+    cnpj = models.CharField('CNPJ Prestador', max_length=14)
+    serie = models.CharField('Série', max_length=5)
+    numero = models.CharField('Número RPS', max_length=15)
+    impressao_digital = models.CharField('Impressão Digital', max_length=64)  # SHA-256 da cadeia assinada do RPS
+    status = models.CharField('Status', max_length=20, choices=STATUS_REGISTRO_ENVIO_CHOICES, default='enviando')
+    data_envio = models.DateTimeField('Último Envio')
+    data_atualizacao = models.DateTimeField('Última Atualização', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Registro de Envio de RPS'
+        verbose_name_plural = 'Registros de Envio de RPS'
+        indexes = [
+            models.Index(fields=['cnpj', 'serie', 'numero'], name='registro_envio_chave_rps'),
+        ]
+    
+    def __str__(self):
+        return f"RPS {self.serie}/{self.numero} ({self.cnpj}) - {self.get_status_display()}"
+
+
+TIPO_NOTA_PREFEITURA_CHOICES = (
+    ('E', 'Emitida'),
+    ('R', 'Recebida'),
+)
+
+
+class NotaPrefeituraSP(models.Model):
+    """
+    NFS-e emitida ou recebida pela empresa, sincronizada da Prefeitura de SP
+    (ConsultaNFeEmitidas/ConsultaNFeRecebidas)
+    """
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='notas_prefeitura',
+        verbose_name='Empresa'
+    )
+    tipo = models.CharField('Tipo', max_length=1, choices=TIPO_NOTA_PREFEITURA_CHOICES)
+    
+    # Chave da NFS-e
+    inscricao_prestador = models.CharField('Inscrição Municipal Prestador', max_length=12)
+    numero_nfe = models.CharField('Número NFS-e', max_length=15)
+    codigo_verificacao = models.CharField('Código de Verificação', max_length=8, blank=True, null=True)
+    data_emissao = models.DateTimeField('Data/Hora Emissão', null=True, blank=True)
+    data_fato_gerador = models.DateTimeField('Data do Fato Gerador', null=True, blank=True)
+    
+    # RPS que originou a NFS-e
+    serie_rps = models.CharField('Série RPS', max_length=5, blank=True, null=True)
+    numero_rps = models.CharField('Número RPS', max_length=15, blank=True, null=True)
+    
+    # Prestador
+    cpf_cnpj_prestador = models.CharField('CPF/CNPJ Prestador', max_length=14, blank=True, null=True)
+    razao_social_prestador = models.CharField('Razão Social Prestador', max_length=120, blank=True, null=True)
+    logradouro = models.CharField('Logradouro', max_length=50, blank=True, null=True)
+    numero_endereco = models.CharField('Número', max_length=10, blank=True, null=True)
+    bairro = models.CharField('Bairro', max_length=30, blank=True, null=True)
+    cidade = models.CharField('Cidade', max_length=7, blank=True, null=True)  # Código IBGE
+    uf = models.CharField('UF', max_length=2, blank=True, null=True)
+    cep = models.CharField('CEP', max_length=8, blank=True, null=True)
+    
+    # Situação e valores
+    status_nfe = models.CharField('Status', max_length=1, blank=True, null=True)  # N, C ou E
+    data_cancelamento = models.DateTimeField('Data de Cancelamento', null=True, blank=True)
+    tributacao_nfe = models.CharField('Tributação', max_length=1, blank=True, null=True)
+    codigo_servico = models.CharField('Código do Serviço', max_length=5, blank=True, null=True)
+    aliquota_servicos = models.DecimalField('Alíquota', max_digits=5, decimal_places=4, null=True, blank=True)
+    valor_servicos = models.DecimalField('Valor dos Serviços', max_digits=15, decimal_places=2, default=0)
+    valor_deducoes = models.DecimalField('Valor das Deduções', max_digits=15, decimal_places=2, default=0)
+    valor_iss = models.DecimalField('Valor do ISS', max_digits=15, decimal_places=2, default=0)
+    valor_credito = models.DecimalField('Valor do Crédito', max_digits=15, decimal_places=2, default=0)
+    iss_retido = models.BooleanField('ISS Retido', default=False)
+    
+    # Tomador
+    cpf_cnpj_tomador = models.CharField('CPF/CNPJ Tomador', max_length=14, blank=True, null=True)
+    razao_social_tomador = models.CharField('Razão Social Tomador', max_length=120, blank=True, null=True)
+    
+    discriminacao = models.TextField('Discriminação', blank=True, null=True)
+    data_sincronizacao = models.DateTimeField('Última Sincronização', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Nota da Prefeitura SP'
+        verbose_name_plural = 'Notas da Prefeitura SP'
+        ordering = ['-data_emissao']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'tipo', 'inscricao_prestador', 'numero_nfe'],
+                name='nota_prefeitura_chave_nfe',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['empresa', 'tipo', 'data_emissao']),
+        ]
+    
+    def __str__(self):
+        return f"NFS-e {self.numero_nfe} ({self.inscricao_prestador}) - {self.get_tipo_display()}"
+
+
+class MarcoSincronizacaoNotas(models.Model):
+    """
+    Marca d'água da sincronização de notas da prefeitura por empresa e tipo:
+    a próxima sincronização consulta apenas a partir de data_ate
+    """
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='marcos_sincronizacao',
+        verbose_name='Empresa'
+    )
+    tipo = models.CharField('Tipo', max_length=1, choices=TIPO_NOTA_PREFEITURA_CHOICES)
+    data_ate = models.DateField('Sincronizado Até')
+    data_atualizacao = models.DateTimeField('Última Atualização', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Marco de Sincronização de Notas'
+        verbose_name_plural = 'Marcos de Sincronização de Notas'
+        unique_together = [('empresa', 'tipo')]
+    
+    def __str__(self):
+        return f"{self.empresa} - {self.get_tipo_display()}s até {self.data_ate:%d/%m/%Y}"
+
+
+STATUS_EXECUCAO_SINCRONIZACAO_CHOICES = (
+    ('sucesso', 'Sucesso'),
+    ('erro', 'Erro'),
+    ('nao_executada', 'Não Executada'),
+)
+
+
+class ExecucaoSincronizacaoNotas(models.Model):
+    """
+    Consulta de um intervalo (empresa, tipo, período) feita pelo agendador
+    sincronizar_notas, com duração e quantidade de notas
+    """
+    
+    execucao = models.CharField('Execução', max_length=32, db_index=True)  # Identifica a rodada do agendador
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='execucoes_sincronizacao',
+        verbose_name='Empresa'
+    )
+    tipo = models.CharField('Tipo', max_length=1, choices=TIPO_NOTA_PREFEITURA_CHOICES)
+    periodo_inicio = models.DateField('Início do Período')
+    periodo_fim = models.DateField('Fim do Período')
+    status = models.CharField('Status', max_length=20, choices=STATUS_EXECUCAO_SINCRONIZACAO_CHOICES)
+    notas = models.PositiveIntegerField('Notas', default=0)
+    duracao = models.FloatField('Duração (s)', default=0)
+    mensagem = models.TextField('Mensagem', blank=True, null=True)
+    data_execucao = models.DateTimeField('Data de Execução', auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Execução de Sincronização de Notas'
+        verbose_name_plural = 'Execuções de Sincronização de Notas'
+        ordering = ['-data_execucao']
+        indexes = [
+            models.Index(fields=['empresa', 'tipo', 'data_execucao']),
+        ]
+    
+    def __str__(self):
+        return (
+            f"{self.empresa} - {self.get_tipo_display()}s de {self.periodo_inicio:%d/%m/%Y} "
+            f"a {self.periodo_fim:%d/%m/%Y} ({self.get_status_display()})"
+        )
+
+
+TIPO_AGREGADO_CHOICES = (
+    ('nfse_sp', 'NFS-e SP'),
+    ('nfts_sp', 'NFTS SP'),
+    ('nfse_nacional', 'NFS-e Nacional'),
+)
+
+
+class AgregadoDiarioNotas(models.Model):
+    """
+    Quantidade e valores das notas de uma empresa por tipo, status e dia
+    (mantido por core.services.agregados_notas; base do painel da tela inicial)
+    """
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='agregados_diarios',
+        verbose_name='Empresa'
+    )
+    tipo = models.CharField('Tipo', max_length=20, choices=TIPO_AGREGADO_CHOICES)
+    status = models.CharField('Status', max_length=20)
+    dia = models.DateField('Dia')
+    quantidade = models.PositiveIntegerField('Quantidade', default=0)
+    valor_total = models.DecimalField('Valor Total', max_digits=15, decimal_places=2, default=0)
+    valor_iss = models.DecimalField('Valor ISS', max_digits=15, decimal_places=2, default=0)
+    data_atualizacao = models.DateTimeField('Última Atualização', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Agregado Diário de Notas'
+        verbose_name_plural = 'Agregados Diários de Notas'
+        unique_together = [('empresa', 'tipo', 'status', 'dia')]
+        indexes = [
+            models.Index(fields=['empresa', 'dia']),
+        ]
+    
+    def __str__(self):
+        return f"{self.empresa} - {self.get_tipo_display()} {self.status} em {self.dia:%d/%m/%Y}: {self.quantidade}"
+
+
+TIPO_TAREFA_EMISSAO_CHOICES = (
+    ('nfse_sp', 'NFS-e São Paulo'),
+    ('nfts_sp', 'NFTS São Paulo'),
+    ('nfse_nacional', 'NFS-e Nacional'),
+)
+
+STATUS_TAREFA_CHOICES = (
+    ('pendente', 'Pendente'),
+    ('processando', 'Processando'),
+    ('concluida', 'Concluída'),
+    ('erro', 'Erro'),
+)
+
+
+class TarefaEmissao(models.Model):
+    """Tarefa de emissão em segundo plano (fila no banco, processada por processar_emissoes)"""
+    
+    tipo = models.CharField('Tipo', max_length=20, choices=TIPO_TAREFA_EMISSAO_CHOICES)
+    status = models.CharField('Status', max_length=20, choices=STATUS_TAREFA_CHOICES, default='pendente')
+    usuario = models.ForeignKey(
+        'auth.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='tarefas_emissao',
+        verbose_name='Usuário'
+    )
+    
+    # Entrada
+    notas_ids = models.JSONField('IDs das Notas', default=list)
+    parametros = models.JSONField('Parâmetros', default=dict, blank=True)
+    
+    # Progresso e resultado (mesmo formato da resposta de emissão)
+    total = models.PositiveIntegerField('Total', default=0)
+    processadas = models.PositiveIntegerField('Processadas', default=0)
+    emitidas = models.PositiveIntegerField('Emitidas', default=0)
+    erros = models.PositiveIntegerField('Erros', default=0)
+    resultados = models.JSONField('Resultados', default=list, blank=True)
+    mensagem = models.TextField('Mensagem', blank=True, null=True)
+    
+    # Controle
+    worker = models.CharField('Worker', max_length=100, blank=True, null=True)
+    data_criacao = models.DateTimeField('Data de Criação', auto_now_add=True)
+    data_inicio = models.DateTimeField('Início do Processamento', null=True, blank=True)
+    data_sinal = models.DateTimeField('Último Sinal do Worker', null=True, blank=True)  # Atualizado a cada progresso gravado
+    data_conclusao = models.DateTimeField('Conclusão', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Tarefa de Emissão'
+        verbose_name_plural = 'Tarefas de Emissão'
+        ordering = ['-data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'data_criacao']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.id} - {self.get_status_display()}"
+    
+    @property
+    def concluida(self):
+        return self.status in ('concluida', 'erro')
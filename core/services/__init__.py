@@ -0,0 +1,3 @@
+"""
+Serviços compartilhados entre os módulos de emissão
+"""
@@ -0,0 +1,267 @@
+"""
+Agregados diários das notas (AgregadoDiarioNotas) e painel da tela inicial
+Cada linha guarda quantidade, valor total e ISS das notas de uma empresa por
+tipo, status e dia. As alterações de notas marcam os pares (empresa, dia)
+afetados, que são recalculados a partir das notas ao fim da transação; o
+comando reconstruir_agregados refaz a tabela inteira (execução noturna)
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from core.models import AgregadoDiarioNotas, soma_em_centavos
+
+logger = logging.getLogger(__name__)
+
+# Tipo do agregado: (modelo, campo de status)
+TIPOS = {
+    'nfse_sp': ('core.NotaFiscalSP', 'status_rps'),
+    'nfts_sp': ('core.NotaFiscalTomadorSP', 'status_nfts'),
+    'nfse_nacional': ('nfse_nacional.NotaFiscalNacional', 'status_nfse'),
+}
+
+# Agregados gravados por consulta na reconstrução
+TAMANHO_LOTE = 1000
+
+# Pares (empresa, dia) aguardando o fim da transação, por tipo
+_pendentes = threading.local()
+
+
+def _modelo(tipo):
+    rotulo, campo_status = TIPOS[tipo]
+    return apps.get_model(rotulo), campo_status
+
+
+def tipo_do_modelo(modelo):
+    """Tipo do agregado correspondente ao modelo de nota (ou None)"""
+    rotulo = modelo._meta.label
+    for tipo, (rotulo_tipo, _) in TIPOS.items():
+        if rotulo_tipo == rotulo:
+            return tipo
+    return None
+
+
+def _linhas_agregadas(notas, campo_status, tipo):
+    """
+    Agrupa as notas por empresa, dia e status
+
+    Yields:
+        AgregadoDiarioNotas: Linhas não salvas
+    """
+    linhas = notas.com_impostos().filter(empresa__isnull=False).values(
+        'empresa_id', dia=F(notas.campo_data), situacao=F(campo_status)
+    ).annotate(
+        quantidade=Count('id'), soma_valor_total=Sum('valor_total'), soma_valor_iss=Sum('valor_iss')
+    ).order_by()
+    for linha in linhas.iterator():
+        if linha['dia'] is None:
+            continue
+        yield AgregadoDiarioNotas(
+            empresa_id=linha['empresa_id'],
+            tipo=tipo,
+            status=linha['situacao'],
+            dia=linha['dia'],
+            quantidade=linha['quantidade'],
+            valor_total=soma_em_centavos(linha['soma_valor_total']),
+            valor_iss=soma_em_centavos(linha['soma_valor_iss']),
+        )
+
+
+def _gravar(linhas):
+    """Grava as linhas em lotes de TAMANHO_LOTE"""
+    total = 0
+    while True:
+        lote = list(islice(linhas, TAMANHO_LOTE))
+        if not lote:
+            return total
+        AgregadoDiarioNotas.objects.bulk_create(lote)
+        total += len(lote)
+
+
+def recalcular(tipo, chaves):
+    """
+    Recalcula os agregados dos pares (empresa, dia) a partir das notas
+
+    Args:
+        tipo: Tipo do agregado (chave de TIPOS)
+        chaves: Pares (empresa_id, dia); os com empresa ou dia vazios são ignorados
+    """
+    dias_por_empresa = defaultdict(set)
+    for empresa_id, dia in chaves:
+        if empresa_id and dia:
+            dias_por_empresa[empresa_id].add(dia)
+    if not dias_por_empresa:
+        return
+
+    modelo, campo_status = _modelo(tipo)
+    notas = modelo.objects.all()
+    filtro_notas = Q()
+    filtro_agregados = Q()
+    for empresa_id, dias in dias_por_empresa.items():
+        filtro_notas |= Q(empresa_id=empresa_id, **{f'{notas.campo_data}__in': dias})
+        filtro_agregados |= Q(empresa_id=empresa_id, dia__in=dias)
+
+    with transaction.atomic():
+        AgregadoDiarioNotas.objects.filter(filtro_agregados, tipo=tipo).delete()
+        _gravar(_linhas_agregadas(notas.filter(filtro_notas), campo_status, tipo))
+
+
+def reconstruir(tipos=None, empresas=None, desde=None):
+    """
+    Refaz os agregados a partir das notas
+
+    Args:
+        tipos: Tipos a reconstruir (padrão: todos)
+        empresas: IDs das empresas (padrão: todas)
+        desde: Primeiro dia reconstruído (padrão: todo o histórico)
+
+    Returns:
+        dict: Quantidade de agregados gravados por tipo
+    """
+    gravados = {}
+    for tipo in tipos or TIPOS:
+        modelo, campo_status = _modelo(tipo)
+        notas = modelo.objects.all()
+        agregados = AgregadoDiarioNotas.objects.filter(tipo=tipo)
+        if empresas is not None:
+            notas = notas.filter(empresa_id__in=empresas)
+            agregados = agregados.filter(empresa_id__in=empresas)
+        if desde:
+            notas = notas.filter(**{f'{notas.campo_data}__gte': desde})
+            agregados = agregados.filter(dia__gte=desde)
+
+        with transaction.atomic():
+            agregados.delete()
+            gravados[tipo] = _gravar(_linhas_agregadas(notas, campo_status, tipo))
+    return gravados
+
+
+def _processar_pendentes():
+    pendentes = getattr(_pendentes, 'chaves', None)
+    if not pendentes:
+        return
+    _pendentes.chaves = defaultdict(set)
+    for tipo, chaves in pendentes.items():
+        try:
+            recalcular(tipo, chaves)
+        except Exception as e:
+            # O agregado fica desatualizado até a próxima reconstrução
+            logger.exception(f"Falha ao recalcular agregados {tipo}: {e}")
+
+
+def registrar(tipo, chaves):
+    """
+    Marca pares (empresa, dia) para recálculo ao fim da transação atual
+    (imediatamente, fora de transação). Vários registros na mesma transação
+    são recalculados juntos; os de uma transação desfeita são recalculados no
+    próximo commit, o que é inofensivo
+
+    Args:
+        tipo: Tipo do agregado
+        chaves: Pares (empresa_id, dia)
+    """
+    if not hasattr(_pendentes, 'chaves'):
+        _pendentes.chaves = defaultdict(set)
+    _pendentes.chaves[tipo].update(chaves)
+    transaction.on_commit(_processar_pendentes)
+
+
+def chave_nota(nota):
+    """Par (empresa, dia) da nota no agregado"""
+    return nota.empresa_id, getattr(nota, type(nota).objects.all().campo_data)
+
+
+def notas_gravadas(notas):
+    """
+    Registra notas gravadas sem save() (bulk_create/bulk_update)
+
+    Args:
+        notas: Notas do mesmo modelo
+    """
+    notas = list(notas)
+    tipo = tipo_do_modelo(type(notas[0])) if notas else None
+    if tipo:
+        registrar(tipo, {chave_nota(nota) for nota in notas})
+
+
+def _antes_de_salvar(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Guarda o par (empresa, dia) anterior da nota que pode mudar de dia ou de empresa"""
+    instance._chave_agregado_anterior = None
+    if raw or instance.pk is None:
+        return
+    campo_data = sender.objects.all().campo_data
+    if update_fields is not None and not {'empresa', 'empresa_id', campo_data} & set(update_fields):
+        return
+    instance._chave_agregado_anterior = sender.objects.filter(pk=instance.pk).values_list(
+        'empresa_id', campo_data
+    ).first()
+
+
+def _depois_de_salvar(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    chaves = {chave_nota(instance)}
+    anterior = getattr(instance, '_chave_agregado_anterior', None)
+    if anterior:
+        chaves.add(anterior)
+    registrar(tipo_do_modelo(sender), chaves)
+
+
+def _depois_de_excluir(sender, instance, **kwargs):
+    registrar(tipo_do_modelo(sender), {chave_nota(instance)})
+
+
+def conectar_sinais():
+    """Conecta os sinais dos modelos de nota (chamado em CoreConfig.ready)"""
+    for tipo, (rotulo, _) in TIPOS.items():
+        pre_save.connect(_antes_de_salvar, sender=rotulo, dispatch_uid=f'agregados_pre_save_{tipo}')
+        post_save.connect(_depois_de_salvar, sender=rotulo, dispatch_uid=f'agregados_post_save_{tipo}')
+        post_delete.connect(_depois_de_excluir, sender=rotulo, dispatch_uid=f'agregados_post_delete_{tipo}')
+
+
+def painel(empresa_contratante, hoje=None):
+    """
+    Totais do mês corrente das notas da contratante, lidos dos agregados
+
+    Args:
+        empresa_contratante: Empresa contratante do usuário
+        hoje: Último dia considerado (padrão: hoje)
+
+    Returns:
+        dict: inicio, fim e tipos (lista com tipo, nome, quantidade por status e
+              valor_total/valor_iss das notas emitidas)
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = date(hoje.year, hoje.month, 1)
+    linhas = AgregadoDiarioNotas.objects.filter(
+        empresa__empresa_contratante=empresa_contratante,
+        dia__range=(inicio, hoje)
+    ).values('tipo', 'status').annotate(
+        soma_quantidade=Sum('quantidade'), soma_valor_total=Sum('valor_total'), soma_valor_iss=Sum('valor_iss')
+    ).order_by()
+
+    nomes = dict(AgregadoDiarioNotas._meta.get_field('tipo').choices)
+    tipos = {
+        tipo: {
+            'tipo': tipo, 'nome': nomes[tipo], 'total': 0, 'status': {},
+            'valor_total': Decimal('0.00'), 'valor_iss': Decimal('0.00'),
+        }
+        for tipo in TIPOS
+    }
+    for linha in linhas:
+        resumo = tipos[linha['tipo']]
+        resumo['total'] += linha['soma_quantidade']
+        resumo['status'][linha['status']] = linha['soma_quantidade']
+        if linha['status'] == 'emitida':
+            resumo['valor_total'] = soma_em_centavos(linha['soma_valor_total'])
+            resumo['valor_iss'] = soma_em_centavos(linha['soma_valor_iss'])
+    return {'inicio': inicio, 'fim': hoje, 'tipos': list(tipos.values())}
@@ -0,0 +1,237 @@
+"""
+Gerador mínimo de PDF (texto, linhas e retângulos em páginas A4)
+Usa as fontes padrão Helvetica/Helvetica-Bold com WinAnsiEncoding, que cobrem
+os acentos do português, e comprime o conteúdo de cada página (FlateDecode).
+Não depende do Django: é importado pelos processos de renderização em paralelo
+"""
+import unicodedata
+import zlib
+
+# Tamanho A4 em pontos
+LARGURA_A4 = 595
+ALTURA_A4 = 842
+
+# Larguras (1/1000 do tamanho da fonte) dos caracteres 32-126 da Helvetica
+_LARGURAS_HELVETICA = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+
+
+def largura_texto(texto, tamanho, negrito=False):
+    """
+    Largura aproximada do texto em pontos
+
+    Caracteres acentuados usam a largura da letra base; a Helvetica-Bold é
+    aproximada pela regular acrescida de 5%.
+
+    Args:
+        texto: Texto
+        tamanho: Tamanho da fonte
+        negrito: Se True, considera a Helvetica-Bold
+
+    Returns:
+        float: Largura em pontos
+    """
+    total = 0
+    for caractere in texto:
+        codigo = ord(unicodedata.normalize('NFD', caractere)[0])
+        total += _LARGURAS_HELVETICA[codigo - 32] if 32 <= codigo <= 126 else 556
+    return total * tamanho / 1000 * (1.05 if negrito else 1)
+
+
+def quebrar_linhas(texto, largura, tamanho, negrito=False):
+    """
+    Quebra o texto em linhas que cabem na largura informada
+
+    Args:
+        texto: Texto (pode conter quebras de linha)
+        largura: Largura disponível em pontos
+        tamanho: Tamanho da fonte
+        negrito: Se True, considera a Helvetica-Bold
+
+    Returns:
+        list: Linhas
+    """
+    linhas = []
+    for paragrafo in (texto or '').splitlines() or ['']:
+        atual = ''
+        for palavra in paragrafo.split():
+            candidata = f'{atual} {palavra}' if atual else palavra
+            if atual and largura_texto(candidata, tamanho, negrito) > largura:
+                linhas.append(atual)
+                candidata = palavra
+            # Palavra maior que a linha: quebra por caracteres
+            while largura_texto(candidata, tamanho, negrito) > largura and len(candidata) > 1:
+                corte = len(candidata) - 1
+                while corte > 1 and largura_texto(candidata[:corte], tamanho, negrito) > largura:
+                    corte -= 1
+                linhas.append(candidata[:corte])
+                candidata = candidata[corte:]
+            atual = candidata
+        linhas.append(atual)
+    return linhas
+
+
+def _escapar(texto):
+    """Texto codificado em WinAnsi (cp1252) e escapado para uma string PDF"""
+    dados = str(texto).encode('cp1252', errors='replace')
+    return dados.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _numero(valor):
+    return ('%.2f' % valor).rstrip('0').rstrip('.')
+
+
+class DocumentoPDF:
+    """
+    Documento PDF montado por coordenadas (origem no canto superior esquerdo, em pontos)
+    """
+
+    def __init__(self, titulo=None):
+        """
+        Inicializa o documento com uma página em branco
+
+        Args:
+            titulo: Título gravado nas propriedades do PDF
+        """
+        self.titulo = titulo
+        self.paginas = []
+        self.nova_pagina()
+
+    def nova_pagina(self):
+        """Inicia uma nova página"""
+        self._conteudo = []
+        self.paginas.append(self._conteudo)
+
+    def texto(self, x, y, texto, tamanho=9, negrito=False, alinhamento='esquerda', largura=None):
+        """
+        Escreve uma linha de texto
+
+        Args:
+            x: Posição horizontal
+            y: Posição vertical da linha de base
+            texto: Texto
+            tamanho: Tamanho da fonte
+            negrito: Se True, usa Helvetica-Bold
+            alinhamento: 'esquerda', 'centro' ou 'direita' (dentro de largura)
+            largura: Largura da área de alinhamento (obrigatória para centro/direita)
+        """
+        texto = '' if texto is None else str(texto)
+        if alinhamento != 'esquerda' and largura:
+            sobra = largura - largura_texto(texto, tamanho, negrito)
+            x += sobra / 2 if alinhamento == 'centro' else sobra
+        fonte = b'/F2' if negrito else b'/F1'
+        self._conteudo.append(
+            b'BT %s %s Tf %s %s Td (%s) Tj ET' % (
+                fonte, _numero(tamanho).encode(), _numero(x).encode(),
+                _numero(ALTURA_A4 - y).encode(), _escapar(texto)
+            )
+        )
+
+    def paragrafo(self, x, y, largura, texto, tamanho=9, negrito=False, entrelinha=1.25, limite=None):
+        """
+        Escreve um texto com quebra automática de linhas
+
+        Args:
+            x: Posição horizontal
+            y: Posição vertical da primeira linha de base
+            largura: Largura disponível
+            texto: Texto
+            tamanho: Tamanho da fonte
+            negrito: Se True, usa Helvetica-Bold
+            entrelinha: Espaçamento entre linhas (proporção do tamanho)
+            limite: Posição vertical máxima; as linhas além dela são omitidas
+
+        Returns:
+            float: Posição vertical após a última linha escrita
+        """
+        for linha in quebrar_linhas(texto, largura, tamanho, negrito):
+            if limite is not None and y > limite:
+                break
+            self.texto(x, y, linha, tamanho, negrito)
+            y += tamanho * entrelinha
+        return y
+
+    def linha(self, x1, y1, x2, y2, espessura=0.5):
+        """Traça uma linha"""
+        self._conteudo.append(
+            b'%s w %s %s m %s %s l S' % (
+                _numero(espessura).encode(), _numero(x1).encode(), _numero(ALTURA_A4 - y1).encode(),
+                _numero(x2).encode(), _numero(ALTURA_A4 - y2).encode()
+            )
+        )
+
+    def retangulo(self, x, y, largura, altura, espessura=0.5, cinza=None):
+        """
+        Desenha um retângulo
+
+        Args:
+            x: Posição horizontal do canto superior esquerdo
+            y: Posição vertical do canto superior esquerdo
+            largura: Largura
+            altura: Altura
+            espessura: Espessura do contorno
+            cinza: Nível de cinza do preenchimento (0 preto a 1 branco); None sem preenchimento
+        """
+        caixa = b'%s %s %s %s re' % (
+            _numero(x).encode(), _numero(ALTURA_A4 - y - altura).encode(),
+            _numero(largura).encode(), _numero(altura).encode()
+        )
+        if cinza is not None:
+            self._conteudo.append(b'q %s g %s f Q' % (_numero(cinza).encode(), caixa))
+        self._conteudo.append(b'%s w %s S' % (_numero(espessura).encode(), caixa))
+
+    def gerar(self):
+        """
+        Serializa o documento
+
+        A saída depende apenas do conteúdo (sem data de criação), de modo que os
+        mesmos dados geram sempre os mesmos bytes.
+
+        Returns:
+            bytes: Arquivo PDF
+        """
+        objetos = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            None,  # Pages, preenchido após as páginas
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        ]
+        paginas = []
+        for conteudo in self.paginas:
+            fluxo = zlib.compress(b'\n'.join(conteudo))
+            objetos.append(
+                b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(fluxo), fluxo)
+            )
+            objetos.append(
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>' % (
+                    LARGURA_A4, ALTURA_A4, len(objetos)
+                )
+            )
+            paginas.append(b'%d 0 R' % len(objetos))
+        objetos[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(paginas), len(paginas))
+        if self.titulo:
+            objetos.append(b'<< /Title (%s) /Producer (DCOMP Web) >>' % _escapar(self.titulo))
+
+        saida = [b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n']
+        posicoes = []
+        tamanho = len(saida[0])
+        for numero, objeto in enumerate(objetos, start=1):
+            posicoes.append(tamanho)
+            bloco = b'%d 0 obj\n%s\nendobj\n' % (numero, objeto)
+            saida.append(bloco)
+            tamanho += len(bloco)
+
+        saida.append(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1))
+        saida.extend(b'%010d 00000 n \n' % posicao for posicao in posicoes)
+        info = b' /Info %d 0 R' % len(objetos) if self.titulo else b''
+        saida.append(
+            b'trailer\n<< /Size %d /Root 1 0 R%s >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, info, tamanho)
+        )
+        return b''.join(saida)
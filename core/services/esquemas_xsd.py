@@ -0,0 +1,234 @@
+"""
+Validação local dos XMLs pelos schemas XSD de layouts/
+Os XMLSchema compilados são reaproveitados no processo; os pedidos são validados
+antes do envio, de modo que um XML inválido é rejeitado sem ida à prefeitura
+"""
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from lxml import etree
+
+
+# Schema de cada documento enviado (caminhos relativos a BASE_DIR)
+ESQUEMAS = {
+    # NFS-e São Paulo (v01)
+    'PedidoEnvioRPS': os.path.join('layouts', 'nfse', 'PedidoEnvioRPS_v01.xsd'),
+    'PedidoEnvioLoteRPS': os.path.join('layouts', 'nfse', 'PedidoEnvioLoteRPS_v01.xsd'),
+    'PedidoCancelamentoNFe': os.path.join('layouts', 'nfse', 'PedidoCancelamentoNFe_v01.xsd'),
+    'PedidoConsultaNFe': os.path.join('layouts', 'nfse', 'PedidoConsultaNFe_v01.xsd'),
+    'PedidoConsultaNFePeriodo': os.path.join('layouts', 'nfse', 'PedidoConsultaNFePeriodo_v01.xsd'),
+    # NFS-e São Paulo - reforma tributária (v02)
+    'PedidoEnvioRPS_v02': os.path.join('layouts', 'schemas-reformatributaria-v02-2 (1)', 'PedidoEnvioRPS_v02.xsd'),
+    'PedidoEnvioLoteRPS_v02': os.path.join(
+        'layouts', 'schemas-reformatributaria-v02-2 (1)', 'PedidoEnvioLoteRPS_v02.xsd'
+    ),
+    # NFTS São Paulo
+    'PedidoEnvioNFTS': os.path.join('layouts', 'nfts', 'PedidoEnvioNFTS_v01.xsd'),
+    'PedidoEnvioLoteNFTS': os.path.join('layouts', 'nfts', 'PedidoEnvioLoteNFTS_v01.xsd'),
+    'PedidoCancelamentoNFTS': os.path.join('layouts', 'nfts', 'PedidoCancelamentoNFTS_v01.xsd'),
+    # NFS-e Nacional
+    'DPS': os.path.join('layouts', 'nfse_nacional', 'DPS_v1.00.xsd'),
+    'pedRegEvento': os.path.join('layouts', 'nfse_nacional', 'pedRegEvento_v1.00.xsd'),
+}
+
+# Namespace da assinatura XML (ds:Signature)
+NS_ASSINATURA = 'http://www.w3.org/2000/09/xmldsig#'
+
+# Pastas onde são procurados os schemas importados com caminho inexistente
+# (ex.: os XSDs da NFTS importam "..\1\xmldsig-core-schema_v01.xsd")
+PASTAS_IMPORTACAO = [
+    os.path.join('layouts', 'nfse'),
+    os.path.join('layouts', 'nfts'),
+    os.path.join('layouts', 'nfse_nacional'),
+]
+
+
+class ErroValidacaoXML(ValueError):
+    """
+    XML não conforme ao schema
+
+    Attributes:
+        esquema: Nome do schema (chave de ESQUEMAS)
+        erros: Lista de dicts com caminho, campo, mensagem e linha de cada erro
+    """
+
+    def __init__(self, esquema, erros):
+        self.esquema = esquema
+        self.erros = erros
+        super().__init__('\n'.join(f"{erro['caminho']}: {erro['mensagem']}" for erro in erros))
+
+
+def _localizar_importacao(pasta, local):
+    """
+    Corrige o schemaLocation de um XSD de layouts/ que aponta para arquivo inexistente
+
+    Args:
+        pasta: Pasta do XSD que faz a importação
+        local: Valor de schemaLocation
+
+    Returns:
+        str: schemaLocation original, ou o caminho relativo do arquivo encontrado
+             em PASTAS_IMPORTACAO
+    """
+    if os.path.exists(os.path.join(pasta, local)):
+        return local
+
+    nome = re.split(r'[\\/]', local)[-1]
+    for pasta_importacao in PASTAS_IMPORTACAO:
+        caminho = os.path.join(settings.BASE_DIR, pasta_importacao, nome)
+        if os.path.exists(caminho):
+            return os.path.relpath(caminho, pasta).replace(os.sep, '/')
+    return local
+
+
+def _ler_xsd(caminho):
+    """Conteúdo do XSD com os schemaLocation apontando para arquivos existentes"""
+    pasta = os.path.dirname(caminho)
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read().decode('utf-8-sig')
+    return re.sub(
+        r'schemaLocation="([^"]+)"',
+        lambda m: 'schemaLocation="%s"' % _localizar_importacao(pasta, m.group(1)),
+        conteudo,
+    ).encode('utf-8')
+
+
+class _ResolvedorLayouts(etree.Resolver):
+    """Carrega os schemas importados já com os schemaLocation corrigidos"""
+
+    def resolve(self, url, public_id, context):
+        caminho = url.replace('file://', '', 1) if url else url
+        if caminho and caminho.endswith('.xsd') and os.path.exists(caminho):
+            return self.resolve_string(_ler_xsd(caminho), context, base_url=caminho)
+        return None
+
+
+def _caminho_erro(caminho):
+    """Remove os prefixos de namespace do caminho XPath do erro"""
+    return re.sub(r'(^|/)[\w.-]+:', r'\1', caminho or '').lstrip('/')
+
+
+class RegistroEsquemas:
+    """
+    Schemas XSD compilados, reaproveitados por todo o processo
+
+    Um XMLSchema não pode validar em duas threads ao mesmo tempo (o error_log é
+    do schema); em vez de um lock global, cada schema tem uma reserva de
+    instâncias compiladas e cada validação usa uma instância livre, compilando
+    outra quando todas estão em uso.
+    """
+
+    def __init__(self):
+        self._livres = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return getattr(settings, 'NFE_VALIDAR_XSD', True)
+
+    @staticmethod
+    def compilar(nome):
+        """
+        Compila o schema
+
+        Args:
+            nome: Chave de ESQUEMAS
+
+        Returns:
+            etree.XMLSchema: Schema compilado
+        """
+        caminho = os.path.join(settings.BASE_DIR, ESQUEMAS[nome])
+        parser = etree.XMLParser()
+        parser.resolvers.add(_ResolvedorLayouts())
+        documento = etree.fromstring(_ler_xsd(caminho), parser, base_url=caminho).getroottree()
+        return etree.XMLSchema(documento)
+
+    @contextmanager
+    def usar(self, nome):
+        """
+        Empresta uma instância do schema, de uso exclusivo até o fim do bloco
+
+        Args:
+            nome: Chave de ESQUEMAS
+
+        Yields:
+            etree.XMLSchema: Schema compilado
+        """
+        with self._lock:
+            livres = self._livres.setdefault(nome, [])
+            esquema = livres.pop() if livres else None
+        if esquema is None:
+            esquema = self.compilar(nome)
+        try:
+            yield esquema
+        finally:
+            with self._lock:
+                self._livres[nome].append(esquema)
+
+    def erros(self, nome, xml, ignorar_assinatura=True):
+        """
+        Valida o XML e retorna os erros encontrados
+
+        Args:
+            nome: Chave de ESQUEMAS
+            xml: XML (str, bytes ou elemento lxml)
+            ignorar_assinatura: Se True, desconsidera os erros dentro de ds:Signature
+                                (template ainda não preenchido pela assinatura)
+
+        Returns:
+            list: Dicts com caminho, campo, mensagem e linha de cada erro
+        """
+        if isinstance(xml, str):
+            xml = xml.encode('utf-8')
+        documento = etree.fromstring(xml) if isinstance(xml, bytes) else xml
+
+        # O error_log pertence à instância: validação e leitura do log com a mesma instância emprestada
+        with self.usar(nome) as esquema:
+            valido = esquema.validate(documento)
+            log = list(esquema.error_log)
+        if valido:
+            return []
+
+        erros = []
+        for entrada in log:
+            caminho = _caminho_erro(entrada.path)
+            if ignorar_assinatura and (
+                re.search(r'(^|/)Signature(\[\d+\])?(/|$)', caminho)
+                or entrada.message.startswith("Element '{%s}" % NS_ASSINATURA)
+            ):
+                continue
+            # Elementos no namespace padrão aparecem como * no caminho: o nome vem da mensagem
+            elemento = re.match(r"Element '(?:\{[^}]*\})?([^']+)'", entrada.message)
+            campo = elemento.group(1) if elemento else re.sub(r'\[\d+\]$', '', caminho.rsplit('/', 1)[-1])
+            erros.append({
+                'caminho': campo if '*' in caminho else caminho,
+                'campo': campo,
+                'mensagem': re.sub(r'\{[^}]*\}', '', entrada.message),
+                'linha': entrada.line,
+            })
+        return erros
+
+    def validar(self, nome, xml, ignorar_assinatura=True):
+        """
+        Valida o XML antes do envio
+
+        Args:
+            nome: Chave de ESQUEMAS
+            xml: XML (str, bytes ou elemento lxml)
+            ignorar_assinatura: Se True, desconsidera os erros dentro de ds:Signature
+
+        Raises:
+            ErroValidacaoXML: Se o XML não estiver conforme o schema
+        """
+        if not self.ativo:
+            return
+        erros = self.erros(nome, xml, ignorar_assinatura)
+        if erros:
+            raise ErroValidacaoXML(nome, erros)
+
+
+# Instância única por processo
+registro_esquemas = RegistroEsquemas()
@@ -0,0 +1,223 @@
+"""
+Fila de emissão em segundo plano
+As tarefas ficam na tabela TarefaEmissao e são processadas pelo comando
+processar_emissoes, sem necessidade de broker externo
+"""
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import TarefaEmissao
+
+logger = logging.getLogger(__name__)
+
+
+# Emissor responsável por cada tipo de tarefa (classe com emitir(notas_ids, progresso))
+EMISSORES = {
+    'nfse_sp': 'nfs_sp.services.emissao_lote.EmissorLoteRPS',
+    'nfts_sp': 'nfs_sp.services.emissao_nfts.EmissorNFTS',
+    'nfse_nacional': 'nfse_nacional.services.emissao_nacional.EmissorNFSeNacional',
+}
+
+
+def emissao_assincrona():
+    """Indica se as emissões devem ser enfileiradas (settings.EMISSAO_ASSINCRONA)"""
+    return getattr(settings, 'EMISSAO_ASSINCRONA', True)
+
+
+def obter_emissor(tipo, parametros=None):
+    """
+    Instancia o emissor do tipo de tarefa
+
+    Args:
+        tipo: Tipo da tarefa (ver EMISSORES)
+        parametros: Argumentos repassados ao construtor do emissor
+
+    Returns:
+        object: Emissor com o método emitir(notas_ids, progresso=None)
+    """
+    modulo, classe = EMISSORES[tipo].rsplit('.', 1)
+    return getattr(import_module(modulo), classe)(**(parametros or {}))
+
+
+def enfileirar(tipo, notas_ids, usuario=None, parametros=None):
+    """
+    Cria uma tarefa de emissão pendente
+
+    Args:
+        tipo: Tipo da tarefa (ver EMISSORES)
+        notas_ids: IDs das notas selecionadas
+        usuario: Usuário que solicitou a emissão
+        parametros: Argumentos do emissor (ex.: {'teste': True})
+
+    Returns:
+        TarefaEmissao: Tarefa criada
+    """
+    if tipo not in EMISSORES:
+        raise ValueError(f"Tipo de tarefa inválido: {tipo}")
+
+    return TarefaEmissao.objects.create(
+        tipo=tipo,
+        usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+        notas_ids=[str(nota_id) for nota_id in notas_ids],
+        parametros=parametros or {},
+        total=len(notas_ids),
+    )
+
+
+def resposta_enfileirada(tarefa):
+    """
+    Resposta imediata da view ao enfileirar uma tarefa
+
+    Args:
+        tarefa: TarefaEmissao criada
+
+    Returns:
+        dict: Dados para o acompanhamento do progresso no navegador
+    """
+    return {
+        'sucesso': True,
+        'tarefa_id': tarefa.id,
+        'url_status': reverse('core:status_tarefa', args=[tarefa.id]),
+        'total': tarefa.total,
+        'mensagem': f'Emissão de {tarefa.total} nota(s) enviada para processamento.',
+    }
+
+
+def resposta_status(tarefa):
+    """
+    Estado atual da tarefa, no mesmo formato da resposta de emissão
+
+    Args:
+        tarefa: TarefaEmissao
+
+    Returns:
+        dict: sucesso, mensagem, emitidas, erros, total, resultados e progresso
+    """
+    return {
+        'tarefa_id': tarefa.id,
+        'status': tarefa.status,
+        'concluida': tarefa.concluida,
+        'processadas': tarefa.processadas,
+        'sucesso': tarefa.emitidas > 0,
+        'mensagem': tarefa.mensagem or '',
+        'emitidas': tarefa.emitidas,
+        'erros': tarefa.erros,
+        'total': tarefa.total,
+        'resultados': tarefa.resultados,
+    }
+
+
+def identificacao_worker():
+    """Identificação do processo worker (host:pid)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def reservar_tarefa(worker):
+    """
+    Reserva a tarefa pendente mais antiga para o worker
+
+    A reserva é feita com UPDATE condicional (status='pendente'), de modo que
+    dois workers nunca processem a mesma tarefa.
+
+    Args:
+        worker: Identificação do worker
+
+    Returns:
+        TarefaEmissao ou None: Tarefa reservada
+    """
+    candidatas = TarefaEmissao.objects.filter(status='pendente').order_by('data_criacao', 'id')
+    for tarefa_id in candidatas.values_list('id', flat=True)[:10]:
+        agora = timezone.now()
+        reservada = TarefaEmissao.objects.filter(id=tarefa_id, status='pendente').update(
+            status='processando',
+            worker=worker,
+            data_inicio=agora,
+            data_sinal=agora,
+        )
+        if reservada:
+            return TarefaEmissao.objects.get(id=tarefa_id)
+    return None
+
+
+def processar_tarefa(tarefa, intervalo_progresso=1.0):
+    """
+    Executa a emissão da tarefa, gravando o progresso parcial
+
+    Cada gravação de progresso atualiza data_sinal, o sinal de vida usado por
+    recuperar_tarefas_interrompidas.
+
+    Args:
+        tarefa: TarefaEmissao reservada
+        intervalo_progresso: Intervalo mínimo (segundos) entre gravações de progresso
+    """
+    ultima_gravacao = [0.0]
+
+    def progresso(resultados):
+        agora = time.monotonic()
+        if agora - ultima_gravacao[0] < intervalo_progresso:
+            return
+        ultima_gravacao[0] = agora
+        emitidas = sum(1 for r in resultados if r.get('sucesso'))
+        TarefaEmissao.objects.filter(id=tarefa.id).update(
+            processadas=len(resultados),
+            emitidas=emitidas,
+            erros=len(resultados) - emitidas,
+            resultados=resultados,
+            data_sinal=timezone.now(),
+        )
+
+    try:
+        emissor = obter_emissor(tarefa.tipo, tarefa.parametros)
+        resposta = emissor.emitir(tarefa.notas_ids, progresso=progresso)
+    except Exception as e:
+        logger.exception(f"Erro ao processar tarefa de emissão {tarefa.id}")
+        TarefaEmissao.objects.filter(id=tarefa.id).update(
+            status='erro',
+            mensagem=f'❌ Erro no processamento da emissão:\n\n{str(e)}',
+            data_conclusao=timezone.now(),
+        )
+        return
+
+    TarefaEmissao.objects.filter(id=tarefa.id).update(
+        status='concluida',
+        processadas=len(resposta['resultados']),
+        emitidas=resposta['emitidas'],
+        erros=resposta['erros'],
+        resultados=resposta['resultados'],
+        mensagem=resposta['mensagem'],
+        data_conclusao=timezone.now(),
+    )
+
+
+def recuperar_tarefas_interrompidas(minutos):
+    """
+    Encerra tarefas presas em processamento (worker finalizado no meio da emissão)
+
+    Uma tarefa é considerada interrompida quando o worker deixa de gravar
+    progresso (data_sinal), e não pela duração total: lotes grandes em andamento
+    continuam enviando sinal. As tarefas não são reenfileiradas automaticamente,
+    pois parte das notas pode já ter sido transmitida; as notas restantes seguem
+    pendentes para nova emissão.
+
+    Args:
+        minutos: Tempo máximo sem sinal do worker antes de considerar a tarefa interrompida
+
+    Returns:
+        int: Quantidade de tarefas encerradas
+    """
+    limite = timezone.now() - timedelta(minutes=minutos)
+    sem_sinal = Q(data_sinal__lt=limite) | Q(data_sinal__isnull=True, data_inicio__lt=limite)
+    return TarefaEmissao.objects.filter(sem_sinal, status='processando').update(
+        status='erro',
+        mensagem='❌ Processamento interrompido. Verifique o status das notas e emita novamente as pendentes.',
+        data_conclusao=timezone.now(),
+    )
@@ -0,0 +1,212 @@
+"""
+Geração dos PDFs das notas com cache por conteúdo e download em ZIP
+Cada PDF é gravado em MEDIA_ROOT/pdfs/ com o nome dado pelo hash dos dados
+desenhados (e da versão do layout): uma nota inalterada nunca é redesenhada e
+notas alteradas (ex.: canceladas) geram um novo arquivo. Os PDFs ausentes são
+desenhados em um pool de processos e o ZIP é enviado em fluxo, arquivo por arquivo
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+from .pdf_notas import VERSAO_LAYOUT, renderizar_nota
+from .pool_processos import PoolProcessos, quantidade_processos
+
+# Pasta do cache, relativa a MEDIA_ROOT
+PASTA_PDFS = 'pdfs'
+
+# Bytes lidos de cada PDF por vez ao montar o ZIP
+TAMANHO_BLOCO_ZIP = 64 * 1024
+
+
+def caminho_pdf(dados):
+    """
+    Caminho do PDF no cache, derivado dos dados da nota
+
+    Args:
+        dados: Dados de renderizar_nota
+
+    Returns:
+        str: Caminho relativo a MEDIA_ROOT (valor gravado em arquivo_pdf)
+    """
+    conteudo = json.dumps([VERSAO_LAYOUT, dados], sort_keys=True, ensure_ascii=False, default=str)
+    chave = hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+    return f'{PASTA_PDFS}/{chave[:2]}/{chave}.pdf'
+
+
+def caminho_absoluto(relativo):
+    return os.path.join(settings.MEDIA_ROOT, *relativo.split('/'))
+
+
+def gravar_pdf(relativo, conteudo):
+    """
+    Grava o PDF no cache (escrita atômica: outro processo nunca lê um arquivo pela metade)
+
+    Args:
+        relativo: Caminho de caminho_pdf
+        conteudo: Bytes do PDF
+    """
+    destino = caminho_absoluto(relativo)
+    pasta = os.path.dirname(destino)
+    os.makedirs(pasta, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, destino)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+class GeradorPDFs:
+    """
+    Garante o PDF de cada nota no cache e atualiza arquivo_pdf
+    """
+
+    def __init__(self, processos=None):
+        """
+        Inicializa o gerador
+
+        Args:
+            processos: Processos de renderização. Se None, usa settings.PDF_PROCESSOS
+                       (padrão: núcleos da máquina)
+        """
+        if processos is None:
+            processos = quantidade_processos(getattr(settings, 'PDF_PROCESSOS', None))
+        self.processos = processos
+        self.minimo_paralelo = getattr(settings, 'PDF_PARALELO_MINIMO', 100)
+
+    def renderizar(self, dados):
+        """
+        Desenha os PDFs, em paralelo a partir de settings.PDF_PARALELO_MINIMO notas
+
+        Args:
+            dados: Lista de dados de renderizar_nota
+
+        Returns:
+            iterator: Bytes de cada PDF, na mesma ordem
+        """
+        processos = self.processos if len(dados) >= self.minimo_paralelo else 1
+        with PoolProcessos(processos, 'renderização de PDFs') as pool:
+            tamanho = max(1, len(dados) // (processos * 4))
+            yield from pool.mapear(renderizar_nota, dados, chunksize=tamanho)
+
+    def gerar(self, notas, extrair_dados, nome_arquivo):
+        """
+        Garante o PDF de cada nota
+
+        Args:
+            notas: Notas (NotaFiscalSP, NotaFiscalTomadorSP ou NotaFiscalNacional, do mesmo modelo)
+            extrair_dados: Função que monta os dados da nota (pdf_notas.dados_*)
+            nome_arquivo: Função que retorna o nome do PDF da nota no ZIP
+
+        Returns:
+            list: Tuplas (nome no ZIP, caminho absoluto do PDF), na ordem das notas
+        """
+        arquivos = []
+        alteradas = []
+        pendentes = {}
+        for nota in notas:
+            dados = extrair_dados(nota)
+            relativo = caminho_pdf(dados)
+            # Notas com os mesmos dados compartilham o arquivo: desenhado uma única vez
+            if relativo not in pendentes and not os.path.exists(caminho_absoluto(relativo)):
+                pendentes[relativo] = dados
+            if nota.arquivo_pdf != relativo:
+                nota.arquivo_pdf = relativo
+                alteradas.append(nota)
+            arquivos.append((nome_arquivo(nota), caminho_absoluto(relativo)))
+
+        if pendentes:
+            conteudos = self.renderizar(list(pendentes.values()))
+            for relativo, conteudo in zip(list(pendentes), conteudos):
+                gravar_pdf(relativo, conteudo)
+
+        if alteradas:
+            type(alteradas[0]).objects.bulk_update(alteradas, ['arquivo_pdf'], batch_size=500)
+        return arquivos
+
+
+class _SaidaZip:
+    """Destino do ZipFile que acumula os bytes escritos até serem enviados"""
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def zip_em_fluxo(arquivos):
+    """
+    Monta um ZIP em fluxo, sem manter o arquivo inteiro em memória
+
+    Args:
+        arquivos: Tuplas (nome no ZIP, caminho do arquivo); nomes repetidos
+                  recebem um sufixo numérico
+
+    Yields:
+        bytes: Partes do ZIP (para StreamingHttpResponse)
+    """
+    saida = _SaidaZip()
+    nomes = set()
+    # Os PDFs já são comprimidos: compressão mínima, só para que cada entrada
+    # tenha fim delimitado (o tamanho vai no descritor de dados, após o conteúdo)
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as arquivo_zip:
+        for nome, caminho in arquivos:
+            base, extensao = os.path.splitext(nome)
+            contador = 1
+            while nome in nomes:
+                contador += 1
+                nome = f'{base}_{contador}{extensao}'
+            nomes.add(nome)
+
+            with open(caminho, 'rb') as origem, arquivo_zip.open(nome, 'w') as destino:
+                for bloco in iter(lambda: origem.read(TAMANHO_BLOCO_ZIP), b''):
+                    destino.write(bloco)
+                    yield saida.esvaziar()
+            # Descritor de dados do arquivo (o ZIP não é reposicionado para trás)
+            yield saida.esvaziar()
+    # Diretório central
+    yield saida.esvaziar()
+
+
+def resposta_pdfs(arquivos, nome_zip):
+    """
+    Resposta de download dos PDFs: o próprio PDF se for um só, senão um ZIP em fluxo
+
+    Args:
+        arquivos: Tuplas (nome, caminho absoluto) de GeradorPDFs.gerar
+        nome_zip: Nome do ZIP (sem extensão)
+
+    Returns:
+        HttpResponse: FileResponse ou StreamingHttpResponse
+    """
+    if len(arquivos) == 1:
+        nome, caminho = arquivos[0]
+        return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=nome, content_type='application/pdf')
+
+    response = StreamingHttpResponse(zip_em_fluxo(arquivos), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{nome_zip}.zip"'
+    return response
@@ -0,0 +1,122 @@
+"""
+Importação de planilhas Excel em lotes
+Lê a planilha em modo streaming (read_only) e grava as notas com bulk_create,
+um lote por transação, mantendo a lista de erros por linha
+"""
+import copy
+import logging
+
+import openpyxl
+from django.db import transaction
+
+from .agregados_notas import notas_gravadas
+
+logger = logging.getLogger(__name__)
+
+
+class ImportadorPlanilha:
+    """
+    Importa as linhas de uma planilha para um modelo de nota fiscal
+    """
+
+    TAMANHO_LOTE = 1000
+
+    def __init__(self, modelo, montar_nota, antes_de_gravar=None, tamanho_lote=None):
+        """
+        Inicializa o importador
+
+        Args:
+            modelo: Classe do modelo (ex.: NotaFiscalSP)
+            montar_nota: Função que recebe a linha (tupla de valores) e retorna a
+                         instância não salva; exceções viram erro da linha
+            antes_de_gravar: Função opcional chamada com a lista de notas do lote
+                             antes da gravação, na mesma transação (ex.: numeração
+                             de RPS)
+            tamanho_lote: Quantidade de linhas por lote/transação
+        """
+        self.modelo = modelo
+        self.montar_nota = montar_nota
+        self.antes_de_gravar = antes_de_gravar
+        self.tamanho_lote = tamanho_lote or self.TAMANHO_LOTE
+        self.importadas = 0
+        self.erros = []
+
+    def importar(self, arquivo):
+        """
+        Importa a planilha (a primeira linha é o cabeçalho)
+
+        Args:
+            arquivo: Arquivo enviado (.xlsx)
+
+        Returns:
+            tuple: (quantidade importada, lista de erros "Linha N: ...")
+        """
+        wb = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            lote = []
+
+            # Pular cabeçalho (linha 1)
+            for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+                # Validar se linha não está vazia
+                if not any(row):
+                    continue
+
+                try:
+                    lote.append((row_num, self.montar_nota(row)))
+                except Exception as e:
+                    self.erros.append(f"Linha {row_num}: {str(e)}")
+                    continue
+
+                if len(lote) >= self.tamanho_lote:
+                    self.gravar_lote(lote)
+                    lote = []
+
+            if lote:
+                self.gravar_lote(lote)
+        finally:
+            wb.close()
+
+        return self.importadas, self.erros
+
+    def gravar_lote(self, lote):
+        """
+        Grava um lote com bulk_create; se falhar, grava linha a linha para
+        identificar as linhas com erro
+
+        Args:
+            lote: Lista de tuplas (número da linha, nota não salva)
+        """
+        notas = [nota for _, nota in lote]
+
+        # bulk_create não chama save(): preencher os campos calculados pelo modelo
+        if hasattr(self.modelo, 'preencher_campos_calculados'):
+            for nota in notas:
+                nota.preencher_campos_calculados()
+
+        # Cópias das notas antes de antes_de_gravar: se o lote for rejeitado, a
+        # transação desfaz o que o hook reservou (ex.: números de RPS) e cada
+        # linha é preparada de novo na sua própria transação
+        originais = [copy.copy(nota) for nota in notas]
+
+        try:
+            with transaction.atomic():
+                if self.antes_de_gravar:
+                    self.antes_de_gravar(notas)
+                self.modelo.objects.bulk_create(notas)
+                # bulk_create não dispara sinais: atualizar os agregados do painel
+                notas_gravadas(notas)
+            self.importadas += len(notas)
+            return
+        except Exception as e:
+            logger.warning(f"Lote de {len(notas)} linha(s) rejeitado, gravando linha a linha: {e}")
+
+        for (row_num, _), nota in zip(lote, originais):
+            try:
+                with transaction.atomic():
+                    if self.antes_de_gravar:
+                        self.antes_de_gravar([nota])
+                    nota.save()
+                self.importadas += 1
+            except Exception as e:
+                self.erros.append(f"Linha {row_num}: {str(e)}")
@@ -0,0 +1,102 @@
+"""
+Paginação por chave (keyset) das listagens de notas
+As páginas são ordenadas por (-data_importacao, -id) e a próxima página começa
+logo após a última linha exibida, sem OFFSET
+"""
+import base64
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+
+ORDENACAO = ('-data_importacao', '-id')
+
+
+def tamanho_pagina():
+    """Quantidade de notas por página (settings.NOTAS_POR_PAGINA)"""
+    return getattr(settings, 'NOTAS_POR_PAGINA', 100)
+
+
+def codificar_cursor(nota):
+    """
+    Gera o cursor da posição após a nota informada
+
+    Args:
+        nota: Última nota exibida
+
+    Returns:
+        str: Cursor opaco (base64)
+    """
+    valor = f"{nota.data_importacao.isoformat()}|{nota.id}"
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """
+    Lê o cursor gerado por codificar_cursor
+
+    Args:
+        cursor: Cursor recebido do navegador
+
+    Returns:
+        tuple: (data_importacao, id) ou None se o cursor for inválido
+    """
+    try:
+        data, nota_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(data), int(nota_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def paginar(queryset, cursor=None, tamanho=None):
+    """
+    Retorna uma página da listagem
+
+    Args:
+        queryset: Notas já filtradas
+        cursor: Cursor da página anterior (None para a primeira página)
+        tamanho: Quantidade de notas por página
+
+    Returns:
+        tuple: (lista de notas, cursor da próxima página ou None, tem_mais)
+    """
+    tamanho = tamanho or tamanho_pagina()
+    queryset = queryset.order_by(*ORDENACAO)
+
+    posicao = decodificar_cursor(cursor) if cursor else None
+    if posicao:
+        data_importacao, nota_id = posicao
+        queryset = queryset.filter(
+            Q(data_importacao__lt=data_importacao) |
+            Q(data_importacao=data_importacao, id__lt=nota_id)
+        )
+
+    notas = list(queryset[:tamanho + 1])
+    tem_mais = len(notas) > tamanho
+    notas = notas[:tamanho]
+    proximo_cursor = codificar_cursor(notas[-1]) if tem_mais else None
+    return notas, proximo_cursor, tem_mais
+
+
+def contar(queryset, timeout=60):
+    """
+    Conta as notas da listagem, guardando o resultado em cache por alguns segundos
+
+    Args:
+        queryset: Notas já filtradas
+        timeout: Tempo (segundos) de cache da contagem
+
+    Returns:
+        int: Quantidade de notas
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    chave = 'contagem_notas:' + hashlib.md5(f"{sql}{params}".encode()).hexdigest()
+
+    total = cache.get(chave)
+    if total is None:
+        total = queryset.count()
+        cache.set(chave, total, timeout)
+    return total
@@ -0,0 +1,325 @@
+"""
+Layout do PDF das notas (NFS-e SP, NFTS e DANFSe da NFS-e Nacional)
+Os dados de cada nota são extraídos em um dicionário de textos já formatados
+(dados_nfse_sp, dados_nfts_sp, dados_danfse) e desenhados por renderizar_nota,
+que não depende do Django e pode rodar em outro processo
+"""
+from .documento_pdf import ALTURA_A4, LARGURA_A4, DocumentoPDF, quebrar_linhas
+
+# Versão do layout: faz parte da chave do cache, alterar ao mudar o desenho
+VERSAO_LAYOUT = 1
+
+MARGEM = 30
+LARGURA_UTIL = LARGURA_A4 - 2 * MARGEM
+LIMITE_PAGINA = ALTURA_A4 - MARGEM
+
+
+def _moeda(valor):
+    """Valor no formato R$ 1.234,56"""
+    if valor is None:
+        valor = 0
+    return 'R$ ' + f'{valor:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def _percentual(valor):
+    return f'{valor or 0:.2f}%'.replace('.', ',')
+
+
+def _data(valor, formato='%d/%m/%Y'):
+    return valor.strftime(formato) if valor else ''
+
+
+def _documento(numero):
+    """CPF/CNPJ formatado (apenas dígitos de entrada)"""
+    digitos = ''.join(c for c in (numero or '') if c.isdigit())
+    if len(digitos) == 14:
+        return f'{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}'
+    if len(digitos) == 11:
+        return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+    return numero or ''
+
+
+def _endereco(*partes):
+    return ', '.join(str(parte) for parte in partes if parte)
+
+
+def _prestador_empresa(empresa):
+    """Campos da empresa emissora"""
+    if empresa is None:
+        return []
+    return [
+        ('Razão Social', empresa.razao_social),
+        ('CPF/CNPJ', _documento(empresa.cnpj)),
+        ('Inscrição Municipal', empresa.inscricao_municipal or ''),
+        ('Endereço', _endereco(empresa.logradouro, empresa.numero, empresa.complemento, empresa.bairro)),
+        ('Município', _endereco(empresa.cidade, empresa.uf)),
+        ('CEP', empresa.cep or ''),
+    ]
+
+
+def _retencoes(nota):
+    return [
+        ('PIS', _moeda(nota.pis_retido)),
+        ('COFINS', _moeda(nota.cofins_retido)),
+        ('IRRF', _moeda(nota.irrf_retido)),
+        ('CSLL', _moeda(nota.csll_retido)),
+        ('INSS', _moeda(nota.inss_retido)),
+    ]
+
+
+def dados_nfse_sp(nota):
+    """
+    Dados do PDF de uma NFS-e de São Paulo
+
+    Args:
+        nota: NotaFiscalSP emitida (com empresa carregada)
+
+    Returns:
+        dict: Dados de renderizar_nota
+    """
+    return {
+        'titulo': 'NOTA FISCAL ELETRÔNICA DE SERVIÇOS - NFS-e',
+        'subtitulo': 'PREFEITURA DO MUNICÍPIO DE SÃO PAULO - SECRETARIA MUNICIPAL DA FAZENDA',
+        'cabecalho': [
+            ('Número da Nota', nota.numero_nfse or ''),
+            ('Data e Hora de Emissão', _data(nota.data_emissao_nfse, '%d/%m/%Y %H:%M:%S')),
+            ('Código de Verificação', nota.codigo_verificacao or ''),
+        ],
+        'situacao': 'NOTA CANCELADA' if nota.status_rps == 'cancelada' else '',
+        'secoes': [
+            ('PRESTADOR DE SERVIÇOS', _prestador_empresa(nota.empresa)),
+            ('TOMADOR DE SERVIÇOS', [
+                ('Nome/Razão Social', nota.nome_tomador),
+                ('CPF/CNPJ', _documento(nota.cnpj_cpf_tomador)),
+                ('Endereço', _endereco(nota.logradouro_tomador, nota.numero_tomador, nota.bairro_tomador)),
+                ('Município', _endereco(nota.cidade_tomador, nota.uf_tomador)),
+                ('CEP', nota.cep_tomador or ''),
+                ('E-mail', nota.email_tomador or ''),
+            ]),
+        ],
+        'discriminacao': nota.descricao,
+        'valores': [
+            ('Valor Total do Serviço', _moeda(nota.valor_total)),
+            ('Deduções', _moeda(nota.deducoes)),
+            ('Base de Cálculo', _moeda(nota.valor_total - nota.deducoes)),
+            ('Alíquota', _percentual(nota.aliquota)),
+            ('Valor do ISS', _moeda(nota.valor_iss)),
+            ('ISS Retido', 'Sim' if nota.iss_retido else 'Não'),
+        ] + _retencoes(nota) + [
+            ('Valor Líquido', _moeda(nota.valor_liquido)),
+        ],
+        'rodape': [
+            ('Código do Serviço', nota.cod_servico),
+            ('Tributação', nota.get_tipo_tributacao_display()),
+            ('RPS', f'{nota.serie_rps or ""} {nota.numero_rps or ""} - {_data(nota.data_emissao)}'.strip(' -')),
+            ('Consulta', nota.link_nfse or ''),
+        ],
+    }
+
+
+def dados_nfts_sp(nota):
+    """
+    Dados do PDF de uma NFTS de São Paulo
+
+    Args:
+        nota: NotaFiscalTomadorSP emitida (com empresa carregada)
+
+    Returns:
+        dict: Dados de renderizar_nota
+    """
+    return {
+        'titulo': 'NOTA FISCAL ELETRÔNICA DO TOMADOR/INTERMEDIÁRIO DE SERVIÇOS - NFTS',
+        'subtitulo': 'PREFEITURA DO MUNICÍPIO DE SÃO PAULO - SECRETARIA MUNICIPAL DA FAZENDA',
+        'cabecalho': [
+            ('Número da NFTS', nota.nfts or ''),
+            ('Data e Hora de Emissão', _data(nota.data_emissao_nfts, '%d/%m/%Y %H:%M:%S')),
+            ('Protocolo', nota.protocolo or ''),
+        ],
+        'situacao': 'NFTS CANCELADA' if nota.status_nfts == 'cancelada' else '',
+        'secoes': [
+            ('TOMADOR DE SERVIÇOS', _prestador_empresa(nota.empresa) or [
+                ('CPF/CNPJ', _documento(nota.cnpj_tomador)),
+                ('Inscrição Municipal', nota.inscricao_municipal),
+            ]),
+            ('PRESTADOR DE SERVIÇOS', [
+                ('CPF/CNPJ', _documento(nota.cnpj_cpf_prestador)),
+                ('Município', _endereco(nota.cidade, nota.estado)),
+                ('CEP', nota.cep or ''),
+                ('Regime de Tributação', nota.get_regime_tributacao_display()),
+            ]),
+        ],
+        'discriminacao': nota.descricao,
+        'valores': [
+            ('Valor Total do Serviço', _moeda(nota.valor_total)),
+            ('Deduções', _moeda(nota.deducoes)),
+            ('Base de Cálculo', _moeda(nota.valor_total - nota.deducoes)),
+            ('Alíquota', _percentual(nota.aliquota)),
+            ('Valor do ISS', _moeda(nota.valor_iss)),
+            ('ISS Retido', 'Sim' if nota.iss_retido else 'Não'),
+        ],
+        'rodape': [
+            ('Código do Serviço', nota.cod_servico),
+            ('Tributação', nota.get_tipo_tributacao_display()),
+            ('Documento', _endereco(
+                nota.get_tipo_documento_display(), nota.serie, nota.numero_documento
+            )),
+            ('Data da Prestação', _data(nota.data_prestacao_servico)),
+        ],
+    }
+
+
+def dados_danfse(nota):
+    """
+    Dados do DANFSe (documento auxiliar) de uma NFS-e Nacional
+
+    Args:
+        nota: NotaFiscalNacional emitida (com empresa carregada)
+
+    Returns:
+        dict: Dados de renderizar_nota
+    """
+    return {
+        'titulo': 'DANFSe - DOCUMENTO AUXILIAR DA NFS-e',
+        'subtitulo': 'NOTA FISCAL DE SERVIÇO ELETRÔNICA - PADRÃO NACIONAL',
+        'cabecalho': [
+            ('Número da NFS-e', nota.numero_nfse or ''),
+            ('Data e Hora de Emissão', _data(nota.data_emissao_nfse, '%d/%m/%Y %H:%M:%S')),
+            ('Chave de Acesso', nota.chave_acesso or ''),
+        ],
+        'situacao': 'NFS-e CANCELADA' if nota.status_nfse == 'cancelada' else '',
+        'secoes': [
+            ('EMITENTE DA NFS-e', _prestador_empresa(nota.empresa)),
+            ('TOMADOR DO SERVIÇO', [
+                ('Nome/Razão Social', nota.nome_tomador),
+                ('CPF/CNPJ', _documento(nota.cnpj_cpf_tomador)),
+                ('Inscrição Municipal', nota.inscricao_municipal_tomador or ''),
+                ('Endereço', _endereco(
+                    nota.logradouro_tomador, nota.numero_tomador, nota.complemento_tomador, nota.bairro_tomador
+                )),
+                ('Município', _endereco(nota.cidade_tomador, nota.uf_tomador)),
+                ('E-mail', nota.email_tomador or ''),
+            ]),
+        ],
+        'discriminacao': nota.descricao,
+        'valores': [
+            ('Valor do Serviço', _moeda(nota.valor_total)),
+            ('Deduções', _moeda(nota.deducoes)),
+            ('Desconto Incondicionado', _moeda(nota.desconto_incondicionado)),
+            ('Desconto Condicionado', _moeda(nota.desconto_condicionado)),
+            ('Alíquota ISS', _percentual(nota.aliquota_iss)),
+            ('Valor do ISS', _moeda(nota.valor_iss)),
+            ('ISS Retido', 'Sim' if nota.iss_retido else 'Não'),
+            ('IBS', _moeda(nota.valor_ibs)),
+            ('CBS', _moeda(nota.valor_cbs)),
+        ] + _retencoes(nota) + [
+            ('Valor Líquido', _moeda(nota.valor_liquido)),
+        ],
+        'rodape': [
+            ('Código do Serviço', nota.cod_servico),
+            ('Código de Tributação Municipal', nota.cod_tributacao_municipio or ''),
+            ('Município de Incidência', nota.municipio_incidencia or ''),
+            ('DPS', f'{nota.serie_rps or ""} {nota.numero_rps or ""} - {_data(nota.data_emissao)}'.strip(' -')),
+            ('Consulta', nota.link_nfse or ''),
+        ],
+    }
+
+
+def _campos(pdf, y, campos, colunas=2):
+    """Campos (rótulo pequeno sobre o valor) em colunas; retorna a posição após o bloco"""
+    largura = LARGURA_UTIL / colunas
+    for indice in range(0, len(campos), colunas):
+        altura = 0
+        for coluna, (rotulo, valor) in enumerate(campos[indice:indice + colunas]):
+            x = MARGEM + 4 + coluna * largura
+            pdf.texto(x, y + 8, rotulo, 6.5, negrito=True)
+            linhas = quebrar_linhas(valor, largura - 8, 8.5)[:3]
+            for numero, linha in enumerate(linhas):
+                pdf.texto(x, y + 18 + numero * 10, linha, 8.5)
+            altura = max(altura, 14 + 10 * len(linhas))
+        y += altura
+    return y + 2
+
+
+def _faixa(pdf, y, titulo):
+    """Faixa de título de seção"""
+    pdf.retangulo(MARGEM, y, LARGURA_UTIL, 13, cinza=0.88)
+    pdf.texto(MARGEM, y + 9.5, titulo, 8, negrito=True, alinhamento='centro', largura=LARGURA_UTIL)
+    return y + 13
+
+
+def renderizar_nota(dados):
+    """
+    Desenha o PDF de uma nota
+
+    Args:
+        dados: Dicionário de dados_nfse_sp, dados_nfts_sp ou dados_danfse
+
+    Returns:
+        bytes: Arquivo PDF
+    """
+    pdf = DocumentoPDF(titulo=dados['titulo'])
+
+    # Cabeçalho: título à esquerda, identificação da nota à direita
+    largura_identificacao = 175
+    largura_titulo = LARGURA_UTIL - largura_identificacao
+    pdf.retangulo(MARGEM, MARGEM, LARGURA_UTIL, 72)
+    pdf.linha(MARGEM + largura_titulo, MARGEM, MARGEM + largura_titulo, MARGEM + 72)
+    y = pdf.paragrafo(MARGEM + 8, MARGEM + 24, largura_titulo - 16, dados['titulo'], 12, negrito=True)
+    pdf.paragrafo(MARGEM + 8, y + 4, largura_titulo - 16, dados['subtitulo'], 7.5)
+    for indice, (rotulo, valor) in enumerate(dados['cabecalho']):
+        x = MARGEM + largura_titulo + 6
+        pdf.texto(x, MARGEM + 11 + indice * 22, rotulo, 6.5, negrito=True)
+        tamanho = 9 if len(valor) <= 30 else 6
+        pdf.texto(x, MARGEM + 21 + indice * 22, valor, tamanho)
+    y = MARGEM + 72
+
+    if dados['situacao']:
+        pdf.retangulo(MARGEM, y, LARGURA_UTIL, 20)
+        pdf.texto(MARGEM, y + 15, dados['situacao'], 14, negrito=True, alinhamento='centro', largura=LARGURA_UTIL)
+        y += 20
+
+    for titulo, campos in dados['secoes']:
+        inicio = y
+        y = _faixa(pdf, y, titulo)
+        y = _campos(pdf, y, campos)
+        pdf.retangulo(MARGEM, inicio, LARGURA_UTIL, y - inicio)
+
+    # Discriminação: continua nas páginas seguintes se não couber
+    y = _faixa(pdf, y, 'DISCRIMINAÇÃO DOS SERVIÇOS')
+    inicio = y
+    y += 12
+    for linha in quebrar_linhas(dados['discriminacao'], LARGURA_UTIL - 8, 8.5):
+        if y > LIMITE_PAGINA - 10:
+            pdf.retangulo(MARGEM, inicio, LARGURA_UTIL, y - inicio)
+            pdf.nova_pagina()
+            y = inicio = MARGEM
+            y = _faixa(pdf, y, 'DISCRIMINAÇÃO DOS SERVIÇOS (CONTINUAÇÃO)') + 12
+        pdf.texto(MARGEM + 4, y, linha, 8.5)
+        y += 10.5
+    y = max(y, inicio + 60)
+    pdf.retangulo(MARGEM, inicio, LARGURA_UTIL, y - inicio)
+
+    # Valores (4 por linha) e informações complementares
+    valores = dados['valores']
+    altura_valores = 22 * -(-len(valores) // 4) + 13
+    altura_rodape = 13 + 24 * -(-len(dados['rodape']) // 2)
+    if y + altura_valores + altura_rodape > LIMITE_PAGINA:
+        pdf.nova_pagina()
+        y = MARGEM
+
+    y = _faixa(pdf, y, 'VALORES')
+    largura = LARGURA_UTIL / 4
+    for indice, (rotulo, valor) in enumerate(valores):
+        x = MARGEM + (indice % 4) * largura
+        linha_y = y + (indice // 4) * 22
+        pdf.retangulo(x, linha_y, largura, 22)
+        pdf.texto(x + 4, linha_y + 8, rotulo, 6.5, negrito=True)
+        pdf.texto(x, linha_y + 18, valor, 8.5, alinhamento='direita', largura=largura - 4)
+    y += 22 * -(-len(valores) // 4)
+
+    inicio = y
+    y = _faixa(pdf, y, 'OUTRAS INFORMAÇÕES')
+    y = _campos(pdf, y, dados['rodape'])
+    pdf.retangulo(MARGEM, inicio, LARGURA_UTIL, y - inicio)
+
+    return pdf.gerar()
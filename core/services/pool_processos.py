@@ -0,0 +1,141 @@
+"""
+Pool de processos para trabalho de CPU (desenho dos PDFs, assinatura dos RPS)
+Os processos são criados com spawn: não herdam conexões de banco nem locks do
+processo Django. Se o pool não puder ser usado, o trabalho continua no próprio
+processo, com a função serial informada por quem chama.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Falhas que desativam o pool (o trabalho segue no próprio processo)
+FALHAS_POOL = (BrokenProcessPool, OSError)
+
+
+def quantidade_processos(configurado=None):
+    """
+    Quantidade de processos do pool
+
+    Args:
+        configurado: Valor do settings (None ou 0: núcleos da máquina)
+
+    Returns:
+        int: Quantidade de processos (mínimo 1)
+    """
+    return configurado or os.cpu_count() or 1
+
+
+class PoolProcessos:
+    """
+    Pool de processos criado sob demanda, com volta para a execução serial
+
+    Usado como gerenciador de contexto. Com um único processo não cria o pool;
+    se o pool quebrar (ou não puder ser criado), é desativado e o restante do
+    trabalho roda no próprio processo.
+    """
+
+    def __init__(self, processos, descricao, initializer=None, initargs=()):
+        """
+        Inicializa o pool
+
+        Args:
+            processos: Quantidade de processos (1: sempre serial)
+            descricao: Nome do trabalho, para o log quando o pool é desativado
+            initializer: Função executada uma vez em cada processo
+            initargs: Argumentos de initializer
+        """
+        self.processos = processos
+        self.descricao = descricao
+        self.ativo = processos > 1
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+    @property
+    def executor(self):
+        if self._executor is None and self.ativo:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=self._initializer,
+                initargs=self._initargs
+            )
+        return self._executor
+
+    def fechar(self):
+        """Encerra o pool de processos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def desativar(self, erro):
+        """Encerra o pool após uma falha; as próximas chamadas rodam no próprio processo"""
+        logger.warning(f"Pool de {self.descricao} indisponível, executando no próprio processo: {erro}")
+        self.ativo = False
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def mapear(self, funcao, itens, serial=None, chunksize=1):
+        """
+        Aplica a função a cada item, no pool quando ativo
+
+        Args:
+            funcao: Função executada nos processos (precisa ser importável)
+            itens: Lista de argumentos
+            serial: Função usada no próprio processo (padrão: a mesma funcao)
+            chunksize: Itens enviados a cada processo por vez
+
+        Yields:
+            Resultado de cada item, na mesma ordem; se o pool falhar no meio,
+            os itens restantes são processados no próprio processo
+        """
+        feitos = 0
+        if self.ativo:
+            try:
+                for resultado in self.executor.map(funcao, itens, chunksize=chunksize):
+                    feitos += 1
+                    yield resultado
+                return
+            except FALHAS_POOL as e:
+                self.desativar(e)
+
+        serial = serial or funcao
+        for item in itens[feitos:]:
+            yield serial(item)
+
+    def submeter(self, funcao, argumento, serial):
+        """
+        Agenda uma chamada no pool quando ativo
+
+        Args:
+            funcao: Função executada nos processos (precisa ser importável)
+            argumento: Argumento de funcao (enviado ao processo)
+            serial: Função sem argumentos usada no próprio processo
+
+        Returns:
+            Future: Resultado da chamada
+        """
+        if self.ativo:
+            try:
+                return self.executor.submit(funcao, argumento)
+            except FALHAS_POOL + (RuntimeError,) as e:
+                self.desativar(e)
+
+        futuro = Future()
+        try:
+            futuro.set_result(serial())
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
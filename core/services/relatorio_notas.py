@@ -0,0 +1,314 @@
+"""
+Relatórios de notas em CSV e XLSX com memória constante
+As linhas são lidas do banco em blocos (values_list + iterator) e escritas à
+medida que chegam: o CSV é enviado em fluxo (StreamingHttpResponse) e o XLSX é
+montado pelo openpyxl em modo write_only em arquivo temporário. Os valores
+calculados (ISS, retenções) vêm de NotasQuerySet.com_impostos() e os totais
+são somados pelo banco
+"""
+import csv
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+import openpyxl
+from django.db.models import Count, Sum
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from core.models import soma_em_centavos
+
+# Notas lidas do banco por consulta
+TAMANHO_BLOCO = 2000
+
+# Formato do XLSX de cada tipo de coluna
+FORMATOS_XLSX = {
+    'moeda': '#,##0.00',
+    'percentual': '0.00',
+    'inteiro': '0',
+    'data': 'DD/MM/YYYY',
+    'mes': 'MM/YYYY',
+    'data_hora': 'DD/MM/YYYY HH:MM',
+}
+
+
+class Coluna:
+    """Coluna do relatório"""
+
+    def __init__(self, titulo, campo, formato='texto', total=None, escolhas=None, largura=None):
+        """
+        Args:
+            titulo: Título da coluna
+            campo: Campo ou anotação do queryset
+            formato: texto, moeda, percentual, inteiro, data, mes, data_hora, booleano ou escolha
+            total: Agregação do total da coluna (ex.: Sum('valor_total')); None sem total
+            escolhas: Choices do campo (formato escolha)
+            largura: Largura da coluna no XLSX
+        """
+        self.titulo = titulo
+        self.campo = campo
+        self.formato = formato
+        self.total = total
+        self.escolhas = dict(escolhas or ())
+        self.largura = largura or {'moeda': 14, 'data': 12, 'data_hora': 17}.get(formato, max(12, len(titulo) + 2))
+
+    def valor(self, valor):
+        """Valor convertido para a planilha (números e datas sem formatação)"""
+        if valor is None:
+            return None
+        if self.formato == 'booleano':
+            return 'Sim' if valor else 'Não'
+        if self.formato == 'escolha':
+            return self.escolhas.get(valor, valor)
+        if self.formato in ('moeda', 'percentual') and isinstance(valor, (Decimal, float)):
+            return soma_em_centavos(valor)
+        if self.formato == 'data_hora' and timezone.is_aware(valor):
+            # O Excel não guarda fuso horário
+            return timezone.localtime(valor).replace(tzinfo=None)
+        return valor
+
+    def texto(self, valor):
+        """Valor formatado para o CSV (padrão brasileiro)"""
+        valor = self.valor(valor)
+        if valor is None:
+            return ''
+        if isinstance(valor, (Decimal, float)):
+            return f'{valor:.2f}'.replace('.', ',')
+        if isinstance(valor, datetime):
+            return valor.strftime('%d/%m/%Y %H:%M')
+        if isinstance(valor, date):
+            return valor.strftime('%m/%Y' if self.formato == 'mes' else '%d/%m/%Y')
+        return str(valor)
+
+
+class Relatorio:
+    """
+    Definição de um relatório: queryset, colunas e totais
+    """
+
+    def __init__(self, titulo, queryset, colunas, queryset_totais=None):
+        """
+        Args:
+            titulo: Título (nome da aba do XLSX)
+            queryset: QuerySet já filtrado, anotado e ordenado
+            colunas: Lista de Coluna
+            queryset_totais: QuerySet sobre o qual os totais são agregados (padrão:
+                             queryset; informar o queryset não agrupado nos relatórios
+                             com values().annotate())
+        """
+        self.titulo = titulo
+        self.queryset = queryset
+        self.colunas = colunas
+        self.queryset_totais = queryset if queryset_totais is None else queryset_totais
+
+    def linhas(self):
+        """
+        Linhas do relatório, lidas do banco em blocos
+
+        Yields:
+            tuple: Valores das colunas
+        """
+        campos = [coluna.campo for coluna in self.colunas]
+        return self.queryset.values_list(*campos).iterator(chunk_size=TAMANHO_BLOCO)
+
+    def totais(self):
+        """
+        Totais das colunas calculados pelo banco
+
+        Returns:
+            list: Total de cada coluna (None nas colunas sem total)
+        """
+        agregacoes = {
+            f'total_{indice}': coluna.total
+            for indice, coluna in enumerate(self.colunas) if coluna.total is not None
+        }
+        if not agregacoes:
+            return [None] * len(self.colunas)
+        resultado = self.queryset_totais.order_by().aggregate(**agregacoes)
+        return [resultado.get(f'total_{indice}') for indice in range(len(self.colunas))]
+
+
+def relatorio_sintetico(titulo, queryset, retencoes=True):
+    """
+    Relatório sintético: quantidade e valores por empresa e mês, agrupados pelo banco
+
+    Args:
+        titulo: Título do relatório
+        queryset: Notas filtradas (NotasQuerySet)
+        retencoes: Se False, omite a coluna de retenções
+
+    Returns:
+        Relatorio: Relatório agrupado
+    """
+    colunas = [
+        Coluna('CNPJ Empresa', 'cnpj_contribuinte', largura=20),
+        Coluna('Mês', 'mes', 'mes', largura=10),
+        Coluna('Quantidade', 'quantidade', 'inteiro', total=Count('id')),
+        Coluna('Valor Total', 'soma_valor_total', 'moeda', total=Sum('valor_total')),
+        Coluna('Deduções', 'soma_deducoes', 'moeda', total=Sum('deducoes')),
+        Coluna('Valor ISS', 'soma_valor_iss', 'moeda', total=Sum('valor_iss')),
+        Coluna('Retenções', 'soma_total_retencoes', 'moeda', total=Sum('total_retencoes')),
+        Coluna('Valor Líquido', 'soma_valor_liquido', 'moeda', total=Sum('valor_liquido')),
+    ]
+    if not retencoes:
+        colunas = [coluna for coluna in colunas if coluna.campo != 'soma_total_retencoes']
+    return Relatorio(
+        titulo, queryset.totais_por_mes('cnpj_contribuinte'), colunas, queryset_totais=queryset.com_impostos()
+    )
+
+
+class _Eco:
+    """Destino do csv.writer que devolve a linha escrita"""
+
+    def write(self, valor):
+        return valor
+
+
+def resposta_csv(relatorio, nome_arquivo):
+    """
+    Relatório em CSV (separador ;, decimais com vírgula), enviado em fluxo
+
+    Args:
+        relatorio: Relatorio
+        nome_arquivo: Nome do arquivo (sem extensão)
+
+    Returns:
+        StreamingHttpResponse: Download do CSV
+    """
+    escritor = csv.writer(_Eco(), delimiter=';')
+    colunas = relatorio.colunas
+
+    def gerar():
+        # BOM: o Excel reconhece o arquivo como UTF-8
+        yield '\ufeff' + escritor.writerow([coluna.titulo for coluna in colunas])
+        bloco = []
+        for linha in relatorio.linhas():
+            bloco.append(escritor.writerow([coluna.texto(valor) for coluna, valor in zip(colunas, linha)]))
+            if len(bloco) >= TAMANHO_BLOCO:
+                yield ''.join(bloco)
+                bloco = []
+        yield ''.join(bloco)
+
+        totais = relatorio.totais()
+        if any(total is not None for total in totais):
+            linha = [coluna.texto(total) for coluna, total in zip(colunas, totais)]
+            linha[0] = 'TOTAL'
+            yield escritor.writerow(linha)
+
+    response = StreamingHttpResponse(gerar(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}.csv"'
+    return response
+
+
+def resposta_xlsx(relatorio, nome_arquivo):
+    """
+    Relatório em XLSX, montado em modo write_only (as linhas vão para o disco
+    à medida que são escritas) e enviado a partir de um arquivo temporário
+
+    Args:
+        relatorio: Relatorio
+        nome_arquivo: Nome do arquivo (sem extensão)
+
+    Returns:
+        FileResponse: Download do XLSX
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(relatorio.titulo[:31])
+    colunas = relatorio.colunas
+
+    for indice, coluna in enumerate(colunas, 1):
+        ws.column_dimensions[get_column_letter(indice)].width = coluna.largura
+    ws.freeze_panes = 'A2'
+
+    # Estilizar cabeçalho
+    header_fill = PatternFill(start_color='FFD700', end_color='FFD700', fill_type='solid')
+    header_font = Font(bold=True, color='000000')
+    cabecalho = []
+    for coluna in colunas:
+        cell = WriteOnlyCell(ws, value=coluna.titulo)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+        cabecalho.append(cell)
+    ws.append(cabecalho)
+
+    # Só as colunas numéricas/datas precisam de célula com formato
+    formatos = [FORMATOS_XLSX.get(coluna.formato) for coluna in colunas]
+    for linha in relatorio.linhas():
+        valores = []
+        for coluna, formato, valor in zip(colunas, formatos, linha):
+            valor = coluna.valor(valor)
+            if formato and valor is not None:
+                cell = WriteOnlyCell(ws, value=valor)
+                cell.number_format = formato
+                valores.append(cell)
+            else:
+                valores.append(valor)
+        ws.append(valores)
+
+    totais = relatorio.totais()
+    if any(total is not None for total in totais):
+        linha_totais = []
+        for indice, (coluna, formato, total) in enumerate(zip(colunas, formatos, totais)):
+            cell = WriteOnlyCell(ws, value='TOTAL' if indice == 0 else coluna.valor(total))
+            cell.font = header_font
+            if formato and indice:
+                cell.number_format = formato
+            linha_totais.append(cell)
+        ws.append(linha_totais)
+
+    arquivo = tempfile.TemporaryFile()
+    wb.save(arquivo)
+    arquivo.seek(0)
+    return FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename=f'{nome_arquivo}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+def periodo_relatorio(data_inicio, data_fim):
+    """
+    Valida o período informado no formulário do relatório
+
+    Args:
+        data_inicio: Data inicial (AAAA-MM-DD)
+        data_fim: Data final (AAAA-MM-DD)
+
+    Returns:
+        tuple: (date inicial, date final)
+
+    Raises:
+        ValueError: Datas ausentes, inválidas ou fora de ordem
+    """
+    if not data_inicio or not data_fim:
+        raise ValueError('Informe o período do relatório.')
+    try:
+        inicio = date.fromisoformat(data_inicio)
+        fim = date.fromisoformat(data_fim)
+    except ValueError:
+        raise ValueError('Período do relatório inválido.')
+    if inicio > fim:
+        raise ValueError('A data inicial do relatório é posterior à data final.')
+    return inicio, fim
+
+
+def resposta_relatorio(relatorio, formato, nome_arquivo):
+    """
+    Resposta de download no formato escolhido
+
+    Args:
+        relatorio: Relatorio
+        formato: 'csv' ou 'excel'
+        nome_arquivo: Nome do arquivo (sem extensão)
+
+    Returns:
+        HttpResponse: Download do relatório
+    """
+    if formato == 'csv':
+        return resposta_csv(relatorio, nome_arquivo)
+    return resposta_xlsx(relatorio, nome_arquivo)
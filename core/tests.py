@@ -0,0 +1,106 @@
+import re
+import zlib
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Empresa, NotaFiscalSP
+from core.services.documento_pdf import DocumentoPDF
+from core.services.pdf_notas import dados_nfse_sp, renderizar_nota
+
+
+def ler_pdf(conteudo):
+    """
+    Lê a estrutura de um PDF pela tabela xref, como um leitor faria
+
+    Returns:
+        dict: Objetos por número (bytes entre 'obj' e 'endobj') e o trailer
+    """
+    assert conteudo.startswith(b'%PDF-1.4\n'), 'cabeçalho ausente'
+    assert conteudo.endswith(b'%%EOF\n'), 'marcador de fim ausente'
+    inicio_xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', conteudo).group(1))
+    assert conteudo[inicio_xref:].startswith(b'xref\n'), 'startxref não aponta para a tabela xref'
+
+    cabecalho, _, resto = conteudo[inicio_xref + 5:].partition(b'\n')
+    primeiro, quantidade = map(int, cabecalho.split())
+    assert primeiro == 0
+    entradas = [resto[i * 20:(i + 1) * 20] for i in range(quantidade)]
+    assert entradas[0] == b'0000000000 65535 f \n'
+
+    posicoes = []
+    for entrada in entradas[1:]:
+        assert len(entrada) == 20 and entrada.endswith(b' 00000 n \n'), f'entrada xref inválida: {entrada!r}'
+        posicoes.append(int(entrada[:10]))
+
+    # Cada objeto vai do seu offset até o offset do seguinte (o último, até a xref)
+    objetos = {}
+    for numero, (posicao, fim) in enumerate(zip(posicoes, posicoes[1:] + [inicio_xref]), start=1):
+        marcador = b'%d 0 obj\n' % numero
+        bloco = conteudo[posicao:fim]
+        assert bloco.startswith(marcador), f'xref do objeto {numero} desalinhada'
+        assert bloco.endswith(b'\nendobj\n'), f'objeto {numero} sem endobj'
+        objetos[numero] = bloco[len(marcador):-len(b'\nendobj\n')]
+
+    trailer = resto[quantidade * 20:]
+    assert trailer.startswith(b'trailer\n')
+    assert int(re.search(rb'/Size (\d+)', trailer).group(1)) == quantidade
+    return {'objetos': objetos, 'trailer': trailer}
+
+
+class DocumentoPDFTest(TestCase):
+    """Estrutura do PDF gerado por DocumentoPDF (offsets da xref, páginas e fluxos)"""
+
+    def paginas(self, conteudo):
+        pdf = ler_pdf(conteudo)
+        objetos = pdf['objetos']
+        raiz = int(re.search(rb'/Root (\d+) 0 R', pdf['trailer']).group(1))
+        numero_paginas = int(re.search(rb'/Pages (\d+) 0 R', objetos[raiz]).group(1))
+        arvore = objetos[numero_paginas]
+        filhas = [int(numero) for numero in re.findall(rb'(\d+) 0 R', re.search(rb'/Kids \[(.*?)\]', arvore).group(1))]
+        self.assertEqual(int(re.search(rb'/Count (\d+)', arvore).group(1)), len(filhas))
+
+        conteudos = []
+        for numero in filhas:
+            pagina = objetos[numero]
+            self.assertIn(b'/Type /Page ', pagina)
+            fluxo = objetos[int(re.search(rb'/Contents (\d+) 0 R', pagina).group(1))]
+            tamanho = int(re.search(rb'/Length (\d+)', fluxo).group(1))
+            dados = fluxo.split(b'\nstream\n', 1)[1]
+            self.assertEqual(dados[tamanho:], b'\nendstream')
+            conteudos.append(zlib.decompress(dados[:tamanho]))
+        return conteudos
+
+    def test_documento_com_varias_paginas(self):
+        documento = DocumentoPDF(titulo='Teste (parênteses) \\ barra')
+        documento.texto(30, 30, 'Página 1 – ação')
+        documento.nova_pagina()
+        documento.retangulo(30, 30, 100, 50, cinza=0.9)
+        documento.nova_pagina()
+        documento.linha(30, 30, 200, 30)
+
+        paginas = self.paginas(documento.gerar())
+        self.assertEqual(len(paginas), 3)
+        self.assertIn('Página 1'.encode('cp1252'), paginas[0])
+        self.assertIn(b' re', paginas[1])
+
+    def test_nota_renderizada(self):
+        empresa = Empresa.objects.create(
+            cnpj='11.222.333/0001-81', razao_social='Prestadora Ltda', inscricao_municipal='12345678',
+            codigo_municipio='3550308'
+        )
+        nota = NotaFiscalSP.objects.create(
+            empresa=empresa, cnpj_contribuinte=empresa.cnpj, nome_tomador='Tomador (Filial)',
+            cnpj_cpf_tomador='12345678909', cod_servico='02919', valor_total=Decimal('1234.56'),
+            aliquota=Decimal('2.00'), tipo_tributacao='T', serie_rps='RPS', numero_rps='000000000001',
+            status_rps='emitida', numero_nfse='123', codigo_verificacao='ABCD1234',
+            data_emissao_nfse=timezone.now(), descricao='Serviço de consultoria técnica. ' * 400,
+        )
+
+        conteudo = renderizar_nota(dados_nfse_sp(nota))
+        paginas = self.paginas(conteudo)
+        # A discriminação longa continua nas páginas seguintes
+        self.assertGreater(len(paginas), 1)
+        self.assertIn(b'NOTA FISCAL ELETR', paginas[0])
+        self.assertIn(b'Tomador \\(Filial\\)', paginas[0])
+        self.assertEqual(renderizar_nota(dados_nfse_sp(nota)), conteudo)
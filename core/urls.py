@@ -9,4 +9,5 @@ urlpatterns = [
     path('cadastro/editar/<int:empresa_id>/', views.editar_empresa, name='editar_empresa'),
     path('cadastro/excluir/<int:empresa_id>/', views.excluir_empresa, name='excluir_empresa'),
     path('ajuda/', views.ajuda, name='ajuda'),
+    path('tarefas/<int:tarefa_id>/', views.status_tarefa, name='status_tarefa'),
 ]
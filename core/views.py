@@ -1,9 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import JsonResponse
 from django.conf import settings
-from .models import Empresa
+from .models import Empresa, TarefaEmissao
 from .forms import EmpresaCadastroForm
+from nfs_sp.services.certificado_service import CertificadoService
+from .services.fila_emissao import resposta_status
+from .services.agregados_notas import painel
 import os
 from datetime import datetime
 from cryptography import x509
@@ -13,10 +17,13 @@ from cryptography.hazmat.primitives.serialization import pkcs12
 
 @login_required
 def home(request):
-    """Tela inicial do sistema com informações e apresentação"""
+    """Tela inicial do sistema com informações, apresentação e o painel do mês"""
+    empresa = request.user.profile.empresa if hasattr(request.user, 'profile') else None
     context = {
         'user': request.user,
-        'empresa': request.user.profile.empresa if hasattr(request.user, 'profile') else None,
+        'empresa': empresa,
+        # Lido dos agregados diários: não depende da quantidade de notas
+        'painel': painel(empresa) if empresa else None,
     }
     return render(request, 'core/home.html', context)
 
@@ -177,6 +184,9 @@ def editar_empresa(request, empresa_id):
                         pass
                     
                     empresa.certificado_arquivo = nome_arquivo
+                    
+                    # Descarta o PEM e as conexões do certificado anterior
+                    CertificadoService().invalidar_certificado(empresa)
                     messages.success(request, 'Certificado digital atualizado com sucesso!')
                     
                 except Exception as e:
@@ -230,6 +240,12 @@ def excluir_empresa(request, empresa_id):
         except Exception as e:
             messages.warning(request, f'Erro ao remover certificado: {str(e)}')
     
+    # Remove o PEM gerado e as conexões em cache
+    try:
+        CertificadoService().invalidar_certificado(empresa)
+    except Exception as e:
+        messages.warning(request, f'Erro ao remover certificado: {str(e)}')
+    
     # Exclui a empresa (em cascata exclui todas as notas fiscais relacionadas)
     empresa.delete()
     
@@ -249,3 +265,14 @@ def ajuda(request):
         'user': request.user,
     }
     return render(request, 'core/ajuda.html', context)
+
+
+@login_required
+def status_tarefa(request, tarefa_id):
+    """Retorna o progresso de uma tarefa de emissão (consultado pelo navegador)"""
+    tarefa = get_object_or_404(TarefaEmissao, id=tarefa_id)
+    
+    if not request.user.is_superuser and tarefa.usuario_id != request.user.id:
+        return JsonResponse({'sucesso': False, 'mensagem': 'Tarefa não encontrada.'}, status=404)
+    
+    return JsonResponse(resposta_status(tarefa))
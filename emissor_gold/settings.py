@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.ContextoContratanteMiddleware',  # Perfil e empresas do usuário (em cache)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -128,6 +129,8 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+PDF_PROCESSOS = None  # Processos de renderização dos PDFs das notas (None: núcleos da máquina)
+PDF_PARALELO_MINIMO = 100  # PDFs a desenhar a partir dos quais a renderização usa o pool de processos
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -146,3 +149,47 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = True  # Expira ao fechar o navegador
 SESSION_COOKIE_SECURE = False  # True em produção com HTTPS
 SESSION_COOKIE_HTTPONLY = True  # Proteção contra XSS
 SESSION_COOKIE_SAMESITE = 'Lax'  # Proteção contra CSRF
+
+# Configurações NFS-e São Paulo
+NFE_SOAP_CLIENTE_TTL = 3600  # Tempo (segundos) de reuso dos clientes SOAP por certificado
+NFE_WSDL_LOCAL = False  # Carrega os WSDLs de layouts/ (gerados por atualizar_wsdl) em vez de baixá-los a cada cliente
+NFE_ZEEP_CACHE_PATH = BASE_DIR / 'cache' / 'zeep_cache.db'
+NFE_CACHE_CHAVES_TAMANHO = 64  # Certificados com chaves decodificadas mantidos em memória
+NFE_ASSINATURA_PROCESSOS = None  # Processos de assinatura em lotes grandes (None: núcleos da máquina)
+NFE_ASSINATURA_PARALELA_MINIMO = 200  # RPS a partir dos quais a assinatura usa o pool de processos
+NFE_SOAP_TIMEOUT_CONEXAO = 10  # Tempo (segundos) para conectar ao webservice da prefeitura
+NFE_SOAP_TIMEOUT_LEITURA = 60  # Tempo (segundos) de espera da resposta SOAP
+NFE_SOAP_TENTATIVAS = 3  # Tentativas das consultas em falhas transitórias (envios não são repetidos)
+NFE_SOAP_ESPERA_BASE = 0.5  # Espera (segundos) base do backoff exponencial entre tentativas
+NFE_SOAP_ESPERA_MAXIMA = 8  # Espera máxima (segundos) entre tentativas
+NFE_DISJUNTOR_FALHAS = 5  # Falhas transitórias consecutivas que abrem o disjuntor do endpoint
+NFE_DISJUNTOR_TEMPO_ABERTO = 60  # Tempo (segundos) em que o endpoint fica suspenso
+NFE_VALIDAR_XSD = True  # Valida os pedidos nos XSDs de layouts/ antes do envio
+NFE_CONSULTA_PERIODO_DIAS = 31  # Dias por consulta de NFS-e emitidas/recebidas (períodos maiores são divididos)
+NFE_SINCRONIZACAO_DIAS_INICIAIS = 90  # Dias consultados na primeira sincronização de notas de uma empresa
+NFE_SINCRONIZACAO_WORKERS = 16  # Consultas simultâneas do agendador sincronizar_notas (todas as empresas)
+NFE_CONSULTAS_SIMULTANEAS_CERTIFICADO = 2  # Consultas simultâneas por certificado no agendador
+NFE_CODIGOS_RPS_NAO_ENCONTRADO = ()  # Códigos de erro da ConsultaNFe de RPS/NF-e inexistente (vazio: qualquer erro da consulta impede o reenvio)
+
+# Configurações NFS-e Nacional
+NFSE_NACIONAL_AMBIENTE = 2  # 1: produção, 2: produção restrita
+NFSE_NACIONAL_URL = None  # URL base da API (None: Sefin do ambiente; ex.: servidor_sefin_local em testes)
+NFSE_NACIONAL_TIMEOUT = 60  # Tempo (segundos) de espera das requisições à Sefin
+NFSE_NACIONAL_VERSAO_APLICATIVO = 'DCOMP_WEB_1.0'  # verAplic enviado na DPS e nos eventos
+NFSE_NACIONAL_SERIE_DPS = '00001'  # Série usada quando a nota não tem número/série numéricos
+NFSE_NACIONAL_ENVIOS_SIMULTANEOS = 8  # DPS em envio simultâneo por certificado (EmpresaContratante pode alterar)
+NFSE_NACIONAL_TENTATIVAS_429 = 5  # Reenvios após HTTP 429 (Too Many Requests), respeitando o Retry-After
+NFSE_NACIONAL_ESPERA_MAXIMA = 60  # Espera máxima (segundos) aceita de um Retry-After
+
+# Fila de emissão (worker: python manage.py processar_emissoes)
+EMISSAO_ASSINCRONA = True  # False: emite dentro da requisição (sem worker)
+
+# Listagens de notas (paginação por cursor)
+NOTAS_POR_PAGINA = 100
+
+# Console administrativo (admin_empresas)
+ADMIN_EMPRESAS_POR_PAGINA = 25
+ADMIN_ESTATISTICAS_CACHE = 300  # Tempo (segundos) de cache dos totais por status das contratantes
+
+# Contexto da contratante do usuário (accounts.middleware)
+CONTEXTO_USUARIO_CACHE = 300  # Tempo (segundos) de cache do perfil e das empresas ativas do usuário
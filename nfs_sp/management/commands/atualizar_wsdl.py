@@ -0,0 +1,109 @@
+"""
+Atualiza e verifica as cópias locais dos WSDLs da Prefeitura de SP
+
+Uso:
+    python manage.py atualizar_wsdl                # baixa, valida e grava
+    python manage.py atualizar_wsdl --verificar    # apenas valida as cópias locais
+    python manage.py atualizar_wsdl --servico nfts
+"""
+import os
+import tempfile
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from zeep import Client
+from zeep.transports import Transport
+
+from nfs_sp.services.wsdl_local import WEBSERVICES, caminho_wsdl_local
+
+
+class Command(BaseCommand):
+    help = 'Baixa e verifica os WSDLs dos webservices NFS-e/NFTS da Prefeitura de SP'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servico', choices=sorted(WEBSERVICES), action='append',
+            help='Webservice a processar (padrão: todos)'
+        )
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Apenas verifica as cópias locais, sem baixar'
+        )
+        parser.add_argument(
+            '--timeout', type=int, default=30,
+            help='Timeout (segundos) do download'
+        )
+
+    def handle(self, *args, **options):
+        servicos = options['servico'] or sorted(WEBSERVICES)
+        falhas = []
+
+        for servico in servicos:
+            try:
+                if options['verificar']:
+                    self.verificar(servico, caminho_wsdl_local(servico))
+                else:
+                    self.atualizar(servico, options['timeout'])
+            except Exception as e:
+                falhas.append(servico)
+                self.stderr.write(self.style.ERROR(f'[{servico}] {e}'))
+
+        if falhas:
+            raise CommandError(f'Falha em: {", ".join(falhas)}')
+
+    def verificar(self, servico, caminho):
+        """
+        Carrega o WSDL com o zeep e confere as operações usadas pelo sistema
+
+        Args:
+            servico: Chave do webservice
+            caminho: Caminho do arquivo WSDL
+        """
+        if not os.path.exists(caminho):
+            raise CommandError(f'Arquivo não encontrado: {caminho}')
+
+        cliente = Client(caminho, transport=Transport(cache=None))
+        operacoes = set(cliente.service._operations)
+        faltando = [op for op in WEBSERVICES[servico]['operacoes'] if op not in operacoes]
+        if faltando:
+            raise CommandError(f'Operações ausentes no WSDL: {", ".join(faltando)}')
+
+        endereco = cliente.service._binding_options.get('address')
+        self.stdout.write(self.style.SUCCESS(
+            f'[{servico}] OK - {len(operacoes)} operações, endpoint {endereco}'
+        ))
+
+    def atualizar(self, servico, timeout):
+        """
+        Baixa o WSDL, valida em arquivo temporário e substitui a cópia local
+
+        Args:
+            servico: Chave do webservice
+            timeout: Timeout do download em segundos
+        """
+        url = WEBSERVICES[servico]['url']
+        destino = caminho_wsdl_local(servico)
+
+        self.stdout.write(f'[{servico}] Baixando {url}')
+        resposta = requests.get(url, timeout=timeout)
+        resposta.raise_for_status()
+
+        fd, temporario = tempfile.mkstemp(suffix='.wsdl', dir=os.path.dirname(destino))
+        try:
+            with os.fdopen(fd, 'wb') as arquivo:
+                arquivo.write(resposta.content)
+            self.verificar(servico, temporario)
+
+            atual = b''
+            if os.path.exists(destino):
+                with open(destino, 'rb') as arquivo:
+                    atual = arquivo.read()
+            if atual == resposta.content:
+                self.stdout.write(f'[{servico}] Cópia local já está atualizada')
+                return
+
+            os.replace(temporario, destino)
+            self.stdout.write(self.style.SUCCESS(f'[{servico}] WSDL atualizado em {destino}'))
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
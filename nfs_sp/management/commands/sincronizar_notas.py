@@ -0,0 +1,104 @@
+"""
+Sincroniza as NFS-e emitidas e recebidas de várias empresas (execução noturna)
+
+Uso:
+    python manage.py sincronizar_notas                          # todas as empresas ativas
+    python manage.py sincronizar_notas --contratante 3 --tipo emitidas
+    python manage.py sincronizar_notas --empresa 12 --empresa 15 --ate 2025-01-31
+    python manage.py sincronizar_notas --workers 24 --por-certificado 3 --prazo 120
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Empresa
+from nfs_sp.services.agendador_sincronizacao import AgendadorSincronizacao
+
+TIPOS = {
+    'emitidas': ('E',),
+    'recebidas': ('R',),
+    'ambas': ('E', 'R'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza as NFS-e emitidas/recebidas das empresas com a Prefeitura de SP, em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa', type=int, action='append',
+            help='ID da empresa a sincronizar (padrão: todas as ativas)'
+        )
+        parser.add_argument(
+            '--contratante', type=int,
+            help='Sincroniza apenas as empresas da contratante informada'
+        )
+        parser.add_argument(
+            '--tipo', choices=sorted(TIPOS), default='ambas',
+            help='Notas a sincronizar'
+        )
+        parser.add_argument(
+            '--ate', type=date.fromisoformat,
+            help='Último dia consultado, AAAA-MM-DD (padrão: hoje)'
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            help='Consultas simultâneas no total (padrão: NFE_SINCRONIZACAO_WORKERS)'
+        )
+        parser.add_argument(
+            '--por-certificado', type=int,
+            help='Consultas simultâneas por certificado (padrão: NFE_CONSULTAS_SIMULTANEAS_CERTIFICADO)'
+        )
+        parser.add_argument(
+            '--prazo', type=float,
+            help='Minutos após os quais nenhuma consulta nova é iniciada'
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.filter(ativo=True).exclude(inscricao_municipal__isnull=True)
+        if options['empresa']:
+            empresas = empresas.filter(id__in=options['empresa'])
+        if options['contratante']:
+            empresas = empresas.filter(empresa_contratante_id=options['contratante'])
+        empresas = list(empresas)
+        if not empresas:
+            raise CommandError('Nenhuma empresa ativa encontrada')
+
+        agendador = AgendadorSincronizacao(
+            empresas,
+            tipos=TIPOS[options['tipo']],
+            data_fim=options['ate'],
+            workers=options['workers'],
+            por_certificado=options['por_certificado'],
+            prazo=options['prazo'] * 60 if options['prazo'] else None,
+        )
+        self.stdout.write(
+            f'Execução {agendador.execucao}: {len(empresas)} empresa(s), '
+            f'{agendador.workers} consulta(s) simultânea(s), {agendador.por_certificado} por certificado'
+        )
+
+        def progresso(intervalo):
+            linha = (
+                f'{intervalo.empresa.cnpj} {intervalo.tipo} '
+                f'{intervalo.inicio:%d/%m/%Y}-{intervalo.fim:%d/%m/%Y}: '
+                f'{intervalo.notas} nota(s) em {intervalo.duracao:.1f}s'
+            )
+            if intervalo.status == 'sucesso':
+                self.stdout.write(linha)
+            else:
+                self.stdout.write(self.style.ERROR(f'{linha} - {intervalo.mensagem}'))
+
+        resumo = agendador.executar(progresso)
+
+        for falha in resumo['falhas']:
+            self.stdout.write(self.style.ERROR(falha))
+        mensagem = (
+            f"{resumo['sucesso']}/{resumo['intervalos']} intervalo(s) sincronizado(s), "
+            f"{resumo['notas']} nota(s) em {resumo['duracao']:.1f}s"
+        )
+        if resumo['erros'] or resumo['nao_executados'] or resumo['falhas']:
+            self.stdout.write(self.style.WARNING(
+                f"{mensagem}; {resumo['erros']} com erro, {resumo['nao_executados']} não executado(s)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(mensagem))
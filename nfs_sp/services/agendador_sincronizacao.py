@@ -0,0 +1,257 @@
+"""
+Agendador da sincronização de notas de várias empresas
+Divide a janela de cada (empresa, tipo) em intervalos e distribui as consultas
+em um pool limitado de threads, respeitando o máximo de consultas simultâneas
+por certificado. Os clientes SOAP (pool_clientes) e as chaves (cache_chaves)
+de cada certificado são reaproveitados por todas as consultas da empresa
+"""
+import logging
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection
+
+from core.models import ExecucaoSincronizacaoNotas
+from .sincronizacao_notas import SincronizadorNotas, periodos
+
+logger = logging.getLogger(__name__)
+
+
+class _Intervalo:
+    """Consulta de um intervalo (empresa, tipo, período) e seu resultado"""
+
+    def __init__(self, sincronizador, tipo, inicio, fim):
+        self.sincronizador = sincronizador
+        self.tipo = tipo
+        self.inicio = inicio
+        self.fim = fim
+        self.status = None
+        self.notas = 0
+        self.duracao = 0
+        self.mensagem = None
+
+    @property
+    def empresa(self):
+        return self.sincronizador.empresa
+
+    @property
+    def certificado(self):
+        return self.sincronizador.processador.cert_path
+
+
+class AgendadorSincronizacao:
+    """
+    Sincroniza as notas emitidas/recebidas de várias empresas em paralelo
+    """
+
+    def __init__(self, empresas, tipos=('E', 'R'), data_fim=None, workers=None,
+                 por_certificado=None, prazo=None):
+        """
+        Inicializa o agendador
+
+        Args:
+            empresas: Empresas a sincronizar (iterável de Empresa)
+            tipos: Tipos de nota ('E' emitidas, 'R' recebidas)
+            data_fim: Último dia consultado (padrão: hoje)
+            workers: Consultas simultâneas no total. Se None, usa
+                     settings.NFE_SINCRONIZACAO_WORKERS
+            por_certificado: Consultas simultâneas por certificado. Se None, usa
+                             settings.NFE_CONSULTAS_SIMULTANEAS_CERTIFICADO
+            prazo: Segundos a partir dos quais nenhuma consulta nova é iniciada
+                   (None: sem prazo)
+        """
+        self.empresas = list(empresas)
+        self.tipos = tipos
+        self.data_fim = data_fim
+        self.workers = max(1, workers or getattr(settings, 'NFE_SINCRONIZACAO_WORKERS', 16))
+        self.por_certificado = max(
+            1, por_certificado or getattr(settings, 'NFE_CONSULTAS_SIMULTANEAS_CERTIFICADO', 2)
+        )
+        self.prazo = prazo
+        self.execucao = uuid.uuid4().hex
+        self.falhas = []
+
+    def planejar(self):
+        """
+        Monta os intervalos a consultar de cada empresa e tipo
+
+        Returns:
+            dict: Intervalos de cada (empresa_id, tipo), em ordem cronológica
+        """
+        planos = {}
+        for empresa in self.empresas:
+            try:
+                sincronizador = SincronizadorNotas(empresa)
+            except Exception as e:
+                # Sem certificado utilizável: nenhuma consulta da empresa é possível
+                logger.warning(f"Sincronização da empresa {empresa.id} não iniciada: {e}")
+                self.falhas.append(f'{empresa}: {e}')
+                continue
+
+            for tipo in self.tipos:
+                inicio, fim = sincronizador.janela(tipo, self.data_fim)
+                planos[(empresa.id, tipo)] = [
+                    _Intervalo(sincronizador, tipo, inicio_periodo, fim_periodo)
+                    for inicio_periodo, fim_periodo in periodos(inicio, fim)
+                ]
+        return planos
+
+    def consultar(self, intervalo):
+        """
+        Consulta um intervalo (executado nas threads do pool)
+
+        Args:
+            intervalo: _Intervalo a consultar
+
+        Returns:
+            _Intervalo: O próprio intervalo, com status, notas e duração
+        """
+        inicio = time.monotonic()
+        try:
+            intervalo.notas = intervalo.sincronizador.consultar_periodo(
+                intervalo.tipo, intervalo.inicio, intervalo.fim
+            )
+            intervalo.status = 'sucesso'
+        except Exception as e:
+            intervalo.status = 'erro'
+            intervalo.mensagem = str(e)
+        finally:
+            intervalo.duracao = time.monotonic() - inicio
+            # Cada thread do pool abre a própria conexão com o banco
+            connection.close()
+        return intervalo
+
+    def registrar(self, intervalos):
+        """
+        Grava as consultas concluídas (ou não executadas) em ExecucaoSincronizacaoNotas
+
+        Args:
+            intervalos: Lista de _Intervalo
+        """
+        ExecucaoSincronizacaoNotas.objects.bulk_create([
+            ExecucaoSincronizacaoNotas(
+                execucao=self.execucao,
+                empresa=intervalo.empresa,
+                tipo=intervalo.tipo,
+                periodo_inicio=intervalo.inicio,
+                periodo_fim=intervalo.fim,
+                status=intervalo.status,
+                notas=intervalo.notas,
+                duracao=round(intervalo.duracao, 3),
+                mensagem=intervalo.mensagem,
+            )
+            for intervalo in intervalos
+        ])
+
+    @staticmethod
+    def avancar_marco(intervalos, concluidos):
+        """
+        Avança a marca d'água pelos intervalos concluídos em sequência
+
+        As consultas terminam fora de ordem: a marca só passa de um intervalo
+        quando todos os anteriores da mesma empresa/tipo tiveram sucesso.
+
+        Args:
+            intervalos: Intervalos de uma (empresa, tipo), em ordem cronológica
+            concluidos: Quantos intervalos do início já avançaram a marca
+
+        Returns:
+            int: Novo total de intervalos que avançaram a marca
+        """
+        ultimo = None
+        while concluidos < len(intervalos) and intervalos[concluidos].status == 'sucesso':
+            ultimo = intervalos[concluidos]
+            concluidos += 1
+        if ultimo is not None:
+            ultimo.sincronizador.avancar_marco(ultimo.tipo, ultimo.fim)
+        return concluidos
+
+    def executar(self, progresso=None):
+        """
+        Executa todas as consultas
+
+        Args:
+            progresso: Função chamada com cada _Intervalo concluído
+
+        Returns:
+            dict: Resumo (execucao, intervalos, sucesso, erros, nao_executados,
+                  notas, duracao, falhas)
+        """
+        inicio = time.monotonic()
+        planos = self.planejar()
+
+        # Uma fila por certificado; o intervalo mais antigo de cada empresa/tipo sai primeiro
+        filas = {}
+        for intervalos in planos.values():
+            for intervalo in intervalos:
+                filas.setdefault(intervalo.certificado, deque()).append(intervalo)
+        for certificado, fila in filas.items():
+            filas[certificado] = deque(sorted(fila, key=lambda intervalo: intervalo.inicio))
+
+        avancados = Counter()
+        ativos = Counter()
+        em_andamento = {}
+        contagem = Counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sincronizar-notas') as executor:
+            while filas or em_andamento:
+                if filas and self.prazo is not None and time.monotonic() - inicio > self.prazo:
+                    # Prazo esgotado: as consultas em andamento terminam, as demais ficam para a próxima
+                    restantes = [intervalo for fila in filas.values() for intervalo in fila]
+                    for intervalo in restantes:
+                        intervalo.status = 'nao_executada'
+                        intervalo.mensagem = 'Prazo da execução esgotado'
+                    self.registrar(restantes)
+                    contagem['nao_executada'] += len(restantes)
+                    filas = {}
+
+                # Distribui as vagas entre os certificados, um intervalo de cada por vez
+                distribuiu = True
+                while distribuiu and len(em_andamento) < self.workers:
+                    distribuiu = False
+                    for certificado in list(filas):
+                        if len(em_andamento) >= self.workers:
+                            break
+                        if ativos[certificado] >= self.por_certificado:
+                            continue
+                        intervalo = filas[certificado].popleft()
+                        if not filas[certificado]:
+                            del filas[certificado]
+                        ativos[certificado] += 1
+                        em_andamento[executor.submit(self.consultar, intervalo)] = intervalo
+                        distribuiu = True
+
+                if not em_andamento:
+                    continue
+
+                prontos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    intervalo = em_andamento.pop(futuro)
+                    ativos[intervalo.certificado] -= 1
+                    contagem[intervalo.status] += 1
+                    contagem['notas'] += intervalo.notas
+                    if intervalo.status == 'erro':
+                        logger.warning(
+                            f"Consulta {intervalo.tipo} da empresa {intervalo.empresa.id} de "
+                            f"{intervalo.inicio:%d/%m/%Y} a {intervalo.fim:%d/%m/%Y} falhou: {intervalo.mensagem}"
+                        )
+
+                    self.registrar([intervalo])
+                    chave = (intervalo.empresa.id, intervalo.tipo)
+                    avancados[chave] = self.avancar_marco(planos[chave], avancados[chave])
+                    if progresso:
+                        progresso(intervalo)
+
+        return {
+            'execucao': self.execucao,
+            'intervalos': sum(len(intervalos) for intervalos in planos.values()),
+            'sucesso': contagem['sucesso'],
+            'erros': contagem['erro'],
+            'nao_executados': contagem['nao_executada'],
+            'notas': contagem['notas'],
+            'duracao': time.monotonic() - inicio,
+            'falhas': self.falhas,
+        }
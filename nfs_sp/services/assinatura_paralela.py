@@ -0,0 +1,168 @@
+"""
+Assinatura de documentos da NFS-e São Paulo
+Funções de assinatura (RSA-SHA1 dos RPS e assinatura XML envelopada) e o
+AssinadorParalelo, que distribui as assinaturas de lotes grandes entre processos
+"""
+import base64
+
+import xmlsec
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.conf import settings
+from lxml import etree
+
+from core.services.pool_processos import PoolProcessos, quantidade_processos
+from .cache_chaves import CacheChaves, ChavesCertificado, cache_chaves
+
+
+def assinar_cadeia(chave_privada, cadeia):
+    """
+    Assina a cadeia de caracteres de um RPS (PKCS1v15 + SHA1)
+
+    Args:
+        chave_privada: Chave privada (cryptography)
+        cadeia: Cadeia de caracteres do RPS (string_nfe/string_nfe_cancelamento)
+
+    Returns:
+        str: Assinatura em base64
+    """
+    assinatura = chave_privada.sign(
+        cadeia.encode('utf-8'),
+        padding.PKCS1v15(),
+        hashes.SHA1()
+    )
+    return base64.b64encode(assinatura).decode('utf-8')
+
+
+def assinar_documento(chave_xmlsec, xml):
+    """
+    Preenche o template ds:Signature do XML (assinatura envelopada)
+
+    Args:
+        chave_xmlsec: Chave xmlsec com o certificado carregado
+        xml: Pedido com o template de assinatura; um elemento lxml (montado por
+             EventoNFeDjango) é assinado na própria árvore, sem nova leitura
+
+    Returns:
+        str: XML assinado
+    """
+    if isinstance(xml, str):
+        xml = xml.encode('utf-8')
+    template = etree.fromstring(xml) if isinstance(xml, bytes) else xml
+    signature_node = xmlsec.tree.find_node(template, xmlsec.constants.NodeSignature)
+
+    if signature_node is None:
+        raise Exception("Nó de assinatura não encontrado no XML")
+
+    ctx = xmlsec.SignatureContext()
+    ctx.key = chave_xmlsec
+    ctx.sign(signature_node)
+
+    xml_bytes = etree.tostring(template, pretty_print=False, encoding="utf-8", xml_declaration=True)
+    return xml_bytes.decode("utf-8")
+
+
+# Chaves carregadas em cada processo do pool (_inicializar_processo)
+_chaves_processo = None
+
+
+def _inicializar_processo(pem_path):
+    """Carrega as chaves do certificado uma única vez por processo do pool"""
+    global _chaves_processo
+    _chaves_processo = ChavesCertificado(pem_path, CacheChaves.impressao_digital(pem_path))
+
+
+def _assinar_cadeias_processo(cadeias):
+    return [assinar_cadeia(_chaves_processo.chave_privada, cadeia) for cadeia in cadeias]
+
+
+def _assinar_documento_processo(xml_bytes):
+    return assinar_documento(_chaves_processo.chave_xmlsec, xml_bytes)
+
+
+class AssinadorParalelo:
+    """
+    Assina os documentos de um certificado em um pool de processos
+
+    Usado como gerenciador de contexto. Abaixo de settings.NFE_ASSINATURA_PARALELA_MINIMO
+    documentos (ou com um único processo) assina no próprio processo, com as chaves do
+    cache_chaves; se o pool não puder ser usado, também volta para a assinatura serial.
+    """
+
+    def __init__(self, pem_path, quantidade=None, processos=None):
+        """
+        Inicializa o assinador
+
+        Args:
+            pem_path: Caminho do certificado PEM da empresa
+            quantidade: Quantidade de RPS a assinar (decide se vale a pena usar o pool)
+            processos: Quantidade de processos. Se None, usa
+                       settings.NFE_ASSINATURA_PROCESSOS (padrão: núcleos da máquina)
+        """
+        self.pem_path = pem_path
+        if processos is None:
+            processos = quantidade_processos(getattr(settings, 'NFE_ASSINATURA_PROCESSOS', None))
+        minimo = getattr(settings, 'NFE_ASSINATURA_PARALELA_MINIMO', 200)
+        if quantidade is not None and quantidade < minimo:
+            processos = 1
+
+        self.pool = PoolProcessos(
+            processos, 'assinatura', initializer=_inicializar_processo, initargs=(pem_path,)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+        return False
+
+    def fechar(self):
+        """Encerra o pool de processos"""
+        self.pool.fechar()
+
+    def assinar_cadeias(self, cadeias):
+        """
+        Assina as cadeias de caracteres dos RPS
+
+        Args:
+            cadeias: Lista de cadeias (EventoNFeDjango.cadeia_assinatura_rps)
+
+        Returns:
+            list: Assinaturas em base64, na mesma ordem
+        """
+        tamanho = max(1, -(-len(cadeias) // self.pool.processos))
+        blocos = [cadeias[i:i + tamanho] for i in range(0, len(cadeias), tamanho)]
+
+        def assinar_bloco(bloco):
+            chave_privada = cache_chaves.obter(self.pem_path).chave_privada
+            return [assinar_cadeia(chave_privada, cadeia) for cadeia in bloco]
+
+        return [
+            assinatura
+            for bloco in self.pool.mapear(_assinar_cadeias_processo, blocos, serial=assinar_bloco)
+            for assinatura in bloco
+        ]
+
+    def assinar_documento(self, xml):
+        """
+        Agenda a assinatura XML de um documento
+
+        No modo paralelo a assinatura roda em segundo plano, permitindo enviar um
+        lote enquanto os seguintes são assinados; o elemento é serializado uma
+        única vez para ser enviado ao processo. No modo serial a própria árvore
+        é assinada.
+
+        Args:
+            xml: Pedido com o template de assinatura (elemento lxml ou XML em texto)
+
+        Returns:
+            Future: Resultado com o XML assinado
+        """
+        xml_bytes = None
+        if self.pool.ativo:
+            xml_bytes = xml if isinstance(xml, (str, bytes)) else etree.tostring(xml)
+        return self.pool.submeter(
+            _assinar_documento_processo, xml_bytes,
+            serial=lambda: assinar_documento(cache_chaves.obter(self.pem_path).chave_xmlsec, xml)
+        )
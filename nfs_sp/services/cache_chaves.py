@@ -0,0 +1,130 @@
+"""
+Cache das chaves de assinatura por certificado
+Mantém em memória a chave privada (cryptography), a chave xmlsec e o certificado
+em base64 (DER) de cada PEM, evitando ler e decodificar o arquivo a cada nota
+"""
+import base64
+import os
+import threading
+from collections import OrderedDict
+
+import xmlsec
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import Encoding, load_pem_private_key
+from django.conf import settings
+
+
+class ChavesCertificado:
+    """Chaves e certificado decodificados de um arquivo PEM"""
+
+    def __init__(self, pem_path, impressao_digital):
+        """
+        Lê e decodifica o arquivo PEM (chave privada + certificado)
+
+        Args:
+            pem_path: Caminho do arquivo PEM
+            impressao_digital: (mtime em ns, tamanho) do arquivo lido
+        """
+        with open(pem_path, 'rb') as pem_file:
+            pem = pem_file.read()
+
+        self.impressao_digital = impressao_digital
+        self.chave_privada = load_pem_private_key(pem, password=None, backend=default_backend())
+
+        # Primeiro certificado do arquivo (o da empresa; os seguintes são a cadeia)
+        inicio = pem.find(b'-----BEGIN CERTIFICATE-----')
+        fim = pem.find(b'-----END CERTIFICATE-----', inicio) + len(b'-----END CERTIFICATE-----')
+        certificado = x509.load_pem_x509_certificate(pem[inicio:fim], default_backend())
+        self.certificado_base64 = base64.b64encode(certificado.public_bytes(Encoding.DER)).decode('utf-8')
+
+        # O SignatureContext duplica a chave ao recebê-la, então a instância pode ser compartilhada
+        self.chave_xmlsec = xmlsec.Key.from_memory(pem, xmlsec.constants.KeyDataFormatPem)
+        self.chave_xmlsec.load_cert_from_memory(pem, xmlsec.constants.KeyDataFormatPem)
+
+
+class CacheChaves:
+    """
+    Cache LRU das chaves por arquivo PEM, compartilhado por todo o processo
+
+    A impressão digital do arquivo (mtime + tamanho) é conferida a cada uso:
+    um certificado substituído é relido e a entrada anterior descartada.
+    """
+
+    def __init__(self, tamanho_maximo=None):
+        """
+        Inicializa o cache
+
+        Args:
+            tamanho_maximo: Quantidade máxima de certificados em memória. Se None,
+                            usa settings.NFE_CACHE_CHAVES_TAMANHO
+        """
+        self._tamanho_maximo = tamanho_maximo
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def tamanho_maximo(self):
+        if self._tamanho_maximo is not None:
+            return self._tamanho_maximo
+        return getattr(settings, 'NFE_CACHE_CHAVES_TAMANHO', 64)
+
+    @staticmethod
+    def impressao_digital(pem_path):
+        """
+        Retorna a impressão digital do arquivo PEM
+
+        Args:
+            pem_path: Caminho do arquivo PEM
+
+        Returns:
+            tuple: (mtime em ns, tamanho em bytes)
+        """
+        stat = os.stat(pem_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def obter(self, pem_path):
+        """
+        Retorna as chaves do certificado, lendo o arquivo se necessário
+
+        Args:
+            pem_path: Caminho do arquivo PEM
+
+        Returns:
+            ChavesCertificado: Chaves decodificadas
+        """
+        impressao = self.impressao_digital(pem_path)
+
+        with self._lock:
+            entrada = self._entradas.get(pem_path)
+            if entrada is not None and entrada.impressao_digital == impressao:
+                self._entradas.move_to_end(pem_path)
+                return entrada
+
+        # Leitura e decodificação fora do lock para não bloquear outros certificados
+        nova = ChavesCertificado(pem_path, impressao)
+
+        with self._lock:
+            self._entradas[pem_path] = nova
+            self._entradas.move_to_end(pem_path)
+            while len(self._entradas) > self.tamanho_maximo:
+                self._entradas.popitem(last=False)
+
+        return nova
+
+    def invalidar(self, pem_path=None):
+        """
+        Descarta as chaves de um certificado (ou todas, se pem_path for None)
+
+        Args:
+            pem_path: Caminho do arquivo PEM
+        """
+        with self._lock:
+            if pem_path is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(pem_path, None)
+
+
+# Instância única por processo
+cache_chaves = CacheChaves()
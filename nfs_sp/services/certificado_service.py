@@ -106,3 +106,27 @@ class CertificadoService:
             return self.converter_pfx_para_pem(empresa)
         
         return pem_path
+    
+    def invalidar_certificado(self, empresa):
+        """
+        Descarta o PEM gerado, as chaves e os clientes SOAP/HTTP em cache da empresa
+        
+        Deve ser chamado quando o certificado PFX é substituído ou removido,
+        para que o próximo uso converta o novo arquivo.
+        
+        Args:
+            empresa: Instância do modelo Empresa
+        """
+        from nfse_nacional.services.cliente_sefin import pool_sessoes
+        from .cache_chaves import cache_chaves
+        from .pool_clientes_soap import pool_clientes
+        
+        cnpj_limpo = empresa.cnpj.replace('.', '').replace('/', '').replace('-', '')
+        pem_path = os.path.join(self.cert_dir, f"{cnpj_limpo}.pem")
+        
+        pool_clientes.invalidar(pem_path)
+        pool_sessoes.invalidar(pem_path)
+        cache_chaves.invalidar(pem_path)
+        
+        if os.path.exists(pem_path):
+            os.remove(pem_path)
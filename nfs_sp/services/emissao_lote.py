@@ -0,0 +1,485 @@
+"""
+Emissão de NFS-e São Paulo em lote
+Agrupa os RPS por empresa em PedidoEnvioLoteRPS (até 50 RPS por requisição)
+e aplica o retorno de cada RPS nas notas
+"""
+import logging
+import re
+from concurrent.futures import Future
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import NotaFiscalSP
+from core.services.esquemas_xsd import ErroValidacaoXML
+from .assinatura_paralela import AssinadorParalelo
+from .nfe_eventos_django import EventoNFeDjango
+from .numeracao_rps import numerar_notas
+from .processador_django import ProcessadorNFeDjango
+from .registro_envio import RegistroEnvios
+
+logger = logging.getLogger(__name__)
+
+
+class EmissorLoteRPS:
+    """
+    Emite as notas selecionadas usando EnvioLoteRPS (ou TesteEnvioLoteRPS)
+    """
+
+    def __init__(self, teste=False):
+        """
+        Inicializa o emissor
+
+        Args:
+            teste: Se True, apenas valida os lotes (TesteEnvioLoteRPS), sem gerar NFS-e
+        """
+        self.teste = teste
+
+    def emitir(self, notas_ids, progresso=None):
+        """
+        Emite as notas informadas
+
+        Args:
+            notas_ids: Lista de IDs de NotaFiscalSP
+            progresso: Função chamada com os resultados parciais após cada lote
+
+        Returns:
+            dict: Resumo no formato esperado por emitir.html (sucesso, mensagem,
+                  emitidas, erros, total, resultados)
+        """
+        resultados = []
+        notas_por_empresa = {}
+
+        notas = NotaFiscalSP.objects.select_related('empresa').in_bulk(
+            [nota_id for nota_id in notas_ids if str(nota_id).isdigit()]
+        )
+
+        for nota_id in notas_ids:
+            nota = notas.get(int(nota_id)) if str(nota_id).isdigit() else None
+            if nota is None:
+                resultados.append({
+                    'id': nota_id,
+                    'sucesso': False,
+                    'mensagem': 'Erro: Nota não encontrada'
+                })
+                continue
+
+            # Verificar se já foi emitida ou cancelada (não permite reenvio)
+            if nota.status_rps in ['emitida', 'cancelada']:
+                resultados.append({
+                    'id': nota_id,
+                    'sucesso': False,
+                    'mensagem': f'RPS {nota.numero_rps} já foi {nota.get_status_rps_display().lower()}'
+                })
+                continue
+
+            if nota.empresa is None:
+                resultados.append(self.resultado_erro(nota, 'Nota sem empresa prestadora vinculada'))
+                continue
+
+            notas_por_empresa.setdefault(nota.empresa_id, []).append(nota)
+
+        try:
+            self.preparar_notas([nota for notas_empresa in notas_por_empresa.values() for nota in notas_empresa])
+        except Exception as e:
+            for notas_empresa in notas_por_empresa.values():
+                resultados.extend(self.resultado_erro(nota, str(e)) for nota in notas_empresa)
+            notas_por_empresa = {}
+
+        for notas_empresa in notas_por_empresa.values():
+            self.emitir_empresa(notas_empresa, resultados, progresso)
+
+        # Mantém a ordem da seleção
+        ordem = {str(nota_id): posicao for posicao, nota_id in enumerate(notas_ids)}
+        resultados.sort(key=lambda r: ordem.get(str(r['id']), len(ordem)))
+
+        return self.resumo(resultados, len(notas_ids))
+
+    def preparar_notas(self, notas):
+        """
+        Limpa erros anteriores e numera os RPS sem número (um bloco por empresa/série)
+
+        Args:
+            notas: Lista de NotaFiscalSP a emitir
+        """
+        alteradas = []
+        for nota in notas:
+            # Se estava com erro, limpar mensagem de erro anterior
+            if nota.status_rps == 'erro' and nota.mensagem_erro:
+                nota.mensagem_erro = None
+                alteradas.append(nota)
+
+        # Reserva e gravação na mesma transação: sem lacuna na numeração se a gravação falhar
+        with transaction.atomic():
+            for nota in numerar_notas(notas):
+                nota.tributacao_rps = nota.tributacao_rps or nota.tipo_tributacao
+                alteradas.append(nota)
+
+            if alteradas:
+                NotaFiscalSP.objects.bulk_update(
+                    list({nota.id: nota for nota in alteradas}.values()),
+                    ['numero_rps', 'serie_rps', 'tributacao_rps', 'mensagem_erro']
+                )
+
+    def emitir_empresa(self, notas, resultados, progresso=None):
+        """
+        Envia as notas de uma empresa em lotes
+
+        Args:
+            notas: Lista de NotaFiscalSP da mesma empresa
+            resultados: Lista onde os resultados por nota são acrescentados
+            progresso: Função chamada com os resultados parciais após cada lote
+        """
+        empresa = notas[0].empresa
+        evento = EventoNFeDjango(empresa)
+        processador = ProcessadorNFeDjango(empresa)
+        registro = None if self.teste else RegistroEnvios(evento)
+        limite = EventoNFeDjango.LIMITE_RPS_LOTE
+
+        if registro is not None:
+            # RPS com envio anterior sem resultado gravado: consulta antes de reenviar
+            pendentes = registro.pendentes(notas)
+            if pendentes:
+                resolvidas = self.reconciliar(
+                    processador, evento, registro, [nota for nota in notas if nota.id in pendentes], resultados
+                )
+                notas = [nota for nota in notas if nota.id not in resolvidas]
+                if progresso:
+                    progresso(resultados)
+                if not notas:
+                    return
+
+        lotes = [notas[inicio:inicio + limite] for inicio in range(0, len(notas), limite)]
+
+        with AssinadorParalelo(processador.cert_path, len(notas)) as assinador:
+            # Monta e agenda a assinatura de todos os lotes; o envio de cada lote
+            # começa assim que a sua assinatura fica pronta
+            pedidos = [self.preparar_pedido(evento, assinador, lote) for lote in lotes]
+
+            for lote, pedido, rejeitadas in pedidos:
+                if rejeitadas:
+                    # RPS fora do leiaute: rejeitados localmente, sem ida à prefeitura
+                    resultados.extend(self.aplicar_retorno(list(rejeitadas), {
+                        'sucesso': False,
+                        'rps': {},
+                        'erros_rps': {
+                            ProcessadorNFeDjango.chave_rps(nota.serie_rps, nota.numero_rps): erros
+                            for nota, erros in rejeitadas.items()
+                        },
+                    }))
+                if not lote:
+                    if progresso:
+                        progresso(resultados)
+                    continue
+
+                enviado = False
+                try:
+                    xml = pedido.result()
+                    if registro is not None:
+                        registro.registrar(lote)
+                    enviado = True
+                    retorno = processador.enviar_lote_rps(xml, teste=self.teste, assinado=True)
+                except Exception as e:
+                    # Depois do início do envio, o lote pode ter sido processado pela prefeitura
+                    retorno = {'sucesso': False, 'mensagem': str(e), 'rps': {}, 'erros_rps': {}, 'incerto': enviado}
+
+                logger.info(
+                    f"Lote de {len(lote)} RPS da empresa {empresa.id} "
+                    f"({'teste' if self.teste else 'envio'}): {retorno.get('mensagem')}"
+                )
+                resultados.extend(self.aplicar_retorno(lote, retorno))
+                if registro is not None:
+                    registro.concluir(lote, incerto=retorno.get('incerto', False))
+                if progresso:
+                    progresso(resultados)
+
+    def reconciliar(self, processador, evento, registro, notas, resultados):
+        """
+        Consulta na prefeitura (ConsultaNFe por ChaveRPS) os RPS com envio anterior
+        sem resultado gravado
+
+        Os RPS encontrados são gravados como emitidos, sem novo envio; os não
+        encontrados seguem para o envio normal. Se a consulta falhar (transporte
+        ou erro da prefeitura que não seja de RPS inexistente), os RPS não são
+        reenviados (o envio anterior pode ter gerado NFS-e).
+
+        Args:
+            processador: ProcessadorNFeDjango da empresa
+            evento: EventoNFeDjango da empresa
+            registro: RegistroEnvios da empresa
+            notas: Lista de NotaFiscalSP com registro 'enviando'
+            resultados: Lista onde os resultados por nota são acrescentados
+
+        Returns:
+            set: IDs das notas resolvidas (não devem ser reenviadas)
+        """
+        resolvidas = set()
+        limite = EventoNFeDjango.LIMITE_RPS_LOTE
+        # RPS alterados depois do envio anterior: a NFS-e, se existir, tem os dados enviados
+        alterados = registro.alterados(notas)
+
+        for inicio in range(0, len(notas), limite):
+            lote = notas[inicio:inicio + limite]
+            try:
+                retorno = processador.consultar_nfe_rps(evento.criar_pedido_consulta_rps(lote))
+            except Exception as e:
+                retorno = {'sucesso': False, 'mensagem': str(e)}
+
+            if not self.consulta_conclusiva(retorno):
+                mensagem = (
+                    'Envio anterior deste RPS sem confirmação e a consulta à prefeitura falhou; '
+                    'o RPS não foi reenviado para evitar NFS-e duplicada.\n'
+                    f"{retorno.get('mensagem', '')}"
+                )
+                for nota in lote:
+                    resultados.append(self.resultado_erro(nota, mensagem))
+                    resolvidas.add(nota.id)
+                continue
+
+            encontradas = {
+                ProcessadorNFeDjango.chave_rps(dados.serie_rps, dados.numero_rps): dados
+                for dados in retorno.get('notas', [])
+                if dados.numero_rps
+            }
+            confirmadas = []
+            for nota in lote:
+                dados = encontradas.get(ProcessadorNFeDjango.chave_rps(nota.serie_rps, nota.numero_rps))
+                if not dados:
+                    continue
+
+                nota.numero_nfse = dados.numero_nfe
+                nota.codigo_verificacao = dados.codigo_verificacao
+                nota.status_rps = 'emitida'
+                nota.mensagem_erro = None
+                nota.data_emissao = datetime.now()
+                nota.save()
+                confirmadas.append(nota)
+                resolvidas.add(nota.id)
+                resultado = self.resultado_sucesso(nota)
+                resultado['mensagem'] += '\n(NFS-e já gerada em envio anterior; confirmada por consulta)'
+                if nota.id in alterados:
+                    resultado['mensagem'] += (
+                        '\nAtenção: a nota foi alterada depois do envio anterior; '
+                        'a NFS-e foi gerada com os dados enviados naquele momento.'
+                    )
+                resultados.append(resultado)
+
+            registro.concluir(confirmadas)
+            logger.info(
+                f"Consulta de {len(lote)} RPS sem confirmação da empresa {evento.empresa.id}: "
+                f"{len(confirmadas)} já emitido(s)"
+            )
+
+        return resolvidas
+
+    def consulta_conclusiva(self, retorno):
+        """
+        Indica se o retorno da ConsultaNFe permite decidir quais RPS reenviar
+
+        O retorno do processador tem sucesso=True sempre que o XML é lido; um
+        Cabecalho com Sucesso=false (ex.: certificado inválido) só é conclusivo
+        quando todos os erros são de RPS/NF-e inexistente.
+
+        Args:
+            retorno: Resultado de ProcessadorNFeDjango.consultar_nfe_rps
+
+        Returns:
+            bool: True se os RPS não encontrados podem ser reenviados
+        """
+        if not retorno.get('sucesso'):
+            return False
+        if retorno.get('sucesso_prefeitura') is False:
+            erros = retorno.get('erros') or []
+            codigos = set(getattr(settings, 'NFE_CODIGOS_RPS_NAO_ENCONTRADO', ()))
+            return bool(erros) and all(erro.get('codigo') in codigos for erro in erros)
+        return True
+
+    def preparar_pedido(self, evento, assinador, lote):
+        """
+        Monta o PedidoEnvioLoteRPS de um lote, valida no XSD e agenda a assinatura XML
+
+        Os RPS que não passam na validação do schema saem do lote; os demais
+        seguem para o envio.
+
+        Args:
+            evento: EventoNFeDjango da empresa
+            assinador: AssinadorParalelo do certificado da empresa
+            lote: Lista de NotaFiscalSP do lote
+
+        Returns:
+            tuple: (notas do lote a enviar, Future com o XML assinado (ou a exceção
+                   ocorrida na montagem), {nota: erros} dos RPS rejeitados)
+        """
+        rejeitadas = {}
+        try:
+            assinaturas = assinador.assinar_cadeias([evento.cadeia_assinatura_rps(nota) for nota in lote])
+            try:
+                xml = evento.criar_pedido_envio_lote_rps(lote, assinaturas=assinaturas)
+            except ErroValidacaoXML as e:
+                rejeitadas = self.rps_invalidos(lote, e)
+                if not rejeitadas:
+                    raise
+                validos = [posicao for posicao, nota in enumerate(lote) if nota not in rejeitadas]
+                lote = [lote[posicao] for posicao in validos]
+                xml = evento.criar_pedido_envio_lote_rps(
+                    lote, assinaturas=[assinaturas[posicao] for posicao in validos]
+                ) if lote else None
+        except Exception as e:
+            pedido = Future()
+            pedido.set_exception(e)
+            return lote, pedido, rejeitadas
+        return lote, assinador.assinar_documento(xml) if xml is not None else None, rejeitadas
+
+    @staticmethod
+    def rps_invalidos(lote, erro):
+        """
+        Separa por RPS os erros de validação do lote
+
+        Args:
+            lote: Lista de NotaFiscalSP, na ordem do pedido
+            erro: ErroValidacaoXML do PedidoEnvioLoteRPS
+
+        Returns:
+            dict: {nota: [{'codigo', 'descricao'}]} dos RPS com erro; vazio se algum
+                  erro estiver fora dos RPS (ex.: Cabecalho), o que invalida o lote todo
+        """
+        rejeitadas = {}
+        for item in erro.erros:
+            match = re.search(r'(?:^|/)RPS(?:\[(\d+)\])?/', item['caminho'])
+            if match is None:
+                return {}
+            posicao = int(match.group(1) or 1) - 1
+            rejeitadas.setdefault(lote[posicao], []).append({
+                'codigo': '',
+                'descricao': f"Leiaute XML inválido em {item['campo']}: {item['mensagem']}",
+            })
+        return rejeitadas
+
+    def aplicar_retorno(self, lote, retorno):
+        """
+        Atualiza as notas do lote conforme o retorno da prefeitura
+
+        Args:
+            lote: Lista de NotaFiscalSP enviadas
+            retorno: Resultado de ProcessadorNFeDjango.enviar_lote_rps
+
+        Returns:
+            list: Resultados por nota
+        """
+        resultados = []
+        for nota in lote:
+            chave = ProcessadorNFeDjango.chave_rps(nota.serie_rps, nota.numero_rps)
+            dados_nfe = retorno.get('rps', {}).get(chave)
+            erros_rps = retorno.get('erros_rps', {}).get(chave)
+
+            if dados_nfe:
+                nota.numero_nfse = dados_nfe.get('numero_nfe')
+                nota.codigo_verificacao = dados_nfe.get('codigo_verificacao')
+                nota.status_rps = 'emitida'
+                nota.data_emissao = datetime.now()
+                nota.save()
+                resultados.append(self.resultado_sucesso(nota, dados_nfe.get('url_nfe')))
+                continue
+
+            if erros_rps:
+                mensagem = '\n'.join(
+                    f"{erro['codigo']} - {erro['descricao']}" if erro['codigo'] else erro['descricao']
+                    for erro in erros_rps
+                )
+            elif retorno.get('sucesso') and self.teste:
+                resultados.append(self.resultado_teste(nota))
+                continue
+            elif retorno.get('sucesso'):
+                mensagem = 'RPS não retornado pela prefeitura no processamento do lote'
+            else:
+                mensagem = retorno.get('mensagem', 'Erro ao emitir RPS')
+
+            if not self.teste:
+                nota.status_rps = 'erro'
+                nota.mensagem_erro = mensagem
+                nota.save()
+            resultados.append(self.resultado_erro(nota, mensagem))
+
+        return resultados
+
+    def resultado_sucesso(self, nota, url=None):
+        return {
+            'id': nota.id,
+            'sucesso': True,
+            'numero_rps': nota.numero_rps,
+            'serie_rps': nota.serie_rps,
+            'tomador': nota.nome_tomador,
+            'valor': float(nota.valor_total),
+            'mensagem': f'✅ RPS Nº {nota.numero_rps} - Série {nota.serie_rps}\n'
+                       f'Emitido com sucesso!\n'
+                       f'Tomador: {nota.nome_tomador}\n'
+                       f'Valor: R$ {nota.valor_total:,.2f}',
+            'numero_nfe': nota.numero_nfse,
+            'codigo_verificacao': nota.codigo_verificacao,
+            'url': url
+        }
+
+    def resultado_teste(self, nota):
+        return {
+            'id': nota.id,
+            'sucesso': True,
+            'numero_rps': nota.numero_rps,
+            'serie_rps': nota.serie_rps,
+            'tomador': nota.nome_tomador,
+            'valor': float(nota.valor_total),
+            'mensagem': f'✅ RPS Nº {nota.numero_rps} - Série {nota.serie_rps}\n'
+                       f'Validado no teste de envio (nenhuma NFS-e gerada)\n'
+                       f'Tomador: {nota.nome_tomador}\n'
+                       f'Valor: R$ {nota.valor_total:,.2f}'
+        }
+
+    def resultado_erro(self, nota, mensagem):
+        return {
+            'id': nota.id,
+            'sucesso': False,
+            'numero_rps': nota.numero_rps,
+            'serie_rps': nota.serie_rps,
+            'tomador': nota.nome_tomador,
+            'valor': float(nota.valor_total),
+            'mensagem': f'❌ RPS Nº {nota.numero_rps} - Série {nota.serie_rps}\n'
+                       f'Erro na emissão:\n\n'
+                       f'{mensagem}\n\n'
+                       f'Tomador: {nota.nome_tomador}\n'
+                       f'Valor: R$ {nota.valor_total:,.2f}'
+        }
+
+    def resumo(self, resultados, total):
+        """
+        Monta a resposta final da emissão
+
+        Args:
+            resultados: Resultados por nota
+            total: Quantidade de notas solicitadas
+
+        Returns:
+            dict: Resposta no formato esperado por emitir.html
+        """
+        emitidas = sum(1 for r in resultados if r['sucesso'])
+        erros = len(resultados) - emitidas
+
+        # Mensagem de resumo profissional
+        if self.teste and erros == 0:
+            mensagem_resumo = f'🧪 Teste de envio concluído.\n\nTodas as {emitidas} nota(s) foram validadas pela prefeitura.'
+        elif self.teste:
+            mensagem_resumo = f'🧪 Teste de envio concluído.\n\n{emitidas} nota(s) válida(s).\n{erros} nota(s) com erro.'
+        elif emitidas > 0 and erros == 0:
+            mensagem_resumo = f'🎉 Processamento concluído com sucesso!\n\nTodas as {emitidas} nota(s) foram emitidas corretamente.'
+        elif emitidas > 0 and erros > 0:
+            mensagem_resumo = f'⚠️ Processamento concluído com avisos.\n\n{emitidas} nota(s) emitida(s) com sucesso.\n{erros} nota(s) com erro.'
+        else:
+            mensagem_resumo = f'❌ Não foi possível emitir as notas.\n\n{erros} erro(s) encontrado(s).'
+
+        return {
+            'sucesso': emitidas > 0,
+            'mensagem': mensagem_resumo,
+            'emitidas': emitidas,
+            'erros': erros,
+            'total': total,
+            'resultados': resultados
+        }
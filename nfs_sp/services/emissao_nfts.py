@@ -0,0 +1,161 @@
+"""
+Emissão de NFTS (Nota Fiscal do Tomador de Serviços) São Paulo
+"""
+from datetime import datetime
+
+from core.models import NotaFiscalTomadorSP
+from core.services.esquemas_xsd import ErroValidacaoXML
+from .nfe_eventos_django import EventoNFeDjango
+from .processador_django import ProcessadorNFeDjango
+
+
+class EmissorNFTS:
+    """
+    Emite as NFTS selecionadas, reaproveitando evento e processador por empresa
+    """
+
+    def __init__(self):
+        self.eventos = {}
+        self.processadores = {}
+
+    def emitir(self, notas_ids, progresso=None):
+        """
+        Emite as NFTS informadas
+
+        Args:
+            notas_ids: Lista de IDs de NotaFiscalTomadorSP
+            progresso: Função chamada com os resultados parciais após cada nota
+
+        Returns:
+            dict: Resumo no formato esperado por emitir.html
+        """
+        resultados = []
+
+        for nota_id in notas_ids:
+            try:
+                nota = NotaFiscalTomadorSP.objects.select_related('empresa').get(id=nota_id)
+                resultados.append(self.emitir_nota(nota))
+            except Exception as e:
+                resultados.append({
+                    'id': nota_id,
+                    'sucesso': False,
+                    'mensagem': f'Erro: {str(e)}'
+                })
+            if progresso:
+                progresso(resultados)
+
+        return self.resumo(resultados, len(notas_ids))
+
+    def emitir_nota(self, nota):
+        """
+        Emite uma NFTS
+
+        Args:
+            nota: Instância de NotaFiscalTomadorSP
+
+        Returns:
+            dict: Resultado da nota
+        """
+        dados = {
+            'id': nota.id,
+            'numero_documento': nota.numero_documento,
+            'serie': nota.serie,
+            'prestador': nota.cnpj_cpf_prestador,
+            'valor': float(nota.valor_total),
+        }
+        identificacao = f'NFTS Nº {nota.numero_documento}' + (f' - Série {nota.serie}' if nota.serie else '')
+        rodape = f'Prestador: {nota.cnpj_cpf_prestador}\nValor: R$ {nota.valor_total:,.2f}'
+
+        # Verificar se já foi emitida ou cancelada (não permite reenvio)
+        if nota.status_nfts in ['emitida', 'cancelada']:
+            return {
+                **dados,
+                'sucesso': False,
+                'mensagem': f'❌ {identificacao}\n'
+                           f'Não pode ser emitida:\n\n'
+                           f'Status atual: {nota.get_status_nfts_display()}\n'
+                           f'Esta nota já foi {nota.get_status_nfts_display().lower()}.\n\n'
+                           f'{rodape}'
+            }
+
+        # Se estava com erro, limpar mensagem de erro anterior
+        if nota.status_nfts == 'erro':
+            nota.mensagem_erro = None
+
+        # Criar XML e enviar
+        if nota.empresa_id not in self.processadores:
+            self.eventos[nota.empresa_id] = EventoNFeDjango(nota.empresa)
+            self.processadores[nota.empresa_id] = ProcessadorNFeDjango(nota.empresa)
+        evento = self.eventos[nota.empresa_id]
+        processador = self.processadores[nota.empresa_id]
+
+        try:
+            xml = evento.criar_pedido_envio_nfts(nota)
+        except ErroValidacaoXML as e:
+            # Rejeitada localmente, sem ida à prefeitura
+            resultado = {'sucesso': False, 'mensagem': f'Leiaute XML inválido:\n{e}'}
+        else:
+            resultado = processador.enviar_nfts(xml)
+
+        if resultado['sucesso']:
+            # Atualizar nota
+            nota.nfts = resultado.get('numero_nfe')
+            nota.codigo_verificacao = resultado.get('codigo_verificacao')
+            nota.status_nfts = 'emitida'
+            nota.data_emissao = datetime.now()
+            nota.save()
+
+            return {
+                **dados,
+                'sucesso': True,
+                'mensagem': f'✅ {identificacao}\n'
+                           f'Emitida com sucesso!\n'
+                           f'{rodape}',
+                'numero_nfe': nota.nfts,
+                'codigo_verificacao': nota.codigo_verificacao,
+                'url': resultado.get('url_nfe')
+            }
+
+        nota.status_nfts = 'erro'
+        nota.mensagem_erro = resultado.get('mensagem', 'Erro desconhecido')
+        nota.save()
+
+        return {
+            **dados,
+            'sucesso': False,
+            'mensagem': f'❌ {identificacao}\n'
+                       f'Erro na emissão:\n\n'
+                       f'{resultado.get("mensagem", "Erro ao emitir NFTS")}\n\n'
+                       f'{rodape}'
+        }
+
+    def resumo(self, resultados, total):
+        """
+        Monta a resposta final da emissão
+
+        Args:
+            resultados: Resultados por nota
+            total: Quantidade de notas solicitadas
+
+        Returns:
+            dict: Resposta no formato esperado por emitir.html
+        """
+        emitidas = sum(1 for r in resultados if r['sucesso'])
+        erros = len(resultados) - emitidas
+
+        # Mensagem de resumo profissional
+        if emitidas > 0 and erros == 0:
+            mensagem_resumo = f'🎉 Emissão concluída com sucesso!\n\nTodas as {emitidas} NFTS foram emitidas corretamente.'
+        elif emitidas > 0 and erros > 0:
+            mensagem_resumo = f'⚠️ Emissão concluída com avisos.\n\n{emitidas} NFTS emitida(s) com sucesso.\n{erros} NFTS com erro.'
+        else:
+            mensagem_resumo = f'❌ Não foi possível emitir as NFTS.\n\n{erros} erro(s) encontrado(s).'
+
+        return {
+            'sucesso': emitidas > 0,
+            'mensagem': mensagem_resumo,
+            'emitidas': emitidas,
+            'erros': erros,
+            'total': total,
+            'resultados': resultados
+        }
@@ -0,0 +1,197 @@
+"""
+Leitura em fluxo do RetornoConsulta (ConsultaNFe, ConsultaNFeEmitidas e
+ConsultaNFeRecebidas)
+Cada elemento NFe é convertido em um registro tipado (Decimal, datetime) ao
+terminar de ser lido e descartado em seguida: a memória fica limitada a uma
+nota por vez e o tempo de leitura é linear no tamanho da resposta
+"""
+import io
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from lxml import etree
+
+
+@dataclass(slots=True)
+class NFeConsultada:
+    """NFS-e de um RetornoConsulta (valores sem formatação de apresentação)"""
+
+    inscricao_prestador: str = None
+    numero_nfe: str = None
+    codigo_verificacao: str = None
+    data_emissao: datetime = None
+    data_fato_gerador: datetime = None
+    serie_rps: str = None
+    numero_rps: str = None
+    cpf_cnpj_prestador: str = None
+    razao_social_prestador: str = None
+    logradouro: str = None
+    numero_endereco: str = None
+    bairro: str = None
+    cidade: str = None
+    uf: str = None
+    cep: str = None
+    status_nfe: str = None
+    data_cancelamento: datetime = None
+    tributacao_nfe: str = None
+    valor_servicos: Decimal = None
+    valor_deducoes: Decimal = None
+    codigo_servico: str = None
+    aliquota_servicos: Decimal = None
+    valor_iss: Decimal = None
+    valor_credito: Decimal = None
+    iss_retido: bool = None
+    cpf_cnpj_tomador: str = None
+    razao_social_tomador: str = None
+    discriminacao: str = None
+
+
+def _texto(valor):
+    return valor.strip() if valor else None
+
+
+def _decimal(valor):
+    try:
+        return Decimal(valor) if valor else None
+    except InvalidOperation:
+        return None
+
+
+def _data_hora(valor):
+    try:
+        return datetime.fromisoformat(valor) if valor else None
+    except ValueError:
+        return None
+
+
+def _booleano(valor):
+    return valor.strip().lower() in ('true', '1') if valor else None
+
+
+# Filhos diretos do tpNFe: atributo do registro e conversão
+CAMPOS_NFE = {
+    'DataEmissaoNFe': ('data_emissao', _data_hora),
+    'DataFatoGeradorNFe': ('data_fato_gerador', _data_hora),
+    'RazaoSocialPrestador': ('razao_social_prestador', _texto),
+    'StatusNFe': ('status_nfe', _texto),
+    'DataCancelamento': ('data_cancelamento', _data_hora),
+    'TributacaoNFe': ('tributacao_nfe', _texto),
+    'ValorServicos': ('valor_servicos', _decimal),
+    'ValorDeducoes': ('valor_deducoes', _decimal),
+    'CodigoServico': ('codigo_servico', _texto),
+    'AliquotaServicos': ('aliquota_servicos', _decimal),
+    'ValorISS': ('valor_iss', _decimal),
+    'ValorCredito': ('valor_credito', _decimal),
+    'ISSRetido': ('iss_retido', _booleano),
+    'RazaoSocialTomador': ('razao_social_tomador', _texto),
+    'Discriminacao': ('discriminacao', lambda valor: valor),
+}
+
+# Grupos do tpNFe: atributo do registro de cada filho (texto)
+GRUPOS_NFE = {
+    'ChaveNFe': {
+        'InscricaoPrestador': 'inscricao_prestador',
+        'NumeroNFe': 'numero_nfe',
+        'CodigoVerificacao': 'codigo_verificacao',
+    },
+    'ChaveRPS': {'SerieRPS': 'serie_rps', 'NumeroRPS': 'numero_rps'},
+    'CPFCNPJPrestador': {'CPF': 'cpf_cnpj_prestador', 'CNPJ': 'cpf_cnpj_prestador'},
+    'EnderecoPrestador': {
+        'Logradouro': 'logradouro',
+        'NumeroEndereco': 'numero_endereco',
+        'Bairro': 'bairro',
+        'Cidade': 'cidade',
+        'UF': 'uf',
+        'CEP': 'cep',
+    },
+    'CPFCNPJTomador': {'CPF': 'cpf_cnpj_tomador', 'CNPJ': 'cpf_cnpj_tomador'},
+}
+
+
+def _nome(tag):
+    """Nome local da tag (sem namespace)"""
+    return tag.rpartition('}')[2]
+
+
+def ler_nfe(elemento):
+    """
+    Converte um elemento NFe (tpNFe) em registro, percorrendo seus filhos uma única vez
+
+    Args:
+        elemento: Elemento lxml da NFe
+
+    Returns:
+        NFeConsultada: Registro da nota
+    """
+    campos = {}
+    for filho in elemento:
+        nome = _nome(filho.tag)
+        grupo = GRUPOS_NFE.get(nome)
+        if grupo is not None:
+            for neto in filho:
+                atributo = grupo.get(_nome(neto.tag))
+                if atributo:
+                    campos[atributo] = _texto(neto.text)
+            continue
+
+        campo = CAMPOS_NFE.get(nome)
+        if campo:
+            atributo, conversao = campo
+            campos[atributo] = conversao(filho.text)
+    return NFeConsultada(**campos)
+
+
+class LeitorRetornoConsulta:
+    """
+    Leitor em fluxo de um RetornoConsulta
+
+    Iterar o leitor produz as NFeConsultada na ordem da resposta. O Cabecalho,
+    os Alertas e os Erros vêm antes das notas no schema e ficam disponíveis em
+    sucesso, alertas e erros (completos ao final da iteração).
+    """
+
+    def __init__(self, xml_resposta):
+        """
+        Inicializa o leitor
+
+        Args:
+            xml_resposta: XML de resposta do webservice (str ou bytes)
+        """
+        if isinstance(xml_resposta, str):
+            xml_resposta = xml_resposta.encode('utf-8')
+        self.xml_resposta = xml_resposta
+        self.sucesso = None
+        self.alertas = []
+        self.erros = []
+
+    @staticmethod
+    def evento(elemento):
+        """Código e descrição de um Alerta/Erro (tpEvento)"""
+        dados = {_nome(filho.tag): _texto(filho.text) for filho in elemento}
+        return {'codigo': dados.get('Codigo') or '', 'descricao': dados.get('Descricao') or ''}
+
+    def __iter__(self):
+        contexto = etree.iterparse(
+            io.BytesIO(self.xml_resposta),
+            events=('end',),
+            tag=('{*}NFe', '{*}Sucesso', '{*}Alerta', '{*}Erro'),
+            remove_blank_text=True,
+        )
+        for _, elemento in contexto:
+            nome = _nome(elemento.tag)
+            if nome == 'Sucesso':
+                self.sucesso = _booleano(elemento.text)
+                continue
+
+            if nome == 'NFe':
+                yield ler_nfe(elemento)
+            else:
+                (self.alertas if nome == 'Alerta' else self.erros).append(self.evento(elemento))
+
+            # Libera a nota (ou evento) lida e os irmãos anteriores já processados
+            elemento.clear()
+            pai = elemento.getparent()
+            if pai is not None:
+                while elemento.getprevious() is not None:
+                    del pai[0]
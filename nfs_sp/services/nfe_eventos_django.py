@@ -1,19 +1,21 @@
 """
 Serviço de Eventos NFS-e para Django
 Adaptado para funcionar com Django ORM e estrutura web
+
+Os pedidos são montados diretamente em árvores lxml (E-factory) e entregues à
+assinatura XML sem serialização intermediária
 """
-import xml.etree.ElementTree as ET
+import copy
 import lxml.etree as etree
+from lxml.builder import ElementMaker
 from datetime import datetime
 import locale
 import os
 from django.conf import settings
 
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives.serialization import load_pem_private_key
-from cryptography.hazmat.backends import default_backend
-import base64
+from core.services.esquemas_xsd import registro_esquemas
+from .assinatura_paralela import assinar_cadeia
+from .cache_chaves import cache_chaves
 
 # Configurar locale para formatação de valores
 try:
@@ -25,12 +27,131 @@ except:
         pass
 
 
+NS_NFE = "http://www.prefeitura.sp.gov.br/nfe"
+NS_NFTS = "http://www.prefeitura.sp.gov.br/nfts"
+NS_DS = "http://www.w3.org/2000/09/xmldsig#"
+
+C14N = "http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+
+# Elementos sem namespace (conteúdo dos pedidos)
+E = ElementMaker()
+
+
+def _montar_template_assinatura():
+    """Template ds:Signature (RSA-SHA1, C14N, envelopada) preenchido na assinatura XML"""
+    ds = ElementMaker(namespace=NS_DS, nsmap={None: NS_DS})
+    return ds.Signature(
+        ds.SignedInfo(
+            ds.CanonicalizationMethod(Algorithm=C14N),
+            ds.SignatureMethod(Algorithm=NS_DS + "rsa-sha1"),
+            ds.Reference(
+                ds.Transforms(
+                    ds.Transform(Algorithm=NS_DS + "enveloped-signature"),
+                    ds.Transform(Algorithm=C14N),
+                ),
+                ds.DigestMethod(Algorithm=NS_DS + "sha1"),
+                ds.DigestValue(),
+                URI="",
+            ),
+        ),
+        ds.SignatureValue(),
+        ds.KeyInfo(ds.X509Data()),
+    )
+
+
+def _montar_template_rps():
+    """
+    Template do RPS (tpRPS) com todos os elementos, na ordem do schema
+    
+    Os opcionais não informados são removidos da cópia em _preencher.
+    """
+    return E.RPS(
+        E.Assinatura(),
+        E.ChaveRPS(E.InscricaoPrestador(), E.SerieRPS(), E.NumeroRPS()),
+        E.TipoRPS(),
+        E.DataEmissao(),
+        E.StatusRPS(),
+        E.TributacaoRPS(),
+        E.ValorServicos(),
+        E.ValorDeducoes(),
+        E.ValorPIS(),
+        E.ValorCOFINS(),
+        E.ValorINSS(),
+        E.ValorIR(),
+        E.ValorCSLL(),
+        E.CodigoServico(),
+        E.AliquotaServicos(),
+        E.ISSRetido(),
+        E.CPFCNPJTomador(E.CNPJ()),
+        E.RazaoSocialTomador(),
+        E.Discriminacao(),
+    )
+
+
+# Montados uma única vez; cada pedido recebe cópias
+TEMPLATE_ASSINATURA = _montar_template_assinatura()
+TEMPLATE_RPS = _montar_template_rps()
+
+
+def _texto(valor):
+    """Texto de um elemento (None vira vazio)"""
+    return '' if valor is None else str(valor)
+
+
+def _preencher(elemento, valores):
+    """
+    Preenche os filhos de uma cópia de template, na ordem
+    
+    Args:
+        elemento: Cópia do template
+        valores: Texto de cada filho; uma lista preenche os netos e None remove
+                 o elemento opcional
+        
+    Returns:
+        Element: O próprio elemento
+    """
+    for filho, valor in zip(list(elemento), valores):
+        if valor is None:
+            elemento.remove(filho)
+        elif isinstance(valor, list):
+            _preencher(filho, valor)
+        else:
+            filho.text = valor
+    return elemento
+
+
+def _presentes(*elementos):
+    """Remove os elementos opcionais não informados (None)"""
+    return [elemento for elemento in elementos if elemento is not None]
+
+
+def serializar(elemento):
+    """
+    Serializa um pedido montado por EventoNFeDjango
+
+    Args:
+        elemento: Elemento lxml (ou XML já em texto, devolvido sem alteração)
+
+    Returns:
+        str: XML em texto
+    """
+    if isinstance(elemento, str):
+        return elemento
+    return etree.tostring(elemento, encoding="unicode")
+
+
 class EventoNFeDjango:
     """
     Classe para criar XMLs de eventos da NFS-e São Paulo
     Adaptada para Django
     """
     
+    # Quantidade máxima de RPS por PedidoEnvioLoteRPS (PedidoEnvioLoteRPS_v01.xsd)
+    LIMITE_RPS_LOTE = 50
+    
+    # Quantidade máxima de NFe por página do RetornoConsulta (RetornoConsulta_v01.xsd)
+    NOTAS_POR_PAGINA_CONSULTA = 50
+    
     def __init__(self, empresa):
         """
         Inicializa o evento com uma empresa Django
@@ -56,6 +177,23 @@ class EventoNFeDjango:
             
         return pem_path
     
+    def validar(self, esquema, pedido):
+        """
+        Valida o pedido no schema XSD antes do envio (assinatura XML desconsiderada)
+        
+        Args:
+            esquema: Nome do schema em core.services.esquemas_xsd.ESQUEMAS
+            pedido: Elemento raiz do pedido
+            
+        Returns:
+            Element: O próprio pedido
+            
+        Raises:
+            ErroValidacaoXML: Com os erros por campo, se o XML for inválido
+        """
+        registro_esquemas.validar(esquema, pedido)
+        return pedido
+    
     def formata_valor(self, valor):
         """Formata valor monetário"""
         if not valor or valor == 0:
@@ -79,23 +217,10 @@ class EventoNFeDjango:
         else:
             cadeia_caracteres = self.string_nfe(dados)
         
-        caminho_pem = self.get_certificado_pem_path()
+        # Chave privada lida uma única vez por certificado (cache do processo)
+        private_key = cache_chaves.obter(self.get_certificado_pem_path()).chave_privada
         
-        with open(caminho_pem, 'rb') as key_file:
-            private_key = serialization.load_pem_private_key(
-                key_file.read(),
-                password=None,
-                backend=default_backend()
-            )
-        
-        assinatura = private_key.sign(
-            cadeia_caracteres.encode('utf-8'),
-            padding.PKCS1v15(),
-            hashes.SHA1()
-        )
-        
-        assinatura_base64 = base64.b64encode(assinatura).decode('utf-8')
-        return assinatura_base64
+        return assinar_cadeia(private_key, cadeia_caracteres)
     
     def string_nfe(self, dados):
         """Cria string para assinatura do RPS"""
@@ -127,12 +252,87 @@ class EventoNFeDjango:
         
         Args:
             nota_fiscal: Instância do modelo NotaFiscalSP
+            
+        Returns:
+            Element: Pedido com o template de assinatura (assinado por
+                     ProcessadorNFeDjango.assinar_xml sem nova leitura do XML)
+        """
+        root = self.pedido("PedidoEnvioRPS", self.cabecalho())
+        self.adicionar_rps(root, nota_fiscal)
+        self.adicionar_signature(root)
+        return self.validar('PedidoEnvioRPS', root)
+    
+    def pedido(self, nome, cabecalho, namespace=NS_NFE):
+        """
+        Cria o elemento raiz de um pedido com o cabeçalho
+        
+        Args:
+            nome: Nome do elemento raiz (ex.: 'PedidoEnvioRPS')
+            cabecalho: Elemento Cabecalho
+            namespace: Namespace do pedido (NS_NFE ou NS_NFTS)
+            
+        Returns:
+            Element: Elemento raiz
+        """
+        root = etree.Element("{%s}%s" % (namespace, nome), nsmap={"p1": namespace})
+        root.append(cabecalho)
+        return root
+    
+    def cabecalho(self, *filhos):
+        """Cabecalho (Versao 1) com o CNPJ remetente seguido dos elementos informados"""
+        return E.Cabecalho(E.CPFCNPJRemetente(E.CNPJ(self.cnpj)), *filhos, Versao="1")
+    
+    def criar_pedido_envio_lote_rps(self, notas, transacao=False, assinaturas=None):
+        """
+        Cria XML para envio de lote de RPS (PedidoEnvioLoteRPS)
+        
+        Args:
+            notas: Lista de instâncias de NotaFiscalSP (máximo LIMITE_RPS_LOTE)
+            transacao: Se True, o lote só é convertido se todos os RPS forem válidos
+            assinaturas: Assinaturas dos RPS já calculadas, na ordem das notas
+                         (ex.: AssinadorParalelo); se None, assina cada RPS aqui
+            
+        Returns:
+            Element: Pedido do lote (assinatura XML pendente)
+        """
+        if not notas:
+            raise ValueError("Lote de RPS vazio")
+        if len(notas) > self.LIMITE_RPS_LOTE:
+            raise ValueError(f"Lote excede o limite de {self.LIMITE_RPS_LOTE} RPS")
+        
+        datas = [nota.data_emissao or datetime.now().date() for nota in notas]
+        total_servicos = sum(nota.valor_total for nota in notas)
+        total_deducoes = sum(nota.deducoes for nota in notas)
+        
+        root = self.pedido("PedidoEnvioLoteRPS", self.cabecalho(
+            E.transacao("true" if transacao else "false"),
+            E.dtInicio(min(datas).strftime('%Y-%m-%d')),
+            E.dtFim(max(datas).strftime('%Y-%m-%d')),
+            E.QtdRPS(str(len(notas))),
+            E.ValorTotalServicos(self.formata_valor(total_servicos).replace(",", ".")),
+            E.ValorTotalDeducoes(self.formata_valor(total_deducoes).replace(",", ".")),
+        ))
+        
+        # RPS
+        for posicao, nota_fiscal in enumerate(notas):
+            self.adicionar_rps(root, nota_fiscal, assinaturas[posicao] if assinaturas else None)
+        
+        # Signature
+        self.adicionar_signature(root)
+        return self.validar('PedidoEnvioLoteRPS', root)
+    
+    def dados_assinatura_rps(self, nota_fiscal):
+        """
+        Monta os dados da assinatura do RPS (ordem conforme NFeEventos.py)
+        
+        Args:
+            nota_fiscal: Instância do modelo NotaFiscalSP
+            
+        Returns:
+            list: Dados usados por string_nfe
         """
-        # Prepara dados
         valor_servico = self.formata_valor(nota_fiscal.valor_total).replace(",", ".")
         valor_deducao = self.formata_valor(nota_fiscal.deducoes).replace(",", ".")
-        aliquota = str(float(nota_fiscal.aliquota) / 100)
-        data_rps = nota_fiscal.data_emissao.strftime('%Y-%m-%d') if nota_fiscal.data_emissao else datetime.now().strftime('%Y-%m-%d')
         
         # Determina se é CPF ou CNPJ do tomador
         # Se não tiver CNPJ/CPF, usa tipo 3 (Não Informado) para assinatura
@@ -157,8 +357,7 @@ class EventoNFeDjango:
         }
         status_rps_api = status_map.get(nota_fiscal.status_rps, 'N')
         
-        # Dados para assinatura (ordem correta conforme NFeEventos.py)
-        dados_ass = [
+        return [
             self.inscricao_municipal,                                    # dados[0] - IE
             nota_fiscal.serie_rps or 'RPS',                             # dados[1] - Serie
             nota_fiscal.numero_rps or '1',                              # dados[2] - Numero RPS
@@ -172,92 +371,85 @@ class EventoNFeDjango:
             indicador_cnpj_cpf,                                         # dados[10] - Tipo CPF/CNPJ
             cnpj_cpf_tomador                                            # dados[11] - CPF/CNPJ
         ]
+    
+    def cadeia_assinatura_rps(self, nota_fiscal):
+        """
+        Cadeia de caracteres assinada no campo Assinatura do RPS
         
-        # Define namespace
-        nfe_namespace = "http://www.prefeitura.sp.gov.br/nfe"
-        ET.register_namespace("p1", nfe_namespace)
+        Args:
+            nota_fiscal: Instância do modelo NotaFiscalSP
+            
+        Returns:
+            str: Cadeia a assinar (RSA-SHA1)
+        """
+        return self.string_nfe(self.dados_assinatura_rps(nota_fiscal))
+    
+    def adicionar_rps(self, root, nota_fiscal, assinatura_rps=None):
+        """
+        Adiciona o elemento RPS (tpRPS) de uma nota ao pedido
         
-        root = ET.Element("{%s}PedidoEnvioRPS" % nfe_namespace)
+        Args:
+            root: Elemento raiz do pedido (PedidoEnvioRPS ou PedidoEnvioLoteRPS)
+            nota_fiscal: Instância do modelo NotaFiscalSP
+            assinatura_rps: Assinatura do RPS já calculada (se None, assina aqui)
+            
+        Returns:
+            Element: Elemento RPS criado
+        """
+        # Prepara dados
+        dados_ass = self.dados_assinatura_rps(nota_fiscal)
+        status_rps_api = dados_ass[5]
+        valor_servico = dados_ass[7]
+        valor_deducao = dados_ass[8]
+        cnpj_cpf_tomador = dados_ass[11]
+        aliquota = str(float(nota_fiscal.aliquota) / 100)
+        data_rps = nota_fiscal.data_emissao.strftime('%Y-%m-%d') if nota_fiscal.data_emissao else datetime.now().strftime('%Y-%m-%d')
         
-        # Cabecalho
-        cabecalho = ET.SubElement(root, "Cabecalho", Versao="1")
-        cpfcnpj_remetente = ET.SubElement(cabecalho, "CPFCNPJRemetente")
-        ET.SubElement(cpfcnpj_remetente, "CNPJ").text = self.cnpj
+        def valor(campo):
+            return self.formata_valor(campo).replace(",", ".") if campo else None
+        
+        rps = _preencher(copy.deepcopy(TEMPLATE_RPS), [
+            assinatura_rps or self.criar_assinatura_rps(dados_ass),
+            [self.inscricao_municipal, _texto(nota_fiscal.serie_rps), _texto(nota_fiscal.numero_rps)],
+            "RPS",
+            data_rps,
+            status_rps_api,  # N, C ou E
+            (nota_fiscal.tributacao_rps or nota_fiscal.tipo_tributacao)[:1],
+            valor_servico,
+            valor_deducao,
+            # Valores retidos (se houver)
+            valor(nota_fiscal.pis_retido),
+            valor(nota_fiscal.cofins_retido),
+            valor(nota_fiscal.inss_retido),
+            valor(nota_fiscal.irrf_retido),
+            valor(nota_fiscal.csll_retido),
+            _texto(nota_fiscal.cod_servico),
+            aliquota,
+            "true" if nota_fiscal.iss_retido else "false",
+            # Tomador: só inclui CPFCNPJTomador se houver CNPJ/CPF válido
+            [cnpj_cpf_tomador] if nota_fiscal.cnpj_cpf_tomador else None,
+            nota_fiscal.nome_tomador or None,
+            _texto(nota_fiscal.descricao),
+        ])
+        if nota_fiscal.cnpj_cpf_tomador and len(cnpj_cpf_tomador) <= 11:
+            rps.find("CPFCNPJTomador")[0].tag = "CPF"
+        
+        root.append(rps)
+        return rps
+    
+    def adicionar_signature(self, root):
+        """
+        Adiciona o template ds:Signature (preenchido na assinatura XML)
         
-        # RPS
-        rps = ET.SubElement(root, "RPS")
-        
-        # Assinatura
-        assinatura = ET.SubElement(rps, "Assinatura")
-        assinatura.text = self.criar_assinatura_rps(dados_ass)
-        
-        # Chave RPS
-        chave_rps = ET.SubElement(rps, "ChaveRPS")
-        ET.SubElement(chave_rps, "InscricaoPrestador").text = self.inscricao_municipal
-        ET.SubElement(chave_rps, "SerieRPS").text = nota_fiscal.serie_rps
-        ET.SubElement(chave_rps, "NumeroRPS").text = str(nota_fiscal.numero_rps)
-        
-        # Dados do RPS
-        ET.SubElement(rps, "TipoRPS").text = "RPS"
-        ET.SubElement(rps, "DataEmissao").text = data_rps
-        ET.SubElement(rps, "StatusRPS").text = status_rps_api  # N, C ou E
-        ET.SubElement(rps, "TributacaoRPS").text = (nota_fiscal.tributacao_rps or nota_fiscal.tipo_tributacao)[:1]
-        ET.SubElement(rps, "ValorServicos").text = valor_servico
-        ET.SubElement(rps, "ValorDeducoes").text = valor_deducao
-        
-        # Valores retidos (se houver)
-        if nota_fiscal.pis_retido:
-            ET.SubElement(rps, "ValorPIS").text = self.formata_valor(nota_fiscal.pis_retido).replace(",", ".")
-        if nota_fiscal.cofins_retido:
-            ET.SubElement(rps, "ValorCOFINS").text = self.formata_valor(nota_fiscal.cofins_retido).replace(",", ".")
-        if nota_fiscal.inss_retido:
-            ET.SubElement(rps, "ValorINSS").text = self.formata_valor(nota_fiscal.inss_retido).replace(",", ".")
-        if nota_fiscal.irrf_retido:
-            ET.SubElement(rps, "ValorIR").text = self.formata_valor(nota_fiscal.irrf_retido).replace(",", ".")
-        if nota_fiscal.csll_retido:
-            ET.SubElement(rps, "ValorCSLL").text = self.formata_valor(nota_fiscal.csll_retido).replace(",", ".")
-        
-        ET.SubElement(rps, "CodigoServico").text = nota_fiscal.cod_servico
-        ET.SubElement(rps, "AliquotaServicos").text = aliquota
-        ET.SubElement(rps, "ISSRetido").text = "true" if nota_fiscal.iss_retido else "false"
-        
-        # Tomador
-        # Só inclui CPFCNPJTomador se houver CNPJ/CPF válido
-        if nota_fiscal.cnpj_cpf_tomador:
-            cpfcnpj_tomador_elem = ET.SubElement(rps, "CPFCNPJTomador")
-            if len(cnpj_cpf_tomador) <= 11:
-                ET.SubElement(cpfcnpj_tomador_elem, "CPF").text = cnpj_cpf_tomador
-            else:
-                ET.SubElement(cpfcnpj_tomador_elem, "CNPJ").text = cnpj_cpf_tomador
-        
-        if nota_fiscal.nome_tomador:
-            ET.SubElement(rps, "RazaoSocialTomador").text = nota_fiscal.nome_tomador
-        
-        ET.SubElement(rps, "Discriminacao").text = nota_fiscal.descricao
-        
-        # Signature (será preenchido na assinatura XML)
-        signature = ET.SubElement(root, "{http://www.w3.org/2000/09/xmldsig#}Signature")
-        signed_info = ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}SignedInfo")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}CanonicalizationMethod", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}SignatureMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1")
-        reference = ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}Reference", URI="")
-        transforms = ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}Transforms")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#enveloped-signature")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#sha1")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestValue")
-        ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}SignatureValue")
-        key_info = ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}KeyInfo")
-        ET.SubElement(key_info, "{http://www.w3.org/2000/09/xmldsig#}X509Data")
-        
-        # Converte para string
-        xml_string = ET.tostring(root, encoding="utf-8")
-        return xml_string.decode("utf-8")
+        Args:
+            root: Elemento raiz do pedido
+            
+        Returns:
+            Element: Cópia do TEMPLATE_ASSINATURA adicionada ao pedido
+        """
+        signature = copy.deepcopy(TEMPLATE_ASSINATURA)
+        root.append(signature)
+        return signature
     
     def cancelamento_nfe(self, nota_fiscal):
         """
@@ -265,58 +457,32 @@ class EventoNFeDjango:
         
         Args:
             nota_fiscal: Instância do modelo NotaFiscalSP
+            
+        Returns:
+            Element: Pedido com o template de assinatura
         """
-        nfe_namespace = "http://www.prefeitura.sp.gov.br/nfe"
-        ET.register_namespace("p1", nfe_namespace)
-        
-        root = ET.Element("{%s}PedidoCancelamentoNFe" % nfe_namespace)
-        
-        # Cabecalho
-        cabecalho = ET.SubElement(root, "Cabecalho", Versao="1")
-        cpfcnpj_remetente = ET.SubElement(cabecalho, "CPFCNPJRemetente")
-        ET.SubElement(cpfcnpj_remetente, "CNPJ").text = self.cnpj
-        ET.SubElement(cabecalho, "transacao").text = "true"
-        
-        # Detalhe
-        detalhe = ET.SubElement(root, "Detalhe")
-        chave_nfe = ET.SubElement(detalhe, "ChaveNFe")
-        ET.SubElement(chave_nfe, "InscricaoPrestador").text = self.inscricao_municipal
-        ET.SubElement(chave_nfe, "NumeroNFe").text = str(nota_fiscal.numero_nfse)
-        
         # Assinatura de cancelamento
         dados_cancel = [self.inscricao_municipal, str(nota_fiscal.numero_nfse)]
-        assinatura = ET.SubElement(detalhe, "AssinaturaCancelamento")
-        assinatura.text = self.criar_assinatura_rps(dados_cancel, cancelamento=True)
+        
+        root = self.pedido("PedidoCancelamentoNFe", self.cabecalho(E.transacao("true")))
+        root.append(E.Detalhe(
+            E.ChaveNFe(
+                E.InscricaoPrestador(self.inscricao_municipal),
+                E.NumeroNFe(str(nota_fiscal.numero_nfse)),
+            ),
+            E.AssinaturaCancelamento(self.criar_assinatura_rps(dados_cancel, cancelamento=True)),
+        ))
         
         # Signature
-        signature = ET.SubElement(root, "{http://www.w3.org/2000/09/xmldsig#}Signature")
-        signed_info = ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}SignedInfo")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}CanonicalizationMethod", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}SignatureMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1")
-        reference = ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}Reference", URI="")
-        transforms = ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}Transforms")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#enveloped-signature")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#sha1")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestValue")
-        ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}SignatureValue")
-        key_info = ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}KeyInfo")
-        ET.SubElement(key_info, "{http://www.w3.org/2000/09/xmldsig#}X509Data")
-        
-        xml_string = ET.tostring(root, encoding="utf-8")
-        return xml_string.decode("utf-8")
+        self.adicionar_signature(root)
+        return self.validar('PedidoCancelamentoNFe', root)
     
     # Alias para compatibilidade
     def criar_pedido_cancelamento_nfe(self, nota_fiscal):
         """Alias para cancelamento_nfe"""
         return self.cancelamento_nfe(nota_fiscal)
     
-    def pedidoConsultaNFPeriodo(self, cnpj_cpf, inscricao, data_inicio, data_fim):
+    def pedidoConsultaNFPeriodo(self, cnpj_cpf, inscricao, data_inicio, data_fim, pagina=1):
         """
         Cria XML para consulta de NFS-e por período
         
@@ -325,52 +491,66 @@ class EventoNFeDjango:
             inscricao: Inscrição municipal
             data_inicio: Data inicial (formato: dd/mm/yyyy)
             data_fim: Data final (formato: dd/mm/yyyy)
+            pagina: Página do resultado (NOTAS_POR_PAGINA_CONSULTA notas por página)
+            
+        Returns:
+            Element: Pedido com o template de assinatura
         """
         # Converte datas
         data_init = data_inicio[-4:] + '-' + data_inicio[3:5] + '-' + data_inicio[0:2]
         data_fim_fmt = data_fim[-4:] + '-' + data_fim[3:5] + '-' + data_fim[0:2]
         
-        namespace = "http://www.prefeitura.sp.gov.br/nfe"
-        ET.register_namespace("p1", namespace)
+        root = self.pedido("PedidoConsultaNFePeriodo", E.Cabecalho(
+            E.CPFCNPJRemetente(E.CNPJ(cnpj_cpf)),
+            E.CPFCNPJ(E.CNPJ(cnpj_cpf)),
+            E.Inscricao(inscricao),
+            E.dtInicio(data_init),
+            E.dtFim(data_fim_fmt),
+            E.NumeroPagina(str(pagina)),
+            Versao="1",
+        ))
         
-        root = ET.Element("{%s}PedidoConsultaNFePeriodo" % namespace)
-        cabecalho = ET.SubElement(root, "Cabecalho", Versao="1")
-        
-        cpf_cnpj_remetente = ET.SubElement(cabecalho, "CPFCNPJRemetente")
-        ET.SubElement(cpf_cnpj_remetente, "CNPJ").text = cnpj_cpf
+        # Signature
+        self.adicionar_signature(root)
+        return self.validar('PedidoConsultaNFePeriodo', root)
+    
+    def criar_pedido_consulta_rps(self, notas):
+        """
+        Cria XML para consulta de NFS-e pela chave dos RPS (PedidoConsultaNFe)
         
-        cpf_cnpj = ET.SubElement(cabecalho, "CPFCNPJ")
-        ET.SubElement(cpf_cnpj, "CNPJ").text = cnpj_cpf
-        ET.SubElement(cabecalho, "Inscricao").text = inscricao
-        ET.SubElement(cabecalho, "dtInicio").text = data_init
-        ET.SubElement(cabecalho, "dtFim").text = data_fim_fmt
-        ET.SubElement(cabecalho, "NumeroPagina").text = "1"
+        Args:
+            notas: Lista de instâncias de NotaFiscalSP (máximo LIMITE_RPS_LOTE)
+            
+        Returns:
+            Element: Pedido da consulta (assinatura XML pendente)
+        """
+        if not notas:
+            raise ValueError("Consulta de RPS vazia")
+        if len(notas) > self.LIMITE_RPS_LOTE:
+            raise ValueError(f"Consulta excede o limite de {self.LIMITE_RPS_LOTE} RPS")
+        
+        root = self.pedido("PedidoConsultaNFe", self.cabecalho())
+        for nota_fiscal in notas:
+            root.append(E.Detalhe(E.ChaveRPS(
+                E.InscricaoPrestador(self.inscricao_municipal),
+                E.SerieRPS(_texto(nota_fiscal.serie_rps)),
+                E.NumeroRPS(_texto(nota_fiscal.numero_rps)),
+            )))
         
         # Signature
-        signature = ET.SubElement(root, "{http://www.w3.org/2000/09/xmldsig#}Signature")
-        signed_info = ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}SignedInfo")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}CanonicalizationMethod", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}SignatureMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1")
-        reference = ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}Reference", URI="")
-        transforms = ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}Transforms")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#enveloped-signature")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#sha1")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestValue")
-        ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}SignatureValue")
-        key_info = ET.SubElement(signature, "{http://www.w3.org/2000/09/xmldsig#}KeyInfo")
-        ET.SubElement(key_info, "{http://www.w3.org/2000/09/xmldsig#}X509Data")
-        
-        xml_string = ET.tostring(root, encoding="utf-8")
-        return xml_string.decode("utf-8")
+        self.adicionar_signature(root)
+        return self.validar('PedidoConsultaNFe', root)
     
     def criar_pedido_envio_nfts(self, nota_fiscal_tomador):
-        """Cria XML para envio de NFTS"""
+        """
+        Cria XML para envio de NFTS
+        
+        Args:
+            nota_fiscal_tomador: Instância do modelo NotaFiscalTomador
+            
+        Returns:
+            Element: Pedido com a Assinatura do tpNFTS e o X509Certificate
+        """
         valor_servico = self.formata_valor(nota_fiscal_tomador.valor_total).replace(",", ".")
         valor_deducao = self.formata_valor(nota_fiscal_tomador.deducoes).replace(",", ".")
         aliquota = str(float(nota_fiscal_tomador.aliquota) / 100)
@@ -400,126 +580,66 @@ class EventoNFeDjango:
         }
         regime_codigo = regime_map.get(nota_fiscal_tomador.regime_tributacao.lower(), '0')
         
-        nfe_namespace = "http://www.prefeitura.sp.gov.br/nfts"
-        ET.register_namespace("", nfe_namespace)  # Namespace padrão sem prefixo
+        cnpj_tomador = nota_fiscal_tomador.cnpj_tomador.replace('.', '').replace('/', '').replace('-', '')
         
-        root = ET.Element("{%s}PedidoEnvioNFTS" % nfe_namespace)
         # Elementos internos SEM namespace (xmlns="")
-        cabecalho = ET.SubElement(root, "Cabecalho", Versao="1")
-        cabecalho.set("xmlns", "")  # Remove namespace
-        cpfcnpj_remetente = ET.SubElement(cabecalho, "Remetente")
-        cpf_cnpj = ET.SubElement(cpfcnpj_remetente, "CPFCNPJ")
-        
-        cnpj_tomador = nota_fiscal_tomador.cnpj_tomador.replace('.', '').replace('/', '').replace('-', '')
-        if len(cnpj_tomador) <= 11:
-            ET.SubElement(cpf_cnpj, "CPF").text = cnpj_tomador
-        else:
-            ET.SubElement(cpf_cnpj, "CNPJ").text = cnpj_tomador
-        
-        nfts = ET.SubElement(root, "tpNFTS")
-        ET.SubElement(nfts, "TipoDocumento").text = tipo_documento_codigo
-        chave_nfts = ET.SubElement(nfts, "ChaveDocumento")
-        ET.SubElement(chave_nfts, "InscricaoMunicipal").text = nota_fiscal_tomador.inscricao_municipal
-        if nota_fiscal_tomador.serie:
-            ET.SubElement(chave_nfts, "SerieNFTS").text = nota_fiscal_tomador.serie[:5].strip()
-        ET.SubElement(chave_nfts, "NumeroDocumento").text = nota_fiscal_tomador.numero_documento[:12]
-        
-        ET.SubElement(nfts, "DataPrestacao").text = data_nfts
-        # StatusNFTS: "N" = Normal, "C" = Cancelada (sempre "N" na emissão)
-        ET.SubElement(nfts, "StatusNFTS").text = "N"
-        ET.SubElement(nfts, "TributacaoNFTS").text = nota_fiscal_tomador.tipo_tributacao[:1]
-        ET.SubElement(nfts, "ValorServicos").text = valor_servico
-        ET.SubElement(nfts, "ValorDeducoes").text = valor_deducao
-        ET.SubElement(nfts, "CodigoServico").text = nota_fiscal_tomador.cod_servico[:4]
-        ET.SubElement(nfts, "AliquotaServicos").text = aliquota
-        ET.SubElement(nfts, "ISSRetidoTomador").text = "true" if nota_fiscal_tomador.iss_retido else "false"
-        
-        cpfcnpj_prestador_elem = ET.SubElement(nfts, "Prestador")
-        cpf_cnpj_prest = ET.SubElement(cpfcnpj_prestador_elem, "CPFCNPJ")
-        if len(cnpj_cpf_prestador) <= 11:
-            ET.SubElement(cpf_cnpj_prest, "CPF").text = cnpj_cpf_prestador
-        else:
-            ET.SubElement(cpf_cnpj_prest, "CNPJ").text = cnpj_cpf_prestador
+        cabecalho = E.Cabecalho(
+            E.Remetente(E.CPFCNPJ(E.CPF(cnpj_tomador) if len(cnpj_tomador) <= 11 else E.CNPJ(cnpj_tomador))),
+            Versao="1",
+        )
         
-        endereco = ET.SubElement(cpfcnpj_prestador_elem, "Endereco")
-        ET.SubElement(endereco, "Cidade").text = cidade
-        ET.SubElement(endereco, "UF").text = estado
-        if cep:
-            ET.SubElement(endereco, "CEP").text = str(int(cep))
+        chave_nfts = E.ChaveDocumento(*_presentes(
+            E.InscricaoMunicipal(nota_fiscal_tomador.inscricao_municipal),
+            E.SerieNFTS(nota_fiscal_tomador.serie[:5].strip()) if nota_fiscal_tomador.serie else None,
+            E.NumeroDocumento(nota_fiscal_tomador.numero_documento[:12]),
+        ))
+        
+        prestador = E.Prestador(
+            E.CPFCNPJ(E.CPF(cnpj_cpf_prestador) if len(cnpj_cpf_prestador) <= 11 else E.CNPJ(cnpj_cpf_prestador)),
+            E.Endereco(*_presentes(
+                E.Cidade(cidade),
+                E.UF(estado),
+                E.CEP(str(int(cep))) if cep else None,
+            )),
+        )
         
-        ET.SubElement(nfts, "RegimeTributacao").text = regime_codigo
-        ET.SubElement(nfts, "Discriminacao").text = nota_fiscal_tomador.descricao
-        ET.SubElement(nfts, "TipoNFTS").text = '1'
+        # Montado fora do pedido: a cadeia assinada é o tpNFTS sem declarações de namespace
+        nfts = E.tpNFTS(
+            E.TipoDocumento(tipo_documento_codigo),
+            chave_nfts,
+            E.DataPrestacao(data_nfts),
+            # StatusNFTS: "N" = Normal, "C" = Cancelada (sempre "N" na emissão)
+            E.StatusNFTS("N"),
+            E.TributacaoNFTS(nota_fiscal_tomador.tipo_tributacao[:1]),
+            E.ValorServicos(valor_servico),
+            E.ValorDeducoes(valor_deducao),
+            E.CodigoServico(nota_fiscal_tomador.cod_servico[:4]),
+            E.AliquotaServicos(aliquota),
+            E.ISSRetidoTomador("true" if nota_fiscal_tomador.iss_retido else "false"),
+            prestador,
+            E.RegimeTributacao(regime_codigo),
+            E.Discriminacao(_texto(nota_fiscal_tomador.descricao)),
+            E.TipoNFTS('1'),
+        )
         
         # Assinar ANTES de renomear (assina tpNFTS, não NFTS) - IGUAL AO CÓDIGO ORIGINAL
-        xml_to_sign = ET.tostring(nfts, encoding="utf-8", method="xml").decode("utf-8")
-        # Remover namespace (igual ao código original)
-        xml_to_sign = xml_to_sign.replace(' xmlns:p1="http://www.prefeitura.sp.gov.br/nfts"', '')
-        
-        # DEBUG: Ver XML que será assinado
-        print("=" * 80)
-        print("XML QUE SERÁ ASSINADO (tpNFTS):")
-        print(xml_to_sign[:500])
-        print("=" * 80)
-        
-        caminho_pem = self.get_certificado_pem_path()
-        # Carregar chave privada (igual ao código original)
-        with open(caminho_pem, 'rb') as key_file:
-            private_key = load_pem_private_key(key_file.read(), password=None, backend=default_backend())
-        
-        # Extrair certificado X509 do PEM para NFTS
-        from cryptography import x509
-        from cryptography.hazmat.primitives.serialization import Encoding
-        
-        with open(caminho_pem, 'rb') as cert_file:
-            cert_pem = cert_file.read()
-            # Encontrar o certificado (não a chave privada)
-            cert_start = cert_pem.find(b'-----BEGIN CERTIFICATE-----')
-            cert_end = cert_pem.find(b'-----END CERTIFICATE-----') + len(b'-----END CERTIFICATE-----')
-            cert_data = cert_pem[cert_start:cert_end]
-            certificate = x509.load_pem_x509_certificate(cert_data, default_backend())
-            cert_base64 = base64.b64encode(certificate.public_bytes(Encoding.DER)).decode('utf-8')
+        xml_to_sign = etree.tostring(nfts, encoding="unicode")
         
-        # Assinando o XML (PKCS1v15 + SHA1 - igual ao código original)
-        signature = private_key.sign(
-            xml_to_sign.encode('utf-8'),
-            padding.PKCS1v15(),
-            hashes.SHA1()
-        )
-        # Codificar a assinatura em Base64
-        signature_base64 = base64.b64encode(signature).decode('utf-8')
+        # Chave privada e certificado X509 (DER base64) do cache do processo
+        chaves = cache_chaves.obter(self.get_certificado_pem_path())
         
-        assinatura = ET.SubElement(nfts, "Assinatura")
-        assinatura.text = signature_base64
+        # Assinando o XML (PKCS1v15 + SHA1 - igual ao código original)
+        nfts.append(E.Assinatura(assinar_cadeia(chaves.chave_privada, xml_to_sign)))
         
         # Renomear a tag tpNFTS para NFTS (DEPOIS de assinar - igual ao código original)
         nfts.tag = "NFTS"
-        # Remover namespace do elemento NFTS (xmlns="")
-        nfts.set("xmlns", "")
+        
+        root = self.pedido("PedidoEnvioNFTS", cabecalho, namespace=NS_NFTS)
+        root.append(nfts)
         
         # Signature (com X509Certificate para NFTS)
-        signature_elem = ET.SubElement(root, "{http://www.w3.org/2000/09/xmldsig#}Signature")
-        signed_info = ET.SubElement(signature_elem, "{http://www.w3.org/2000/09/xmldsig#}SignedInfo")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}CanonicalizationMethod", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}SignatureMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1")
-        reference = ET.SubElement(signed_info, "{http://www.w3.org/2000/09/xmldsig#}Reference", URI="")
-        transforms = ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}Transforms")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#enveloped-signature")
-        ET.SubElement(transforms, "{http://www.w3.org/2000/09/xmldsig#}Transform", 
-                     Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestMethod", 
-                     Algorithm="http://www.w3.org/2000/09/xmldsig#sha1")
-        ET.SubElement(reference, "{http://www.w3.org/2000/09/xmldsig#}DigestValue")
-        ET.SubElement(signature_elem, "{http://www.w3.org/2000/09/xmldsig#}SignatureValue")
-        key_info = ET.SubElement(signature_elem, "{http://www.w3.org/2000/09/xmldsig#}KeyInfo")
-        x509_data = ET.SubElement(key_info, "{http://www.w3.org/2000/09/xmldsig#}X509Data")
-        x509_cert = ET.SubElement(x509_data, "{http://www.w3.org/2000/09/xmldsig#}X509Certificate")
-        x509_cert.text = cert_base64
-        
-        # Converte a árvore XML para uma string formatada
-        xml_string = ET.tostring(root, encoding="utf-8")
-        
-        return xml_string.decode("utf-8")
+        signature = self.adicionar_signature(root)
+        x509_data = signature.find("{%s}KeyInfo/{%s}X509Data" % (NS_DS, NS_DS))
+        etree.SubElement(x509_data, "{%s}X509Certificate" % NS_DS).text = chaves.certificado_base64
+        
+        return self.validar('PedidoEnvioNFTS', root)
@@ -0,0 +1,122 @@
+"""
+Numeração de RPS
+Reserva blocos contíguos de números por empresa e série (tabela SequenciaRPS),
+com bloqueio da linha da sequência durante a reserva. Para não deixar lacunas,
+a reserva deve ser feita na mesma transação que grava os números nas notas: o
+bloqueio vale até o fim dessa transação e, se a gravação falhar, a reserva é
+desfeita junto
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast
+
+from core.models import NotaFiscalSP, SequenciaRPS
+
+
+SERIE_PADRAO = 'RPS'
+DIGITOS_NUMERO_RPS = 12
+
+
+def maior_numero_existente(empresa, serie, notas=None):
+    """
+    Maior número de RPS já gravado nas notas da empresa/série
+
+    Usado apenas na criação da sequência, para continuar a numeração existente.
+
+    Args:
+        empresa: Instância de Empresa
+        serie: Série do RPS
+        notas: QuerySet das notas da série, com numero_rps (padrão: NotaFiscalSP
+               da empresa na série)
+
+    Returns:
+        int: Maior número encontrado (0 se não houver)
+    """
+    if notas is None:
+        notas = NotaFiscalSP.objects.filter(empresa=empresa)
+        if serie == SERIE_PADRAO:
+            notas = notas.filter(serie_rps__in=[serie, ''])
+        else:
+            notas = notas.filter(serie_rps=serie)
+    notas = notas.filter(numero_rps__regex=r'^[0-9]+$')
+
+    maior = notas.annotate(
+        numero=Cast('numero_rps', BigIntegerField())
+    ).aggregate(maior=Max('numero'))['maior']
+    return maior or 0
+
+
+def reservar_numeros(empresa, serie=SERIE_PADRAO, quantidade=1, notas=None):
+    """
+    Reserva um bloco contíguo de números de RPS
+
+    Chamar dentro da transação que grava os números nas notas (transaction.atomic).
+
+    Args:
+        empresa: Instância de Empresa
+        serie: Série do RPS
+        quantidade: Quantidade de números a reservar
+        notas: QuerySet das notas da série usado para iniciar a sequência
+               (maior_numero_existente; padrão: NotaFiscalSP)
+
+    Returns:
+        int: Primeiro número do bloco (o bloco vai até primeiro + quantidade - 1)
+    """
+    if quantidade < 1:
+        raise ValueError("Quantidade de RPS a reservar deve ser maior que zero")
+
+    serie = serie or SERIE_PADRAO
+
+    with transaction.atomic():
+        sequencia = SequenciaRPS.objects.select_for_update().filter(
+            empresa=empresa, serie=serie
+        ).first()
+
+        if sequencia is None:
+            try:
+                with transaction.atomic():
+                    sequencia = SequenciaRPS.objects.create(
+                        empresa=empresa,
+                        serie=serie,
+                        ultimo_numero=maior_numero_existente(empresa, serie, notas)
+                    )
+            except IntegrityError:
+                # Criada por outro processo entre a consulta e o INSERT
+                sequencia = SequenciaRPS.objects.select_for_update().get(empresa=empresa, serie=serie)
+
+        primeiro = sequencia.ultimo_numero + 1
+        sequencia.ultimo_numero += quantidade
+        sequencia.save(update_fields=['ultimo_numero', 'data_atualizacao'])
+
+    return primeiro
+
+
+def numerar_notas(notas):
+    """
+    Atribui números de RPS às notas que ainda não têm, um bloco por empresa/série
+
+    As notas são atualizadas em memória; a gravação fica a cargo de quem chama
+    (bulk_create na importação, bulk_update na emissão), na mesma transação.
+
+    Args:
+        notas: Lista de NotaFiscalSP (com empresa definida)
+
+    Returns:
+        list: Notas que receberam número
+    """
+    grupos = {}
+    for nota in notas:
+        if nota.numero_rps:
+            continue
+        nota.serie_rps = nota.serie_rps or SERIE_PADRAO
+        grupos.setdefault((nota.empresa_id, nota.serie_rps), []).append(nota)
+
+    numeradas = []
+    for (_, serie), grupo in grupos.items():
+        numero = reservar_numeros(grupo[0].empresa, serie, len(grupo))
+        for nota in grupo:
+            nota.numero_rps = str(numero).zfill(DIGITOS_NUMERO_RPS)
+            numero += 1
+        numeradas.extend(grupo)
+
+    return numeradas
@@ -0,0 +1,260 @@
+"""
+Política de transporte das chamadas SOAP à Prefeitura de SP
+Classifica as falhas (transitórias x negócio), repete com espera exponencial
+aleatória apenas as operações idempotentes (consultas) e mantém um disjuntor
+(circuit breaker) por endpoint, para que um lote falhe rápido quando o
+webservice da prefeitura está fora do ar
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from zeep.exceptions import Fault, TransportError
+
+logger = logging.getLogger(__name__)
+
+
+class ErroTransporte(Exception):
+    """
+    Falha de comunicação com o webservice (rede, timeout, HTTP 5xx/429)
+
+    Attributes:
+        incerto: True se a requisição pode ter sido processada pela prefeitura
+                 (ex.: timeout de leitura de um envio)
+    """
+
+    def __init__(self, mensagem, incerto=False):
+        super().__init__(mensagem)
+        self.incerto = incerto
+
+
+class CircuitoAberto(ErroTransporte):
+    """Endpoint suspenso pelo disjuntor após falhas consecutivas"""
+
+
+def timeouts_soap():
+    """
+    Timeouts das operações SOAP
+
+    Returns:
+        tuple: (conexão, leitura) em segundos, de settings.NFE_SOAP_TIMEOUT_CONEXAO
+               e settings.NFE_SOAP_TIMEOUT_LEITURA
+    """
+    return (
+        getattr(settings, 'NFE_SOAP_TIMEOUT_CONEXAO', 10),
+        getattr(settings, 'NFE_SOAP_TIMEOUT_LEITURA', 60),
+    )
+
+
+def falha_transitoria(erro):
+    """
+    Indica se a exceção é uma falha de transporte (vale repetir / conta no disjuntor)
+
+    Fault SOAP e erros de validação/negócio não são transitórios: o webservice
+    respondeu e repetir a chamada daria o mesmo resultado.
+
+    Args:
+        erro: Exceção ocorrida na chamada
+
+    Returns:
+        bool: True para falhas de rede, timeout e HTTP 5xx/429
+    """
+    if isinstance(erro, (Fault, requests.exceptions.SSLError)):
+        # SSLError (subclasse de ConnectionError): em geral o certificado do
+        # cliente (vencido, revogado) é do contribuinte e não do endpoint
+        return False
+    if isinstance(erro, TransportError):
+        return erro.status_code >= 500 or erro.status_code == 429
+    return isinstance(erro, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+def _causas(erro):
+    """A exceção e as que ela encapsula (__cause__, __context__, MaxRetryError.reason)"""
+    vistas = set()
+    pendentes = [erro]
+    while pendentes:
+        atual = pendentes.pop()
+        if atual is None or id(atual) in vistas:
+            continue
+        vistas.add(id(atual))
+        yield atual
+        pendentes.extend([atual.__cause__, atual.__context__, getattr(atual, 'reason', None)])
+        pendentes.extend(arg for arg in getattr(atual, 'args', ()) if isinstance(arg, BaseException))
+
+
+def resultado_incerto(erro):
+    """
+    Indica se a requisição de um envio que falhou pode ter chegado à prefeitura
+
+    Só é certo que nada foi processado quando a conexão não chegou a ser
+    estabelecida (timeout de conexão, conexão recusada, falha do handshake TLS)
+    ou quando a prefeitura recusou por limite de requisições (HTTP 429); qualquer
+    outra falha (timeout de leitura, conexão encerrada durante a resposta,
+    HTTP 5xx) é incerta.
+
+    Args:
+        erro: Exceção ocorrida na chamada
+
+    Returns:
+        bool: True se o resultado do envio é desconhecido
+    """
+    if isinstance(erro, CircuitoAberto):
+        return False
+    if isinstance(erro, TransportError):
+        return erro.status_code != 429
+    for causa in _causas(erro):
+        if isinstance(causa, (
+            requests.ConnectTimeout, requests.exceptions.SSLError,
+            NewConnectionError, ConnectTimeoutError, ConnectionRefusedError,
+        )):
+            return False
+    return True
+
+
+class Disjuntor:
+    """
+    Disjuntor de um endpoint
+
+    Fechado: as chamadas passam. Após settings.NFE_DISJUNTOR_FALHAS falhas
+    transitórias consecutivas abre e recusa as chamadas por
+    settings.NFE_DISJUNTOR_TEMPO_ABERTO segundos; depois libera uma única
+    chamada de teste (meio-aberto), que fecha ou reabre o disjuntor.
+    """
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio-aberto'
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.estado = self.FECHADO
+        self.falhas = 0
+        self.aberto_em = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limite_falhas(self):
+        return getattr(settings, 'NFE_DISJUNTOR_FALHAS', 5)
+
+    @property
+    def tempo_aberto(self):
+        return getattr(settings, 'NFE_DISJUNTOR_TEMPO_ABERTO', 60)
+
+    def liberar(self):
+        """
+        Verifica se a chamada pode ser feita
+
+        Raises:
+            CircuitoAberto: Se o endpoint estiver suspenso
+        """
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return
+
+            restante = self.aberto_em + self.tempo_aberto - time.monotonic()
+            if self.estado == self.ABERTO and restante <= 0:
+                # Libera uma chamada de teste
+                self.estado = self.MEIO_ABERTO
+                return
+
+        raise CircuitoAberto(
+            f'Webservice da prefeitura indisponível ({self.falhas} falha(s) consecutiva(s)). '
+            f'Nova tentativa em {max(int(restante), 1)} segundo(s).'
+        )
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.estado = self.FECHADO
+            self.falhas = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.estado == self.MEIO_ABERTO or self.falhas >= self.limite_falhas:
+                if self.estado != self.ABERTO:
+                    logger.warning(f"Disjuntor aberto para {self.endpoint} após {self.falhas} falha(s)")
+                self.estado = self.ABERTO
+                self.aberto_em = time.monotonic()
+
+
+class PoliticaTransporte:
+    """
+    Executa as operações SOAP com disjuntor por endpoint e repetição das consultas
+    """
+
+    def __init__(self):
+        self._disjuntores = {}
+        self._lock = threading.Lock()
+
+    def disjuntor(self, endpoint):
+        """Disjuntor do endpoint (criado no primeiro uso)"""
+        with self._lock:
+            if endpoint not in self._disjuntores:
+                self._disjuntores[endpoint] = Disjuntor(endpoint)
+            return self._disjuntores[endpoint]
+
+    @staticmethod
+    def espera(tentativa):
+        """Espera exponencial com variação aleatória (full jitter) antes da nova tentativa"""
+        base = getattr(settings, 'NFE_SOAP_ESPERA_BASE', 0.5)
+        maxima = getattr(settings, 'NFE_SOAP_ESPERA_MAXIMA', 8)
+        return random.uniform(0, min(maxima, base * 2 ** tentativa))
+
+    def executar(self, endpoint, operacao, idempotente=False):
+        """
+        Executa a operação respeitando o disjuntor do endpoint
+
+        Args:
+            endpoint: Identificação do webservice (ex.: URL do WSDL)
+            operacao: Função sem argumentos que faz a chamada SOAP
+            idempotente: Se True (consultas), repete as falhas transitórias até
+                         settings.NFE_SOAP_TENTATIVAS vezes
+
+        Returns:
+            Retorno da operação
+
+        Raises:
+            CircuitoAberto: Endpoint suspenso; a chamada não foi feita
+            ErroTransporte: Falha transitória após as tentativas
+            Exception: Erros de negócio (Fault SOAP, XML inválido) são repassados
+        """
+        disjuntor = self.disjuntor(endpoint)
+        tentativas = getattr(settings, 'NFE_SOAP_TENTATIVAS', 3) if idempotente else 1
+
+        for tentativa in range(tentativas):
+            disjuntor.liberar()
+            try:
+                retorno = operacao()
+            except Exception as e:
+                if isinstance(e, requests.exceptions.SSLError):
+                    # Certificado do contribuinte: não diz nada sobre o endpoint
+                    raise
+                if not falha_transitoria(e):
+                    # O webservice respondeu: o endpoint está no ar
+                    disjuntor.registrar_sucesso()
+                    raise
+
+                disjuntor.registrar_falha()
+                incerto = not idempotente and resultado_incerto(e)
+                if tentativa + 1 >= tentativas:
+                    raise ErroTransporte(str(e), incerto=incerto) from e
+
+                espera = self.espera(tentativa)
+                logger.info(f"Falha transitória em {endpoint} ({e}); nova tentativa em {espera:.1f}s")
+                time.sleep(espera)
+            else:
+                disjuntor.registrar_sucesso()
+                return retorno
+
+    def redefinir(self):
+        """Fecha todos os disjuntores (ex.: testes, manutenção)"""
+        with self._lock:
+            self._disjuntores = {}
+
+
+# Instância única por processo
+politica_transporte = PoliticaTransporte()
@@ -0,0 +1,179 @@
+"""
+Pool de clientes SOAP para os webservices da Prefeitura de SP
+Reaproveita o cliente zeep (WSDL já processado) e a sessão mTLS por certificado
+"""
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from zeep import Client
+from zeep.transports import Transport
+
+from .politica_transporte import timeouts_soap
+from .wsdl_local import obter_cache_zeep
+
+
+class _EntradaPool:
+    """Cliente SOAP armazenado no pool"""
+
+    def __init__(self, cliente, sessao, impressao_digital):
+        self.cliente = cliente
+        self.sessao = sessao
+        self.impressao_digital = impressao_digital
+        self.criado_em = time.monotonic()
+
+    def expirou(self, ttl):
+        return time.monotonic() - self.criado_em > ttl
+
+    def fechar(self):
+        try:
+            self.sessao.close()
+        except Exception:
+            pass
+
+
+class PoolClientesSOAP:
+    """
+    Registro de clientes SOAP compartilhado por todo o processo
+
+    Cada entrada é identificada pela URL do WSDL e pelo caminho do certificado PEM.
+    A impressão digital do arquivo (mtime + tamanho) é conferida a cada uso, de modo
+    que um certificado substituído gera um novo cliente e descarta o anterior.
+    """
+
+    def __init__(self, ttl=None):
+        """
+        Inicializa o pool
+
+        Args:
+            ttl: Tempo de vida (segundos) de cada cliente. Se None, usa
+                 settings.NFE_SOAP_CLIENTE_TTL
+        """
+        self._ttl = ttl
+        self._entradas = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'NFE_SOAP_CLIENTE_TTL', 3600)
+
+    @staticmethod
+    def impressao_digital(cert_path):
+        """
+        Retorna a impressão digital do arquivo de certificado
+
+        Args:
+            cert_path: Caminho do arquivo PEM
+
+        Returns:
+            tuple: (mtime em ns, tamanho em bytes)
+        """
+        stat = os.stat(cert_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def criar_sessao(self, cert_path):
+        """
+        Cria a sessão HTTP com o certificado do cliente (mTLS)
+
+        Args:
+            cert_path: Caminho do arquivo PEM
+
+        Returns:
+            requests.Session: Sessão configurada
+        """
+        session = requests.Session()
+        session.cert = cert_path
+        return session
+
+    def criar_cliente(self, url, sessao):
+        """
+        Cria o cliente zeep para o WSDL informado
+
+        Args:
+            url: URL ou caminho local do WSDL
+            sessao: Sessão HTTP com o certificado
+
+        Returns:
+            Client: Cliente SOAP configurado
+        """
+        timeouts = timeouts_soap()
+        transport = Transport(
+            session=sessao,
+            cache=obter_cache_zeep(),
+            timeout=timeouts,
+            operation_timeout=timeouts,
+        )
+        return Client(url, transport=transport)
+
+    def obter_cliente(self, url, cert_path):
+        """
+        Retorna um cliente SOAP para o WSDL e certificado, criando se necessário
+
+        Args:
+            url: URL do WSDL
+            cert_path: Caminho do certificado PEM
+
+        Returns:
+            Client: Cliente SOAP configurado
+        """
+        chave = (url, cert_path)
+        impressao = self.impressao_digital(cert_path)
+
+        with self._lock:
+            self._remover_expirados()
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada.impressao_digital == impressao:
+                return entrada.cliente
+
+        # O download/parse do WSDL é feito fora do lock para não bloquear outros certificados
+        sessao = self.criar_sessao(cert_path)
+        try:
+            cliente = self.criar_cliente(url, sessao)
+        except Exception:
+            sessao.close()
+            raise
+        nova = _EntradaPool(cliente, sessao, impressao)
+
+        with self._lock:
+            atual = self._entradas.get(chave)
+            if atual is not None and atual.impressao_digital == impressao and not atual.expirou(self.ttl):
+                # Outra thread criou o cliente enquanto este era montado
+                nova.fechar()
+                return atual.cliente
+            self._entradas[chave] = nova
+
+        if atual is not None:
+            atual.fechar()
+        return cliente
+
+    def invalidar(self, cert_path=None):
+        """
+        Descarta os clientes de um certificado (ou todos, se cert_path for None)
+
+        Args:
+            cert_path: Caminho do certificado PEM
+        """
+        with self._lock:
+            chaves = [
+                chave for chave in self._entradas
+                if cert_path is None or chave[1] == cert_path
+            ]
+            removidas = [self._entradas.pop(chave) for chave in chaves]
+
+        for entrada in removidas:
+            entrada.fechar()
+
+    def _remover_expirados(self):
+        """Remove entradas com TTL vencido (chamar com o lock adquirido)"""
+        ttl = self.ttl
+        expiradas = [chave for chave, entrada in self._entradas.items() if entrada.expirou(ttl)]
+        for chave in expiradas:
+            self._entradas.pop(chave).fechar()
+
+
+# Instância única por processo
+pool_clientes = PoolClientesSOAP()
@@ -4,14 +4,16 @@ Gerencia comunicação com webservices da Prefeitura de SP
 """
 import xml.etree.ElementTree as ET
 from lxml import etree
-import xmlsec
-import requests
-from zeep import Client
-from zeep.transports import Transport
-from datetime import datetime
 import locale
 
+from .assinatura_paralela import assinar_documento
+from .cache_chaves import cache_chaves
 from .certificado_service import CertificadoService
+from .leitor_consulta import LeitorRetornoConsulta
+from .nfe_eventos_django import serializar
+from .politica_transporte import CircuitoAberto, ErroTransporte, politica_transporte, resultado_incerto
+from .pool_clientes_soap import pool_clientes
+from .wsdl_local import obter_wsdl
 
 # Configurar locale
 try:
@@ -39,61 +41,82 @@ class ProcessadorNFeDjango:
         self.cert_service = CertificadoService()
         self.cert_path = self.cert_service.get_pem_path(empresa)
         
-        # URLs dos webservices
-        self.url_nfe = "https://nfe.prefeitura.sp.gov.br/ws/lotenfe.asmx?WSDL"
-        self.url_nfts = "https://nfe.prefeitura.sp.gov.br/ws/loteNFTS.asmx?WSDL"
+        # WSDLs dos webservices (cópia local em layouts/, com fallback para a URL)
+        self.url_nfe = obter_wsdl('nfe')
+        self.url_nfts = obter_wsdl('nfts')
     
     def assinar_xml(self, xml_string):
         """
         Assina o XML com o certificado digital
         
         Args:
-            xml_string: String do XML a ser assinado
+            xml_string: Pedido a ser assinado (elemento lxml de EventoNFeDjango,
+                        assinado na própria árvore, ou XML em texto)
             
         Returns:
             str: XML assinado
         """
-        template = etree.fromstring(xml_string.encode('utf-8'))
-        signature_node = xmlsec.tree.find_node(template, xmlsec.constants.NodeSignature)
-        
-        if not signature_node:
-            raise Exception("Nó de assinatura não encontrado no XML")
-        
-        ctx = xmlsec.SignatureContext()
-        
-        # Carrega a chave do certificado
-        key = xmlsec.Key.from_file(self.cert_path, xmlsec.constants.KeyDataFormatPem)
-        key.load_cert_from_file(self.cert_path, xmlsec.constants.KeyDataFormatPem)
-        ctx.key = key
-        
-        # Adiciona o nó de assinatura ao template
-        if signature_node.getparent() is None:
-            template.append(signature_node)
+        # Chave do certificado (lida uma única vez por certificado, cache do processo)
+        return assinar_documento(cache_chaves.obter(self.cert_path).chave_xmlsec, xml_string)
+    
+    def criar_cliente_soap(self, url):
+        """
+        Obtém cliente SOAP com certificado do pool do processo
         
-        # Assina o XML
-        ctx.sign(signature_node)
+        Args:
+            url: URL do WSDL
+            
+        Returns:
+            Client: Cliente SOAP configurado (reaproveitado entre chamadas)
+        """
+        return pool_clientes.obter_cliente(url, self.cert_path)
+    
+    def chamar_servico(self, url, operacao, *args, idempotente=False):
+        """
+        Chama uma operação do webservice pela política de transporte
+        (timeouts, disjuntor por endpoint e repetição das consultas)
         
-        # Converte para string
-        xml_bytes = etree.tostring(template, pretty_print=False, encoding="utf-8", xml_declaration=True)
-        xml_str = xml_bytes.decode("utf-8")
+        Args:
+            url: URL do WSDL
+            operacao: Nome da operação SOAP (ex.: 'EnvioRPS')
+            *args: Argumentos da operação
+            idempotente: Se True, falhas transitórias são repetidas
+            
+        Returns:
+            Retorno da operação SOAP
+            
+        Raises:
+            ErroTransporte: Falha de comunicação ou endpoint suspenso pelo disjuntor
+        """
+        def chamada():
+            client = self.criar_cliente_soap(url)
+            return getattr(client.service, operacao)(*args)
         
-        return xml_str
+        return politica_transporte.executar(url, chamada, idempotente=idempotente)
     
-    def criar_cliente_soap(self, url):
+    @staticmethod
+    def resultado_falha_transporte(erro, mensagem):
         """
-        Cria cliente SOAP com certificado
+        Monta o resultado de uma falha de comunicação com a prefeitura
         
         Args:
-            url: URL do WSDL
+            erro: ErroTransporte ocorrido
+            mensagem: Prefixo da mensagem (ex.: 'Erro ao enviar RPS')
             
         Returns:
-            Client: Cliente SOAP configurado
+            dict: Resultado com sucesso False e a classificação da falha
         """
-        session = requests.Session()
-        session.cert = self.cert_path
-        transport = Transport(session=session)
-        client = Client(url, transport=transport)
-        return client
+        texto = f'{mensagem}: {str(erro)}'
+        if erro.incerto:
+            texto += ' (a prefeitura pode ter processado a requisição; consulte antes de reenviar)'
+        return {
+            'sucesso': False,
+            'mensagem': texto,
+            'erro': str(erro),
+            'transitorio': True,
+            'circuito_aberto': isinstance(erro, CircuitoAberto),
+            'incerto': erro.incerto
+        }
     
     def enviar_rps(self, xml_string):
         """
@@ -109,15 +132,14 @@ class ProcessadorNFeDjango:
             # Assina o XML
             xml_assinado = self.assinar_xml(xml_string)
             
-            # Cria cliente SOAP
-            client = self.criar_cliente_soap(self.url_nfe)
-            
-            # Envia RPS
-            result = client.service.EnvioRPS(1, xml_assinado)
+            # Envia RPS (envio não é repetido automaticamente)
+            result = self.chamar_servico(self.url_nfe, 'EnvioRPS', 1, xml_assinado)
             
             # Processa resposta
             return self.processar_resposta_envio_rps(result)
             
+        except ErroTransporte as e:
+            return self.resultado_falha_transporte(e, 'Erro ao enviar RPS')
         except Exception as e:
             return {
                 'sucesso': False,
@@ -252,6 +274,155 @@ class ProcessadorNFeDjango:
                 'xml_resposta': xml_resposta
             }
     
+    def enviar_lote_rps(self, xml_string, teste=False, assinado=False):
+        """
+        Envia lote de RPS (PedidoEnvioLoteRPS) para emissão de NFS-e
+        
+        Args:
+            xml_string: XML do lote gerado por EventoNFeDjango.criar_pedido_envio_lote_rps
+            teste: Se True, usa TesteEnvioLoteRPS (valida o lote sem gerar NFS-e)
+            assinado: Se True, o XML já vem assinado (ex.: AssinadorParalelo)
+        
+        Returns:
+            dict: Resultado do lote com o retorno de cada RPS
+        """
+        enviando = False
+        try:
+            # Assina o XML
+            xml_assinado = xml_string if assinado else self.assinar_xml(xml_string)
+            
+            # Envia lote (o teste não gera NFS-e e pode ser repetido)
+            operacao = 'TesteEnvioLoteRPS' if teste else 'EnvioLoteRPS'
+            enviando = True
+            result = self.chamar_servico(self.url_nfe, operacao, 1, xml_assinado, idempotente=teste)
+            
+            # Processa resposta
+            return self.processar_resposta_envio_lote(result)
+        
+        except ErroTransporte as e:
+            resultado = self.resultado_falha_transporte(e, 'Erro ao enviar lote de RPS')
+            resultado.update({'rps': {}, 'erros_rps': {}})
+            return resultado
+        except Exception as e:
+            # Falha depois da chamada (ex.: resposta ilegível): o lote pode ter sido processado
+            return {
+                'sucesso': False,
+                'mensagem': f'Erro ao enviar lote de RPS: {str(e)}',
+                'erro': str(e),
+                'rps': {},
+                'erros_rps': {},
+                'incerto': enviando and not teste and resultado_incerto(e),
+            }
+    
+    @staticmethod
+    def chave_rps(serie, numero):
+        """
+        Normaliza a chave de um RPS para cruzar o retorno do lote com as notas
+        
+        Args:
+            serie: Série do RPS
+            numero: Número do RPS (com ou sem zeros à esquerda)
+        
+        Returns:
+            tuple: (série, número inteiro)
+        """
+        return ((serie or '').strip().upper(), int(str(numero).strip() or 0))
+    
+    def processar_resposta_envio_lote(self, xml_resposta):
+        """
+        Processa a resposta do envio de lote de RPS (RetornoEnvioLoteRPS)
+        
+        Args:
+            xml_resposta: XML de resposta do webservice
+        
+        Returns:
+            dict: sucesso, mensagem, informacoes do lote, 'rps' com a NFS-e gerada
+                  por chave RPS, 'erros_rps' com os erros por chave RPS e 'erros'
+                  gerais (sem chave)
+        """
+        def texto(elemento, caminho):
+            filho = elemento.find(caminho)
+            return filho.text if filho is not None else None
+        
+        try:
+            root = etree.fromstring(xml_resposta.encode('utf-8'))
+            # Remove namespaces para simplificar as buscas
+            for elemento in root.iter():
+                if isinstance(elemento.tag, str) and '}' in elemento.tag:
+                    elemento.tag = elemento.tag.split('}', 1)[1]
+            
+            sucesso = (texto(root, './/Cabecalho/Sucesso') or '').lower() == 'true'
+            
+            resultado = {
+                'sucesso': sucesso,
+                'xml_resposta': xml_resposta,
+                'rps': {},
+                'erros_rps': {},
+                'erros': [],
+                'alertas': [],
+            }
+            
+            informacoes = root.find('.//Cabecalho/InformacoesLote')
+            if informacoes is not None:
+                resultado['numero_lote'] = texto(informacoes, 'NumeroLote')
+                resultado['qtd_notas_processadas'] = texto(informacoes, 'QtdNotasProcessadas')
+            
+            # NFS-e geradas (ChaveNFeRPS)
+            for chave_nfe_rps in root.findall('ChaveNFeRPS'):
+                chave_rps = chave_nfe_rps.find('ChaveRPS')
+                chave_nfe = chave_nfe_rps.find('ChaveNFe')
+                if chave_rps is None or chave_nfe is None:
+                    continue
+                chave = self.chave_rps(texto(chave_rps, 'SerieRPS'), texto(chave_rps, 'NumeroRPS'))
+                numero_nfe = texto(chave_nfe, 'NumeroNFe')
+                codigo_verificacao = texto(chave_nfe, 'CodigoVerificacao')
+                dados = {
+                    'numero_nfe': numero_nfe,
+                    'codigo_verificacao': codigo_verificacao,
+                }
+                if numero_nfe and codigo_verificacao:
+                    dados['url_nfe'] = (
+                        f"https://nfe.prefeitura.sp.gov.br/contribuinte/notaprint.aspx?"
+                        f"inscricao={self.empresa.inscricao_municipal}&nf={numero_nfe}&"
+                        f"verificacao={codigo_verificacao}"
+                    )
+                resultado['rps'][chave] = dados
+            
+            # Erros e alertas (por RPS quando o evento traz a ChaveRPS)
+            for tipo in ('Erro', 'Alerta'):
+                for evento in root.findall(tipo):
+                    item = {
+                        'codigo': texto(evento, 'Codigo') or '',
+                        'descricao': texto(evento, 'Descricao') or '',
+                    }
+                    chave_rps = evento.find('ChaveRPS')
+                    if tipo == 'Alerta':
+                        resultado['alertas'].append(item)
+                    elif chave_rps is not None:
+                        chave = self.chave_rps(texto(chave_rps, 'SerieRPS'), texto(chave_rps, 'NumeroRPS'))
+                        resultado['erros_rps'].setdefault(chave, []).append(item)
+                    else:
+                        resultado['erros'].append(item)
+            
+            if resultado['erros']:
+                resultado['mensagem'] = resultado['erros'][0]['descricao']
+            elif sucesso:
+                resultado['mensagem'] = f"Lote processado: {len(resultado['rps'])} NFS-e gerada(s)"
+            else:
+                resultado['mensagem'] = 'Erro ao processar lote de RPS'
+            
+            return resultado
+        
+        except Exception as e:
+            return {
+                'sucesso': False,
+                'mensagem': f'Erro ao processar resposta: {str(e)}',
+                'erro': str(e),
+                'xml_resposta': xml_resposta,
+                'rps': {},
+                'erros_rps': {}
+            }
+
     def cancelar_nfe(self, xml_string):
         """
         Cancela uma NFS-e
@@ -266,15 +437,14 @@ class ProcessadorNFeDjango:
             # Assina o XML
             xml_assinado = self.assinar_xml(xml_string)
             
-            # Cria cliente SOAP
-            client = self.criar_cliente_soap(self.url_nfe)
-            
             # Cancela NFS-e
-            result = client.service.CancelamentoNFe(1, xml_assinado)
+            result = self.chamar_servico(self.url_nfe, 'CancelamentoNFe', 1, xml_assinado)
             
             # Processa resposta
             return self.processar_resposta_cancelamento(result)
             
+        except ErroTransporte as e:
+            return self.resultado_falha_transporte(e, 'Erro ao cancelar NFS-e')
         except Exception as e:
             return {
                 'sucesso': False,
@@ -348,18 +518,15 @@ class ProcessadorNFeDjango:
             # Assina o XML
             xml_assinado = self.assinar_xml(xml_string)
             
-            # Cria cliente SOAP
-            client = self.criar_cliente_soap(self.url_nfe)
-            
-            # Consulta NFS-e
-            if tipo == 'E':
-                result = client.service.ConsultaNFeEmitidas(1, xml_assinado)
-            else:
-                result = client.service.ConsultaNFeRecebidas(1, xml_assinado)
+            # Consulta NFS-e (idempotente: falhas transitórias são repetidas)
+            operacao = 'ConsultaNFeEmitidas' if tipo == 'E' else 'ConsultaNFeRecebidas'
+            result = self.chamar_servico(self.url_nfe, operacao, 1, xml_assinado, idempotente=True)
             
             # Processa resposta
             return self.processar_resposta_consulta(result, tipo)
             
+        except ErroTransporte as e:
+            return self.resultado_falha_transporte(e, 'Erro ao consultar NFS-e')
         except Exception as e:
             return {
                 'sucesso': False,
@@ -367,6 +534,35 @@ class ProcessadorNFeDjango:
                 'erro': str(e)
             }
     
+    def consultar_nfe_rps(self, xml_string):
+        """
+        Consulta NFS-e pela chave dos RPS (ConsultaNFe)
+        
+        Args:
+            xml_string: XML de EventoNFeDjango.criar_pedido_consulta_rps
+            
+        Returns:
+            dict: Resultado da consulta com lista de notas (com serie_rps e numero_rps)
+        """
+        try:
+            # Assina o XML
+            xml_assinado = self.assinar_xml(xml_string)
+            
+            # Consulta NFS-e (idempotente: falhas transitórias são repetidas)
+            result = self.chamar_servico(self.url_nfe, 'ConsultaNFe', 1, xml_assinado, idempotente=True)
+            
+            # Processa resposta
+            return self.processar_resposta_consulta(result, 'E')
+            
+        except ErroTransporte as e:
+            return self.resultado_falha_transporte(e, 'Erro ao consultar RPS')
+        except Exception as e:
+            return {
+                'sucesso': False,
+                'mensagem': f'Erro ao consultar RPS: {str(e)}',
+                'erro': str(e)
+            }
+    
     def processar_resposta_consulta(self, xml_resposta, tipo):
         """
         Processa a resposta da consulta de NFS-e
@@ -376,26 +572,30 @@ class ProcessadorNFeDjango:
             tipo: Tipo de consulta ('E' ou 'R')
             
         Returns:
-            dict: Dados processados com lista de notas
+            dict: Dados processados com a lista de notas (NFeConsultada, valores em
+                  Decimal/datetime; a formatação fica a cargo da apresentação),
+                  'erros' e 'alertas' da prefeitura e 'sucesso_prefeitura'
+                  (Cabecalho/Sucesso do retorno)
         """
         try:
-            root = ET.fromstring(xml_resposta)
-            namespace = {'nfe': 'http://www.prefeitura.sp.gov.br/nfe'}
+            leitor = LeitorRetornoConsulta(xml_resposta)
+            notas = list(leitor)
             
             resultado = {
                 'sucesso': True,
                 'tipo': 'Emitidas' if tipo == 'E' else 'Recebidas',
-                'notas': [],
+                'notas': notas,
+                'total': len(notas),
+                'erros': leitor.erros,
+                'alertas': leitor.alertas,
+                'sucesso_prefeitura': leitor.sucesso,
                 'xml_resposta': xml_resposta
             }
             
-            # Extrai notas
-            for nfe in root.findall('.//NFe', namespace):
-                nota = self.extrair_dados_nfe(nfe, namespace)
-                resultado['notas'].append(nota)
-            
-            resultado['total'] = len(resultado['notas'])
-            resultado['mensagem'] = f"{resultado['total']} nota(s) encontrada(s)"
+            if not notas and leitor.erros:
+                resultado['mensagem'] = leitor.erros[0]['descricao']
+            else:
+                resultado['mensagem'] = f"{resultado['total']} nota(s) encontrada(s)"
             
             return resultado
             
@@ -407,77 +607,13 @@ class ProcessadorNFeDjango:
                 'xml_resposta': xml_resposta
             }
     
-    def extrair_dados_nfe(self, nfe_element, namespace):
-        """
-        Extrai dados de um elemento NFe do XML
-        
-        Args:
-            nfe_element: Elemento XML da NFe
-            namespace: Namespace do XML
-            
-        Returns:
-            dict: Dados da nota fiscal
-        """
-        def get_text(element, tag):
-            child = element.find(tag, namespace)
-            return child.text if child is not None else None
-        
-        def formata_valor(valor):
-            if valor:
-                try:
-                    return str(locale.currency(float(valor), grouping=True, symbol=False))
-                except:
-                    return valor
-            return ''
-        
-        def formata_data(data):
-            if data:
-                try:
-                    return datetime.strptime(data, "%Y-%m-%dT%H:%M:%S").strftime("%d/%m/%Y %H:%M:%S")
-                except:
-                    return data
-            return ''
-        
-        nota = {
-            'inscricao_prestador': get_text(nfe_element, './/InscricaoPrestador'),
-            'numero_nfe': get_text(nfe_element, './/NumeroNFe'),
-            'codigo_verificacao': get_text(nfe_element, './/CodigoVerificacao'),
-            'data_emissao': formata_data(get_text(nfe_element, './/DataEmissaoNFe')),
-            'data_fato_gerador': formata_data(get_text(nfe_element, './/DataFatoGeradorNFe')),
-            'cnpj_prestador': get_text(nfe_element, './/CNPJ'),
-            'razao_social_prestador': get_text(nfe_element, './/RazaoSocialPrestador'),
-            'logradouro': get_text(nfe_element, './/Logradouro'),
-            'numero_endereco': get_text(nfe_element, './/NumeroEndereco'),
-            'bairro': get_text(nfe_element, './/Bairro'),
-            'cidade': get_text(nfe_element, './/Cidade'),
-            'uf': get_text(nfe_element, './/UF'),
-            'cep': get_text(nfe_element, './/CEP'),
-            'status_nfe': get_text(nfe_element, './/StatusNFe'),
-            'data_cancelamento': formata_data(get_text(nfe_element, './/DataCancelamento')),
-            'tributacao_nfe': get_text(nfe_element, './/TributacaoNFe'),
-            'valor_servicos': formata_valor(get_text(nfe_element, './/ValorServicos')),
-            'codigo_servico': get_text(nfe_element, './/CodigoServico'),
-            'aliquota_servicos': get_text(nfe_element, './/AliquotaServicos'),
-            'valor_iss': formata_valor(get_text(nfe_element, './/ValorISS')),
-            'valor_credito': formata_valor(get_text(nfe_element, './/ValorCredito')),
-            'iss_retido': get_text(nfe_element, './/ISSRetido'),
-            'discriminacao': get_text(nfe_element, './/Discriminacao'),
-        }
-        
-        # CPF ou CNPJ do tomador
-        cpf_tomador = get_text(nfe_element, './/CPFCNPJTomador/.//CPF')
-        cnpj_tomador = get_text(nfe_element, './/CPFCNPJTomador/.//CNPJ')
-        nota['cpf_cnpj_tomador'] = cpf_tomador if cpf_tomador else cnpj_tomador
-        nota['razao_social_tomador'] = get_text(nfe_element, './/RazaoSocialTomador')
-        
-        return nota
-    
     def enviar_nfts(self, xml_string):
         """
         Envia NFTS (Nota Fiscal do Tomador de Serviços)
         
         Args:
-            xml_string: XML da NFTS já assinado
+            xml_string: XML da NFTS já assinado (elemento lxml de
+                        EventoNFeDjango.criar_pedido_envio_nfts ou texto)
             
         Returns:
             dict: Resultado do envio
@@ -485,16 +621,16 @@ class ProcessadorNFeDjango:
         try:
             # O XML já vem assinado do criar_pedido_envio_nfts()
             # NÃO assinar novamente!
-            
-            # Cria cliente SOAP
-            client = self.criar_cliente_soap(self.url_nfts)
+            xml_string = serializar(xml_string)
             
             # Envia NFTS
-            result = client.service.EnvioNFTS(xml_string)
+            result = self.chamar_servico(self.url_nfts, 'EnvioNFTS', xml_string)
             
             # Processa resposta (similar ao RPS)
             return self.processar_resposta_envio_rps(result)
             
+        except ErroTransporte as e:
+            return self.resultado_falha_transporte(e, 'Erro ao enviar NFTS')
         except Exception as e:
             return {
                 'sucesso': False,
@@ -0,0 +1,121 @@
+"""
+Registro de envios de RPS (tabela RegistroEnvioRPS)
+Grava a impressão digital de cada RPS antes da chamada SOAP, para que uma nova
+tentativa de emissão consulte a prefeitura em vez de reenviar um RPS que pode
+já ter gerado NFS-e
+"""
+import hashlib
+
+from django.utils import timezone
+
+from core.models import RegistroEnvioRPS
+
+
+def impressao_digital(cadeia):
+    """
+    Impressão digital de um RPS
+
+    Args:
+        cadeia: Cadeia assinada do RPS (EventoNFeDjango.cadeia_assinatura_rps)
+
+    Returns:
+        str: SHA-256 em hexadecimal
+    """
+    return hashlib.sha256(cadeia.encode('utf-8')).hexdigest()
+
+
+class RegistroEnvios:
+    """
+    Registro de envios dos RPS de uma empresa
+    """
+
+    def __init__(self, evento):
+        """
+        Inicializa o registro
+
+        Args:
+            evento: EventoNFeDjango da empresa (CNPJ e cadeia de assinatura dos RPS)
+        """
+        self.evento = evento
+
+    def pendentes(self, notas):
+        """
+        RPS cujo envio anterior não teve o resultado gravado
+
+        Args:
+            notas: Lista de NotaFiscalSP
+
+        Returns:
+            dict: {nota_id: RegistroEnvioRPS} dos registros ainda 'enviando'
+        """
+        registros = RegistroEnvioRPS.objects.filter(
+            nota_id__in=[nota.id for nota in notas], status='enviando'
+        )
+        return {registro.nota_id: registro for registro in registros}
+
+    def alterados(self, notas):
+        """
+        RPS cuja cadeia assinada atual difere da gravada no último envio
+
+        Args:
+            notas: Lista de NotaFiscalSP com registro de envio
+
+        Returns:
+            set: IDs das notas alteradas depois do envio
+        """
+        registros = dict(RegistroEnvioRPS.objects.filter(
+            nota_id__in=[nota.id for nota in notas]
+        ).values_list('nota_id', 'impressao_digital'))
+        return {
+            nota.id for nota in notas
+            if nota.id in registros
+            and registros[nota.id] != impressao_digital(self.evento.cadeia_assinatura_rps(nota))
+        }
+
+    def registrar(self, notas):
+        """
+        Grava (ou atualiza) o registro dos RPS como 'enviando', antes do envio
+
+        Args:
+            notas: Lista de NotaFiscalSP que serão enviadas
+        """
+        agora = timezone.now()
+        RegistroEnvioRPS.objects.bulk_create(
+            [
+                RegistroEnvioRPS(
+                    nota=nota,
+                    cnpj=self.evento.cnpj,
+                    serie=nota.serie_rps or '',
+                    numero=str(nota.numero_rps),
+                    impressao_digital=impressao_digital(self.evento.cadeia_assinatura_rps(nota)),
+                    status='enviando',
+                    data_envio=agora,
+                )
+                for nota in notas
+            ],
+            update_conflicts=True,
+            unique_fields=['nota'],
+            update_fields=['cnpj', 'serie', 'numero', 'impressao_digital', 'status', 'data_envio', 'data_atualizacao'],
+        )
+
+    def concluir(self, notas, incerto=False):
+        """
+        Atualiza o registro conforme o resultado gravado nas notas
+
+        Args:
+            notas: Lista de NotaFiscalSP enviadas (já atualizadas com o retorno)
+            incerto: Se True, o envio pode ter sido processado pela prefeitura
+                     (ex.: timeout de leitura); os RPS sem NFS-e continuam 'enviando'
+        """
+        emitidas = [nota.id for nota in notas if nota.status_rps == 'emitida']
+        demais = [nota.id for nota in notas if nota.status_rps != 'emitida']
+        agora = timezone.now()
+
+        if emitidas:
+            RegistroEnvioRPS.objects.filter(nota_id__in=emitidas).update(
+                status='confirmado', data_atualizacao=agora
+            )
+        if demais and not incerto:
+            RegistroEnvioRPS.objects.filter(nota_id__in=demais).update(
+                status='rejeitado', data_atualizacao=agora
+            )
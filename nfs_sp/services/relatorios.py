@@ -0,0 +1,138 @@
+"""
+Relatórios das NFS-e e NFTS de São Paulo (botão Relatório da tela de emissão)
+"""
+from django.db.models import Sum
+
+from core.models import (
+    STATUS_NFTS_CHOICES, STATUS_RPS_CHOICES, TIPO_DOCUMENTO_CHOICES, TIPO_TRIBUTACAO_CHOICES
+)
+from core.services.relatorio_notas import Coluna, Relatorio, relatorio_sintetico
+
+
+def relatorio_nfse_sp(notas, tipo):
+    """
+    Relatório das NFS-e
+
+    Args:
+        notas: QuerySet de NotaFiscalSP já filtrado
+        tipo: analitico, sintetico, financeiro ou tributos
+
+    Returns:
+        Relatorio: Definição do relatório
+    """
+    notas = notas.com_impostos()
+    if tipo == 'sintetico':
+        return relatorio_sintetico('NFS-e SP - Sintético', notas)
+
+    notas = notas.order_by('data_referencia', 'id')
+    identificacao = [
+        Coluna('CNPJ Empresa', 'cnpj_contribuinte', largura=20),
+        Coluna('Número NFS-e', 'numero_nfse'),
+        Coluna('Data', 'data_referencia', 'data'),
+    ]
+
+    if tipo == 'financeiro':
+        return Relatorio('NFS-e SP - Financeiro', notas, identificacao + [
+            Coluna('Tomador', 'nome_tomador', largura=40),
+            Coluna('Valor Total', 'valor_total', 'moeda', total=Sum('valor_total')),
+            Coluna('Deduções', 'deducoes', 'moeda', total=Sum('deducoes')),
+            Coluna('Retenções', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+            Coluna('Valor Líquido', 'valor_liquido', 'moeda', total=Sum('valor_liquido')),
+            Coluna('Status', 'status_rps', 'escolha', escolhas=STATUS_RPS_CHOICES),
+        ])
+
+    if tipo == 'tributos':
+        return Relatorio('NFS-e SP - Tributos', notas, identificacao + [
+            Coluna('Código Serviço', 'cod_servico'),
+            Coluna('Tributação', 'tipo_tributacao', 'escolha', escolhas=TIPO_TRIBUTACAO_CHOICES, largura=28),
+            Coluna('Base de Cálculo', 'base_calculo', 'moeda', total=Sum('base_calculo')),
+            Coluna('Alíquota (%)', 'aliquota', 'percentual'),
+            Coluna('Valor ISS', 'valor_iss', 'moeda', total=Sum('valor_iss')),
+            Coluna('ISS Retido', 'iss_retido', 'booleano'),
+            Coluna('PIS', 'pis_retido', 'moeda', total=Sum('pis_retido')),
+            Coluna('COFINS', 'cofins_retido', 'moeda', total=Sum('cofins_retido')),
+            Coluna('IRRF', 'irrf_retido', 'moeda', total=Sum('irrf_retido')),
+            Coluna('CSLL', 'csll_retido', 'moeda', total=Sum('csll_retido')),
+            Coluna('INSS', 'inss_retido', 'moeda', total=Sum('inss_retido')),
+            Coluna('Total Retido', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+        ])
+
+    return Relatorio('NFS-e SP - Analítico', notas, identificacao + [
+        Coluna('Código Verificação', 'codigo_verificacao'),
+        Coluna('Emissão NFS-e', 'data_emissao_nfse', 'data_hora'),
+        Coluna('Série RPS', 'serie_rps'),
+        Coluna('Número RPS', 'numero_rps'),
+        Coluna('CNPJ/CPF Tomador', 'cnpj_cpf_tomador', largura=20),
+        Coluna('Tomador', 'nome_tomador', largura=40),
+        Coluna('Código Serviço', 'cod_servico'),
+        Coluna('Descrição', 'descricao', largura=50),
+        Coluna('Valor Total', 'valor_total', 'moeda', total=Sum('valor_total')),
+        Coluna('Deduções', 'deducoes', 'moeda', total=Sum('deducoes')),
+        Coluna('Alíquota (%)', 'aliquota', 'percentual'),
+        Coluna('Valor ISS', 'valor_iss', 'moeda', total=Sum('valor_iss')),
+        Coluna('ISS Retido', 'iss_retido', 'booleano'),
+        Coluna('Retenções', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+        Coluna('Valor Líquido', 'valor_liquido', 'moeda', total=Sum('valor_liquido')),
+        Coluna('Status', 'status_rps', 'escolha', escolhas=STATUS_RPS_CHOICES),
+    ])
+
+
+def relatorio_nfts_sp(notas, tipo):
+    """
+    Relatório das NFTS
+
+    Args:
+        notas: QuerySet de NotaFiscalTomadorSP já filtrado
+        tipo: analitico, sintetico, financeiro ou tributos
+
+    Returns:
+        Relatorio: Definição do relatório
+    """
+    notas = notas.com_impostos()
+    if tipo == 'sintetico':
+        return relatorio_sintetico('NFTS SP - Sintético', notas, retencoes=False)
+
+    notas = notas.order_by('data_prestacao_servico', 'id')
+    identificacao = [
+        Coluna('CNPJ Empresa', 'cnpj_contribuinte', largura=20),
+        Coluna('Número NFTS', 'nfts'),
+        Coluna('Data Prestação', 'data_prestacao_servico', 'data'),
+        Coluna('CNPJ/CPF Prestador', 'cnpj_cpf_prestador', largura=20),
+    ]
+
+    if tipo == 'financeiro':
+        return Relatorio('NFTS SP - Financeiro', notas, identificacao + [
+            Coluna('Documento', 'numero_documento'),
+            Coluna('Valor Total', 'valor_total', 'moeda', total=Sum('valor_total')),
+            Coluna('Deduções', 'deducoes', 'moeda', total=Sum('deducoes')),
+            Coluna('ISS Retido', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+            Coluna('Valor Líquido', 'valor_liquido', 'moeda', total=Sum('valor_liquido')),
+            Coluna('Status', 'status_nfts', 'escolha', escolhas=STATUS_NFTS_CHOICES),
+        ])
+
+    if tipo == 'tributos':
+        return Relatorio('NFTS SP - Tributos', notas, identificacao + [
+            Coluna('Código Serviço', 'cod_servico'),
+            Coluna('Tributação', 'tipo_tributacao', 'escolha', escolhas=TIPO_TRIBUTACAO_CHOICES, largura=28),
+            Coluna('Base de Cálculo', 'base_calculo', 'moeda', total=Sum('base_calculo')),
+            Coluna('Alíquota (%)', 'aliquota', 'percentual'),
+            Coluna('Valor ISS', 'valor_iss', 'moeda', total=Sum('valor_iss')),
+            Coluna('ISS Retido', 'iss_retido', 'booleano'),
+        ])
+
+    return Relatorio('NFTS SP - Analítico', notas, identificacao + [
+        Coluna('Tipo Documento', 'tipo_documento', 'escolha', escolhas=TIPO_DOCUMENTO_CHOICES),
+        Coluna('Série', 'serie'),
+        Coluna('Documento', 'numero_documento'),
+        Coluna('Cidade', 'cidade'),
+        Coluna('UF', 'estado'),
+        Coluna('Código Serviço', 'cod_servico'),
+        Coluna('Descrição', 'descricao', largura=50),
+        Coluna('Valor Total', 'valor_total', 'moeda', total=Sum('valor_total')),
+        Coluna('Deduções', 'deducoes', 'moeda', total=Sum('deducoes')),
+        Coluna('Alíquota (%)', 'aliquota', 'percentual'),
+        Coluna('Valor ISS', 'valor_iss', 'moeda', total=Sum('valor_iss')),
+        Coluna('ISS Retido', 'iss_retido', 'booleano'),
+        Coluna('Valor Líquido', 'valor_liquido', 'moeda', total=Sum('valor_liquido')),
+        Coluna('Status', 'status_nfts', 'escolha', escolhas=STATUS_NFTS_CHOICES),
+    ])
@@ -0,0 +1,239 @@
+"""
+Sincronização incremental das NFS-e emitidas/recebidas com a Prefeitura de SP
+Consulta apenas a janela desde a última marca d'água (MarcoSincronizacaoNotas)
+de cada empresa e tipo, dividida em períodos aceitos pela API e paginada, e
+grava as notas em NotaPrefeituraSP com upsert em lote
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import MarcoSincronizacaoNotas, NotaPrefeituraSP
+from .leitor_consulta import NFeConsultada
+from .nfe_eventos_django import EventoNFeDjango
+from .processador_django import ProcessadorNFeDjango
+
+logger = logging.getLogger(__name__)
+
+# Campos de NotaPrefeituraSP preenchidos a partir de NFeConsultada
+CAMPOS_NOTA = NFeConsultada.__slots__
+
+# Chave única da nota (constraint nota_prefeitura_chave_nfe)
+CHAVE_NOTA = ['empresa', 'tipo', 'inscricao_prestador', 'numero_nfe']
+
+# Campos que não podem ficar nulos no modelo
+PADROES_NOTA = {
+    'valor_servicos': 0,
+    'valor_deducoes': 0,
+    'valor_iss': 0,
+    'valor_credito': 0,
+    'iss_retido': False,
+}
+
+
+def periodos(inicio, fim, dias=None):
+    """
+    Divide um período nos intervalos aceitos pela consulta da prefeitura
+
+    Args:
+        inicio: Data inicial (date)
+        fim: Data final (date)
+        dias: Dias por intervalo. Se None, usa settings.NFE_CONSULTA_PERIODO_DIAS
+
+    Returns:
+        list: Tuplas (início, fim) consecutivas, cobrindo o período
+    """
+    dias = dias or getattr(settings, 'NFE_CONSULTA_PERIODO_DIAS', 31)
+    intervalos = []
+    while inicio <= fim:
+        final = min(inicio + timedelta(days=dias - 1), fim)
+        intervalos.append((inicio, final))
+        inicio = final + timedelta(days=1)
+    return intervalos
+
+
+class ErroSincronizacao(Exception):
+    """Falha na consulta à prefeitura durante a sincronização"""
+
+
+class SincronizadorNotas:
+    """
+    Sincroniza as NFS-e emitidas (tipo 'E') e recebidas (tipo 'R') de uma empresa
+    """
+
+    def __init__(self, empresa, evento=None, processador=None):
+        """
+        Inicializa o sincronizador
+
+        Args:
+            empresa: Instância de Empresa
+            evento: EventoNFeDjango da empresa (criado se None)
+            processador: ProcessadorNFeDjango da empresa (criado se None)
+        """
+        self.empresa = empresa
+        self.evento = evento or EventoNFeDjango(empresa)
+        self.processador = processador or ProcessadorNFeDjango(empresa)
+
+    def janela(self, tipo, data_fim=None):
+        """
+        Período ainda não sincronizado
+
+        Começa no dia da marca d'água (reconsultado, pois pode ter recebido notas
+        depois da última sincronização) ou, na primeira sincronização,
+        settings.NFE_SINCRONIZACAO_DIAS_INICIAIS dias antes de data_fim.
+
+        Args:
+            tipo: 'E' (emitidas) ou 'R' (recebidas)
+            data_fim: Data final (padrão: hoje)
+
+        Returns:
+            tuple: (início, fim)
+        """
+        data_fim = data_fim or timezone.localdate()
+        marco = MarcoSincronizacaoNotas.objects.filter(empresa=self.empresa, tipo=tipo).first()
+        if marco:
+            return min(marco.data_ate, data_fim), data_fim
+        dias = getattr(settings, 'NFE_SINCRONIZACAO_DIAS_INICIAIS', 90)
+        return data_fim - timedelta(days=dias - 1), data_fim
+
+    def consultar_periodo(self, tipo, inicio, fim):
+        """
+        Consulta todas as páginas de um intervalo e grava as notas
+
+        Args:
+            tipo: 'E' ou 'R'
+            inicio: Data inicial do intervalo
+            fim: Data final do intervalo (dentro de NFE_CONSULTA_PERIODO_DIAS)
+
+        Returns:
+            int: Quantidade de notas recebidas da prefeitura
+
+        Raises:
+            ErroSincronizacao: Se a consulta de alguma página falhar
+        """
+        total = 0
+        pagina = 1
+        cnpj = self.evento.cnpj
+        while True:
+            xml = self.evento.pedidoConsultaNFPeriodo(
+                cnpj, self.empresa.inscricao_municipal,
+                inicio.strftime('%d/%m/%Y'), fim.strftime('%d/%m/%Y'), pagina=pagina
+            )
+            retorno = self.processador.consultar_nfe_periodo(xml, tipo)
+            if not retorno.get('sucesso') or retorno.get('sucesso_prefeitura') is False:
+                raise ErroSincronizacao(retorno.get('mensagem') or 'Erro na consulta à prefeitura')
+
+            notas = retorno['notas']
+            self.gravar(tipo, notas)
+            total += len(notas)
+            if len(notas) < EventoNFeDjango.NOTAS_POR_PAGINA_CONSULTA:
+                return total
+            pagina += 1
+
+    def gravar(self, tipo, notas):
+        """
+        Grava (insere ou atualiza) as notas consultadas em um único comando
+
+        Args:
+            tipo: 'E' ou 'R'
+            notas: Lista de NFeConsultada
+
+        Returns:
+            int: Quantidade de notas gravadas
+        """
+        registros = {}
+        for nota in notas:
+            if not nota.inscricao_prestador or not nota.numero_nfe:
+                continue
+            campos = {campo: getattr(nota, campo) for campo in CAMPOS_NOTA}
+            for campo, padrao in PADROES_NOTA.items():
+                if campos[campo] is None:
+                    campos[campo] = padrao
+            for campo in ('data_emissao', 'data_fato_gerador', 'data_cancelamento'):
+                if campos[campo] is not None and timezone.is_naive(campos[campo]):
+                    campos[campo] = timezone.make_aware(campos[campo])
+            # A mesma nota repetida na resposta é gravada uma única vez
+            registros[(nota.inscricao_prestador, nota.numero_nfe)] = NotaPrefeituraSP(
+                empresa=self.empresa, tipo=tipo, **campos
+            )
+
+        if registros:
+            NotaPrefeituraSP.objects.bulk_create(
+                list(registros.values()),
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=CHAVE_NOTA,
+                update_fields=[campo for campo in CAMPOS_NOTA if campo not in CHAVE_NOTA] + ['data_sincronizacao'],
+            )
+        return len(registros)
+
+    def avancar_marco(self, tipo, data):
+        """
+        Avança a marca d'água da empresa/tipo até data (nunca retrocede)
+
+        Args:
+            tipo: 'E' ou 'R'
+            data: Último dia sincronizado
+        """
+        with transaction.atomic():
+            marco, criado = MarcoSincronizacaoNotas.objects.select_for_update().get_or_create(
+                empresa=self.empresa, tipo=tipo, defaults={'data_ate': data}
+            )
+            if not criado and marco.data_ate < data:
+                marco.data_ate = data
+                marco.save(update_fields=['data_ate', 'data_atualizacao'])
+
+    def sincronizar(self, tipo, data_inicio=None, data_fim=None):
+        """
+        Sincroniza as notas de um tipo
+
+        Sem data_inicio, consulta a janela desde a marca d'água. A marca avança a
+        cada intervalo concluído (desde que contíguo a ela), de modo que uma falha
+        no meio preserva o que já foi sincronizado.
+
+        Args:
+            tipo: 'E' (emitidas) ou 'R' (recebidas)
+            data_inicio: Data inicial (date) de uma consulta explícita
+            data_fim: Data final (padrão: hoje)
+
+        Returns:
+            dict: sucesso, mensagem, total de notas e período consultado
+        """
+        inicio, fim = self.janela(tipo, data_fim)
+        if data_inicio:
+            inicio = data_inicio
+        if inicio > fim:
+            return {'sucesso': False, 'mensagem': 'Período inicial posterior ao final', 'total': 0}
+
+        marco = MarcoSincronizacaoNotas.objects.filter(empresa=self.empresa, tipo=tipo).first()
+        contiguo = marco is None or inicio <= marco.data_ate + timedelta(days=1)
+
+        total = 0
+        for inicio_periodo, fim_periodo in periodos(inicio, fim):
+            try:
+                total += self.consultar_periodo(tipo, inicio_periodo, fim_periodo)
+            except ErroSincronizacao as e:
+                logger.warning(
+                    f"Sincronização de notas da empresa {self.empresa.id} ({tipo}) interrompida em "
+                    f"{inicio_periodo:%d/%m/%Y}: {e}"
+                )
+                return {
+                    'sucesso': False,
+                    'mensagem': f'Consulta de {inicio_periodo:%d/%m/%Y} a {fim_periodo:%d/%m/%Y} falhou: {e}',
+                    'total': total,
+                    'inicio': inicio,
+                    'fim': fim,
+                }
+            if contiguo:
+                self.avancar_marco(tipo, fim_periodo)
+
+        return {
+            'sucesso': True,
+            'mensagem': f"{total} nota(s) sincronizada(s) de {inicio:%d/%m/%Y} a {fim:%d/%m/%Y}",
+            'total': total,
+            'inicio': inicio,
+            'fim': fim,
+        }
@@ -0,0 +1,94 @@
+"""
+WSDLs locais dos webservices da Prefeitura de SP
+Com NFE_WSDL_LOCAL ativo, os WSDLs ficam junto dos XSDs em layouts/ e são
+carregados do disco, sem depender da rede na inicialização dos workers. As cópias
+locais são geradas com `manage.py atualizar_wsdl` a partir dos webservices; sem
+elas, o WSDL remoto é usado. O cache persistente do zeep (SqliteCache) guarda
+qualquer recurso remoto que ainda precise ser baixado.
+"""
+import os
+import threading
+
+from django.conf import settings
+from zeep.cache import SqliteCache
+
+
+# Webservices atendidos, com o WSDL remoto, a cópia local e as operações usadas
+WEBSERVICES = {
+    'nfe': {
+        'url': 'https://nfe.prefeitura.sp.gov.br/ws/lotenfe.asmx?WSDL',
+        'arquivo': os.path.join('layouts', 'nfse', 'lotenfe.wsdl'),
+        'operacoes': [
+            'EnvioRPS', 'EnvioLoteRPS', 'TesteEnvioLoteRPS', 'CancelamentoNFe',
+            'ConsultaNFe', 'ConsultaNFeRecebidas', 'ConsultaNFeEmitidas',
+            'ConsultaLote', 'ConsultaInformacoesLote', 'ConsultaCNPJ',
+        ],
+    },
+    'nfts': {
+        'url': 'https://nfe.prefeitura.sp.gov.br/ws/loteNFTS.asmx?WSDL',
+        'arquivo': os.path.join('layouts', 'nfts', 'loteNFTS.wsdl'),
+        'operacoes': [
+            'EnvioNFTS', 'EnvioLoteNFTS', 'TesteEnvioLoteNFTS', 'CancelamentoNFTS',
+            'ConsultaNFTS', 'ConsultaLote', 'ConsultaInformacoesLote',
+        ],
+    },
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def caminho_wsdl_local(servico):
+    """
+    Retorna o caminho absoluto da cópia local do WSDL
+
+    Args:
+        servico: Chave do webservice ('nfe' ou 'nfts')
+
+    Returns:
+        str: Caminho do arquivo WSDL
+    """
+    return os.path.join(settings.BASE_DIR, WEBSERVICES[servico]['arquivo'])
+
+
+def obter_wsdl(servico):
+    """
+    Retorna o WSDL a ser usado pelo cliente zeep
+
+    Usa a cópia local quando NFE_WSDL_LOCAL está ativo e o arquivo existe;
+    caso contrário, usa a URL do webservice.
+
+    Args:
+        servico: Chave do webservice ('nfe' ou 'nfts')
+
+    Returns:
+        str: Caminho local ou URL do WSDL
+    """
+    if getattr(settings, 'NFE_WSDL_LOCAL', False):
+        caminho = caminho_wsdl_local(servico)
+        if os.path.exists(caminho):
+            return caminho
+    return WEBSERVICES[servico]['url']
+
+
+def obter_cache_zeep():
+    """
+    Retorna o cache persistente do zeep compartilhado pelo processo
+
+    Returns:
+        SqliteCache: Cache em disco (settings.NFE_ZEEP_CACHE_PATH)
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            caminho = getattr(
+                settings, 'NFE_ZEEP_CACHE_PATH',
+                os.path.join(settings.BASE_DIR, 'cache', 'zeep_cache.db')
+            )
+            caminho = str(caminho)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            _cache = SqliteCache(
+                path=caminho,
+                timeout=getattr(settings, 'NFE_ZEEP_CACHE_TIMEOUT', 30 * 24 * 3600)
+            )
+        return _cache
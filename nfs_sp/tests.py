@@ -0,0 +1,226 @@
+import threading
+from decimal import Decimal
+from types import SimpleNamespace
+from http.client import RemoteDisconnected
+from unittest import mock
+
+import requests
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from accounts.models import EmpresaContratante
+from core.models import Empresa, NotaFiscalSP, RegistroEnvioRPS, SequenciaRPS
+from core.services.importacao_planilha import ImportadorPlanilha
+from nfs_sp.services.emissao_lote import EmissorLoteRPS
+from nfs_sp.services.numeracao_rps import numerar_notas, reservar_numeros
+from nfs_sp.services.politica_transporte import Disjuntor, ErroTransporte, politica_transporte, resultado_incerto
+from nfs_sp.services.registro_envio import RegistroEnvios
+
+
+def criar_empresa(cnpj='11.222.333/0001-81'):
+    contratante = EmpresaContratante.objects.create(
+        cnpj_cpf=''.join(filter(str.isdigit, cnpj)), nome_razao='Contratante'
+    )
+    return Empresa.objects.create(
+        cnpj=cnpj, razao_social='Prestadora', inscricao_municipal='12345678',
+        codigo_municipio='3550308', empresa_contratante=contratante
+    )
+
+
+def criar_nota(empresa, **campos):
+    dados = dict(
+        empresa=empresa, cnpj_contribuinte=empresa.cnpj, nome_tomador='Tomador', cod_servico='02919',
+        valor_total=Decimal('100.00'), aliquota=Decimal('2.00'), tipo_tributacao='T', serie_rps='RPS',
+    )
+    dados.update(campos)
+    return NotaFiscalSP.objects.create(**dados)
+
+
+class ReconciliacaoRPSTest(TestCase):
+    """EmissorLoteRPS.reconciliar com a ConsultaNFe simulada"""
+
+    def setUp(self):
+        self.empresa = criar_empresa()
+        self.notas = [criar_nota(self.empresa, numero_rps=str(numero).zfill(12)) for numero in (1, 2)]
+        self.evento = SimpleNamespace(
+            empresa=self.empresa,
+            cnpj='11222333000181',
+            cadeia_assinatura_rps=lambda nota: f'{nota.serie_rps}{nota.numero_rps}{nota.valor_total}',
+            criar_pedido_consulta_rps=lambda notas: '<PedidoConsultaNFe/>',
+        )
+        self.registro = RegistroEnvios(self.evento)
+        self.registro.registrar(self.notas)
+
+    def reconciliar(self, retorno):
+        processador = mock.Mock()
+        processador.consultar_nfe_rps.return_value = retorno
+        resultados = []
+        resolvidas = EmissorLoteRPS().reconciliar(processador, self.evento, self.registro, self.notas, resultados)
+        return resolvidas, resultados
+
+    def test_erro_da_prefeitura_nao_reenvia(self):
+        """Cabecalho com Sucesso=false (ex.: certificado inválido) não libera o reenvio"""
+        resolvidas, resultados = self.reconciliar({
+            'sucesso': True, 'sucesso_prefeitura': False, 'notas': [],
+            'erros': [{'codigo': '1057', 'descricao': 'Certificado inválido'}],
+            'mensagem': 'Certificado inválido',
+        })
+        self.assertEqual(resolvidas, {nota.id for nota in self.notas})
+        self.assertTrue(all(not resultado['sucesso'] for resultado in resultados))
+        self.assertEqual(RegistroEnvioRPS.objects.filter(status='enviando').count(), 2)
+
+    def test_falha_de_transporte_nao_reenvia(self):
+        resolvidas, _ = self.reconciliar({'sucesso': False, 'mensagem': 'Timeout'})
+        self.assertEqual(resolvidas, {nota.id for nota in self.notas})
+
+    @override_settings(NFE_CODIGOS_RPS_NAO_ENCONTRADO=('9999',))
+    def test_rps_inexistente_libera_reenvio(self):
+        resolvidas, resultados = self.reconciliar({
+            'sucesso': True, 'sucesso_prefeitura': False, 'notas': [],
+            'erros': [{'codigo': '9999', 'descricao': 'RPS não encontrado'}],
+        })
+        self.assertEqual(resolvidas, set())
+        self.assertEqual(resultados, [])
+
+    def test_rps_encontrado_confirmado_sem_reenvio(self):
+        nota = self.notas[0]
+        dados = SimpleNamespace(serie_rps='RPS', numero_rps='1', numero_nfe='123', codigo_verificacao='ABCD1234')
+        resolvidas, resultados = self.reconciliar({
+            'sucesso': True, 'sucesso_prefeitura': True, 'notas': [dados], 'erros': [],
+        })
+        self.assertEqual(resolvidas, {nota.id})
+        nota.refresh_from_db()
+        self.assertEqual((nota.status_rps, nota.numero_nfse), ('emitida', '123'))
+        self.assertEqual(RegistroEnvioRPS.objects.get(nota=nota).status, 'confirmado')
+        self.assertNotIn('alterada', resultados[0]['mensagem'])
+
+    def test_rps_alterado_apos_envio(self):
+        """A impressão digital do envio anterior é comparada com o RPS atual"""
+        nota = self.notas[0]
+        nota.valor_total = Decimal('150.00')
+        self.assertEqual(self.registro.alterados(self.notas), {nota.id})
+
+        dados = SimpleNamespace(serie_rps='RPS', numero_rps='1', numero_nfe='123', codigo_verificacao='ABCD1234')
+        _, resultados = self.reconciliar({
+            'sucesso': True, 'sucesso_prefeitura': True, 'notas': [dados], 'erros': [],
+        })
+        self.assertIn('alterada depois do envio anterior', resultados[0]['mensagem'])
+
+
+class NumeracaoRPSTest(TestCase):
+    """Reserva de números de RPS sem sobreposição e sem lacunas"""
+
+    def setUp(self):
+        self.empresa = criar_empresa()
+
+    def ultimo_numero(self):
+        return SequenciaRPS.objects.get(empresa=self.empresa, serie='RPS').ultimo_numero
+
+    def test_reservas_nao_se_sobrepoem(self):
+        primeiro = reservar_numeros(self.empresa, quantidade=3)
+        segundo = reservar_numeros(self.empresa, quantidade=2)
+        self.assertEqual((primeiro, segundo), (1, 4))
+        self.assertEqual(self.ultimo_numero(), 5)
+
+    def test_sequencia_continua_numeracao_existente(self):
+        criar_nota(self.empresa, numero_rps='000000000041')
+        self.assertEqual(reservar_numeros(self.empresa), 42)
+
+    def test_lote_rejeitado_nao_deixa_lacuna(self):
+        """Lote com uma linha inválida: a reserva do lote é desfeita e cada linha válida recebe o seu número"""
+        notas = [
+            NotaFiscalSP(
+                empresa=self.empresa, cnpj_contribuinte=self.empresa.cnpj, nome_tomador=nome, cod_servico='02919',
+                valor_total=Decimal('100.00'), aliquota=Decimal('2.00'), tipo_tributacao='T',
+            )
+            for nome in ('A', None, 'C')
+        ]
+        importador = ImportadorPlanilha(NotaFiscalSP, montar_nota=None, antes_de_gravar=numerar_notas)
+        importador.gravar_lote(list(enumerate(notas, start=2)))
+
+        self.assertEqual(importador.importadas, 2)
+        self.assertEqual(len(importador.erros), 1)
+        numeros = sorted(int(numero) for numero in NotaFiscalSP.objects.values_list('numero_rps', flat=True))
+        self.assertEqual(numeros, [1, 2])
+        self.assertEqual(self.ultimo_numero(), 2)
+
+    def test_falha_ao_gravar_numeracao_desfaz_reserva(self):
+        notas = [criar_nota(self.empresa) for _ in range(3)]
+        with mock.patch.object(NotaFiscalSP.objects, 'bulk_update', side_effect=RuntimeError('queda')):
+            with self.assertRaises(RuntimeError):
+                EmissorLoteRPS().preparar_notas(notas)
+        self.assertFalse(SequenciaRPS.objects.filter(empresa=self.empresa, ultimo_numero__gt=0).exists())
+
+
+class ReservaConcorrenteRPSTest(TransactionTestCase):
+    """Reservas simultâneas (depende de SELECT ... FOR UPDATE no banco)"""
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_reservas_simultaneas_nao_se_sobrepoem(self):
+        empresa = criar_empresa()
+        reservar_numeros(empresa)  # cria a sequência
+        blocos = []
+        erros = []
+        barreira = threading.Barrier(8)
+
+        def reservar():
+            try:
+                barreira.wait()
+                primeiro = reservar_numeros(empresa, quantidade=5)
+                blocos.append(set(range(primeiro, primeiro + 5)))
+            except Exception as e:
+                erros.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reservar) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erros, [])
+        numeros = set().union(*blocos)
+        self.assertEqual(len(numeros), 40)
+        self.assertEqual(numeros, set(range(2, 42)))
+
+
+
+class PoliticaTransporteTest(TestCase):
+    """Classificação das falhas de transporte dos envios"""
+
+    def setUp(self):
+        politica_transporte.redefinir()
+        self.addCleanup(politica_transporte.redefinir)
+
+    def test_conexao_encerrada_durante_resposta_e_incerta(self):
+        erro = requests.ConnectionError(ProtocolError('Connection aborted.', RemoteDisconnected('fechada')))
+        self.assertTrue(resultado_incerto(erro))
+        self.assertTrue(resultado_incerto(requests.ReadTimeout('Read timed out')))
+
+    def test_falha_antes_da_conexao_nao_e_incerta(self):
+        recusada = requests.ConnectionError(
+            MaxRetryError(None, '/ws', NewConnectionError(None, 'Connection refused'))
+        )
+        self.assertFalse(resultado_incerto(recusada))
+        self.assertFalse(resultado_incerto(requests.ConnectTimeout('connect timeout')))
+
+    def test_envio_interrompido_marca_incerto(self):
+        def operacao():
+            raise requests.ConnectionError(ProtocolError('Connection aborted.', ConnectionResetError()))
+
+        with self.assertRaises(ErroTransporte) as contexto:
+            politica_transporte.executar('https://nfe.prefeitura/lote', operacao)
+        self.assertTrue(contexto.exception.incerto)
+
+    @override_settings(NFE_DISJUNTOR_FALHAS=2)
+    def test_erro_de_certificado_nao_abre_disjuntor(self):
+        def operacao():
+            raise requests.exceptions.SSLError('certificate expired')
+
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.SSLError):
+                politica_transporte.executar('https://nfe.prefeitura/lote', operacao)
+        self.assertEqual(politica_transporte.disjuntor('https://nfe.prefeitura/lote').estado, Disjuntor.FECHADO)
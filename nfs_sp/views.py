@@ -2,8 +2,9 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
-from django.db.models import Q, Sum
-from core.models import Empresa, NotaFiscalSP, NotaFiscalTomadorSP
+from django.template.loader import render_to_string
+from django.db.models import Sum
+from core.models import Empresa, MarcoSincronizacaoNotas, NotaFiscalSP, NotaFiscalTomadorSP
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 from datetime import datetime, date
@@ -14,6 +15,17 @@ import json
 # Importar serviços de NFS-e
 from nfs_sp.services.nfe_eventos_django import EventoNFeDjango
 from nfs_sp.services.processador_django import ProcessadorNFeDjango
+from nfs_sp.services.emissao_lote import EmissorLoteRPS
+from nfs_sp.services.emissao_nfts import EmissorNFTS
+from nfs_sp.services.numeracao_rps import numerar_notas
+from nfs_sp.services.sincronizacao_notas import SincronizadorNotas
+from core.services.geracao_pdf import GeradorPDFs, resposta_pdfs
+from core.services.pdf_notas import dados_nfse_sp, dados_nfts_sp
+from core.services.fila_emissao import emissao_assincrona, enfileirar, resposta_enfileirada
+from core.services.importacao_planilha import ImportadorPlanilha
+from core.services.paginacao import contar, paginar
+from core.services.relatorio_notas import periodo_relatorio, resposta_relatorio
+from nfs_sp.services.relatorios import relatorio_nfse_sp, relatorio_nfts_sp
 
 
 @login_required
@@ -26,11 +38,8 @@ def emitir_nfs(request):
         messages.error(request, 'Usuário sem empresa vinculada.')
         return redirect('core:home')
     
-    # Listar empresas cadastradas
-    empresas = Empresa.objects.filter(
-        empresa_contratante=empresa_contratante,
-        ativo=True
-    )
+    # Empresas ativas (carregadas pelo ContextoContratanteMiddleware)
+    empresas = request.empresas_ativas
     
     # Processar ações POST
     if request.method == 'POST':
@@ -50,6 +59,49 @@ def emitir_nfs(request):
     data_fim = request.GET.get('data_fim')
     status = request.GET.get('status')
     cnpj_contribuinte = request.GET.get('cnpj_contribuinte')
+    
+    # Primeira página de cada listagem (as demais são carregadas por listar_notas)
+    notas = filtrar_notas_sp(request, empresa_contratante)
+    notas_nfts = filtrar_notas_nfts(request, empresa_contratante)
+    pagina_notas, cursor_notas, _ = paginar(notas.com_impostos())
+    pagina_nfts, cursor_nfts, _ = paginar(notas_nfts.com_impostos())
+    
+    context = {
+        'user': request.user,
+        'empresas': empresas,
+        'notas': pagina_notas,
+        'notas_nfts': pagina_nfts,
+        'total_notas': contar(notas),
+        'total_nfts': contar(notas_nfts),
+        'cursor_notas': cursor_notas,
+        'cursor_nfts': cursor_nfts,
+        'filtros_query': request.GET.urlencode(),
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
+        'status': status,
+        'cnpj_contribuinte': cnpj_contribuinte,
+        'marcos_sincronizacao': MarcoSincronizacaoNotas.objects.filter(
+            empresa__in=empresas
+        ).select_related('empresa').order_by('empresa__razao_social', 'tipo'),
+    }
+    return render(request, 'nfs_sp/emitir.html', context)
+
+
+def filtrar_notas_sp(request, empresa_contratante):
+    """
+    Aplica os filtros GET da tela de emissão às notas NFS-e
+    
+    Args:
+        request: Requisição com os filtros (data_inicio, data_fim, status, cnpj_contribuinte, aba)
+        empresa_contratante: Empresa contratante do usuário
+        
+    Returns:
+        QuerySet: Notas filtradas (sem ordenação)
+    """
+    data_inicio = request.GET.get('data_inicio')
+    data_fim = request.GET.get('data_fim')
+    status = request.GET.get('status')
+    cnpj_contribuinte = request.GET.get('cnpj_contribuinte')
     aba_ativa = request.GET.get('aba', 'emitir')  # Identifica qual aba está ativa
     
     # Query de notas NFS-e
@@ -61,23 +113,13 @@ def emitir_nfs(request):
     if aba_ativa == 'emitir':
         # Filtro por CNPJ do contribuinte (empresa específica)
         if cnpj_contribuinte:
-            # Filtra por cnpj_contribuinte OU por empresa.cnpj (para notas antigas)
-            notas = notas.filter(
-                Q(cnpj_contribuinte=cnpj_contribuinte) | 
-                Q(empresa__cnpj=cnpj_contribuinte)
-            )
+            notas = notas.filter(cnpj_contribuinte=cnpj_contribuinte)
         
+        # data_referencia = data_emissao ou, para notas sem data_emissao, dia da importação
         if data_inicio:
-            # Filtra por data_emissao OU data_importacao (para notas sem data_emissao)
-            notas = notas.filter(
-                Q(data_emissao__gte=data_inicio) | 
-                Q(data_emissao__isnull=True, data_importacao__date__gte=data_inicio)
-            )
+            notas = notas.filter(data_referencia__gte=data_inicio)
         if data_fim:
-            notas = notas.filter(
-                Q(data_emissao__lte=data_fim) | 
-                Q(data_emissao__isnull=True, data_importacao__date__lte=data_fim)
-            )
+            notas = notas.filter(data_referencia__lte=data_fim)
         if status:
             notas = notas.filter(status_rps=status)
         
@@ -88,6 +130,26 @@ def emitir_nfs(request):
         # Se a aba não for "emitir", mostrar apenas pendentes por padrão
         notas = notas.filter(status_rps='pendente')
     
+    return notas
+
+
+def filtrar_notas_nfts(request, empresa_contratante):
+    """
+    Aplica os filtros GET da tela de emissão às NFTS
+    
+    Args:
+        request: Requisição com os filtros (data_inicio, data_fim, status, cnpj_contribuinte, aba)
+        empresa_contratante: Empresa contratante do usuário
+        
+    Returns:
+        QuerySet: NFTS filtradas (sem ordenação)
+    """
+    data_inicio = request.GET.get('data_inicio')
+    data_fim = request.GET.get('data_fim')
+    status = request.GET.get('status')
+    cnpj_contribuinte = request.GET.get('cnpj_contribuinte')
+    aba_ativa = request.GET.get('aba', 'emitir')  # Identifica qual aba está ativa
+    
     # Query de NFTS
     notas_nfts = NotaFiscalTomadorSP.objects.filter(
         empresa__empresa_contratante=empresa_contratante
@@ -97,23 +159,13 @@ def emitir_nfs(request):
     if aba_ativa == 'emitir-nfts':
         # Filtro por CNPJ do contribuinte (empresa específica)
         if cnpj_contribuinte:
-            # Filtra por cnpj_contribuinte OU por empresa.cnpj (para notas antigas)
-            notas_nfts = notas_nfts.filter(
-                Q(cnpj_contribuinte=cnpj_contribuinte) | 
-                Q(empresa__cnpj=cnpj_contribuinte)
-            )
+            notas_nfts = notas_nfts.filter(cnpj_contribuinte=cnpj_contribuinte)
         
+        # data_prestacao_servico é obrigatória, não há fallback para data_importacao
         if data_inicio:
-            # Filtra por data_prestacao_servico OU data_importacao (para notas sem data)
-            notas_nfts = notas_nfts.filter(
-                Q(data_prestacao_servico__gte=data_inicio) | 
-                Q(data_prestacao_servico__isnull=True, data_importacao__date__gte=data_inicio)
-            )
+            notas_nfts = notas_nfts.filter(data_prestacao_servico__gte=data_inicio)
         if data_fim:
-            notas_nfts = notas_nfts.filter(
-                Q(data_prestacao_servico__lte=data_fim) | 
-                Q(data_prestacao_servico__isnull=True, data_importacao__date__lte=data_fim)
-            )
+            notas_nfts = notas_nfts.filter(data_prestacao_servico__lte=data_fim)
         if status:
             notas_nfts = notas_nfts.filter(status_nfts=status)
         
@@ -124,17 +176,35 @@ def emitir_nfs(request):
         # Se a aba não for "emitir-nfts", mostrar apenas pendentes por padrão
         notas_nfts = notas_nfts.filter(status_nfts='pendente')
     
-    context = {
-        'user': request.user,
-        'empresas': empresas,
-        'notas': notas.order_by('-data_importacao'),
-        'notas_nfts': notas_nfts.order_by('-data_importacao'),
-        'data_inicio': data_inicio,
-        'data_fim': data_fim,
-        'status': status,
-        'cnpj_contribuinte': cnpj_contribuinte,
-    }
-    return render(request, 'nfs_sp/emitir.html', context)
+    return notas_nfts
+
+
+@login_required
+def listar_notas(request):
+    """Próxima página da listagem de notas (rolagem infinita na tela de emissão)"""
+    empresa_contratante = request.user.profile.empresa if hasattr(request.user, 'profile') else None
+    
+    if not empresa_contratante:
+        return JsonResponse({'sucesso': False, 'mensagem': 'Usuário sem empresa vinculada.'}, status=403)
+    
+    if request.GET.get('tipo') == 'nfts':
+        queryset = filtrar_notas_nfts(request, empresa_contratante)
+        template = 'nfs_sp/_linhas_nfts.html'
+        contexto = 'notas_nfts'
+    else:
+        queryset = filtrar_notas_sp(request, empresa_contratante)
+        template = 'nfs_sp/_linhas_notas.html'
+        contexto = 'notas'
+    
+    notas, proximo_cursor, tem_mais = paginar(queryset.com_impostos(), request.GET.get('cursor'))
+    
+    return JsonResponse({
+        'sucesso': True,
+        'html': render_to_string(template, {contexto: notas}, request=request),
+        'proximo_cursor': proximo_cursor,
+        'tem_mais': tem_mais,
+        'quantidade': len(notas),
+    })
 
 
 def importar_planilha(request, empresas):
@@ -154,52 +224,40 @@ def importar_planilha(request, empresas):
             messages.error(request, 'Arquivo deve ser .xlsx ou .xls')
             return redirect('nfs_sp:emitir')
         
-        # Ler planilha
-        wb = openpyxl.load_workbook(arquivo)
-        ws = wb.active
+        def montar_nota(row):
+            """Monta a nota (não salva) a partir de uma linha da planilha"""
+            # Extrair dados (conforme colunas especificadas)
+            nota = NotaFiscalSP(
+                empresa=empresa,
+                cnpj_contribuinte=empresa.cnpj,  # CNPJ da empresa prestadora
+                cnpj_cpf_tomador=str(row[1] or '').strip(),
+                nome_tomador=str(row[2] or '').strip(),
+                cep_tomador=str(row[3] or '').strip() if row[3] else None,
+                logradouro_tomador=str(row[4] or '').strip() if row[4] else None,
+                numero_tomador=str(row[5] or '').strip() if row[5] else None,
+                bairro_tomador=str(row[6] or '').strip() if row[6] else None,
+                cidade_tomador=str(row[7] or '').strip() if row[7] else None,
+                uf_tomador=str(row[8] or '').strip() if row[8] else None,
+                email_tomador=str(row[9] or '').strip() if row[9] else None,
+                cod_servico=str(row[10] or '').strip(),
+                descricao=str(row[11] or '').strip(),
+                valor_total=Decimal(str(row[12] or 0)),
+                deducoes=Decimal(str(row[13] or 0)),
+                aliquota=Decimal(str(row[14] or 0)),
+                tipo_tributacao=str(row[15] or 'T').strip()[0].upper(),
+                iss_retido=str(row[17] or '').strip().upper() in ['SIM', 'S', 'TRUE', '1'],
+                pis_retido=Decimal(str(row[18] or 0)),
+                cofins_retido=Decimal(str(row[19] or 0)),
+                irrf_retido=Decimal(str(row[20] or 0)),
+                csll_retido=Decimal(str(row[21] or 0)),
+                inss_retido=Decimal(str(row[22] or 0)),
+                status_rps='pendente'
+            )
+            return nota
         
-        importadas = 0
-        erros = []
-        
-        # Pular cabeçalho (linha 1)
-        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                # Validar se linha não está vazia
-                if not any(row):
-                    continue
-                
-                # Extrair dados (conforme colunas especificadas)
-                nota = NotaFiscalSP(
-                    empresa=empresa,
-                    cnpj_contribuinte=empresa.cnpj,  # CNPJ da empresa prestadora
-                    cnpj_cpf_tomador=str(row[1] or '').strip(),
-                    nome_tomador=str(row[2] or '').strip(),
-                    cep_tomador=str(row[3] or '').strip() if row[3] else None,
-                    logradouro_tomador=str(row[4] or '').strip() if row[4] else None,
-                    numero_tomador=str(row[5] or '').strip() if row[5] else None,
-                    bairro_tomador=str(row[6] or '').strip() if row[6] else None,
-                    cidade_tomador=str(row[7] or '').strip() if row[7] else None,
-                    uf_tomador=str(row[8] or '').strip() if row[8] else None,
-                    email_tomador=str(row[9] or '').strip() if row[9] else None,
-                    cod_servico=str(row[10] or '').strip(),
-                    descricao=str(row[11] or '').strip(),
-                    valor_total=Decimal(str(row[12] or 0)),
-                    deducoes=Decimal(str(row[13] or 0)),
-                    aliquota=Decimal(str(row[14] or 0)),
-                    tipo_tributacao=str(row[15] or 'T').strip()[0].upper(),
-                    iss_retido=str(row[17] or '').strip().upper() in ['SIM', 'S', 'TRUE', '1'],
-                    pis_retido=Decimal(str(row[18] or 0)),
-                    cofins_retido=Decimal(str(row[19] or 0)),
-                    irrf_retido=Decimal(str(row[20] or 0)),
-                    csll_retido=Decimal(str(row[21] or 0)),
-                    inss_retido=Decimal(str(row[22] or 0)),
-                    status_rps='pendente'
-                )
-                nota.save()
-                importadas += 1
-                
-            except Exception as e:
-                erros.append(f"Linha {row_num}: {str(e)}")
+        # Ler planilha em streaming e gravar em lotes (bulk_create)
+        importador = ImportadorPlanilha(NotaFiscalSP, montar_nota, antes_de_gravar=numerar_notas)
+        importadas, erros = importador.importar(arquivo)
         
         if importadas > 0:
             messages.success(request, f'{importadas} nota(s) importada(s) com sucesso!')
@@ -276,7 +334,7 @@ def gerar_modelo(request):
 
 @login_required
 def emitir_notas(request):
-    """Emite notas fiscais (RPS) selecionadas"""
+    """Emite notas fiscais (RPS) selecionadas, em lotes de até 50 RPS por empresa"""
     if request.method == 'POST':
         notas_ids = request.POST.getlist('notas[]')
         
@@ -286,136 +344,15 @@ def emitir_notas(request):
                 'mensagem': 'Nenhuma nota selecionada.'
             })
         
-        # Processar emissão
-        resultados = []
-        emitidas = 0
-        erros = 0
+        # teste=true usa TesteEnvioLoteRPS (valida sem gerar NFS-e)
+        teste = request.POST.get('teste') == 'true'
         
-        for nota_id in notas_ids:
-            try:
-                nota = NotaFiscalSP.objects.get(id=nota_id)
-                
-                # Verificar se já foi emitida ou cancelada (não permite reenvio)
-                if nota.status_rps in ['emitida', 'cancelada']:
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': False,
-                        'mensagem': f'RPS {nota.numero_rps} já foi {nota.get_status_rps_display().lower()}'
-                    })
-                    erros += 1
-                    continue
-                
-                # Se estava com erro, limpar mensagem de erro anterior
-                if nota.status_rps == 'erro':
-                    nota.mensagem_erro = None
-                
-                # Gerar número RPS se não existir
-                if not nota.numero_rps:
-                    # Buscar o último número RPS da empresa
-                    ultimo_rps = NotaFiscalSP.objects.filter(
-                        empresa=nota.empresa,
-                        numero_rps__isnull=False
-                    ).order_by('-numero_rps').first()
-                    
-                    if ultimo_rps and ultimo_rps.numero_rps:
-                        try:
-                            proximo_numero = int(ultimo_rps.numero_rps) + 1
-                        except:
-                            proximo_numero = 1
-                    else:
-                        proximo_numero = 1
-                    
-                    nota.numero_rps = str(proximo_numero).zfill(12)
-                    nota.serie_rps = nota.serie_rps or 'RPS'
-                    nota.tributacao_rps = nota.tributacao_rps or nota.tipo_tributacao
-                    nota.save()
-                
-                # Criar XML e enviar
-                evento = EventoNFeDjango(nota.empresa)
-                xml = evento.criar_pedido_envio_rps(nota)
-                
-                processador = ProcessadorNFeDjango(nota.empresa)
-                resultado = processador.enviar_rps(xml)
-                
-                if resultado['sucesso']:
-                    # Atualizar nota
-                    nota.numero_nfse = resultado.get('numero_nfe')
-                    nota.codigo_verificacao = resultado.get('codigo_verificacao')
-                    nota.status_rps = 'emitida'
-                    nota.data_emissao = datetime.now()
-                    
-                    # Log para debug
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.info(f"Salvando nota {nota.id}: numero_nfse={nota.numero_nfse}, codigo={nota.codigo_verificacao}")
-                    
-                    # Se não tem número, logar o XML de resposta para debug
-                    if not nota.numero_nfse and resultado.get('xml_resposta'):
-                        logger.warning(f"Nota {nota.id} emitida mas sem numero_nfse!")
-                        logger.debug(f"XML Resposta: {resultado.get('xml_resposta')[:500]}...")
-                    
-                    nota.save()
-                    
-                    emitidas += 1
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': True,
-                        'numero_rps': nota.numero_rps,
-                        'serie_rps': nota.serie_rps,
-                        'tomador': nota.nome_tomador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'✅ RPS Nº {nota.numero_rps} - Série {nota.serie_rps}\n'
-                                   f'Emitido com sucesso!\n'
-                                   f'Tomador: {nota.nome_tomador}\n'
-                                   f'Valor: R$ {nota.valor_total:,.2f}',
-                        'numero_nfe': nota.numero_nfse,
-                        'codigo_verificacao': nota.codigo_verificacao,
-                        'url': resultado.get('url_nfe')
-                    })
-                else:
-                    nota.status_rps = 'erro'
-                    nota.mensagem_erro = resultado.get('mensagem', 'Erro desconhecido')
-                    nota.save()
-                    
-                    erros += 1
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': False,
-                        'numero_rps': nota.numero_rps,
-                        'serie_rps': nota.serie_rps,
-                        'tomador': nota.nome_tomador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'❌ RPS Nº {nota.numero_rps} - Série {nota.serie_rps}\n'
-                                   f'Erro na emissão:\n\n'
-                                   f'{resultado.get("mensagem", "Erro ao emitir RPS")}\n\n'
-                                   f'Tomador: {nota.nome_tomador}\n'
-                                   f'Valor: R$ {nota.valor_total:,.2f}'
-                    })
-                    
-            except Exception as e:
-                erros += 1
-                resultados.append({
-                    'id': nota_id,
-                    'sucesso': False,
-                    'mensagem': f'Erro: {str(e)}'
-                })
-        
-        # Mensagem de resumo profissional
-        if emitidas > 0 and erros == 0:
-            mensagem_resumo = f'🎉 Processamento concluído com sucesso!\n\nTodas as {emitidas} nota(s) foram emitidas corretamente.'
-        elif emitidas > 0 and erros > 0:
-            mensagem_resumo = f'⚠️ Processamento concluído com avisos.\n\n{emitidas} nota(s) emitida(s) com sucesso.\n{erros} nota(s) com erro.'
-        else:
-            mensagem_resumo = f'❌ Não foi possível emitir as notas.\n\n{erros} erro(s) encontrado(s).'
+        # Processamento em segundo plano (worker processar_emissoes)
+        if emissao_assincrona():
+            tarefa = enfileirar('nfse_sp', notas_ids, request.user, {'teste': teste})
+            return JsonResponse(resposta_enfileirada(tarefa))
         
-        return JsonResponse({
-            'sucesso': emitidas > 0,
-            'mensagem': mensagem_resumo,
-            'emitidas': emitidas,
-            'erros': erros,
-            'total': len(notas_ids),
-            'resultados': resultados
-        })
+        return JsonResponse(EmissorLoteRPS(teste=teste).emitir(notas_ids))
     
     return redirect('nfs_sp:emitir')
 
@@ -461,6 +398,10 @@ def cancelar_notas(request):
         canceladas = 0
         erros = 0
         
+        # Eventos e processadores reaproveitados por empresa
+        eventos = {}
+        processadores = {}
+        
         for nota_id in notas_ids:
             try:
                 nota = NotaFiscalSP.objects.get(id=nota_id)
@@ -504,10 +445,13 @@ def cancelar_notas(request):
                     continue
                 
                 # Criar XML de cancelamento e enviar
-                evento = EventoNFeDjango(nota.empresa)
-                xml = evento.criar_pedido_cancelamento_nfe(nota)
+                if nota.empresa_id not in processadores:
+                    eventos[nota.empresa_id] = EventoNFeDjango(nota.empresa)
+                    processadores[nota.empresa_id] = ProcessadorNFeDjango(nota.empresa)
+                evento = eventos[nota.empresa_id]
+                processador = processadores[nota.empresa_id]
                 
-                processador = ProcessadorNFeDjango(nota.empresa)
+                xml = evento.criar_pedido_cancelamento_nfe(nota)
                 resultado = processador.cancelar_nfe(xml)
                 
                 if resultado['sucesso']:
@@ -575,17 +519,38 @@ def cancelar_notas(request):
 
 @login_required
 def salvar_pdfs(request):
-    """Salva PDFs das notas emitidas"""
-    notas_ids = request.GET.get('notas', '').split(',')
+    """Baixa os PDFs das notas emitidas selecionadas (NFS-e ou, com tipo=nfts, NFTS)"""
+    notas_ids = [nota_id for nota_id in request.GET.get('notas', '').split(',') if nota_id.isdigit()]
     
-    if not notas_ids or notas_ids == ['']:
+    if not notas_ids:
         messages.error(request, 'Nenhuma nota selecionada.')
         return redirect('nfs_sp:emitir')
     
-    # TODO: Implementar download de PDFs
-    messages.info(request, f'Download de PDFs em desenvolvimento.')
+    empresa_contratante = request.user.profile.empresa if hasattr(request.user, 'profile') else None
+    if not empresa_contratante:
+        messages.error(request, 'Usuário sem empresa vinculada.')
+        return redirect('core:home')
     
-    return redirect('nfs_sp:emitir')
+    if request.GET.get('tipo') == 'nfts':
+        notas = NotaFiscalTomadorSP.objects.filter(status_nfts__in=['emitida', 'cancelada'])
+        extrair_dados = dados_nfts_sp
+        nome_arquivo = lambda nota: f'NFTS_{nota.nfts or nota.id}.pdf'
+    else:
+        notas = NotaFiscalSP.objects.filter(status_rps__in=['emitida', 'cancelada'])
+        extrair_dados = dados_nfse_sp
+        nome_arquivo = lambda nota: f'NFSe_{nota.numero_nfse or nota.id}.pdf'
+    
+    notas = list(notas.filter(
+        id__in=notas_ids,
+        empresa__empresa_contratante=empresa_contratante
+    ).select_related('empresa').order_by('id'))
+    
+    if not notas:
+        messages.error(request, 'Nenhuma nota emitida entre as selecionadas.')
+        return redirect('nfs_sp:emitir')
+    
+    arquivos = GeradorPDFs().gerar(notas, extrair_dados, nome_arquivo)
+    return resposta_pdfs(arquivos, f'notas_{datetime.now():%Y%m%d_%H%M%S}')
 
 
 @login_required
@@ -640,17 +605,91 @@ def detalhes_nota(request, nota_id):
 
 
 def consultar_notas_api(request):
-    """Consulta notas na API da Prefeitura"""
-    # TODO: Implementar integração com API
-    messages.info(request, 'Consulta de notas via API em desenvolvimento.')
+    """
+    Sincroniza as notas emitidas/recebidas da empresa com a API da Prefeitura
+    
+    Sem período informado, consulta apenas o que mudou desde a última sincronização
+    (marca d'água por empresa e tipo); as notas ficam em NotaPrefeituraSP para
+    consulta e relatórios locais.
+    """
+    empresa_contratante = request.user.profile.empresa if hasattr(request.user, 'profile') else None
+    empresa = Empresa.objects.filter(
+        id=request.POST.get('empresa_consulta') or None,
+        empresa_contratante=empresa_contratante
+    ).first()
+    if not empresa:
+        messages.error(request, 'Selecione a empresa para consultar as notas.')
+        return redirect('nfs_sp:emitir')
+    
+    tipo = 'R' if request.POST.get('tipo_nota') == 'recebidas' else 'E'
+    try:
+        periodo_inicio = request.POST.get('periodo_inicio')
+        periodo_fim = request.POST.get('periodo_fim')
+        data_inicio = date.fromisoformat(periodo_inicio) if periodo_inicio else None
+        data_fim = date.fromisoformat(periodo_fim) if periodo_fim else None
+    except ValueError:
+        messages.error(request, 'Período inválido.')
+        return redirect('nfs_sp:emitir')
+    
+    resultado = SincronizadorNotas(empresa).sincronizar(tipo, data_inicio=data_inicio, data_fim=data_fim)
+    if resultado['sucesso']:
+        messages.success(request, f"{empresa.razao_social}: {resultado['mensagem']}")
+    else:
+        messages.error(request, f"{empresa.razao_social}: {resultado['mensagem']}")
     return redirect('nfs_sp:emitir')
 
 
 def gerar_relatorio(request):
-    """Gera relatório conforme tipo selecionado"""
-    # TODO: Implementar geração de relatórios
-    messages.info(request, 'Geração de relatórios em desenvolvimento.')
-    return redirect('nfs_sp:emitir')
+    """
+    Gera o relatório (CSV ou Excel) das NFS-e ou NFTS do período
+    
+    O arquivo é montado à medida que as notas são lidas do banco, em blocos,
+    e os totais são somados pelo banco.
+    """
+    empresa_contratante = request.user.profile.empresa if hasattr(request.user, 'profile') else None
+    if not empresa_contratante:
+        messages.error(request, 'Usuário sem empresa vinculada.')
+        return redirect('core:home')
+    
+    try:
+        data_inicio, data_fim = periodo_relatorio(request.POST.get('data_inicio'), request.POST.get('data_fim'))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('nfs_sp:emitir')
+    
+    tipo = request.POST.get('tipo_relatorio', 'sintetico')
+    formato = request.POST.get('formato', 'excel')
+    situacao = request.POST.get('situacao', 'emitidas')
+    empresa_id = request.POST.get('empresa_id')
+    status = {'emitidas': 'emitida', 'canceladas': 'cancelada'}.get(situacao)
+    
+    if request.POST.get('documento') == 'nfts':
+        notas = NotaFiscalTomadorSP.objects.filter(
+            empresa__empresa_contratante=empresa_contratante,
+            data_prestacao_servico__range=(data_inicio, data_fim)
+        )
+        if status:
+            notas = notas.filter(status_nfts=status)
+        montar_relatorio = relatorio_nfts_sp
+        prefixo = 'relatorio_nfts'
+    else:
+        notas = NotaFiscalSP.objects.filter(
+            empresa__empresa_contratante=empresa_contratante,
+            data_referencia__range=(data_inicio, data_fim)
+        )
+        if status:
+            notas = notas.filter(status_rps=status)
+        montar_relatorio = relatorio_nfse_sp
+        prefixo = 'relatorio_nfse'
+    
+    if empresa_id and empresa_id.isdigit():
+        notas = notas.filter(empresa_id=empresa_id)
+    
+    return resposta_relatorio(
+        montar_relatorio(notas, tipo),
+        formato,
+        f'{prefixo}_{tipo}_{data_inicio:%Y%m%d}_{data_fim:%Y%m%d}'
+    )
 
 
 # ========== VIEWS PARA NFTS (Nota Fiscal do Tomador) ==========
@@ -798,57 +837,45 @@ def importar_planilha_nfts(request, empresas):
             messages.error(request, 'Arquivo deve ser .xlsx ou .xls')
             return redirect('nfs_sp:emitir')
         
-        # Ler planilha
-        wb = openpyxl.load_workbook(arquivo)
-        ws = wb.active
-        
-        importadas = 0
-        erros = []
+        def montar_nota(row):
+            """Monta a nota (não salva) a partir de uma linha da planilha"""
+            # Converter data
+            data_prestacao = row[2]
+            if isinstance(data_prestacao, str):
+                data_prestacao = datetime.strptime(data_prestacao, '%Y-%m-%d').date()
+            elif isinstance(data_prestacao, datetime):
+                data_prestacao = data_prestacao.date()
+            
+            # Extrair dados (conforme colunas especificadas)
+            nota = NotaFiscalTomadorSP(
+                empresa=empresa,
+                cnpj_contribuinte=empresa.cnpj,  # CNPJ da empresa tomadora
+                cnpj_tomador=str(row[0] or '').strip(),
+                inscricao_municipal=str(row[1] or '').strip(),
+                data_prestacao_servico=data_prestacao,
+                cnpj_cpf_prestador=str(row[3] or '').strip(),
+                numero_documento=str(row[4] or '').strip() if row[4] else None,
+                serie=str(row[5] or '').strip() if row[5] else None,
+                cidade=str(row[6] or '').strip() if row[6] else None,
+                estado=str(row[7] or '').strip() if row[7] else None,
+                cep=str(row[8] or '').strip() if row[8] else None,
+                cod_servico=str(row[9] or '').strip(),
+                descricao=str(row[10] or '').strip(),
+                valor_total=Decimal(str(row[11] or 0)),
+                deducoes=Decimal(str(row[12] or 0)),
+                aliquota=Decimal(str(row[13] or 0)),
+                tipo_tributacao=str(row[14] or 'T').strip()[0].upper(),
+                regime_tributacao=str(row[15] or 'simples').strip().lower(),
+                tipo_documento=str(row[16] or 'nfse').strip().lower(),
+                nfts=str(row[17] or '').strip() if row[17] else None,
+                iss_retido=str(row[19] or '').strip().upper() in ['SIM', 'S', 'TRUE', '1'],
+                status_nfts='pendente'
+            )
+            return nota
         
-        # Pular cabeçalho (linha 1)
-        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                # Validar se linha não está vazia
-                if not any(row):
-                    continue
-                
-                # Converter data
-                data_prestacao = row[2]
-                if isinstance(data_prestacao, str):
-                    data_prestacao = datetime.strptime(data_prestacao, '%Y-%m-%d').date()
-                elif isinstance(data_prestacao, datetime):
-                    data_prestacao = data_prestacao.date()
-                
-                # Extrair dados (conforme colunas especificadas)
-                nota = NotaFiscalTomadorSP(
-                    empresa=empresa,
-                    cnpj_contribuinte=empresa.cnpj,  # CNPJ da empresa tomadora
-                    cnpj_tomador=str(row[0] or '').strip(),
-                    inscricao_municipal=str(row[1] or '').strip(),
-                    data_prestacao_servico=data_prestacao,
-                    cnpj_cpf_prestador=str(row[3] or '').strip(),
-                    numero_documento=str(row[4] or '').strip() if row[4] else None,
-                    serie=str(row[5] or '').strip() if row[5] else None,
-                    cidade=str(row[6] or '').strip() if row[6] else None,
-                    estado=str(row[7] or '').strip() if row[7] else None,
-                    cep=str(row[8] or '').strip() if row[8] else None,
-                    cod_servico=str(row[9] or '').strip(),
-                    descricao=str(row[10] or '').strip(),
-                    valor_total=Decimal(str(row[11] or 0)),
-                    deducoes=Decimal(str(row[12] or 0)),
-                    aliquota=Decimal(str(row[13] or 0)),
-                    tipo_tributacao=str(row[14] or 'T').strip()[0].upper(),
-                    regime_tributacao=str(row[15] or 'simples').strip().lower(),
-                    tipo_documento=str(row[16] or 'nfse').strip().lower(),
-                    nfts=str(row[17] or '').strip() if row[17] else None,
-                    iss_retido=str(row[19] or '').strip().upper() in ['SIM', 'S', 'TRUE', '1'],
-                    status_nfts='pendente'
-                )
-                nota.save()
-                importadas += 1
-                
-            except Exception as e:
-                erros.append(f"Linha {row_num}: {str(e)}")
+        # Ler planilha em streaming e gravar em lotes (bulk_create)
+        importador = ImportadorPlanilha(NotaFiscalTomadorSP, montar_nota)
+        importadas, erros = importador.importar(arquivo)
         
         if importadas > 0:
             messages.success(request, f'{importadas} NFTS importada(s) com sucesso!')
@@ -874,113 +901,12 @@ def emitir_nfts(request):
                 'mensagem': 'Nenhuma NFTS selecionada.'
             })
         
-        # Processar emissão
-        resultados = []
-        emitidas = 0
-        erros = 0
+        # Processamento em segundo plano (worker processar_emissoes)
+        if emissao_assincrona():
+            tarefa = enfileirar('nfts_sp', notas_ids, request.user)
+            return JsonResponse(resposta_enfileirada(tarefa))
         
-        for nota_id in notas_ids:
-            try:
-                nota = NotaFiscalTomadorSP.objects.get(id=nota_id)
-                
-                # Verificar se já foi emitida ou cancelada (não permite reenvio)
-                if nota.status_nfts in ['emitida', 'cancelada']:
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': False,
-                        'numero_documento': nota.numero_documento,
-                        'serie': nota.serie,
-                        'prestador': nota.cnpj_cpf_prestador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'❌ NFTS Nº {nota.numero_documento}' + (f' - Série {nota.serie}' if nota.serie else '') + f'\n'
-                                   f'Não pode ser emitida:\n\n'
-                                   f'Status atual: {nota.get_status_nfts_display()}\n'
-                                   f'Esta nota já foi {nota.get_status_nfts_display().lower()}.\n\n'
-                                   f'Prestador: {nota.cnpj_cpf_prestador}\n'
-                                   f'Valor: R$ {nota.valor_total:,.2f}'
-                    })
-                    erros += 1
-                    continue
-                
-                # Se estava com erro, limpar mensagem de erro anterior
-                if nota.status_nfts == 'erro':
-                    nota.mensagem_erro = None
-                
-                # Criar XML e enviar
-                evento = EventoNFeDjango(nota.empresa)
-                xml = evento.criar_pedido_envio_nfts(nota)
-                
-                processador = ProcessadorNFeDjango(nota.empresa)
-                resultado = processador.enviar_nfts(xml)
-                
-                if resultado['sucesso']:
-                    # Atualizar nota
-                    nota.nfts = resultado.get('numero_nfe')
-                    nota.codigo_verificacao = resultado.get('codigo_verificacao')
-                    nota.status_nfts = 'emitida'
-                    nota.data_emissao = datetime.now()
-                    nota.save()
-                    
-                    emitidas += 1
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': True,
-                        'numero_documento': nota.numero_documento,
-                        'serie': nota.serie,
-                        'prestador': nota.cnpj_cpf_prestador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'✅ NFTS Nº {nota.numero_documento}' + (f' - Série {nota.serie}' if nota.serie else '') + f'\n'
-                                   f'Emitida com sucesso!\n'
-                                   f'Prestador: {nota.cnpj_cpf_prestador}\n'
-                                   f'Valor: R$ {nota.valor_total:,.2f}',
-                        'numero_nfe': nota.nfts,
-                        'codigo_verificacao': nota.codigo_verificacao,
-                        'url': resultado.get('url_nfe')
-                    })
-                else:
-                    nota.status_nfts = 'erro'
-                    nota.mensagem_erro = resultado.get('mensagem', 'Erro desconhecido')
-                    nota.save()
-                    
-                    erros += 1
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': False,
-                        'numero_documento': nota.numero_documento,
-                        'serie': nota.serie,
-                        'prestador': nota.cnpj_cpf_prestador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'❌ NFTS Nº {nota.numero_documento}' + (f' - Série {nota.serie}' if nota.serie else '') + f'\n'
-                                   f'Erro na emissão:\n\n'
-                                   f'{resultado.get("mensagem", "Erro ao emitir NFTS")}\n\n'
-                                   f'Prestador: {nota.cnpj_cpf_prestador}\n'
-                                   f'Valor: R$ {nota.valor_total:,.2f}'
-                    })
-                    
-            except Exception as e:
-                erros += 1
-                resultados.append({
-                    'id': nota_id,
-                    'sucesso': False,
-                    'mensagem': f'Erro: {str(e)}'
-                })
-        
-        # Mensagem de resumo profissional
-        if emitidas > 0 and erros == 0:
-            mensagem_resumo = f'🎉 Emissão concluída com sucesso!\n\nTodas as {emitidas} NFTS foram emitidas corretamente.'
-        elif emitidas > 0 and erros > 0:
-            mensagem_resumo = f'⚠️ Emissão concluída com avisos.\n\n{emitidas} NFTS emitida(s) com sucesso.\n{erros} NFTS com erro.'
-        else:
-            mensagem_resumo = f'❌ Não foi possível emitir as NFTS.\n\n{erros} erro(s) encontrado(s).'
-        
-        return JsonResponse({
-            'sucesso': emitidas > 0,
-            'mensagem': mensagem_resumo,
-            'emitidas': emitidas,
-            'erros': erros,
-            'total': len(notas_ids),
-            'resultados': resultados
-        })
+        return JsonResponse(EmissorNFTS().emitir(notas_ids))
     
     return JsonResponse({'sucesso': False, 'mensagem': 'Método não permitido'})
 
@@ -1026,6 +952,10 @@ def cancelar_nfts(request):
         canceladas = 0
         erros = 0
         
+        # Eventos e processadores reaproveitados por empresa
+        eventos = {}
+        processadores = {}
+        
         for nota_id in notas_ids:
             try:
                 nota = NotaFiscalTomadorSP.objects.get(id=nota_id)
@@ -1041,10 +971,13 @@ def cancelar_nfts(request):
                     continue
                 
                 # Criar XML de cancelamento e enviar
-                evento = EventoNFeDjango(nota.empresa)
-                xml = evento.cancelamento_nfe(nota)
+                if nota.empresa_id not in processadores:
+                    eventos[nota.empresa_id] = EventoNFeDjango(nota.empresa)
+                    processadores[nota.empresa_id] = ProcessadorNFeDjango(nota.empresa)
+                evento = eventos[nota.empresa_id]
+                processador = processadores[nota.empresa_id]
                 
-                processador = ProcessadorNFeDjango(nota.empresa)
+                xml = evento.cancelamento_nfe(nota)
                 resultado = processador.cancelar_nfe(xml)
                 
                 if resultado['sucesso']:
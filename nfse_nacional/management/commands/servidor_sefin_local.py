@@ -0,0 +1,37 @@
+"""
+Servidor local que imita a API da Sefin Nacional (desenvolvimento e testes)
+
+Uso:
+    python manage.py servidor_sefin_local
+    python manage.py servidor_sefin_local --porta 9000
+
+Com o servidor no ar, configure NFSE_NACIONAL_URL = 'http://127.0.0.1:<porta>/SefinNacional'
+"""
+from django.core.management.base import BaseCommand
+
+from nfse_nacional.services.sefin_local import PREFIXO, criar_servidor
+
+
+class Command(BaseCommand):
+    help = 'Inicia um servidor local que imita a API da Sefin Nacional (NFS-e Nacional)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endereco', default='127.0.0.1', help='Endereço de escuta')
+        parser.add_argument('--porta', type=int, default=8765, help='Porta de escuta')
+
+    def handle(self, *args, **options):
+        servidor = criar_servidor(options['endereco'], options['porta'])
+        endereco, porta = servidor.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f'Sefin local em http://{endereco}:{porta}{PREFIXO} (Ctrl+C para encerrar)'
+        ))
+
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(
+                f'{len(servidor.sefin.notas)} NFS-e gerada(s), {len(servidor.sefin.eventos)} evento(s) registrado(s)'
+            )
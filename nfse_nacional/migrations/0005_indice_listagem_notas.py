@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nfse_nacional', '0004_alter_notafiscalnacional_cnpj_cpf_tomador'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notafiscalnacional',
+            index=models.Index(fields=['-data_importacao', '-id'], name='nfse_nacion_data_im_5d0dee_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nfse_nacional', '0005_indice_listagem_notas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notafiscalnacional',
+            name='chave_acesso',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='Chave de Acesso'),
+        ),
+        migrations.AddField(
+            model_name='notafiscalnacional',
+            name='id_dps',
+            field=models.CharField(blank=True, max_length=45, null=True, verbose_name='Identificador da DPS'),
+        ),
+        migrations.AddIndex(
+            model_name='notafiscalnacional',
+            index=models.Index(fields=['chave_acesso'], name='nfse_nacion_chave_a_4792fc_idx'),
+        ),
+    ]
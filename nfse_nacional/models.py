@@ -1,5 +1,5 @@
 from django.db import models
-from core.models import Empresa, TIPO_TRIBUTACAO_CHOICES
+from core.models import Empresa, NotasQuerySet, TIPO_TRIBUTACAO_CHOICES, ValorCalculado, arredondar_centavos
 from django.utils import timezone
 
 
@@ -11,6 +11,15 @@ STATUS_NFSE_CHOICES = (
 )
 
 
+class NotaFiscalNacionalQuerySet(NotasQuerySet):
+    parametros_impostos = {
+        'campo_aliquota': 'aliquota_iss',
+        'deducoes': ('deducoes', 'desconto_incondicionado'),
+        'retidos_se': {'ibs_retido': 'valor_ibs', 'cbs_retido': 'valor_cbs'},
+    }
+    campo_data = 'data_emissao'
+
+
 class NotaFiscalNacional(models.Model):
     """Nota Fiscal de Serviço Eletrônica Nacional (com Reforma Tributária)"""
     
@@ -88,6 +97,8 @@ class NotaFiscalNacional(models.Model):
     
     # Dados da NFS-e (após emissão)
     numero_nfse = models.CharField('Número NFS-e', max_length=50, blank=True, null=True)
+    chave_acesso = models.CharField('Chave de Acesso', max_length=50, blank=True, null=True)
+    id_dps = models.CharField('Identificador da DPS', max_length=45, blank=True, null=True)
     codigo_verificacao = models.CharField('Código de Verificação', max_length=100, blank=True, null=True)
     data_emissao_nfse = models.DateTimeField('Data/Hora Emissão NFS-e', null=True, blank=True)
     link_nfse = models.URLField('Link NFS-e', blank=True, null=True)
@@ -96,6 +107,8 @@ class NotaFiscalNacional(models.Model):
     # Erros
     mensagem_erro = models.TextField('Mensagem de Erro', blank=True, null=True)
     
+    objects = NotaFiscalNacionalQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Nota Fiscal Nacional'
         verbose_name_plural = 'Notas Fiscais Nacionais'
@@ -105,6 +118,8 @@ class NotaFiscalNacional(models.Model):
             models.Index(fields=['cnpj_contribuinte']),
             models.Index(fields=['data_emissao']),
             models.Index(fields=['numero_nfse']),
+            models.Index(fields=['chave_acesso']),
+            models.Index(fields=['-data_importacao', '-id']),
         ]
     
     def __str__(self):
@@ -112,13 +127,13 @@ class NotaFiscalNacional(models.Model):
             return f"NFS-e {self.numero_nfse} - {self.nome_tomador}"
         return f"RPS {self.numero_rps or self.id} - {self.nome_tomador}"
     
-    @property
+    @ValorCalculado
     def valor_iss(self):
         """Calcula o valor do ISS"""
         base_calculo = self.valor_total - self.deducoes - self.desconto_incondicionado
-        return (base_calculo * self.aliquota_iss) / 100
+        return arredondar_centavos((base_calculo * self.aliquota_iss) / 100)
     
-    @property
+    @ValorCalculado
     def valor_liquido(self):
         """Calcula o valor líquido (considerando reforma tributária)"""
         total_retencoes = (
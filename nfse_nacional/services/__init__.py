@@ -2,5 +2,6 @@
 Services para NFS-e Nacional
 """
 from .processador_nacional import ProcessadorNFSeNacional
+from .emissao_nacional import EmissorNFSeNacional
 
-__all__ = ['ProcessadorNFSeNacional']
+__all__ = ['ProcessadorNFSeNacional', 'EmissorNFSeNacional']
@@ -0,0 +1,247 @@
+"""
+Cliente HTTP da API da Sefin Nacional (NFS-e Nacional)
+Mantém uma sessão mTLS por certificado, reaproveitada entre as notas e os workers
+da mesma instância do processo
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from accounts.models import ENVIOS_SIMULTANEOS_NFSE_MAXIMO
+from nfs_sp.services.pool_clientes_soap import PoolClientesSOAP
+
+
+# URLs da Sefin Nacional por ambiente (tpAmb)
+URLS_SEFIN = {
+    '1': 'https://sefin.nfse.gov.br/SefinNacional',
+    '2': 'https://sefin.producaorestrita.nfse.gov.br/SefinNacional',
+}
+
+
+def ambiente():
+    """Ambiente da NFS-e Nacional (settings.NFSE_NACIONAL_AMBIENTE): '1' produção, '2' produção restrita"""
+    return str(getattr(settings, 'NFSE_NACIONAL_AMBIENTE', 2))
+
+
+def url_sefin():
+    """URL base da API (settings.NFSE_NACIONAL_URL tem prioridade, ex.: servidor_sefin_local)"""
+    return (getattr(settings, 'NFSE_NACIONAL_URL', None) or URLS_SEFIN[ambiente()]).rstrip('/')
+
+
+def envios_simultaneos(empresa):
+    """
+    Limite de envios simultâneos do certificado da empresa (campo da contratante
+    ou settings.NFSE_NACIONAL_ENVIOS_SIMULTANEOS), entre 1 e
+    ENVIOS_SIMULTANEOS_NFSE_MAXIMO
+
+    Args:
+        empresa: Instância de Empresa
+
+    Returns:
+        int: Quantidade de envios simultâneos
+    """
+    contratante = empresa.empresa_contratante
+    if contratante is not None:
+        limite = contratante.limite_envios_nfse
+    else:
+        limite = getattr(settings, 'NFSE_NACIONAL_ENVIOS_SIMULTANEOS', 8)
+    return min(max(1, limite), ENVIOS_SIMULTANEOS_NFSE_MAXIMO)
+
+
+def tempo_espera(retry_after, tentativa):
+    """
+    Tempo de espera após um HTTP 429
+
+    Args:
+        retry_after: Cabeçalho Retry-After (segundos ou data HTTP) ou None
+        tentativa: Número da tentativa (0, 1, ...), usado sem Retry-After
+
+    Returns:
+        float: Segundos de espera, limitados a settings.NFSE_NACIONAL_ESPERA_MAXIMA
+    """
+    espera = None
+    if retry_after:
+        try:
+            espera = float(retry_after)
+        except ValueError:
+            try:
+                espera = (parsedate_to_datetime(retry_after) - timezone.now()).total_seconds()
+            except (TypeError, ValueError):
+                espera = None
+
+    if espera is None:
+        espera = 2 ** tentativa
+    return min(max(espera, 0), getattr(settings, 'NFSE_NACIONAL_ESPERA_MAXIMA', 60))
+
+
+class PoolSessoesSefin:
+    """
+    Sessões HTTP com certificado do cliente, uma por arquivo PEM
+
+    A impressão digital do arquivo é conferida a cada uso, como no PoolClientesSOAP:
+    um certificado substituído gera uma nova sessão. As sessões são compartilhadas
+    pelas threads de envio, e uma resposta 429 pausa todas as threads do certificado.
+    """
+
+    def __init__(self):
+        self._sessoes = {}
+        self._pausas = {}
+        self._lock = threading.Lock()
+
+    def obter_sessao(self, cert_path, conexoes=None):
+        """
+        Retorna a sessão do certificado, criando se necessário
+
+        O pool de conexões da sessão acompanha o maior limite de envios
+        simultâneos pedido para o certificado: com menos conexões que threads,
+        o urllib3 descartaria conexões e repetiria o handshake TLS.
+
+        Args:
+            cert_path: Caminho do certificado PEM (chave + certificado)
+            conexoes: Envios simultâneos do certificado (padrão:
+                      settings.NFSE_NACIONAL_ENVIOS_SIMULTANEOS)
+
+        Returns:
+            requests.Session: Sessão configurada
+        """
+        impressao = PoolClientesSOAP.impressao_digital(cert_path)
+        conexoes = max(1, conexoes or getattr(settings, 'NFSE_NACIONAL_ENVIOS_SIMULTANEOS', 8))
+
+        with self._lock:
+            atual = self._sessoes.get(cert_path)
+            if atual is not None and atual[1] == impressao:
+                sessao, _, tamanho = atual
+                if conexoes > tamanho:
+                    # Adaptador maior; o anterior é liberado quando os envios em curso terminarem
+                    sessao.mount('https://', self.adaptador(conexoes))
+                    self._sessoes[cert_path] = (sessao, impressao, conexoes)
+                return sessao
+
+            sessao = requests.Session()
+            sessao.cert = cert_path
+            sessao.mount('https://', self.adaptador(conexoes))
+            sessao.headers.update({'Accept': 'application/json'})
+            self._sessoes[cert_path] = (sessao, impressao, conexoes)
+
+        if atual is not None:
+            atual[0].close()
+        return sessao
+
+    @staticmethod
+    def adaptador(conexoes):
+        """Adaptador HTTP com uma conexão mantida por envio simultâneo"""
+        return requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=conexoes)
+
+    def pausar(self, cert_path, segundos):
+        """
+        Suspende os envios do certificado (resposta 429 da Sefin)
+
+        Args:
+            cert_path: Caminho do certificado PEM
+            segundos: Tempo de pausa
+        """
+        with self._lock:
+            retomar_em = time.monotonic() + segundos
+            self._pausas[cert_path] = max(self._pausas.get(cert_path, 0), retomar_em)
+
+    def aguardar_liberacao(self, cert_path):
+        """Aguarda o fim da pausa do certificado, se houver"""
+        with self._lock:
+            retomar_em = self._pausas.get(cert_path, 0)
+        espera = retomar_em - time.monotonic()
+        if espera > 0:
+            time.sleep(espera)
+
+    def invalidar(self, cert_path=None):
+        """
+        Fecha as sessões de um certificado (ou todas, se cert_path for None)
+
+        Args:
+            cert_path: Caminho do certificado PEM
+        """
+        with self._lock:
+            chaves = [chave for chave in self._sessoes if cert_path is None or chave == cert_path]
+            removidas = [self._sessoes.pop(chave)[0] for chave in chaves]
+
+        for sessao in removidas:
+            sessao.close()
+
+
+# Instância única por processo
+pool_sessoes = PoolSessoesSefin()
+
+
+class ClienteSefin:
+    """
+    Operações da API da Sefin Nacional usadas pelo sistema
+    """
+
+    def __init__(self, cert_path, conexoes=None):
+        """
+        Inicializa o cliente
+
+        Args:
+            cert_path: Caminho do certificado PEM da empresa
+            conexoes: Envios simultâneos do certificado (tamanho do pool de conexões)
+        """
+        self.cert_path = cert_path
+        self.conexoes = conexoes
+        self.url = url_sefin()
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'NFSE_NACIONAL_TIMEOUT', 60)
+
+    def requisitar(self, metodo, caminho, **kwargs):
+        """
+        Executa a requisição na API
+
+        Respostas 429 (Too Many Requests) são repetidas até
+        settings.NFSE_NACIONAL_TENTATIVAS_429 vezes, após o tempo do Retry-After;
+        nesse intervalo os demais envios do mesmo certificado também aguardam.
+
+        Args:
+            metodo: Método HTTP
+            caminho: Caminho a partir da URL base (ex.: '/nfse')
+
+        Returns:
+            tuple: (status HTTP, corpo JSON; respostas que não são JSON viram 'erros')
+        """
+        sessao = pool_sessoes.obter_sessao(self.cert_path, self.conexoes)
+        tentativas = getattr(settings, 'NFSE_NACIONAL_TENTATIVAS_429', 5)
+
+        for tentativa in range(tentativas + 1):
+            pool_sessoes.aguardar_liberacao(self.cert_path)
+            resposta = sessao.request(metodo, self.url + caminho, timeout=self.timeout, **kwargs)
+            if resposta.status_code != 429 or tentativa == tentativas:
+                break
+            pool_sessoes.pausar(self.cert_path, tempo_espera(resposta.headers.get('Retry-After'), tentativa))
+
+        try:
+            corpo = resposta.json()
+        except ValueError:
+            corpo = {'erros': [{'Codigo': str(resposta.status_code), 'Descricao': resposta.text[:500]}]}
+        return resposta.status_code, corpo
+
+    def enviar_dps(self, dps_gzip_b64):
+        """POST /nfse - gera a NFS-e a partir da DPS assinada (gzip + base64)"""
+        return self.requisitar('POST', '/nfse', json={'dpsXmlGZipB64': dps_gzip_b64})
+
+    def consultar_nfse(self, chave_acesso):
+        """GET /nfse/{chaveAcesso} - XML da NFS-e gerada"""
+        return self.requisitar('GET', f'/nfse/{chave_acesso}')
+
+    def consultar_dps(self, id_dps):
+        """GET /dps/{id} - chave de acesso da NFS-e gerada a partir da DPS"""
+        return self.requisitar('GET', f'/dps/{id_dps}')
+
+    def registrar_evento(self, chave_acesso, evento_gzip_b64):
+        """POST /nfse/{chaveAcesso}/eventos - registra um evento (ex.: cancelamento)"""
+        return self.requisitar(
+            'POST', f'/nfse/{chave_acesso}/eventos',
+            json={'pedidoRegistroEventoXmlGZipB64': evento_gzip_b64}
+        )
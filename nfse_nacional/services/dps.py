@@ -0,0 +1,319 @@
+"""
+Geração da DPS (Declaração de Prestação de Serviço) e dos eventos da NFS-e Nacional
+Monta os documentos com lxml a partir da NotaFiscalNacional, assina com xmlsec
+(RSA-SHA256, C14N exclusivo) e compacta no formato aceito pela API (gzip + base64)
+"""
+import base64
+import gzip
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import xmlsec
+from lxml import etree
+from django.utils import timezone
+
+from core.services.esquemas_xsd import registro_esquemas
+
+
+NS_NFSE = 'http://www.sped.fazenda.gov.br/nfse'
+VERSAO_LEIAUTE = '1.00'
+
+# TIPO_TRIBUTACAO_CHOICES -> tribISSQN (1 operação tributável, 3 não incidência, 4 imunidade)
+TRIBUTACAO_ISSQN = {
+    'T': '1',
+    'F': '1',
+    'N': '3',
+    'I': '4',
+}
+
+# Códigos de justificativa do evento de cancelamento (e101101/cMotivo)
+MOTIVOS_CANCELAMENTO = {
+    '1': 'Erro na emissão',
+    '2': 'Serviço não prestado',
+    '9': 'Outros',
+}
+
+EVENTO_CANCELAMENTO = '101101'
+
+
+def somente_digitos(valor):
+    """Remove tudo que não for dígito"""
+    return re.sub(r'\D', '', valor or '')
+
+
+def formatar_valor(valor):
+    """Valor monetário no formato TSDec15V2 (ponto decimal, 2 casas)"""
+    return f"{Decimal(valor or 0):.2f}"
+
+
+def formatar_data_hora(data_hora):
+    """Data/hora no horário local com o deslocamento (ex.: 2025-01-31T10:00:00-03:00)"""
+    return timezone.localtime(data_hora).isoformat(timespec='seconds')
+
+
+def formatar_data(data):
+    """Data no formato AAAA-MM-DD (aceita datetime, ex.: default=timezone.now ainda não gravado)"""
+    if isinstance(data, datetime):
+        data = timezone.localtime(data).date() if timezone.is_aware(data) else data.date()
+    return data.isoformat()
+
+
+def tipo_inscricao(documento):
+    """Tipo de inscrição usado no Id da DPS: 1 CPF, 2 CNPJ"""
+    return '1' if len(documento) == 11 else '2'
+
+
+def gerar_id_dps(codigo_municipio, documento, serie, numero):
+    """
+    Gera o identificador da DPS (atributo Id de infDPS)
+
+    "DPS" + município emissor (7) + tipo de inscrição (1) + inscrição federal (14)
+    + série (5) + número da DPS (15)
+
+    Args:
+        codigo_municipio: Código IBGE do município emissor
+        documento: CNPJ/CPF do prestador (somente dígitos)
+        serie: Série da DPS
+        numero: Número da DPS
+
+    Returns:
+        str: Id com 45 caracteres
+    """
+    return (
+        f"DPS{str(codigo_municipio).zfill(7)}{tipo_inscricao(documento)}"
+        f"{documento.zfill(14)}{str(serie).zfill(5)}{str(numero).zfill(15)}"
+    )
+
+
+def compactar(xml_bytes):
+    """Compacta o XML para envio (gzip + base64)"""
+    return base64.b64encode(gzip.compress(xml_bytes)).decode('ascii')
+
+
+def descompactar(conteudo_b64):
+    """Descompacta um XML recebido da API (base64 + gzip)"""
+    return gzip.decompress(base64.b64decode(conteudo_b64))
+
+
+def _sub(pai, nome, valor=None):
+    elemento = etree.SubElement(pai, f'{{{NS_NFSE}}}{nome}')
+    if valor is not None:
+        elemento.text = str(valor)
+    return elemento
+
+
+def _documento(pai, documento):
+    _sub(pai, 'CPF' if len(documento) == 11 else 'CNPJ', documento)
+
+
+def assinar(raiz, chaves):
+    """
+    Assina o primeiro filho do documento (infDPS/infPedReg)
+
+    A ds:Signature fica como irmã do elemento assinado, depois dele, com as
+    transformações enveloped-signature + C14N exclusivo exigidas pela Sefin.
+
+    Args:
+        raiz: Elemento raiz (DPS ou pedRegEvento)
+        chaves: ChavesCertificado (nfs_sp.services.cache_chaves)
+
+    Returns:
+        bytes: Documento assinado (UTF-8, com declaração XML)
+    """
+    informacoes = raiz[0]
+
+    assinatura = xmlsec.template.create(
+        raiz, xmlsec.constants.TransformExclC14N, xmlsec.constants.TransformRsaSha256
+    )
+    raiz.append(assinatura)
+
+    referencia = xmlsec.template.add_reference(
+        assinatura, xmlsec.constants.TransformSha256, uri=f"#{informacoes.get('Id')}"
+    )
+    xmlsec.template.add_transform(referencia, xmlsec.constants.TransformEnveloped)
+    xmlsec.template.add_transform(referencia, xmlsec.constants.TransformExclC14N)
+
+    key_info = xmlsec.template.ensure_key_info(assinatura)
+    xmlsec.template.add_x509_data(key_info)
+
+    ctx = xmlsec.SignatureContext()
+    ctx.register_id(informacoes, 'Id')
+    ctx.key = chaves.chave_xmlsec
+    ctx.sign(assinatura)
+
+    return etree.tostring(raiz, encoding='UTF-8', xml_declaration=True)
+
+
+class GeradorDPS:
+    """
+    Monta a DPS e o pedido de cancelamento de uma empresa emissora
+    """
+
+    def __init__(self, empresa, ambiente, versao_aplicativo):
+        """
+        Inicializa o gerador
+
+        Args:
+            empresa: Instância do modelo Empresa (prestador)
+            ambiente: tpAmb ('1' produção, '2' produção restrita)
+            versao_aplicativo: verAplic enviado nos documentos
+        """
+        self.empresa = empresa
+        self.ambiente = str(ambiente)
+        self.versao_aplicativo = versao_aplicativo
+        self.documento = somente_digitos(empresa.cnpj)
+        self.codigo_municipio = somente_digitos(empresa.codigo_municipio)
+
+    def id_dps(self, serie, numero):
+        """Id da DPS da empresa para a série/número informados"""
+        return gerar_id_dps(self.codigo_municipio, self.documento, serie, numero)
+
+    def gerar_dps(self, nota, serie, numero):
+        """
+        Monta a DPS da nota
+
+        Args:
+            nota: Instância de NotaFiscalNacional
+            serie: Série da DPS (até 5 dígitos)
+            numero: Número da DPS
+
+        Returns:
+            Element: Elemento DPS (não assinado)
+
+        Raises:
+            ErroValidacaoXML: Se a DPS não estiver conforme o DPS_v1.00.xsd
+        """
+        dps = etree.Element(f'{{{NS_NFSE}}}DPS', nsmap={None: NS_NFSE}, versao=VERSAO_LEIAUTE)
+        inf = _sub(dps, 'infDPS')
+        inf.set('Id', self.id_dps(serie, numero))
+
+        # dhEmi não pode estar à frente do relógio da Sefin
+        _sub(inf, 'tpAmb', self.ambiente)
+        _sub(inf, 'dhEmi', formatar_data_hora(timezone.now() - timedelta(minutes=1)))
+        _sub(inf, 'verAplic', self.versao_aplicativo)
+        _sub(inf, 'serie', str(serie).zfill(5))
+        _sub(inf, 'nDPS', int(numero))
+        _sub(inf, 'dCompet', formatar_data(nota.data_emissao))
+        _sub(inf, 'tpEmit', '1')
+        _sub(inf, 'cLocEmi', self.codigo_municipio)
+
+        self.adicionar_prestador(inf)
+        self.adicionar_tomador(inf, nota)
+        self.adicionar_servico(inf, nota)
+        self.adicionar_valores(inf, nota)
+
+        registro_esquemas.validar('DPS', dps)
+        return dps
+
+    def adicionar_prestador(self, inf):
+        prest = _sub(inf, 'prest')
+        _documento(prest, self.documento)
+
+        reg_trib = _sub(prest, 'regTrib')
+        opcao = self.empresa.opcao_simples_nacional or '1'
+        _sub(reg_trib, 'opSimpNac', opcao)
+        if opcao == '3':
+            # ME/EPP: tributos federais e municipal apurados pelo Simples Nacional
+            _sub(reg_trib, 'regApTribSN', '1')
+        _sub(reg_trib, 'regEspTrib', '0')
+
+    def adicionar_tomador(self, inf, nota):
+        toma = _sub(inf, 'toma')
+        _documento(toma, somente_digitos(nota.cnpj_cpf_tomador))
+        inscricao = somente_digitos(nota.inscricao_municipal_tomador)
+        if inscricao:
+            _sub(toma, 'IM', inscricao)
+        _sub(toma, 'xNome', nota.nome_tomador.strip()[:300])
+        if nota.email_tomador:
+            _sub(toma, 'email', nota.email_tomador)
+
+    def adicionar_servico(self, inf, nota):
+        serv = _sub(inf, 'serv')
+        _sub(_sub(serv, 'locPrest'), 'cLocPrestacao', self.codigo_municipio)
+
+        c_serv = _sub(serv, 'cServ')
+        _sub(c_serv, 'cTribNac', somente_digitos(nota.cod_servico))
+        codigo_municipal = somente_digitos(nota.cod_tributacao_municipio)
+        if len(codigo_municipal) == 3:
+            _sub(c_serv, 'cTribMun', codigo_municipal)
+        _sub(c_serv, 'xDescServ', nota.descricao.strip()[:2000])
+
+    def adicionar_valores(self, inf, nota):
+        valores = _sub(inf, 'valores')
+        _sub(_sub(valores, 'vServPrest'), 'vServ', formatar_valor(nota.valor_total))
+
+        if nota.desconto_incondicionado or nota.desconto_condicionado:
+            descontos = _sub(valores, 'vDescCondIncond')
+            if nota.desconto_incondicionado:
+                _sub(descontos, 'vDescIncond', formatar_valor(nota.desconto_incondicionado))
+            if nota.desconto_condicionado:
+                _sub(descontos, 'vDescCond', formatar_valor(nota.desconto_condicionado))
+
+        if nota.deducoes:
+            _sub(_sub(valores, 'vDedRed'), 'vDR', formatar_valor(nota.deducoes))
+
+        trib = _sub(valores, 'trib')
+
+        # Tributação municipal (pAliq antes de tpRetISSQN, conforme o XSD)
+        trib_mun = _sub(trib, 'tribMun')
+        trib_issqn = TRIBUTACAO_ISSQN.get(nota.tipo_tributacao, '1')
+        _sub(trib_mun, 'tribISSQN', trib_issqn)
+        if trib_issqn == '4':
+            _sub(trib_mun, 'tpImunidade', '0')
+        if trib_issqn == '1' and nota.aliquota_iss:
+            _sub(trib_mun, 'pAliq', formatar_valor(nota.aliquota_iss))
+        _sub(trib_mun, 'tpRetISSQN', '2' if nota.iss_retido else '1')
+
+        # Retenções federais
+        if any([nota.pis_retido, nota.cofins_retido, nota.inss_retido, nota.irrf_retido, nota.csll_retido]):
+            trib_nac = _sub(trib, 'tribNac')
+            if nota.pis_retido or nota.cofins_retido:
+                pis_cofins = _sub(trib_nac, 'piscofins')
+                _sub(pis_cofins, 'CST', '01')
+                _sub(pis_cofins, 'vPis', formatar_valor(nota.pis_retido))
+                _sub(pis_cofins, 'vCofins', formatar_valor(nota.cofins_retido))
+                _sub(pis_cofins, 'tpRetPisCofins', '1')
+            if nota.inss_retido:
+                _sub(trib_nac, 'vRetCP', formatar_valor(nota.inss_retido))
+            if nota.irrf_retido:
+                _sub(trib_nac, 'vRetIRRF', formatar_valor(nota.irrf_retido))
+            if nota.csll_retido:
+                _sub(trib_nac, 'vRetCSLL', formatar_valor(nota.csll_retido))
+
+        # Lei da Transparência: sem informação do total de tributos
+        _sub(_sub(trib, 'totTrib'), 'indTotTrib', '0')
+
+    def gerar_pedido_cancelamento(self, chave_acesso, codigo_motivo, motivo):
+        """
+        Monta o pedido de registro do evento de cancelamento (e101101)
+
+        Args:
+            chave_acesso: Chave de acesso da NFS-e (50 dígitos)
+            codigo_motivo: cMotivo ('1', '2' ou '9')
+            motivo: Justificativa (15 a 255 caracteres)
+
+        Returns:
+            Element: Elemento pedRegEvento (não assinado)
+
+        Raises:
+            ErroValidacaoXML: Se o pedido não estiver conforme o pedRegEvento_v1.00.xsd
+        """
+        pedido = etree.Element(f'{{{NS_NFSE}}}pedRegEvento', nsmap={None: NS_NFSE}, versao=VERSAO_LEIAUTE)
+        inf = _sub(pedido, 'infPedReg')
+        inf.set('Id', f"PRE{chave_acesso}{EVENTO_CANCELAMENTO}001")
+
+        _sub(inf, 'tpAmb', self.ambiente)
+        _sub(inf, 'verAplic', self.versao_aplicativo)
+        _sub(inf, 'dhEvento', formatar_data_hora(timezone.now() - timedelta(minutes=1)))
+        _sub(inf, 'CPFAutor' if len(self.documento) == 11 else 'CNPJAutor', self.documento)
+        _sub(inf, 'chNFSe', chave_acesso)
+        _sub(inf, 'nPedRegEvento', '1')
+
+        evento = _sub(inf, f'e{EVENTO_CANCELAMENTO}')
+        _sub(evento, 'xDesc', 'Cancelamento de NFS-e')
+        _sub(evento, 'cMotivo', codigo_motivo)
+        _sub(evento, 'xMotivo', motivo.strip()[:255])
+
+        registro_esquemas.validar('pedRegEvento', pedido)
+        return pedido
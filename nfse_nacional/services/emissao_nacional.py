@@ -0,0 +1,224 @@
+"""
+Emissão de NFS-e Nacional
+A API recebe uma DPS por requisição: as DPS são preparadas e gravadas em ordem
+nesta thread, enviadas em paralelo (limite por certificado definido pela
+EmpresaContratante) e os resultados gravados em ordem, conforme chegam
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ..models import NotaFiscalNacional
+from .cliente_sefin import envios_simultaneos
+from .processador_nacional import ProcessadorNFSeNacional
+
+
+class _ItemEmissao:
+    """Nota em emissão: dados do resultado e envio em andamento"""
+
+    def __init__(self, dados, processador=None, envio=None, futuro=None, resultado=None):
+        self.dados = dados
+        self.processador = processador
+        self.envio = envio
+        self.futuro = futuro
+        self.resultado = resultado
+
+    @property
+    def pronto(self):
+        return self.futuro is None or self.futuro.done()
+
+
+class EmissorNFSeNacional:
+    """
+    Emite as notas nacionais selecionadas, reaproveitando o processador por empresa
+    """
+
+    def __init__(self):
+        self.processadores = {}
+        self.executores = {}
+
+    def emitir(self, notas_ids, progresso=None):
+        """
+        Emite as notas informadas
+
+        Args:
+            notas_ids: Lista de IDs de NotaFiscalNacional
+            progresso: Função chamada com os resultados parciais após cada nota
+
+        Returns:
+            dict: Resumo no formato esperado por emitir.html
+        """
+        resultados = []
+        fila = deque()
+
+        try:
+            for nota_id in notas_ids:
+                try:
+                    nota = NotaFiscalNacional.objects.select_related(
+                        'empresa', 'empresa__empresa_contratante'
+                    ).get(id=nota_id)
+                    fila.append(self.iniciar_emissao(nota))
+                except Exception as e:
+                    fila.append(_ItemEmissao({'id': nota_id}, resultado={
+                        'sucesso': False,
+                        'mensagem': f'Erro: {str(e)}'
+                    }))
+
+                self.concluir_prontos(fila, resultados, progresso)
+
+            self.concluir_prontos(fila, resultados, progresso, aguardar=True)
+        finally:
+            self.fechar()
+
+        return self.resumo(resultados, len(notas_ids))
+
+    def iniciar_emissao(self, nota):
+        """
+        Prepara a DPS da nota e agenda o envio
+
+        Args:
+            nota: Instância de NotaFiscalNacional
+
+        Returns:
+            _ItemEmissao: Item com o envio agendado (ou já resolvido)
+        """
+        dados = {
+            'id': nota.id,
+            'numero_documento': nota.numero_rps or str(nota.id),
+            'tomador': nota.nome_tomador,
+            'valor': float(nota.valor_total),
+        }
+
+        # Verificar se já foi emitida
+        if nota.status_nfse in ['emitida', 'cancelada']:
+            return _ItemEmissao(dados, resultado={
+                'sucesso': False,
+                'mensagem': f'❌ Nota {nota.numero_rps or nota.id}\n'
+                           f'Não pode ser emitida:\n\n'
+                           f'Status atual: {nota.get_status_nfse_display()}\n'
+                           f'Tomador: {nota.nome_tomador}\n'
+                           f'Valor: R$ {nota.valor_total:,.2f}'
+            })
+
+        if nota.empresa_id not in self.processadores:
+            self.processadores[nota.empresa_id] = ProcessadorNFSeNacional(nota.empresa)
+        processador = self.processadores[nota.empresa_id]
+
+        try:
+            envio = processador.preparar_envio(nota)
+        except Exception as e:
+            return _ItemEmissao(dados, resultado=processador.resultado_falha_envio(nota, e))
+
+        # A preparação pode ter reservado o número da DPS
+        dados['numero_documento'] = nota.numero_rps or str(nota.id)
+
+        if envio.resultado is not None:
+            return _ItemEmissao(dados, resultado=envio.resultado)
+
+        futuro = self.executor(nota.empresa).submit(processador.enviar, envio)
+        return _ItemEmissao(dados, processador, envio, futuro)
+
+    def executor(self, empresa):
+        """
+        Pool de threads de envio do certificado da empresa
+
+        Args:
+            empresa: Instância de Empresa
+
+        Returns:
+            ThreadPoolExecutor: Pool com o limite de envios simultâneos da contratante
+        """
+        if empresa.id not in self.executores:
+            self.executores[empresa.id] = ThreadPoolExecutor(
+                max_workers=envios_simultaneos(empresa), thread_name_prefix=f'nfse-nacional-{empresa.id}'
+            )
+        return self.executores[empresa.id]
+
+    def fechar(self):
+        """Encerra os pools de envio"""
+        for executor in self.executores.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.executores = {}
+
+    def concluir_prontos(self, fila, resultados, progresso=None, aguardar=False):
+        """
+        Grava os resultados dos envios concluídos, na ordem das notas
+
+        Args:
+            fila: Itens em emissão, na ordem das notas
+            resultados: Lista de resultados (recebe os itens concluídos)
+            progresso: Função chamada com os resultados parciais
+            aguardar: Se True, aguarda todos os envios pendentes
+        """
+        while fila and (aguardar or fila[0].pronto):
+            item = fila.popleft()
+            resultados.append(self.concluir(item))
+            if progresso:
+                progresso(resultados)
+
+    def concluir(self, item):
+        """
+        Grava o resultado do envio na nota e monta o resultado exibido
+
+        Args:
+            item: _ItemEmissao
+
+        Returns:
+            dict: Resultado da nota
+        """
+        resultado = item.resultado
+        if resultado is None:
+            nota = item.envio.nota
+            try:
+                resultado = item.processador.concluir_envio(item.envio, *item.futuro.result())
+            except Exception as e:
+                resultado = item.processador.resultado_falha_envio(nota, e)
+
+        if 'numero_documento' not in item.dados:
+            return {**item.dados, **resultado}
+
+        if resultado['sucesso']:
+            return {
+                **item.dados,
+                'sucesso': True,
+                'mensagem': f'✅ Nota {item.dados["numero_documento"]}\n'
+                           f'Emitida com sucesso!\n'
+                           f'Tomador: {item.dados["tomador"]}\n'
+                           f'Valor: R$ {item.dados["valor"]:,.2f}'
+            }
+
+        return {
+            **item.dados,
+            'sucesso': False,
+            'mensagem': resultado.get('mensagem', 'Erro desconhecido')
+        }
+
+    def resumo(self, resultados, total):
+        """
+        Monta a resposta final da emissão
+
+        Args:
+            resultados: Resultados por nota
+            total: Quantidade de notas solicitadas
+
+        Returns:
+            dict: Resposta no formato esperado por emitir.html
+        """
+        emitidas = sum(1 for r in resultados if r['sucesso'])
+        erros = len(resultados) - emitidas
+
+        # Mensagem de resumo profissional
+        if emitidas > 0 and erros == 0:
+            mensagem_resumo = f'🎉 Emissão concluída com sucesso!\n\nTodas as {emitidas} nota(s) foram emitidas corretamente.'
+        elif emitidas > 0 and erros > 0:
+            mensagem_resumo = f'⚠️ Emissão concluída com avisos.\n\n{emitidas} nota(s) emitida(s) com sucesso.\n{erros} nota(s) com erro.'
+        else:
+            mensagem_resumo = f'❌ Não foi possível emitir as notas.\n\n{erros} erro(s) encontrado(s).'
+
+        return {
+            'sucesso': emitidas > 0,
+            'mensagem': mensagem_resumo,
+            'emitidas': emitidas,
+            'erros': erros,
+            'total': total,
+            'resultados': resultados
+        }
@@ -1,13 +1,49 @@
 """
 Processador de Notas Fiscais Nacionais
-Responsável por emitir, cancelar e consultar NFS-e Nacional
+Responsável por emitir, cancelar e consultar NFS-e Nacional na API da Sefin Nacional
 """
-from django.conf import settings
+from datetime import datetime
 import logging
 
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from lxml import etree
+import requests
+
+from core.services.esquemas_xsd import ErroValidacaoXML
+from nfs_sp.services.cache_chaves import cache_chaves
+from nfs_sp.services.certificado_service import CertificadoService
+from nfs_sp.services.numeracao_rps import reservar_numeros
+
+from ..models import NotaFiscalNacional
+from .cliente_sefin import ClienteSefin, ambiente, envios_simultaneos
+from .dps import (
+    GeradorDPS, MOTIVOS_CANCELAMENTO, NS_NFSE, assinar, compactar, descompactar, somente_digitos
+)
+
 logger = logging.getLogger(__name__)
 
 
+class EnvioDPS:
+    """DPS assinada de uma nota, pronta para envio à Sefin"""
+    
+    def __init__(self, nota, id_dps=None, conteudo=None, reconsultar=False, resultado=None):
+        """
+        Args:
+            nota: Instância de NotaFiscalNacional
+            id_dps: Identificador da DPS
+            conteudo: DPS assinada compactada (gzip + base64)
+            reconsultar: True se a DPS já foi enviada antes (consultar antes de reenviar)
+            resultado: Resultado final, quando a nota não chega a ser enviada
+        """
+        self.nota = nota
+        self.id_dps = id_dps
+        self.conteudo = conteudo
+        self.reconsultar = reconsultar
+        self.resultado = resultado
+
+
 class ProcessadorNFSeNacional:
     """Classe para processar operações de NFS-e Nacional"""
     
@@ -20,47 +56,159 @@ class ProcessadorNFSeNacional:
         """
         self.empresa = empresa
         self.logger = logging.getLogger(__name__)
+        self.gerador = GeradorDPS(
+            empresa,
+            ambiente(),
+            getattr(settings, 'NFSE_NACIONAL_VERSAO_APLICATIVO', 'DCOMP_WEB_1.0')
+        )
+        self._pem_path = None
+    
+    @property
+    def pem_path(self):
+        """Certificado PEM da empresa (convertido do PFX no primeiro uso)"""
+        if self._pem_path is None:
+            self._pem_path = CertificadoService().get_pem_path(self.empresa)
+        return self._pem_path
+    
+    @property
+    def cliente(self):
+        return ClienteSefin(self.pem_path, envios_simultaneos(self.empresa))
     
     def emitir_nota(self, nota):
         """
         Emite uma nota fiscal nacional
         
+        Executa as três etapas da emissão em sequência: preparar_envio, enviar e
+        concluir_envio (o EmissorNFSeNacional executa o envio em paralelo).
+        
         Args:
             nota: Instância de NotaFiscalNacional
-            
+        
         Returns:
             dict: Resultado da emissão com sucesso, mensagem e dados
         """
         try:
-            self.logger.info(f"Iniciando emissão de nota ID {nota.id}")
-            
-            # TODO: Implementar integração com API Nacional
-            # Por enquanto, retorna estrutura de resposta
-            
-            resultado = {
-                'sucesso': False,
-                'mensagem': '⚠️ Emissão de NFS-e Nacional em desenvolvimento.\n\nA integração com a API Nacional será implementada em breve.',
-                'nota_id': nota.id,
-            }
-            
-            return resultado
-            
+            envio = self.preparar_envio(nota)
+            if envio.resultado is not None:
+                return envio.resultado
+            return self.concluir_envio(envio, *self.enviar(envio))
         except Exception as e:
-            self.logger.error(f"Erro ao emitir nota {nota.id}: {str(e)}")
-            return {
-                'sucesso': False,
-                'mensagem': f'❌ Erro ao emitir nota:\n\n{str(e)}',
-                'nota_id': nota.id,
-            }
+            return self.resultado_falha_envio(nota, e)
     
-    def cancelar_nota(self, nota, motivo):
+    def preparar_envio(self, nota):
         """
-        Cancela uma nota fiscal nacional emitida
+        Valida, numera, monta e assina a DPS da nota
+        
+        Grava o id_dps antes do envio: uma nota que já enviou a DPS é consultada
+        antes do reenvio, para não gerar duas NFS-e quando a resposta se perdeu.
         
         Args:
             nota: Instância de NotaFiscalNacional
-            motivo: Motivo do cancelamento
+        
+        Returns:
+            EnvioDPS: DPS pronta para envio (ou com o resultado, se a nota for inválida)
+        """
+        self.logger.info(f"Iniciando emissão de nota ID {nota.id}")
+        
+        valida, erro = self.validar_nota(nota)
+        if not valida:
+            return EnvioDPS(nota, resultado=self.registrar_erro(nota, f'❌ Nota com dados inválidos:\n\n{erro}'))
+        
+        serie, numero = self.numeracao_dps(nota)
+        id_dps = self.gerador.id_dps(serie, numero)
+        reconsultar = nota.id_dps == id_dps
+        
+        try:
+            dps = self.gerador.gerar_dps(nota, serie, numero)
+        except ErroValidacaoXML as e:
+            return EnvioDPS(nota, resultado=self.registrar_erro(nota, f'❌ DPS fora do leiaute da NFS-e Nacional:\n\n{e}'))
+        xml = assinar(dps, cache_chaves.obter(self.pem_path))
+        
+        nota.id_dps = id_dps
+        nota.save(update_fields=['id_dps', 'numero_rps', 'serie_rps', 'data_atualizacao'])
+        
+        return EnvioDPS(nota, id_dps=id_dps, conteudo=compactar(xml), reconsultar=reconsultar)
+    
+    def enviar(self, envio):
+        """
+        Envia a DPS à Sefin Nacional
+        
+        Não acessa o banco de dados: pode ser executado em outra thread.
+        
+        Args:
+            envio: EnvioDPS retornado por preparar_envio
+        
+        Returns:
+            tuple: (status HTTP, corpo JSON)
+        """
+        cliente = self.cliente
+        
+        if envio.reconsultar:
+            status, corpo = cliente.consultar_dps(envio.id_dps)
+            if status == 200 and corpo.get('chaveAcesso'):
+                status, corpo = cliente.consultar_nfse(corpo['chaveAcesso'])
+                if status == 200:
+                    return status, corpo
+        
+        return cliente.enviar_dps(envio.conteudo)
+    
+    def concluir_envio(self, envio, status, corpo):
+        """
+        Grava na nota o resultado do envio
+        
+        Args:
+            envio: EnvioDPS enviado
+            status: Status HTTP da resposta
+            corpo: JSON da resposta
+        
+        Returns:
+            dict: Resultado da emissão
+        """
+        with transaction.atomic():
+            if status in (200, 201) and corpo.get('chaveAcesso'):
+                return self.registrar_emissao(envio.nota, corpo)
             
+            return self.registrar_erro(
+                envio.nota, f'❌ NFS-e rejeitada pela Sefin Nacional:\n\n{self.mensagem_erro(corpo)}'
+            )
+    
+    def resultado_falha_envio(self, nota, erro):
+        """
+        Resultado de uma emissão interrompida por exceção
+        
+        A nota não é alterada: com id_dps gravado, a próxima tentativa consulta a
+        Sefin antes de reenviar.
+        
+        Args:
+            nota: Instância de NotaFiscalNacional
+            erro: Exceção ocorrida
+        
+        Returns:
+            dict: Resultado de falha da emissão
+        """
+        if isinstance(erro, requests.RequestException):
+            self.logger.error(f"Erro de comunicação ao emitir nota {nota.id}: {str(erro)}")
+            mensagem = f'❌ Erro de comunicação com a Sefin Nacional:\n\n{str(erro)}'
+        else:
+            self.logger.error(f"Erro ao emitir nota {nota.id}: {str(erro)}")
+            mensagem = f'❌ Erro ao emitir nota:\n\n{str(erro)}'
+        
+        return {
+            'sucesso': False,
+            'mensagem': mensagem,
+            'nota_id': nota.id,
+        }
+    
+    def cancelar_nota(self, nota, motivo, codigo_motivo='9'):
+        """
+        Cancela uma nota fiscal nacional emitida
+        
+        Args:
+            nota: Instância de NotaFiscalNacional
+            motivo: Motivo do cancelamento (15 a 255 caracteres)
+            codigo_motivo: Código da justificativa (1 erro na emissão, 2 serviço
+                           não prestado, 9 outros)
+        
         Returns:
             dict: Resultado do cancelamento
         """
@@ -75,16 +223,55 @@ class ProcessadorNFSeNacional:
                     'nota_id': nota.id,
                 }
             
-            # TODO: Implementar integração com API Nacional para cancelamento
+            if not nota.chave_acesso:
+                return {
+                    'sucesso': False,
+                    'mensagem': '❌ Nota não pode ser cancelada.\n\nChave de acesso da NFS-e não encontrada.',
+                    'nota_id': nota.id,
+                }
             
-            resultado = {
+            motivo = (motivo or '').strip() or MOTIVOS_CANCELAMENTO.get(codigo_motivo, '')
+            if codigo_motivo not in MOTIVOS_CANCELAMENTO or len(motivo) < 15:
+                return {
+                    'sucesso': False,
+                    'mensagem': '❌ Informe um motivo de cancelamento com pelo menos 15 caracteres.',
+                    'nota_id': nota.id,
+                }
+            
+            pedido = self.gerador.gerar_pedido_cancelamento(nota.chave_acesso, codigo_motivo, motivo)
+            xml = assinar(pedido, cache_chaves.obter(self.pem_path))
+            
+            status, corpo = self.cliente.registrar_evento(nota.chave_acesso, compactar(xml))
+            
+            if status not in (200, 201):
+                return {
+                    'sucesso': False,
+                    'mensagem': f'❌ Cancelamento rejeitado pela Sefin Nacional:\n\n{self.mensagem_erro(corpo)}',
+                    'nota_id': nota.id,
+                }
+            
+            nota.status_nfse = 'cancelada'
+            nota.save(update_fields=['status_nfse', 'data_atualizacao'])
+            
+            return {
+                'sucesso': True,
+                'mensagem': f'✅ NFS-e {nota.numero_nfse} cancelada com sucesso.',
+                'nota_id': nota.id,
+            }
+        
+        except ErroValidacaoXML as e:
+            return {
                 'sucesso': False,
-                'mensagem': '⚠️ Cancelamento de NFS-e Nacional em desenvolvimento.\n\nA integração com a API Nacional será implementada em breve.',
+                'mensagem': f'❌ Pedido de cancelamento fora do leiaute da NFS-e Nacional:\n\n{str(e)}',
+                'nota_id': nota.id,
+            }
+        except requests.RequestException as e:
+            self.logger.error(f"Erro de comunicação ao cancelar nota {nota.id}: {str(e)}")
+            return {
+                'sucesso': False,
+                'mensagem': f'❌ Erro de comunicação com a Sefin Nacional:\n\n{str(e)}',
                 'nota_id': nota.id,
             }
-            
-            return resultado
-            
         except Exception as e:
             self.logger.error(f"Erro ao cancelar nota {nota.id}: {str(e)}")
             return {
@@ -93,56 +280,191 @@ class ProcessadorNFSeNacional:
                 'nota_id': nota.id,
             }
     
-    def consultar_nota(self, numero_nfse):
+    def consultar_nota(self, nota):
         """
-        Consulta uma nota fiscal nacional pelo número
+        Consulta uma nota fiscal nacional na Sefin pela chave de acesso
+        
+        Sem chave de acesso, procura a NFS-e gerada a partir da DPS enviada.
         
         Args:
-            numero_nfse: Número da NFS-e
-            
+            nota: Instância de NotaFiscalNacional
+        
         Returns:
-            dict: Dados da nota consultada
+            dict: Resultado da consulta (com o XML da NFS-e em 'xml' quando encontrada)
         """
         try:
-            self.logger.info(f"Consultando nota {numero_nfse}")
+            self.logger.info(f"Consultando nota {nota.chave_acesso or nota.id_dps or nota.id}")
             
-            # TODO: Implementar integração com API Nacional para consulta
+            chave_acesso = nota.chave_acesso
+            if not chave_acesso and nota.id_dps:
+                status, corpo = self.cliente.consultar_dps(nota.id_dps)
+                if status == 200:
+                    chave_acesso = corpo.get('chaveAcesso')
             
-            resultado = {
-                'sucesso': False,
-                'mensagem': '⚠️ Consulta de NFS-e Nacional em desenvolvimento.\n\nA integração com a API Nacional será implementada em breve.',
-            }
+            if not chave_acesso:
+                return {
+                    'sucesso': False,
+                    'mensagem': '❌ NFS-e não encontrada na Sefin Nacional.',
+                }
+            
+            status, corpo = self.cliente.consultar_nfse(chave_acesso)
+            if status != 200:
+                return {
+                    'sucesso': False,
+                    'mensagem': f'❌ Erro ao consultar nota:\n\n{self.mensagem_erro(corpo)}',
+                }
             
-            return resultado
+            if nota.status_nfse != 'cancelada':
+                self.registrar_emissao(nota, corpo)
             
+            return {
+                'sucesso': True,
+                'mensagem': f'✅ NFS-e {nota.numero_nfse} encontrada.',
+                'chave_acesso': chave_acesso,
+                'xml': descompactar(corpo['nfseXmlGZipB64']).decode('utf-8') if corpo.get('nfseXmlGZipB64') else None,
+            }
+        
         except Exception as e:
-            self.logger.error(f"Erro ao consultar nota {numero_nfse}: {str(e)}")
+            self.logger.error(f"Erro ao consultar nota {nota.id}: {str(e)}")
             return {
                 'sucesso': False,
                 'mensagem': f'❌ Erro ao consultar nota:\n\n{str(e)}',
             }
     
+    def numeracao_dps(self, nota):
+        """
+        Série e número da DPS da nota
+        
+        Usa o número/série da nota quando numéricos; caso contrário reserva o próximo
+        número da série settings.NFSE_NACIONAL_SERIE_DPS e grava na nota.
+        
+        Args:
+            nota: Instância de NotaFiscalNacional
+        
+        Returns:
+            tuple: (série com 5 dígitos, número da DPS)
+        """
+        numero = (nota.numero_rps or '').strip()
+        serie = somente_digitos(nota.serie_rps)
+        
+        if numero.isdigit() and int(numero) > 0 and serie and len(serie) <= 5:
+            return serie.zfill(5), int(numero)
+        
+        serie = str(getattr(settings, 'NFSE_NACIONAL_SERIE_DPS', '00001')).zfill(5)
+        # A sequência começa depois do maior número das DPS já gravadas na série
+        # (com ou sem zeros à esquerda); reserva e gravação na mesma transação
+        notas_serie = NotaFiscalNacional.objects.filter(
+            empresa=self.empresa, serie_rps__regex=rf'^0*{int(serie)}$'
+        )
+        with transaction.atomic():
+            numero = reservar_numeros(self.empresa, serie, 1, notas=notas_serie)
+            nota.numero_rps = str(numero)
+            nota.serie_rps = serie
+            nota.save(update_fields=['numero_rps', 'serie_rps', 'data_atualizacao'])
+        return serie, numero
+    
+    def registrar_emissao(self, nota, corpo):
+        """
+        Grava na nota os dados da NFS-e gerada
+        
+        Args:
+            nota: Instância de NotaFiscalNacional
+            corpo: Resposta da API com chaveAcesso e nfseXmlGZipB64
+        
+        Returns:
+            dict: Resultado de sucesso da emissão
+        """
+        nota.chave_acesso = corpo['chaveAcesso']
+        nota.status_nfse = 'emitida'
+        nota.mensagem_erro = None
+        nota.data_emissao_nfse = timezone.now()
+        
+        if corpo.get('nfseXmlGZipB64'):
+            nfse = etree.fromstring(descompactar(corpo['nfseXmlGZipB64']))
+            numero = nfse.findtext(f'.//{{{NS_NFSE}}}nNFSe')
+            processamento = nfse.findtext(f'.//{{{NS_NFSE}}}dhProc')
+            if numero:
+                nota.numero_nfse = numero
+            if processamento:
+                nota.data_emissao_nfse = datetime.fromisoformat(processamento)
+        
+        nota.save(update_fields=[
+            'chave_acesso', 'status_nfse', 'mensagem_erro', 'numero_nfse',
+            'data_emissao_nfse', 'data_atualizacao'
+        ])
+        
+        return {
+            'sucesso': True,
+            'mensagem': f'✅ NFS-e {nota.numero_nfse or nota.chave_acesso} emitida com sucesso.',
+            'nota_id': nota.id,
+            'chave_acesso': nota.chave_acesso,
+            'numero_nfse': nota.numero_nfse,
+        }
+    
+    def registrar_erro(self, nota, mensagem):
+        """Marca a nota com erro de emissão e retorna o resultado de falha"""
+        nota.status_nfse = 'erro'
+        nota.mensagem_erro = mensagem
+        nota.save(update_fields=['status_nfse', 'mensagem_erro', 'data_atualizacao'])
+        
+        return {
+            'sucesso': False,
+            'mensagem': mensagem,
+            'nota_id': nota.id,
+        }
+    
+    @staticmethod
+    def mensagem_erro(corpo):
+        """
+        Monta a mensagem a partir da resposta de erro da API
+        
+        Args:
+            corpo: JSON da resposta (erros[] ou erro)
+        
+        Returns:
+            str: Uma linha por erro ("código - descrição (complemento)")
+        """
+        erros = corpo.get('erros') or ([corpo['erro']] if corpo.get('erro') else [])
+        linhas = []
+        for erro in erros:
+            codigo = erro.get('Codigo') or erro.get('codigo') or ''
+            descricao = erro.get('Descricao') or erro.get('descricao') or ''
+            complemento = erro.get('Complemento') or erro.get('complemento')
+            linha = f"{codigo} - {descricao}".strip(' -')
+            if complemento:
+                linha += f" ({complemento})"
+            linhas.append(linha)
+        return "\n".join(linhas) or 'Erro desconhecido'
+    
     def validar_nota(self, nota):
         """
         Valida os dados de uma nota antes da emissão
         
         Args:
             nota: Instância de NotaFiscalNacional
-            
+        
         Returns:
             tuple: (bool, str) - (válido, mensagem de erro)
         """
         erros = []
         
+        # Dados do prestador exigidos na DPS
+        if len(somente_digitos(self.empresa.codigo_municipio)) != 7:
+            erros.append("Código IBGE do município da empresa não cadastrado")
+        
         # Validar campos obrigatórios
         if not nota.cnpj_cpf_tomador:
             erros.append("CNPJ/CPF do tomador é obrigatório")
+        elif len(somente_digitos(nota.cnpj_cpf_tomador)) not in (11, 14):
+            erros.append("CNPJ/CPF do tomador inválido")
         
         if not nota.nome_tomador:
             erros.append("Nome do tomador é obrigatório")
         
         if not nota.cod_servico:
             erros.append("Código do serviço é obrigatório")
+        elif len(somente_digitos(nota.cod_servico)) != 6:
+            erros.append("Código do serviço deve ser o código de tributação nacional (6 dígitos)")
         
         if not nota.descricao:
             erros.append("Descrição do serviço é obrigatória")
@@ -164,7 +486,7 @@ class ProcessadorNFSeNacional:
         
         Args:
             nota: Instância de NotaFiscalNacional
-            
+        
         Returns:
             dict: Valores calculados dos impostos
         """
@@ -173,7 +495,7 @@ class ProcessadorNFSeNacional:
         valor_iss = (base_calculo * nota.aliquota_iss) / 100
         
         total_retencoes = (
-            nota.pis_retido + nota.cofins_retido + 
+            nota.pis_retido + nota.cofins_retido +
             nota.irrf_retido + nota.csll_retido + nota.inss_retido
         )
         
@@ -0,0 +1,83 @@
+"""
+Relatórios das NFS-e Nacionais (botão Relatório da tela de emissão)
+"""
+from django.db.models import Sum
+
+from core.models import TIPO_TRIBUTACAO_CHOICES
+from core.services.relatorio_notas import Coluna, Relatorio, relatorio_sintetico
+from nfse_nacional.models import STATUS_NFSE_CHOICES
+
+
+def relatorio_nfse_nacional(notas, tipo):
+    """
+    Relatório das NFS-e Nacionais
+
+    Args:
+        notas: QuerySet de NotaFiscalNacional já filtrado
+        tipo: analitico, sintetico, financeiro ou tributos
+
+    Returns:
+        Relatorio: Definição do relatório
+    """
+    notas = notas.com_impostos()
+    if tipo == 'sintetico':
+        return relatorio_sintetico('NFS-e Nacional - Sintético', notas)
+
+    notas = notas.order_by('data_emissao', 'id')
+    identificacao = [
+        Coluna('CNPJ Empresa', 'cnpj_contribuinte', largura=20),
+        Coluna('Número NFS-e', 'numero_nfse'),
+        Coluna('Data', 'data_emissao', 'data'),
+    ]
+
+    if tipo == 'financeiro':
+        return Relatorio('NFS-e Nacional - Financeiro', notas, identificacao + [
+            Coluna('Tomador', 'nome_tomador', largura=40),
+            Coluna('Valor Total', 'valor_total', 'moeda', total=Sum('valor_total')),
+            Coluna('Deduções', 'deducoes', 'moeda', total=Sum('deducoes')),
+            Coluna('Desconto Incond.', 'desconto_incondicionado', 'moeda', total=Sum('desconto_incondicionado')),
+            Coluna('Retenções', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+            Coluna('Valor Líquido', 'valor_liquido', 'moeda', total=Sum('valor_liquido')),
+            Coluna('Status', 'status_nfse', 'escolha', escolhas=STATUS_NFSE_CHOICES),
+        ])
+
+    if tipo == 'tributos':
+        return Relatorio('NFS-e Nacional - Tributos', notas, identificacao + [
+            Coluna('Código Serviço', 'cod_servico'),
+            Coluna('Tributação', 'tipo_tributacao', 'escolha', escolhas=TIPO_TRIBUTACAO_CHOICES, largura=28),
+            Coluna('Base de Cálculo', 'base_calculo', 'moeda', total=Sum('base_calculo')),
+            Coluna('Alíquota ISS (%)', 'aliquota_iss', 'percentual'),
+            Coluna('Valor ISS', 'valor_iss', 'moeda', total=Sum('valor_iss')),
+            Coluna('ISS Retido', 'iss_retido', 'booleano'),
+            Coluna('Alíquota IBS (%)', 'aliquota_ibs', 'percentual'),
+            Coluna('Valor IBS', 'valor_ibs', 'moeda', total=Sum('valor_ibs')),
+            Coluna('IBS Retido', 'ibs_retido', 'booleano'),
+            Coluna('Alíquota CBS (%)', 'aliquota_cbs', 'percentual'),
+            Coluna('Valor CBS', 'valor_cbs', 'moeda', total=Sum('valor_cbs')),
+            Coluna('CBS Retido', 'cbs_retido', 'booleano'),
+            Coluna('PIS', 'pis_retido', 'moeda', total=Sum('pis_retido')),
+            Coluna('COFINS', 'cofins_retido', 'moeda', total=Sum('cofins_retido')),
+            Coluna('IRRF', 'irrf_retido', 'moeda', total=Sum('irrf_retido')),
+            Coluna('CSLL', 'csll_retido', 'moeda', total=Sum('csll_retido')),
+            Coluna('INSS', 'inss_retido', 'moeda', total=Sum('inss_retido')),
+            Coluna('Total Retido', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+        ])
+
+    return Relatorio('NFS-e Nacional - Analítico', notas, identificacao + [
+        Coluna('Chave de Acesso', 'chave_acesso', largura=52),
+        Coluna('Emissão NFS-e', 'data_emissao_nfse', 'data_hora'),
+        Coluna('Série RPS', 'serie_rps'),
+        Coluna('Número RPS', 'numero_rps'),
+        Coluna('CNPJ/CPF Tomador', 'cnpj_cpf_tomador', largura=20),
+        Coluna('Tomador', 'nome_tomador', largura=40),
+        Coluna('Código Serviço', 'cod_servico'),
+        Coluna('Descrição', 'descricao', largura=50),
+        Coluna('Valor Total', 'valor_total', 'moeda', total=Sum('valor_total')),
+        Coluna('Deduções', 'deducoes', 'moeda', total=Sum('deducoes')),
+        Coluna('Alíquota ISS (%)', 'aliquota_iss', 'percentual'),
+        Coluna('Valor ISS', 'valor_iss', 'moeda', total=Sum('valor_iss')),
+        Coluna('ISS Retido', 'iss_retido', 'booleano'),
+        Coluna('Retenções', 'total_retencoes', 'moeda', total=Sum('total_retencoes')),
+        Coluna('Valor Líquido', 'valor_liquido', 'moeda', total=Sum('valor_liquido')),
+        Coluna('Status', 'status_nfse', 'escolha', escolhas=STATUS_NFSE_CHOICES),
+    ])
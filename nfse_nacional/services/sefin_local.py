@@ -0,0 +1,218 @@
+"""
+Servidor local que imita a API da Sefin Nacional
+Usado em desenvolvimento e testes sem acesso à Sefin: recebe a DPS, confere a
+assinatura e devolve uma NFS-e com chave de acesso, guardando tudo em memória
+
+Uso:
+    python manage.py servidor_sefin_local --porta 8765
+    NFSE_NACIONAL_URL = 'http://127.0.0.1:8765/SefinNacional'
+"""
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import xmlsec
+from django.utils import timezone
+from lxml import etree
+
+from .dps import NS_NFSE, compactar, descompactar, formatar_data_hora
+
+
+PREFIXO = '/SefinNacional'
+
+
+def digito_chave(chave):
+    """Dígito verificador (módulo 11) da chave de acesso"""
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave)))
+    resto = soma % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def assinatura_valida(raiz):
+    """Confere a assinatura do documento com o certificado do próprio X509Data"""
+    assinatura = xmlsec.tree.find_node(raiz, xmlsec.constants.NodeSignature)
+    certificado = raiz.findtext('.//{http://www.w3.org/2000/09/xmldsig#}X509Certificate')
+    if assinatura is None or not certificado:
+        return False
+
+    pem = (
+        "-----BEGIN CERTIFICATE-----\n" + certificado.strip() + "\n-----END CERTIFICATE-----\n"
+    ).encode()
+    ctx = xmlsec.SignatureContext()
+    ctx.register_id(raiz[0], 'Id')
+    ctx.key = xmlsec.Key.from_memory(pem, xmlsec.constants.KeyDataFormatCertPem)
+    try:
+        ctx.verify(assinatura)
+        return True
+    except xmlsec.Error:
+        return False
+
+
+class SefinLocal:
+    """Estado do servidor: NFS-e geradas e eventos registrados"""
+
+    def __init__(self):
+        self.notas = {}
+        self.dps = {}
+        self.eventos = {}
+        self.ultimo_numero = 0
+        self._lock = threading.Lock()
+
+    def gerar_nfse(self, xml_dps):
+        """
+        Gera a NFS-e de uma DPS
+
+        Returns:
+            tuple: (status HTTP, corpo JSON)
+        """
+        try:
+            dps = etree.fromstring(xml_dps)
+        except etree.XMLSyntaxError as e:
+            return 400, {'erros': [{'Codigo': 'E1235', 'Descricao': f'XML mal formado: {e}'}]}
+
+        inf = dps.find(f'{{{NS_NFSE}}}infDPS')
+        if inf is None or not inf.get('Id'):
+            return 400, {'erros': [{'Codigo': 'E1235', 'Descricao': 'infDPS não encontrado'}]}
+        if not assinatura_valida(dps):
+            return 400, {'erros': [{'Codigo': 'E0714', 'Descricao': 'Assinatura inválida'}]}
+
+        id_dps = inf.get('Id')
+        with self._lock:
+            if id_dps in self.dps:
+                return 409, {'erros': [{
+                    'Codigo': 'E0014', 'Descricao': 'DPS já utilizada para gerar NFS-e',
+                    'Complemento': self.dps[id_dps]
+                }]}
+
+            self.ultimo_numero += 1
+            numero = self.ultimo_numero
+            agora = timezone.localtime()
+            base = (
+                f"{id_dps[3:10]}2{id_dps[10]}{id_dps[11:25]}{numero:013d}"
+                f"{agora:%y%m}{random.randint(0, 999999999):09d}"
+            )
+            chave = base + digito_chave(base)
+
+            nfse = etree.Element(f'{{{NS_NFSE}}}NFSe', nsmap={None: NS_NFSE}, versao='1.00')
+            inf_nfse = etree.SubElement(nfse, f'{{{NS_NFSE}}}infNFSe', Id=f'NFS{chave}')
+            etree.SubElement(inf_nfse, f'{{{NS_NFSE}}}nNFSe').text = str(numero)
+            etree.SubElement(inf_nfse, f'{{{NS_NFSE}}}dhProc').text = formatar_data_hora(agora)
+            inf_nfse.append(dps)
+
+            self.notas[chave] = etree.tostring(nfse, encoding='UTF-8', xml_declaration=True)
+            self.dps[id_dps] = chave
+
+        return 201, {
+            'tipoAmbiente': 2,
+            'versaoAplicativo': 'SefinLocal',
+            'dataHoraProcessamento': formatar_data_hora(agora),
+            'idDps': id_dps,
+            'chaveAcesso': chave,
+            'nfseXmlGZipB64': compactar(self.notas[chave]),
+            'alertas': [],
+        }
+
+    def registrar_evento(self, chave, xml_evento):
+        """Registra um evento (cancelamento) da NFS-e"""
+        if chave not in self.notas:
+            return 404, {'erro': {'codigo': 'E2000', 'descricao': 'NFS-e não encontrada'}}
+
+        try:
+            pedido = etree.fromstring(xml_evento)
+        except etree.XMLSyntaxError as e:
+            return 400, {'erro': {'codigo': 'E1235', 'descricao': f'XML mal formado: {e}'}}
+
+        if not assinatura_valida(pedido):
+            return 400, {'erro': {'codigo': 'E0714', 'descricao': 'Assinatura inválida'}}
+        if pedido.findtext(f'.//{{{NS_NFSE}}}chNFSe') != chave:
+            return 400, {'erro': {'codigo': 'E1800', 'descricao': 'Chave de acesso divergente'}}
+
+        with self._lock:
+            if chave in self.eventos:
+                return 409, {'erro': {'codigo': 'E0840', 'descricao': 'NFS-e já cancelada'}}
+            self.eventos[chave] = xml_evento
+
+        return 201, {
+            'tipoAmbiente': 2,
+            'dataHoraProcessamento': formatar_data_hora(timezone.localtime()),
+            'eventoXmlGZipB64': compactar(xml_evento),
+        }
+
+    def consultar_nfse(self, chave):
+        if chave not in self.notas:
+            return 404, {'erro': {'codigo': 'E2000', 'descricao': 'NFS-e não encontrada'}}
+        return 200, {'chaveAcesso': chave, 'nfseXmlGZipB64': compactar(self.notas[chave])}
+
+    def consultar_dps(self, id_dps):
+        if id_dps not in self.dps:
+            return 404, {'erro': {'codigo': 'E2000', 'descricao': 'DPS não encontrada'}}
+        return 200, {'idDps': id_dps, 'chaveAcesso': self.dps[id_dps]}
+
+
+class ManipuladorSefinLocal(BaseHTTPRequestHandler):
+    """Rotas da API atendidas pelo servidor local"""
+
+    sefin = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    def responder(self, status, corpo):
+        conteudo = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(conteudo)))
+        self.end_headers()
+        self.wfile.write(conteudo)
+
+    def caminho(self):
+        caminho = self.path.split('?')[0]
+        if caminho.startswith(PREFIXO):
+            caminho = caminho[len(PREFIXO):]
+        return caminho.rstrip('/')
+
+    def corpo(self, campo):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        dados = json.loads(self.rfile.read(tamanho) or b'{}')
+        return descompactar(dados[campo])
+
+    def do_GET(self):
+        caminho = self.caminho()
+        if match := re.fullmatch(r'/nfse/(\d{50})', caminho):
+            return self.responder(*self.sefin.consultar_nfse(match.group(1)))
+        if match := re.fullmatch(r'/dps/(DPS\d{42})', caminho):
+            return self.responder(*self.sefin.consultar_dps(match.group(1)))
+        self.responder(404, {'erro': {'codigo': '404', 'descricao': 'Rota não encontrada'}})
+
+    def do_POST(self):
+        caminho = self.caminho()
+        try:
+            if caminho == '/nfse':
+                return self.responder(*self.sefin.gerar_nfse(self.corpo('dpsXmlGZipB64')))
+            if match := re.fullmatch(r'/nfse/(\d{50})/eventos', caminho):
+                return self.responder(*self.sefin.registrar_evento(
+                    match.group(1), self.corpo('pedidoRegistroEventoXmlGZipB64')
+                ))
+        except (KeyError, ValueError, OSError) as e:
+            return self.responder(400, {'erro': {'codigo': 'E1235', 'descricao': f'Requisição inválida: {e}'}})
+        self.responder(404, {'erro': {'codigo': '404', 'descricao': 'Rota não encontrada'}})
+
+
+def criar_servidor(endereco='127.0.0.1', porta=8765):
+    """
+    Cria o servidor local (ainda não iniciado)
+
+    Args:
+        endereco: Endereço de escuta
+        porta: Porta de escuta (0 escolhe uma porta livre)
+
+    Returns:
+        ThreadingHTTPServer: Servidor; o estado fica em servidor.sefin
+    """
+    sefin = SefinLocal()
+    manipulador = type('Manipulador', (ManipuladorSefinLocal,), {'sefin': sefin})
+    servidor = ThreadingHTTPServer((endereco, porta), manipulador)
+    servidor.sefin = sefin
+    return servidor
@@ -0,0 +1,145 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from django.test import TestCase, override_settings
+
+from accounts.models import EmpresaContratante
+from core.models import Empresa
+from nfs_sp.services.certificado_service import CertificadoService
+from .models import NotaFiscalNacional
+from .services.cliente_sefin import ClienteSefin, pool_sessoes
+from .services.emissao_nacional import EmissorNFSeNacional
+from .services.processador_nacional import ProcessadorNFSeNacional
+from .services.sefin_local import criar_servidor
+
+
+def gerar_certificado(pasta, cnpj):
+    """Certificado autoassinado (chave + certificado em PEM) para assinar as DPS"""
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f'PRESTADORA TESTE:{cnpj}')])
+    agora = datetime.datetime.now(datetime.timezone.utc)
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nome).issuer_name(nome).public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora - datetime.timedelta(days=1))
+        .not_valid_after(agora + datetime.timedelta(days=30))
+        .sign(chave, hashes.SHA256())
+    )
+    caminho = os.path.join(pasta, f'{cnpj}.pem')
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(chave.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        ))
+        arquivo.write(certificado.public_bytes(serialization.Encoding.PEM))
+    return caminho
+
+
+class EmissaoSefinLocalTest(TestCase):
+    """
+    Emissão, consulta e cancelamento pelo EmissorNFSeNacional contra o servidor
+    local da Sefin (sefin_local), com as requisições HTTP reais
+    """
+
+    def setUp(self):
+        self.servidor = criar_servidor(porta=0)
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        self.sefin = self.servidor.sefin
+
+        url = f'http://127.0.0.1:{self.servidor.server_address[1]}/SefinNacional'
+        configuracao = override_settings(NFSE_NACIONAL_URL=url, NFSE_NACIONAL_TIMEOUT=10)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.addCleanup(pool_sessoes.invalidar)
+
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        pem_path = gerar_certificado(pasta, '11222333000181')
+        certificado = mock.patch.object(CertificadoService, 'get_pem_path', return_value=pem_path)
+        certificado.start()
+        self.addCleanup(certificado.stop)
+
+        contratante = EmpresaContratante.objects.create(cnpj_cpf='11222333000181', nome_razao='Contratante')
+        self.empresa = Empresa.objects.create(
+            cnpj='11.222.333/0001-81', razao_social='Prestadora Teste', inscricao_municipal='12345678',
+            codigo_municipio='3550308', empresa_contratante=contratante
+        )
+
+    def criar_nota(self, **campos):
+        dados = dict(
+            empresa=self.empresa, cnpj_contribuinte=self.empresa.cnpj, cnpj_cpf_tomador='12345678909',
+            nome_tomador='Tomador Teste', cod_servico='010101', descricao='Serviço de consultoria',
+            valor_total=Decimal('1000.00'), aliquota_iss=Decimal('2.00'), tipo_tributacao='T',
+        )
+        dados.update(campos)
+        return NotaFiscalNacional.objects.create(**dados)
+
+    def test_emitir_consultar_cancelar(self):
+        notas = [self.criar_nota(), self.criar_nota(valor_total=Decimal('250.50'))]
+
+        resumo = EmissorNFSeNacional().emitir([nota.id for nota in notas])
+        self.assertEqual((resumo['emitidas'], resumo['erros']), (2, 0), resumo)
+        self.assertEqual(len(self.sefin.notas), 2)
+
+        nota = NotaFiscalNacional.objects.get(id=notas[0].id)
+        self.assertEqual(nota.status_nfse, 'emitida')
+        self.assertIn(nota.chave_acesso, self.sefin.notas)
+        self.assertEqual(self.sefin.dps[nota.id_dps], nota.chave_acesso)
+        self.assertTrue(nota.numero_nfse)
+
+        processador = ProcessadorNFSeNacional(self.empresa)
+        consulta = processador.consultar_nota(nota)
+        self.assertTrue(consulta['sucesso'], consulta)
+        self.assertIn(nota.chave_acesso, consulta['xml'])
+
+        cancelamento = processador.cancelar_nota(nota, 'Serviço não foi prestado ao tomador', '2')
+        self.assertTrue(cancelamento['sucesso'], cancelamento)
+        self.assertIn(nota.chave_acesso, self.sefin.eventos)
+        nota.refresh_from_db()
+        self.assertEqual(nota.status_nfse, 'cancelada')
+
+    def test_resposta_perdida_consulta_dps_antes_de_reenviar(self):
+        """A DPS chega à Sefin mas a resposta se perde: o reenvio consulta a DPS e não gera outra NFS-e"""
+        nota = self.criar_nota()
+        enviar_dps = ClienteSefin.enviar_dps
+
+        def enviar_e_perder_resposta(cliente, conteudo):
+            enviar_dps(cliente, conteudo)
+            raise requests.ReadTimeout('Read timed out')
+
+        with mock.patch.object(ClienteSefin, 'enviar_dps', enviar_e_perder_resposta):
+            resumo = EmissorNFSeNacional().emitir([nota.id])
+        self.assertEqual(resumo['erros'], 1)
+        self.assertIn('comunicação', resumo['resultados'][0]['mensagem'])
+        self.assertEqual(len(self.sefin.notas), 1)
+
+        nota.refresh_from_db()
+        self.assertEqual(nota.status_nfse, 'pendente')
+        self.assertIn(nota.id_dps, self.sefin.dps)
+
+        with mock.patch.object(ClienteSefin, 'consultar_dps', autospec=True,
+                               side_effect=ClienteSefin.consultar_dps) as consultar_dps, \
+                mock.patch.object(ClienteSefin, 'enviar_dps', autospec=True,
+                                  side_effect=ClienteSefin.enviar_dps) as enviar_dps_reenvio:
+            resumo = EmissorNFSeNacional().emitir([nota.id])
+        self.assertEqual(resumo['emitidas'], 1, resumo)
+        consultar_dps.assert_called_once_with(mock.ANY, nota.id_dps)
+        enviar_dps_reenvio.assert_not_called()
+
+        self.assertEqual(len(self.sefin.notas), 1)
+        nota.refresh_from_db()
+        self.assertEqual(nota.status_nfse, 'emitida')
+        self.assertEqual(nota.chave_acesso, self.sefin.dps[nota.id_dps])
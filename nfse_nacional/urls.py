@@ -5,6 +5,7 @@ app_name = 'nfse_nacional'
 
 urlpatterns = [
     path('emitir/', views.emitir_nfse, name='emitir'),
+    path('listar-notas/', views.listar_notas, name='listar_notas'),
     path('gerar-modelo/', views.gerar_modelo, name='gerar_modelo'),
     path('emitir-notas/', views.emitir_notas, name='emitir_notas'),
     path('excluir-notas/', views.excluir_notas, name='excluir_notas'),
@@ -2,9 +2,18 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
 from django.db.models import Q, Sum
 from core.models import Empresa
 from .models import NotaFiscalNacional
+from .services.processador_nacional import ProcessadorNFSeNacional
+from .services.relatorios import relatorio_nfse_nacional
+from core.services.geracao_pdf import GeradorPDFs, resposta_pdfs
+from core.services.pdf_notas import dados_danfse
+from core.services.fila_emissao import emissao_assincrona, enfileirar, resposta_enfileirada
+from core.services.importacao_planilha import ImportadorPlanilha
+from core.services.paginacao import contar, paginar
+from core.services.relatorio_notas import periodo_relatorio, resposta_relatorio
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from datetime import datetime, date
@@ -17,11 +26,8 @@ def emitir_nfse(request):
     """Tela para emissão de NFS-e Nacional com abas"""
     empresa_contratante = request.user.profile.empresa
     
-    # Buscar empresas emissoras
-    empresas = Empresa.objects.filter(
-        empresa_contratante=empresa_contratante,
-        ativo=True
-    )
+    # Empresas ativas (carregadas pelo ContextoContratanteMiddleware)
+    empresas = request.empresas_ativas
     
     # Processar ações POST
     if request.method == 'POST':
@@ -40,6 +46,41 @@ def emitir_nfse(request):
     status = request.GET.get('status')
     empresa_filtro = request.GET.get('empresa_id')
     
+    # Primeira página (as demais são carregadas por listar_notas)
+    notas = filtrar_notas_nacional(request, empresa_contratante)
+    pagina_notas, cursor_notas, _ = paginar(notas.com_impostos())
+    
+    context = {
+        'user': request.user,
+        'empresas': empresas,
+        'notas': pagina_notas,
+        'total_notas': contar(notas),
+        'cursor_notas': cursor_notas,
+        'filtros_query': request.GET.urlencode(),
+        'data_inicio': data_inicio,
+        'data_fim': data_fim,
+        'status': status,
+        'empresa_filtro': empresa_filtro,
+    }
+    return render(request, 'nfse_nacional/emitir.html', context)
+
+
+def filtrar_notas_nacional(request, empresa_contratante):
+    """
+    Aplica os filtros GET da tela de emissão às notas nacionais
+    
+    Args:
+        request: Requisição com os filtros (data_inicio, data_fim, status, empresa_id)
+        empresa_contratante: Empresa contratante do usuário
+        
+    Returns:
+        QuerySet: Notas filtradas (sem ordenação)
+    """
+    data_inicio = request.GET.get('data_inicio')
+    data_fim = request.GET.get('data_fim')
+    status = request.GET.get('status')
+    empresa_filtro = request.GET.get('empresa_id')
+    
     # Query de notas
     notas = NotaFiscalNacional.objects.filter(
         empresa__empresa_contratante=empresa_contratante
@@ -59,16 +100,26 @@ def emitir_nfse(request):
     if not data_inicio and not data_fim:
         notas = notas.filter(status_nfse='pendente')
     
-    context = {
-        'user': request.user,
-        'empresas': empresas,
-        'notas': notas.order_by('-data_importacao'),
-        'data_inicio': data_inicio,
-        'data_fim': data_fim,
-        'status': status,
-        'empresa_filtro': empresa_filtro,
-    }
-    return render(request, 'nfse_nacional/emitir.html', context)
+    return notas
+
+
+@login_required
+def listar_notas(request):
+    """Próxima página da listagem de notas (rolagem infinita na tela de emissão)"""
+    empresa_contratante = request.user.profile.empresa
+    
+    notas, proximo_cursor, tem_mais = paginar(
+        filtrar_notas_nacional(request, empresa_contratante).com_impostos(),
+        request.GET.get('cursor')
+    )
+    
+    return JsonResponse({
+        'sucesso': True,
+        'html': render_to_string('nfse_nacional/_linhas_notas.html', {'notas': notas}, request=request),
+        'proximo_cursor': proximo_cursor,
+        'tem_mais': tem_mais,
+        'quantidade': len(notas),
+    })
 
 
 @login_required
@@ -368,75 +419,63 @@ def importar_planilha(request, empresas):
             messages.error(request, 'Arquivo deve ser .xlsx ou .xls')
             return redirect('nfse_nacional:emitir')
         
-        # Ler planilha
-        wb = openpyxl.load_workbook(arquivo)
-        ws = wb.active
-        
-        importadas = 0
-        erros = []
+        def montar_nota(row):
+            """Monta a nota (não salva) a partir de uma linha da planilha"""
+            # Converter data
+            data_emissao = row[11]
+            if isinstance(data_emissao, str):
+                data_emissao = datetime.strptime(data_emissao, '%Y-%m-%d').date()
+            elif isinstance(data_emissao, datetime):
+                data_emissao = data_emissao.date()
+            
+            # Criar nota
+            nota = NotaFiscalNacional(
+                empresa=empresa,
+                cnpj_contribuinte=empresa.cnpj,  # CNPJ da empresa selecionada
+                # Tomador
+                cnpj_cpf_tomador=str(row[0] or '').strip(),
+                nome_tomador=str(row[1] or '').strip(),
+                inscricao_municipal_tomador=str(row[2] or '').strip() if row[2] else None,
+                email_tomador=str(row[3] or '').strip() if row[3] else None,
+                # Endereço
+                logradouro_tomador=str(row[4] or '').strip() if row[4] else None,
+                numero_tomador=str(row[5] or '').strip() if row[5] else None,
+                complemento_tomador=str(row[6] or '').strip() if row[6] else None,
+                bairro_tomador=str(row[7] or '').strip() if row[7] else None,
+                cidade_tomador=str(row[8] or '').strip() if row[8] else None,
+                uf_tomador=str(row[9] or '').strip() if row[9] else None,
+                cep_tomador=str(row[10] or '').strip() if row[10] else None,
+                # Serviço
+                data_emissao=data_emissao,
+                cod_servico=str(row[12] or '').strip(),
+                cod_tributacao_municipio=str(row[13] or '').strip() if row[13] else None,
+                descricao=str(row[14] or '').strip(),
+                valor_total=Decimal(str(row[15] or 0)),
+                deducoes=Decimal(str(row[16] or 0)),
+                desconto_incondicionado=Decimal(str(row[17] or 0)),
+                desconto_condicionado=Decimal(str(row[18] or 0)),
+                # ISS
+                aliquota_iss=Decimal(str(row[19] or 0)),
+                tipo_tributacao=str(row[20] or 'T').strip()[0].upper(),
+                iss_retido=str(row[21] or '').strip().upper() in ['SIM', 'S', 'TRUE', '1'],
+                municipio_incidencia=str(row[22] or '').strip() if row[22] else None,
+                # Retenções (índices ajustados após remoção de IBS/CBS)
+                pis_retido=Decimal(str(row[23] or 0)),
+                cofins_retido=Decimal(str(row[24] or 0)),
+                irrf_retido=Decimal(str(row[25] or 0)),
+                csll_retido=Decimal(str(row[26] or 0)),
+                inss_retido=Decimal(str(row[27] or 0)),
+                # RPS
+                numero_rps=str(row[28] or '').strip() if row[28] else None,
+                serie_rps=str(row[29] or '').strip() if row[29] else None,
+                observacoes=str(row[30] or '').strip() if row[30] else None,
+                status_nfse='pendente'
+            )
+            return nota
         
-        # Pular cabeçalho (linha 1)
-        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                # Validar se linha não está vazia
-                if not any(row):
-                    continue
-                
-                # Converter data
-                data_emissao = row[11]
-                if isinstance(data_emissao, str):
-                    data_emissao = datetime.strptime(data_emissao, '%Y-%m-%d').date()
-                elif isinstance(data_emissao, datetime):
-                    data_emissao = data_emissao.date()
-                
-                # Criar nota
-                nota = NotaFiscalNacional(
-                    empresa=empresa,
-                    cnpj_contribuinte=empresa.cnpj,  # CNPJ da empresa selecionada
-                    # Tomador
-                    cnpj_cpf_tomador=str(row[0] or '').strip(),
-                    nome_tomador=str(row[1] or '').strip(),
-                    inscricao_municipal_tomador=str(row[2] or '').strip() if row[2] else None,
-                    email_tomador=str(row[3] or '').strip() if row[3] else None,
-                    # Endereço
-                    logradouro_tomador=str(row[4] or '').strip() if row[4] else None,
-                    numero_tomador=str(row[5] or '').strip() if row[5] else None,
-                    complemento_tomador=str(row[6] or '').strip() if row[6] else None,
-                    bairro_tomador=str(row[7] or '').strip() if row[7] else None,
-                    cidade_tomador=str(row[8] or '').strip() if row[8] else None,
-                    uf_tomador=str(row[9] or '').strip() if row[9] else None,
-                    cep_tomador=str(row[10] or '').strip() if row[10] else None,
-                    # Serviço
-                    data_emissao=data_emissao,
-                    cod_servico=str(row[12] or '').strip(),
-                    cod_tributacao_municipio=str(row[13] or '').strip() if row[13] else None,
-                    descricao=str(row[14] or '').strip(),
-                    valor_total=Decimal(str(row[15] or 0)),
-                    deducoes=Decimal(str(row[16] or 0)),
-                    desconto_incondicionado=Decimal(str(row[17] or 0)),
-                    desconto_condicionado=Decimal(str(row[18] or 0)),
-                    # ISS
-                    aliquota_iss=Decimal(str(row[19] or 0)),
-                    tipo_tributacao=str(row[20] or 'T').strip()[0].upper(),
-                    iss_retido=str(row[21] or '').strip().upper() in ['SIM', 'S', 'TRUE', '1'],
-                    municipio_incidencia=str(row[22] or '').strip() if row[22] else None,
-                    # Retenções (índices ajustados após remoção de IBS/CBS)
-                    pis_retido=Decimal(str(row[23] or 0)),
-                    cofins_retido=Decimal(str(row[24] or 0)),
-                    irrf_retido=Decimal(str(row[25] or 0)),
-                    csll_retido=Decimal(str(row[26] or 0)),
-                    inss_retido=Decimal(str(row[27] or 0)),
-                    # RPS
-                    numero_rps=str(row[28] or '').strip() if row[28] else None,
-                    serie_rps=str(row[29] or '').strip() if row[29] else None,
-                    observacoes=str(row[30] or '').strip() if row[30] else None,
-                    status_nfse='pendente'
-                )
-                nota.save()
-                importadas += 1
-                
-            except Exception as e:
-                erros.append(f"Linha {row_num}: {str(e)}")
+        # Ler planilha em streaming e gravar em lotes (bulk_create)
+        importador = ImportadorPlanilha(NotaFiscalNacional, montar_nota)
+        importadas, erros = importador.importar(arquivo)
         
         if importadas > 0:
             messages.success(request, f'{importadas} nota(s) importada(s) com sucesso!')
@@ -462,85 +501,13 @@ def emitir_notas(request):
                 'mensagem': 'Nenhuma nota selecionada.'
             })
         
-        # Processar emissão
-        from .services import ProcessadorNFSeNacional
-        resultados = []
-        emitidas = 0
-        erros = 0
+        # Processamento em segundo plano (worker processar_emissoes)
+        if emissao_assincrona():
+            tarefa = enfileirar('nfse_nacional', notas_ids, request.user)
+            return JsonResponse(resposta_enfileirada(tarefa))
         
-        for nota_id in notas_ids:
-            try:
-                nota = NotaFiscalNacional.objects.get(id=nota_id)
-                
-                # Verificar se já foi emitida
-                if nota.status_nfse in ['emitida', 'cancelada']:
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': False,
-                        'numero_documento': nota.numero_rps or str(nota.id),
-                        'tomador': nota.nome_tomador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'❌ Nota {nota.numero_rps or nota.id}\n'\
-                                   f'Não pode ser emitida:\n\n'\
-                                   f'Status atual: {nota.get_status_nfse_display()}\n'\
-                                   f'Tomador: {nota.nome_tomador}\n'\
-                                   f'Valor: R$ {nota.valor_total:,.2f}'
-                    })
-                    erros += 1
-                    continue
-                
-                # Emitir nota
-                processador = ProcessadorNFSeNacional(nota.empresa)
-                resultado = processador.emitir_nota(nota)
-                
-                if resultado['sucesso']:
-                    emitidas += 1
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': True,
-                        'numero_documento': nota.numero_rps or str(nota.id),
-                        'tomador': nota.nome_tomador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': f'✅ Nota {nota.numero_rps or nota.id}\n'\
-                                   f'Emitida com sucesso!\n'\
-                                   f'Tomador: {nota.nome_tomador}\n'\
-                                   f'Valor: R$ {nota.valor_total:,.2f}'
-                    })
-                else:
-                    erros += 1
-                    resultados.append({
-                        'id': nota_id,
-                        'sucesso': False,
-                        'numero_documento': nota.numero_rps or str(nota.id),
-                        'tomador': nota.nome_tomador,
-                        'valor': float(nota.valor_total),
-                        'mensagem': resultado.get('mensagem', 'Erro desconhecido')
-                    })
-                    
-            except Exception as e:
-                erros += 1
-                resultados.append({
-                    'id': nota_id,
-                    'sucesso': False,
-                    'mensagem': f'Erro: {str(e)}'
-                })
-        
-        # Mensagem de resumo profissional
-        if emitidas > 0 and erros == 0:
-            mensagem_resumo = f'🎉 Emissão concluída com sucesso!\n\nTodas as {emitidas} nota(s) foram emitidas corretamente.'
-        elif emitidas > 0 and erros > 0:
-            mensagem_resumo = f'⚠️ Emissão concluída com avisos.\n\n{emitidas} nota(s) emitida(s) com sucesso.\n{erros} nota(s) com erro.'
-        else:
-            mensagem_resumo = f'❌ Não foi possível emitir as notas.\n\n{erros} erro(s) encontrado(s).'
-        
-        return JsonResponse({
-            'sucesso': emitidas > 0,
-            'mensagem': mensagem_resumo,
-            'emitidas': emitidas,
-            'erros': erros,
-            'total': len(notas_ids),
-            'resultados': resultados
-        })
+        from .services import EmissorNFSeNacional
+        return JsonResponse(EmissorNFSeNacional().emitir(notas_ids))
     
     return JsonResponse({'sucesso': False, 'mensagem': 'Método não permitido'})
 
@@ -681,29 +648,108 @@ def cancelar_notas(request):
     """Cancela notas emitidas selecionadas"""
     if request.method == 'POST':
         notas_ids = request.POST.getlist('notas[]')
+        motivo = request.POST.get('motivo', '')
+        codigo_motivo = request.POST.get('codigo_motivo', '9')
         
         if not notas_ids:
-            messages.error(request, 'Nenhuma nota selecionada.')
-            return redirect('nfse_nacional:emitir')
+            return JsonResponse({
+                'sucesso': False,
+                'mensagem': 'Nenhuma nota selecionada.'
+            })
+        
+        # Processar cancelamento
+        resultados = []
+        canceladas = 0
+        erros = 0
         
-        # TODO: Implementar cancelamento via API
-        messages.info(request, f'Cancelamento de {len(notas_ids)} nota(s) em desenvolvimento.')
+        # Processadores reaproveitados por empresa
+        processadores = {}
+        
+        for nota_id in notas_ids:
+            try:
+                nota = NotaFiscalNacional.objects.select_related('empresa').get(id=nota_id)
+                dados = {
+                    'id': nota_id,
+                    'numero_documento': nota.numero_nfse or nota.numero_rps or str(nota.id),
+                    'tomador': nota.nome_tomador,
+                    'valor': float(nota.valor_total),
+                }
+                
+                if nota.empresa_id not in processadores:
+                    processadores[nota.empresa_id] = ProcessadorNFSeNacional(nota.empresa)
+                resultado = processadores[nota.empresa_id].cancelar_nota(nota, motivo, codigo_motivo)
+                
+                if resultado['sucesso']:
+                    canceladas += 1
+                    resultados.append({
+                        **dados,
+                        'sucesso': True,
+                        'mensagem': f'✅ NFS-e Nº {nota.numero_nfse}\n'
+                                   f'Cancelada com sucesso!\n'
+                                   f'Tomador: {nota.nome_tomador}\n'
+                                   f'Valor: R$ {nota.valor_total:,.2f}'
+                    })
+                else:
+                    erros += 1
+                    resultados.append({
+                        **dados,
+                        'sucesso': False,
+                        'mensagem': f'{resultado.get("mensagem", "Erro ao cancelar nota")}\n\n'
+                                   f'Tomador: {nota.nome_tomador}\n'
+                                   f'Valor: R$ {nota.valor_total:,.2f}'
+                    })
+                    
+            except Exception as e:
+                erros += 1
+                resultados.append({
+                    'id': nota_id,
+                    'sucesso': False,
+                    'mensagem': f'Erro: {str(e)}'
+                })
+        
+        # Mensagem de resumo profissional
+        if canceladas > 0 and erros == 0:
+            mensagem_resumo = f'🎉 Cancelamento concluído com sucesso!\n\nTodas as {canceladas} nota(s) foram canceladas corretamente.'
+        elif canceladas > 0 and erros > 0:
+            mensagem_resumo = f'⚠️ Cancelamento concluído com avisos.\n\n{canceladas} nota(s) cancelada(s) com sucesso.\n{erros} nota(s) com erro.'
+        else:
+            mensagem_resumo = f'❌ Não foi possível cancelar as notas.\n\n{erros} erro(s) encontrado(s).'
+        
+        return JsonResponse({
+            'sucesso': canceladas > 0,
+            'mensagem': mensagem_resumo,
+            'canceladas': canceladas,
+            'erros': erros,
+            'total': len(notas_ids),
+            'resultados': resultados
+        })
     
     return redirect('nfse_nacional:emitir')
 
 
 @login_required
 def salvar_pdfs(request):
-    """Salva PDFs das notas selecionadas"""
-    notas_ids = request.GET.get('notas', '').split(',')
+    """Baixa o DANFSe das notas emitidas selecionadas"""
+    notas_ids = [nota_id for nota_id in request.GET.get('notas', '').split(',') if nota_id.isdigit()]
     
-    if not notas_ids or notas_ids == ['']:
+    if not notas_ids:
         messages.error(request, 'Nenhuma nota selecionada.')
         return redirect('nfse_nacional:emitir')
     
-    # TODO: Implementar download de PDFs
-    messages.info(request, f'Download de PDFs em desenvolvimento.')
-    return redirect('nfse_nacional:emitir')
+    notas = list(NotaFiscalNacional.objects.filter(
+        id__in=notas_ids,
+        status_nfse__in=['emitida', 'cancelada'],
+        empresa__empresa_contratante=request.user.profile.empresa
+    ).select_related('empresa').order_by('id'))
+    
+    if not notas:
+        messages.error(request, 'Nenhuma nota emitida entre as selecionadas.')
+        return redirect('nfse_nacional:emitir')
+    
+    arquivos = GeradorPDFs().gerar(
+        notas, dados_danfse, lambda nota: f'DANFSe_{nota.numero_nfse or nota.id}.pdf'
+    )
+    return resposta_pdfs(arquivos, f'danfse_{datetime.now():%Y%m%d_%H%M%S}')
 
 
 @login_required
@@ -786,7 +832,35 @@ def consultar_notas_api(request):
 
 
 def gerar_relatorio(request):
-    """Gera relatório conforme tipo selecionado"""
-    # TODO: Implementar geração de relatórios
-    messages.info(request, 'Geração de relatórios em desenvolvimento.')
-    return redirect('nfse_nacional:emitir')
+    """
+    Gera o relatório (CSV ou Excel) das notas do período
+    
+    O arquivo é montado à medida que as notas são lidas do banco, em blocos,
+    e os totais são somados pelo banco.
+    """
+    try:
+        data_inicio, data_fim = periodo_relatorio(request.POST.get('data_inicio'), request.POST.get('data_fim'))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('nfse_nacional:emitir')
+    
+    tipo = request.POST.get('tipo_relatorio', 'sintetico')
+    formato = request.POST.get('formato', 'excel')
+    situacao = request.POST.get('situacao', 'emitidas')
+    empresa_id = request.POST.get('empresa_id')
+    
+    notas = NotaFiscalNacional.objects.filter(
+        empresa__empresa_contratante=request.user.profile.empresa,
+        data_emissao__range=(data_inicio, data_fim)
+    )
+    status = {'emitidas': 'emitida', 'canceladas': 'cancelada'}.get(situacao)
+    if status:
+        notas = notas.filter(status_nfse=status)
+    if empresa_id and empresa_id.isdigit():
+        notas = notas.filter(empresa_id=empresa_id)
+    
+    return resposta_relatorio(
+        relatorio_nfse_nacional(notas, tipo),
+        formato,
+        f'relatorio_nfse_nacional_{tipo}_{data_inicio:%Y%m%d}_{data_fim:%Y%m%d}'
+    )
@@ -159,6 +159,94 @@ currencyInputs.forEach(input => {
     });
 });
 
+// ===== Background emission jobs =====
+// Se a resposta trouxer tarefa_id, consulta o progresso até a conclusão e
+// então repassa o resultado final (mesmo formato da emissão síncrona) ao callback
+function acompanharTarefaEmissao(data, callback, intervalo = 2000) {
+    if (!data || !data.tarefa_id) {
+        callback(data);
+        return;
+    }
+    
+    Swal.fire({
+        title: 'Emitindo notas...',
+        html: `<div id="tarefaProgressoTexto">0 de ${data.total} nota(s) processada(s)</div>
+               <div class="progress mt-3">
+                   <div id="tarefaProgressoBarra" class="progress-bar progress-bar-striped progress-bar-animated" style="width: 0%"></div>
+               </div>`,
+        allowOutsideClick: false,
+        showConfirmButton: false
+    });
+    
+    const consultar = () => {
+        fetch(data.url_status)
+            .then(response => response.json())
+            .then(status => {
+                const total = status.total || 1;
+                const texto = document.getElementById('tarefaProgressoTexto');
+                const barra = document.getElementById('tarefaProgressoBarra');
+                if (texto) texto.textContent = `${status.processadas} de ${status.total} nota(s) processada(s)`;
+                if (barra) barra.style.width = `${Math.round(status.processadas * 100 / total)}%`;
+                
+                if (status.concluida) {
+                    Swal.close();
+                    callback(status);
+                } else {
+                    setTimeout(consultar, intervalo);
+                }
+            })
+            .catch(error => {
+                console.error('Erro ao consultar tarefa:', error);
+                setTimeout(consultar, intervalo * 2);
+            });
+    };
+    
+    setTimeout(consultar, intervalo);
+}
+
+// ===== Infinite scroll for note listings =====
+// Elementos [data-carregar-mais] buscam a próxima página (cursor) e
+// acrescentam as linhas retornadas ao tbody da tabela indicada
+document.querySelectorAll('[data-carregar-mais]').forEach(container => {
+    const botao = container.querySelector('button');
+    let carregando = false;
+    
+    const carregarMais = () => {
+        if (carregando || !container.dataset.cursor) return;
+        carregando = true;
+        botao.disabled = true;
+        
+        const url = `${container.dataset.url}&cursor=${encodeURIComponent(container.dataset.cursor)}`;
+        fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                const tbody = document.querySelector(`#${container.dataset.tabela} tbody`);
+                if (tbody && data.html) {
+                    tbody.insertAdjacentHTML('beforeend', data.html);
+                }
+                if (data.tem_mais) {
+                    container.dataset.cursor = data.proximo_cursor;
+                } else {
+                    container.remove();
+                }
+            })
+            .catch(error => console.error('Erro ao carregar notas:', error))
+            .finally(() => {
+                carregando = false;
+                botao.disabled = false;
+            });
+    };
+    
+    botao.addEventListener('click', carregarMais);
+    
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) carregarMais();
+        });
+        observer.observe(container);
+    }
+});
+
 // ===== Console log for debugging (remove in production) =====
 console.log('Emissor Gold - Sistema carregado com sucesso!');
 console.log('Tema atual:', html.getAttribute('data-theme'));